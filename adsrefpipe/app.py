@@ -8,18 +8,21 @@ import re
 from builtins import str
 from adsputils import ADSCelery
 from datetime import datetime, timedelta
-from typing import List, Dict
+from typing import List, Dict, Iterator
 
 from adsrefpipe import perf_metrics
-from adsrefpipe.models import Action, Parser, ReferenceSource, ProcessedHistory, ResolvedReference, CompareClassic
+from adsrefpipe.models import Action, Parser, ReferenceSource, ProcessedHistory, ResolvedReference, CompareClassic, \
+    BestResolvedReference, ResolutionChange, TableStatistics, TableCountDelta
 from adsrefpipe.utils import get_date_created, get_date_modified, get_date_now, get_resolved_filename, \
     compare_classic_and_service, ReprocessQueryType
 
 from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy import and_, literal
+from sqlalchemy import and_, literal, any_, String, text, tuple_
 from sqlalchemy.sql import exists
 from sqlalchemy.sql.expression import case, func
 from sqlalchemy import desc
+from sqlalchemy.orm import aliased
+from sqlalchemy.dialects import postgresql
 
 from texttable import Texttable
 
@@ -44,6 +47,10 @@ class ADSReferencePipelineCelery(ADSCelery):
     # captures a double file extension at the end of a string, such as 'test.aas.raw'
     RE_MATCH_EXT = re.compile(r'.*(\..*?\.[a-z]+)$')
 
+    # when the same bibcode is resolved from several sources of a source bibcode, the parser with the highest priority wins
+    PARSER_PRIORITY = {'arXiv': 1, 'CrossRef': 1, 'Arthur': 3}
+    DEFAULT_PARSER_PRIORITY = 2
+
     default_parsers = {}
 
     def __init__(self, app_name: str, *args: tuple, **kwargs: Dict):
@@ -330,40 +337,78 @@ class ADSReferencePipelineCelery(ADSCelery):
         :param source_filename_list: List of source filenames to filter
         :return: List of combined records from multiple tables
         """
-        results = []
+        return list(self.iter_diagnostics(bibcode_list, source_filename_list))
+
+    def iter_diagnostics(self, bibcode_list: List = None, source_filename_list: List = None, batch_size: int = 1000) -> Iterator[Dict]:
+        """
+        stream the combined view of reference_source, processed_history and resolved_reference for many sources,
+        with one query, read from the database in batches
+
+        the sources are matched against one array parameter per list, however many bibcodes or files there are,
+        their runs and the reference counts of their last run are aggregated in the database
+
+        :param bibcode_list: List of bibcodes to filter
+        :param source_filename_list: List of source filenames to filter, both lists have to match if both are given
+        :param batch_size: number of rows fetched from the server side cursor at a time
+        :return: iterator of dictionaries, one per source, ordered by bibcode and source filename
+        """
         bibcode_list = _ensure_list(bibcode_list)
         source_filename_list = _ensure_list(source_filename_list)
 
-        reference_source = self.query_reference_source_tbl(bibcode_list, source_filename_list)
-        processed_history = self.query_processed_history_tbl(bibcode_list, source_filename_list)
-        # get history_ids
-        history_ids = [item['history_id'] for item in processed_history]
-        if history_ids:
-            resolved_reference = self.query_resolved_reference_tbl(history_ids)
-
-            # get bibcodes from both sources
-            reference_bibcodes = [item['bibcode'] for item in reference_source]
-            history_bibcodes = [item['bibcode'] for item in processed_history]
-            # find unique bibcodes
-            bibcodes = sorted(list(set(reference_bibcodes) | set(history_bibcodes)))
-            # go through the List and combine records from all three sources
-            for bibcode in bibcodes:
-                result = {}
-                reference_record = next(item for item in reference_source if item['bibcode'] == bibcode)
-                if reference_record:
-                    result = reference_record
-                history_record = next(item for item in processed_history if item['bibcode'] == bibcode)
-                if history_record:
-                    history_id = history_record.pop('history_id')
-                    resolved_record = next(item for item in resolved_reference if item.get('history_id') == history_id)
-                    result.update(history_record)
-                    if resolved_record:
-                        resolved_record.pop('history_id')
-                        result.update(resolved_record)
-                if result:
-                    results.append(result)
-
-        return results
+        with self.session_scope() as session:
+            sources = session.query(ReferenceSource.bibcode.label('bibcode'),
+                                    ReferenceSource.source_filename.label('source_filename'),
+                                    ReferenceSource.resolved_filename.label('resolved_filename'),
+                                    ReferenceSource.parser_name.label('parser_name'))
+            if bibcode_list:
+                sources = sources.filter(ReferenceSource.bibcode == any_(literal(bibcode_list, postgresql.ARRAY(String))))
+            if source_filename_list:
+                sources = sources.filter(ReferenceSource.source_filename == any_(literal(source_filename_list, postgresql.ARRAY(String))))
+            if not bibcode_list and not source_filename_list:
+                sources = sources.order_by(ReferenceSource.bibcode).limit(10)
+            sources = sources.cte('sources')
+
+            runs = session.query(ProcessedHistory.bibcode.label('bibcode'),
+                                 ProcessedHistory.source_filename.label('source_filename'),
+                                 func.count(ProcessedHistory.id).label('num_runs'),
+                                 func.max(ProcessedHistory.date).label('last_run_date'),
+                                 func.max(ProcessedHistory.id).label('history_id')) \
+                .join(sources, and_(ProcessedHistory.bibcode == sources.c.bibcode,
+                                    ProcessedHistory.source_filename == sources.c.source_filename)) \
+                .group_by(ProcessedHistory.bibcode, ProcessedHistory.source_filename) \
+                .cte('runs')
+
+            last_run = session.query(ResolvedReference.history_id.label('history_id'),
+                                     func.count(ResolvedReference.item_num).label('num_references'),
+                                     func.count(ResolvedReference.score).filter(ResolvedReference.score > 0).label('num_resolved_references')) \
+                .join(runs, ResolvedReference.history_id == runs.c.history_id) \
+                .group_by(ResolvedReference.history_id) \
+                .cte('last_run')
+
+            query = session.query(sources.c.bibcode, sources.c.source_filename, sources.c.resolved_filename, sources.c.parser_name,
+                                  runs.c.num_runs, runs.c.last_run_date,
+                                  last_run.c.num_references, last_run.c.num_resolved_references) \
+                .select_from(sources) \
+                .outerjoin(runs, and_(runs.c.bibcode == sources.c.bibcode, runs.c.source_filename == sources.c.source_filename)) \
+                .outerjoin(last_run, last_run.c.history_id == runs.c.history_id) \
+                .order_by(sources.c.bibcode, sources.c.source_filename)
+
+            count = 0
+            for row in query.yield_per(batch_size):
+                count += 1
+                yield {
+                    'bibcode': row.bibcode,
+                    'source_filename': row.source_filename,
+                    'resolved_filename': row.resolved_filename,
+                    'parser_name': row.parser_name,
+                    'num_runs': row.num_runs or 0,
+                    'last_run_date': str(row.last_run_date) if row.last_run_date else None,
+                    'last_run_num_references': row.num_references or 0,
+                    'last_run_num_resolved_references': row.num_resolved_references or 0,
+                }
+            if count == 0:
+                self.logger.error("No records found for bibcode = %s and source_filename = %s." % (
+                    ','.join(bibcode_list or []), ','.join(source_filename_list or [])))
 
     def insert_reference_source_record(self, session: object, reference: ReferenceSource) -> tuple:
         """
@@ -380,6 +425,7 @@ class ADSReferencePipelineCelery(ADSCelery):
 
         session.add(reference)
         session.flush()
+        self.update_table_statistics(session, ReferenceSource.__tablename__, 1)
         self.logger.debug("Added a `Reference` record successfully.")
         return reference.bibcode, reference.source_filename
 
@@ -393,6 +439,7 @@ class ADSReferencePipelineCelery(ADSCelery):
         """
         session.add(history)
         session.flush()
+        self.update_table_statistics(session, ProcessedHistory.__tablename__, 1)
         self.logger.debug("Added a `ProcessedHistory` record successfully.")
         return history.id
 
@@ -406,6 +453,7 @@ class ADSReferencePipelineCelery(ADSCelery):
         """
         session.bulk_save_objects(resolved_list)
         session.flush()
+        self.update_table_statistics(session, ResolvedReference.__tablename__, len(resolved_list))
         self.logger.debug("Added `ResolvedReference` records successfully.")
         return True
 
@@ -460,9 +508,110 @@ class ADSReferencePipelineCelery(ADSCelery):
         """
         session.bulk_save_objects(compared_list)
         session.flush()
+        self.update_table_statistics(session, CompareClassic.__tablename__, len(compared_list))
         self.logger.debug("Added `CompareClassic` records successfully.")
         return True
 
+    def insert_resolution_change_records(self, session: object, resolved_list: List[ResolvedReference]) -> int:
+        """
+        log the resolved references whose bibcode or score differs from the previous resolution of the same reference,
+        that is the latest one of the same item of the same source file, in this run or an earlier one
+
+        the placeholders written before a reference is sent to the service are not resolutions, and are skipped
+
+        :param session: database session
+        :param resolved_list: List of resolved reference records, with the new bibcode and score
+        :return: number of resolution change records inserted
+        """
+        if not resolved_list:
+            return 0
+        run = aliased(ProcessedHistory)
+        previous_run = aliased(ProcessedHistory)
+        rows = session.query(run.id.label('history_id'),
+                             ResolvedReference.item_num.label('item_num'),
+                             ResolvedReference.bibcode.label('bibcode'),
+                             ResolvedReference.score.label('score')) \
+            .join(previous_run, and_(previous_run.bibcode == run.bibcode,
+                                     previous_run.source_filename == run.source_filename,
+                                     previous_run.id <= run.id)) \
+            .join(ResolvedReference, ResolvedReference.history_id == previous_run.id) \
+            .filter(run.id.in_({r.history_id for r in resolved_list})) \
+            .filter(ResolvedReference.item_num.in_({r.item_num for r in resolved_list})) \
+            .filter(ResolvedReference.bibcode != '0000') \
+            .distinct(run.id, ResolvedReference.item_num) \
+            .order_by(run.id, ResolvedReference.item_num, desc(ResolvedReference.history_id)) \
+            .all()
+        previous = {(row.history_id, row.item_num): row for row in rows}
+
+        now = get_date_now()
+        changes = []
+        for r in resolved_list:
+            old = previous.get((r.history_id, r.item_num))
+            if old is not None and old.bibcode == r.bibcode and \
+                    (old.score is None if r.score is None else old.score is not None and float(old.score) == float(r.score)):
+                continue
+            changes.append(ResolutionChange(history_id=r.history_id,
+                                            item_num=r.item_num,
+                                            old_bibcode=old.bibcode if old is not None else None,
+                                            new_bibcode=r.bibcode,
+                                            score=r.score,
+                                            ts=now))
+        if changes:
+            session.bulk_save_objects(changes)
+            session.flush()
+            self.logger.debug("Added `ResolutionChange` records successfully.")
+        return len(changes)
+
+    def update_best_resolved_reference_records(self, session: object, resolved_list: List[ResolvedReference]) -> int:
+        """
+        keep the highest score of each resolved bibcode per source bibcode and parser in the best resolved reference table
+
+        :param session: database session
+        :param resolved_list: List of resolved reference records
+        :return: number of best resolved reference records inserted or checked
+        """
+        # unresolved references, and the placeholders of the ones not back from the service yet, are not kept
+        candidates = [r for r in resolved_list if r.bibcode and r.bibcode != '0000' and r.score is not None and float(r.score) != 0]
+        if not candidates:
+            return 0
+        rows = session.query(ProcessedHistory.id.label('history_id'),
+                             ProcessedHistory.date.label('date'),
+                             ReferenceSource.bibcode.label('source_bibcode'),
+                             ReferenceSource.parser_name.label('parser_name')) \
+            .join(ReferenceSource, and_(ProcessedHistory.bibcode == ReferenceSource.bibcode,
+                                        ProcessedHistory.source_filename == ReferenceSource.source_filename)) \
+            .filter(ProcessedHistory.id.in_({r.history_id for r in candidates})) \
+            .all()
+        sources = {row.history_id: row for row in rows}
+
+        best = {}
+        for r in candidates:
+            source = sources.get(r.history_id)
+            if not source:
+                continue
+            key = (source.source_bibcode, source.parser_name, r.bibcode)
+            # the same bibcode can be resolved from more than one reference of a file, a single insert can only update it once
+            if key not in best or float(r.score) > float(best[key]['score']):
+                best[key] = {'source_bibcode': source.source_bibcode,
+                             'parser_name': source.parser_name,
+                             'resolved_bibcode': r.bibcode,
+                             'history_id': r.history_id,
+                             'item_num': r.item_num,
+                             'score': r.score,
+                             'parser_priority': self.PARSER_PRIORITY.get(source.parser_name, self.DEFAULT_PARSER_PRIORITY),
+                             'date': source.date}
+        if not best:
+            return 0
+
+        statement = postgresql.insert(BestResolvedReference).values(list(best.values()))
+        statement = statement.on_conflict_do_update(
+            index_elements=[BestResolvedReference.source_bibcode, BestResolvedReference.parser_name, BestResolvedReference.resolved_bibcode],
+            set_={name: statement.excluded[name] for name in ['history_id', 'item_num', 'score', 'parser_priority', 'date']},
+            where=statement.excluded.score > BestResolvedReference.score)
+        session.execute(statement)
+        self.logger.debug("Updated `BestResolvedReference` records successfully.")
+        return len(best)
+
     def populate_resolved_reference_records_pre_resolved(self, references: List, history_id: int, item_nums: List = None) -> tuple:
         """
         insert resolved reference records before sending them to a service
@@ -631,7 +780,9 @@ class ADSReferencePipelineCelery(ADSCelery):
                                                      score=int(resolved_classic[i][2]),
                                                      state=resolved_classic[i][3])
                             compare_records.append(compare_record)
+                    self.insert_resolution_change_records(session, resolved_records)
                     self.update_resolved_reference_records(session, resolved_records)
+                    self.update_best_resolved_reference_records(session, resolved_records)
                     if resolved_classic:
                         self.insert_compare_records(session, compare_records)
                     session.commit()
@@ -686,36 +837,149 @@ class ADSReferencePipelineCelery(ADSCelery):
         self.logger.debug("Currently there are %d records in `CompareClassic` table."%rows)
         return rows
 
-    def get_count_records(self) -> List:
+    def get_estimated_count_records(self, session: object, table_names: List) -> Dict:
+        """
+        get the number of records of tables as estimated by postgres, without reading the tables
+
+        the live row count of the statistics collector is current to within a few seconds of the writes,
+        the row count of the last analyze is used if the statistics have been reset
+
+        :param session: database session
+        :param table_names: names of the tables
+        :return: dictionary of table name to estimated number of records
+        """
+        rows = session.execute(text("SELECT c.relname AS table_name, c.reltuples AS reltuples, s.n_live_tup AS n_live_tup "
+                                    "FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace "
+                                    "LEFT JOIN pg_stat_user_tables s ON s.relid = c.oid "
+                                    "WHERE c.relkind = 'r' AND n.nspname = current_schema() AND c.relname = ANY(:tables)"),
+                               {'tables': list(table_names)}).fetchall()
+        return {row.table_name: int(row.n_live_tup or max(row.reltuples, 0)) for row in rows}
+
+    def save_table_statistics(self, session: object, counts: Dict, exact: bool) -> None:
+        """
+        store the number of records of tables, replacing the previous ones
+
+        :param session: database session
+        :param counts: dictionary of table name to number of records
+        :param exact: True if the records were counted, False if estimated
+        :return: None
+        """
+        if not counts:
+            return
+        now = datetime.now()
+        statement = postgresql.insert(TableStatistics).values([{'table_name': name, 'count': count, 'exact': exact, 'updated': now}
+                                                               for name, count in counts.items()])
+        # an estimate does not replace an exact count that the writes keep up to date
+        where = None
+        if not exact and self._config.get('REFERENCE_PIPELINE_MAINTAIN_EXACT_COUNTS', False):
+            where = TableStatistics.exact.is_(False)
+        session.execute(statement.on_conflict_do_update(
+            index_elements=[TableStatistics.table_name],
+            set_={name: statement.excluded[name] for name in ['count', 'exact', 'updated']},
+            where=where))
+
+    def update_table_statistics(self, session: object, table_name: str, delta: int) -> None:
+        """
+        record the rows a write added to, or deleted from, a table, if the exact counts are kept up to date
+
+        each write appends its own delta row, in its own transaction, instead of updating the count of the table,
+        so that concurrent writers do not wait on each other, the deltas are added to the counts when they are read
+
+        :param session: database session
+        :param table_name: name of the table written to
+        :param delta: number of records inserted, negative for records deleted
+        :return: None
+        """
+        if not delta or not self._config.get('REFERENCE_PIPELINE_MAINTAIN_EXACT_COUNTS', False):
+            return
+        session.add(TableCountDelta(table_name=table_name, delta=delta))
+
+    def fold_table_count_deltas(self, session: object) -> None:
+        """
+        add the recorded deltas to the exact counts, and remove them, in a single statement
+
+        the deltas of a table without an exact count are removed only, a count taken later includes their rows
+
+        :param session: database session
+        :return: None
+        """
+        session.execute(text("WITH consumed AS (DELETE FROM table_count_delta RETURNING table_name, delta), "
+                             "totals AS (SELECT table_name, sum(delta) AS delta FROM consumed GROUP BY table_name) "
+                             "UPDATE table_statistics SET count = table_statistics.count + totals.delta, updated = :now "
+                             "FROM totals WHERE table_statistics.table_name = totals.table_name AND table_statistics.exact"),
+                        {'now': datetime.now()})
+
+    def save_exact_count_records(self, session: object, table_names: List) -> Dict:
+        """
+        count the records of tables and store the counts as exact
+
+        for each table the rows are counted, and the deltas recorded so far removed, in a single statement, so both
+        see the same writes, the deltas of the writes that commit afterwards are added on the next read
+
+        :param session: database session
+        :param table_names: names of the tables
+        :return: dictionary of table name to number of records
+        """
+        counts = {}
+        now = datetime.now()
+        for table_name in table_names:
+            # the names are the ones of the models, not user input
+            counts[table_name] = session.execute(text(
+                "WITH consumed AS (DELETE FROM table_count_delta WHERE table_name = :table_name) "
+                "INSERT INTO table_statistics (table_name, count, exact, updated) "
+                "SELECT :table_name, count(*), true, :now FROM %s "
+                "ON CONFLICT (table_name) DO UPDATE "
+                "SET count = excluded.count, exact = excluded.exact, updated = excluded.updated "
+                "RETURNING count" % table_name), {'table_name': table_name, 'now': now}).scalar()
+        return counts
+
+    def get_count_records(self, exact: bool = False) -> List:
         """
         get the count of records in all tables
 
-        :return: List of dictionaries with table names and record counts
+        by default the counts are estimates from the postgres statistics, stored and reused for
+        REFERENCE_PIPELINE_STATS_CACHE_TTL seconds, or the exact counts of a previous call with exact set
+        while REFERENCE_PIPELINE_MAINTAIN_EXACT_COUNTS keeps them up to date
+
+        :param exact: count the records of every table, and store the counts
+        :return: List of dictionaries with table names and record counts, if the counts are exact, and when they were taken
         """
+        tables = [
+            (ReferenceSource, 'ReferenceSource', 'source reference file information'),
+            (ProcessedHistory, 'ProcessedHistory', 'top level information for a processed run'),
+            (ResolvedReference, 'ResolvedReference', 'resolved reference information for a processed run'),
+            (CompareClassic, 'CompareClassic', 'comparison of new and classic processed run'),
+        ]
         with self.session_scope() as session:
-            results = [
-                {
-                    'name':'ReferenceSource',
-                    'description':'source reference file information',
-                    'count':self.get_count_reference_source_records(session),
-                },
-                {
-                    'name':'ProcessedHistory',
-                    'description':'top level information for a processed run',
-                    'count': self.get_count_processed_history_records(session),
-                },
-                {
-                    'name':'ResolvedReference',
-                    'description':'resolved reference information for a processed run',
-                    'count': self.get_count_resolved_reference_records(session),
-
-                },
-                {
-                    'name':'CompareClassic',
-                    'description':'comparison of new and classic processed run',
-                    'count':self.get_count_compare_classic_records(session),
-                }
-            ]
+            now = datetime.now()
+            if exact:
+                counts = self.save_exact_count_records(session, [model.__tablename__ for model, _, _ in tables])
+                stored = {name: {'count': count, 'exact': True, 'updated': now} for name, count in counts.items()}
+            else:
+                ttl = timedelta(seconds=self._config.get('REFERENCE_PIPELINE_STATS_CACHE_TTL', 0))
+                maintained = self._config.get('REFERENCE_PIPELINE_MAINTAIN_EXACT_COUNTS', False)
+                if maintained:
+                    self.fold_table_count_deltas(session)
+                stored = {row.table_name: {'count': row.count, 'exact': row.exact, 'updated': row.updated}
+                          for row in session.query(TableStatistics).all()
+                          if (row.exact and maintained) or (row.updated and now - row.updated <= ttl)}
+                missing = [model.__tablename__ for model, _, _ in tables if model.__tablename__ not in stored]
+                if missing:
+                    estimates = self.get_estimated_count_records(session, missing)
+                    self.save_table_statistics(session, estimates, exact=False)
+                    stored.update({name: {'count': count, 'exact': False, 'updated': now} for name, count in estimates.items()})
+            session.commit()
+
+            results = []
+            for model, name, description in tables:
+                statistics = stored.get(model.__tablename__, {'count': 0, 'exact': False, 'updated': None})
+                results.append({
+                    'name': name,
+                    'description': description,
+                    'count': statistics['count'],
+                    'exact': statistics['exact'],
+                    'updated': statistics['updated'],
+                })
             return results
 
     def get_service_classic_compare_tags(self, session: object, source_bibcode: str, source_filename: str) -> object:
@@ -906,36 +1170,18 @@ class ADSReferencePipelineCelery(ADSCelery):
         """
         result = []
         with self.session_scope() as session:
-            # build the query to select the highest-scored resolved references per resolved bibcode
+            # the highest-scored resolved reference per parser and resolved bibcode is kept on write,
             # also return name of the parser, order number of parsed reference, date it was parsed,
             # and the confidence score
-            highest_scored_resolved_reference = session.query(
-                ReferenceSource.bibcode.label('source_bibcode'),
-                ProcessedHistory.date.label('date'),
-                ResolvedReference.item_num.label('id'),
-                ResolvedReference.bibcode.label('resolved_bibcode'),
-                ResolvedReference.score.label('score'),
-                ReferenceSource.parser_name.label('parser_name'),
-                func.row_number().over(
-                    partition_by=[ReferenceSource.bibcode, ReferenceSource.parser_name, ResolvedReference.bibcode],
-                    order_by=desc(ResolvedReference.score)
-                ).label('ranking_by_score')
-            ).join(ProcessedHistory, ProcessedHistory.id == ResolvedReference.history_id) \
-                .join(ReferenceSource, ProcessedHistory.bibcode == ReferenceSource.bibcode) \
-                .filter(and_(ReferenceSource.bibcode == source_bibcode,
-                             ResolvedReference.score != 0)) \
-                .subquery()
-
-            # query database now
             rows = session.query(
-                highest_scored_resolved_reference.c.source_bibcode,
-                highest_scored_resolved_reference.c.date,
-                highest_scored_resolved_reference.c.id,
-                highest_scored_resolved_reference.c.resolved_bibcode,
-                highest_scored_resolved_reference.c.score,
-                highest_scored_resolved_reference.c.parser_name) \
-                .filter(highest_scored_resolved_reference.c.ranking_by_score == 1) \
-                .order_by(highest_scored_resolved_reference.c.resolved_bibcode) \
+                BestResolvedReference.source_bibcode.label('source_bibcode'),
+                BestResolvedReference.date.label('date'),
+                BestResolvedReference.item_num.label('id'),
+                BestResolvedReference.resolved_bibcode.label('resolved_bibcode'),
+                BestResolvedReference.score.label('score'),
+                BestResolvedReference.parser_name.label('parser_name')) \
+                .filter(BestResolvedReference.source_bibcode == source_bibcode) \
+                .order_by(BestResolvedReference.resolved_bibcode, BestResolvedReference.parser_name) \
                 .all()
 
             if len(rows) > 0:
@@ -961,49 +1207,22 @@ class ADSReferencePipelineCelery(ADSCelery):
         result = []
         with self.session_scope() as session:
 
-            # Build the query to rank parsers by priority (based on the parser_name) and then by score
-            highest_priority_resolved_reference = session.query(
-                ReferenceSource.bibcode.label('source_bibcode'),
-                ProcessedHistory.date.label('date'),
-                ResolvedReference.item_num.label('id'),
-                ResolvedReference.bibcode.label('resolved_bibcode'),
-                ResolvedReference.score.label('score'),
-                ReferenceSource.parser_name.label('parser_name'),
-                case(
-                    [
-                        (ReferenceSource.parser_name.in_(['arXiv', 'CrossRef']), 1),
-                        (ReferenceSource.parser_name == 'Arthur', 3)
-                    ],
-                    else_=2
-                ).label('parser_priority'),
-                func.row_number().over(
-                    partition_by=[ReferenceSource.bibcode, ResolvedReference.bibcode],
-                    order_by=[desc(case(
-                        [
-                            (ReferenceSource.parser_name.in_(['arXiv', 'CrossRef']), 1),
-                            (ReferenceSource.parser_name == 'Arthur', 3)
-                        ],
-                        else_=2
-                    )), desc(ResolvedReference.score)]
-                ).label('ranking_by_priority')
-            ).join(ProcessedHistory, ProcessedHistory.id == ResolvedReference.history_id) \
-                .join(ReferenceSource, ProcessedHistory.bibcode == ReferenceSource.bibcode) \
-                .filter(and_(ReferenceSource.bibcode == source_bibcode,
-                             ResolvedReference.score != 0)) \
-                .subquery()
-
-            # Query the ranked resolved references, ensuring we get the highest-ranked ones (ranking_by_priority == 1)
-            rows = session.query(
-                highest_priority_resolved_reference.c.source_bibcode,
-                highest_priority_resolved_reference.c.date,
-                highest_priority_resolved_reference.c.id,
-                highest_priority_resolved_reference.c.resolved_bibcode,
-                highest_priority_resolved_reference.c.score,
-                highest_priority_resolved_reference.c.parser_name,
-                highest_priority_resolved_reference.c.parser_priority)\
-                .filter(highest_priority_resolved_reference.c.ranking_by_priority == 1) \
-                .order_by(highest_priority_resolved_reference.c.resolved_bibcode) \
+            # the best resolved reference table has one row per parser for each resolved bibcode,
+            # ordered so that the first row of each resolved bibcode has the highest parser priority and then score
+            ranked_rows = session.query(
+                BestResolvedReference.source_bibcode.label('source_bibcode'),
+                BestResolvedReference.date.label('date'),
+                BestResolvedReference.item_num.label('id'),
+                BestResolvedReference.resolved_bibcode.label('resolved_bibcode'),
+                BestResolvedReference.score.label('score'),
+                BestResolvedReference.parser_name.label('parser_name'),
+                BestResolvedReference.parser_priority.label('parser_priority')) \
+                .filter(BestResolvedReference.source_bibcode == source_bibcode) \
+                .order_by(BestResolvedReference.resolved_bibcode,
+                          desc(BestResolvedReference.parser_priority),
+                          desc(BestResolvedReference.score)) \
                 .all()
+            rows = [row for i, row in enumerate(ranked_rows) if i == 0 or row.resolved_bibcode != ranked_rows[i - 1].resolved_bibcode]
 
             # Process the results
             if rows:
@@ -1021,3 +1240,84 @@ class ADSReferencePipelineCelery(ADSCelery):
                 self.logger.error(f'Unable to fetch resolved references for source bibcode `{source_bibcode}`.')
 
         return result
+
+    def export_resolved_references(self, source_bibcodes: List = None, since: datetime = None, all_parsers: bool = False,
+                                   batch_size: int = 10000) -> Iterator[Dict]:
+        """
+        stream the resolved references of many source bibcodes with one query, read from the database in batches
+
+        :param source_bibcodes: source bibcodes to export, all of them if not given
+        :param since: only export the source bibcodes that have a resolved reference updated at or after this date
+        :param all_parsers: export the highest score of every parser, as get_resolved_references_all does,
+                            instead of the highest parser priority only, as get_resolved_references does
+        :param batch_size: number of rows fetched from the server side cursor at a time
+        :return: iterator of dictionaries, ordered by source bibcode and resolved bibcode
+        """
+        with self.session_scope() as session:
+            query = session.query(
+                BestResolvedReference.source_bibcode.label('source_bibcode'),
+                BestResolvedReference.date.label('date'),
+                BestResolvedReference.item_num.label('id'),
+                BestResolvedReference.resolved_bibcode.label('resolved_bibcode'),
+                BestResolvedReference.score.label('score'),
+                BestResolvedReference.parser_name.label('parser_name'),
+                BestResolvedReference.parser_priority.label('parser_priority'))
+            if source_bibcodes:
+                # one array parameter, however many bibcodes there are
+                query = query.filter(BestResolvedReference.source_bibcode == any_(literal(list(source_bibcodes), postgresql.ARRAY(String))))
+            if since:
+                updated = session.query(BestResolvedReference.source_bibcode).filter(BestResolvedReference.date >= since)
+                query = query.filter(BestResolvedReference.source_bibcode.in_(updated.subquery()))
+            query = query.order_by(BestResolvedReference.source_bibcode,
+                                   BestResolvedReference.resolved_bibcode,
+                                   desc(BestResolvedReference.parser_priority),
+                                   desc(BestResolvedReference.score))
+
+            previous = None
+            for row in query.yield_per(batch_size):
+                key = (row.source_bibcode, row.resolved_bibcode)
+                if key == previous and not all_parsers:
+                    continue
+                previous = key
+                yield {
+                    'source_bibcode': row.source_bibcode,
+                    'date': row.date.strftime("%Y-%m-%d %H:%M:%S") if row.date else None,
+                    'id': row.id,
+                    'resolved_bibcode': row.resolved_bibcode,
+                    'score': float(row.score),
+                    'parser_name': row.parser_name,
+                    'parser_priority': row.parser_priority
+                }
+
+    def get_resolution_changes(self, since_txid: int = 0, since_id: int = 0, limit: int = 1000) -> List[Dict]:
+        """
+        read a page of the resolution change log, the changes after the watermark (since_txid, since_id),
+        in the order of the transactions that wrote them, then of their ids
+
+        only the changes of the transactions that have finished, all the ones that started before the oldest transaction
+        still running, are returned, a transaction that commits late is read once it commits and not skipped
+
+        pass the txid and the id of the last change of a page as the watermark to get the next one,
+        a page shorter than limit is the last one
+
+        :param since_txid: transaction id of the last change already read, 0 to start from the beginning
+        :param since_id: id of the last change already read, 0 to start from the beginning
+        :param limit: maximum number of changes to return
+        :return: List of dictionaries containing the changes
+        """
+        with self.session_scope() as session:
+            rows = session.query(ResolutionChange) \
+                .filter(tuple_(ResolutionChange.txid, ResolutionChange.id) > tuple_(since_txid, since_id)) \
+                .filter(ResolutionChange.txid < func.txid_snapshot_xmin(func.txid_current_snapshot())) \
+                .order_by(ResolutionChange.txid, ResolutionChange.id) \
+                .limit(limit).all()
+            return [{
+                'txid': row.txid,
+                'id': row.id,
+                'history_id': row.history_id,
+                'item_num': row.item_num,
+                'old_bibcode': row.old_bibcode,
+                'new_bibcode': row.new_bibcode,
+                'score': float(row.score) if row.score is not None else None,
+                'ts': row.ts.strftime("%Y-%m-%d %H:%M:%S") if row.ts else None,
+            } for row in rows]
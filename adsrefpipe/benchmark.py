@@ -6,6 +6,8 @@ import argparse
 import json
 import logging
 import os
+import shutil
+import tempfile
 import threading
 import time
 import uuid
@@ -19,11 +21,21 @@ except ImportError:  # pragma: no cover
     def load_config(*args, **kwargs):
         return {}
 
+import adsrefpipe.perf_compare as perf_compare
+import adsrefpipe.perf_corpus as perf_corpus
+import adsrefpipe.perf_db as perf_db
 import adsrefpipe.perf_metrics as perf_metrics
+import adsrefpipe.perf_parsers as perf_parsers
+import adsrefpipe.perf_profile as perf_profile
+import adsrefpipe.perf_prometheus as perf_prometheus
+import adsrefpipe.perf_resolver as perf_resolver
+import adsrefpipe.perf_sweep as perf_sweep
 import adsrefpipe.utils as utils
 
 
 DEFAULT_EXTENSIONS = "*.raw,*.xml,*.txt,*.html,*.tex,*.refs,*.pairs"
+# the events a sweep point with minimal metrics still writes, enough to count the files and the records
+MINIMAL_METRICS_STAGES = "file_wall,ingest_enqueue"
 LOGGER = logging.getLogger(__name__)
 
 
@@ -57,6 +69,20 @@ def _sample_interval_arg(value: str) -> float:
     return parsed
 
 
+def _threshold_arg(value: str) -> float:
+    parsed = float(value)
+    if parsed <= 0:
+        raise argparse.ArgumentTypeError("--threshold must be > 0 percent")
+    return parsed
+
+
+def _confidence_arg(value: str) -> float:
+    parsed = float(value)
+    if not 0 < parsed < 1:
+        raise argparse.ArgumentTypeError("--confidence must be between 0 and 1")
+    return parsed
+
+
 def _safe_git_commit() -> Optional[str]:
     try:
         import subprocess
@@ -126,11 +152,19 @@ def _mock_resolved_reference(reference: dict, service_url: str) -> list:
     }]
 
 
+def _slow_mock_resolver(latency_ms: float):
+    def resolve(reference: dict, service_url: str) -> list:
+        # a resolver round trip, the thread waits as it would on the socket
+        time.sleep(latency_ms / 1000.0)
+        return _mock_resolved_reference(reference, service_url)
+    return resolve
+
+
 @contextmanager
-def mock_resolver(enabled: bool):
+def mock_resolver(enabled: bool, latency_ms: float = 0.0):
     original = utils.post_request_resolved_reference
     if enabled:
-        utils.post_request_resolved_reference = _mock_resolved_reference
+        utils.post_request_resolved_reference = _slow_mock_resolver(latency_ms) if latency_ms > 0 else _mock_resolved_reference
     try:
         yield
     finally:
@@ -138,6 +172,54 @@ def mock_resolver(enabled: bool):
             utils.post_request_resolved_reference = original
 
 
+@contextmanager
+def local_resolver(server: Optional[perf_resolver.ResolverServer]):
+    # run.py reads the service url and utils the solr url from their config when a request is made
+    if server is None:
+        yield
+        return
+    targets = [
+        (getattr(_pipeline_run_module(), "config", None), "REFERENCE_PIPELINE_SERVICE_URL", server.service_url),
+        (utils.config, "REFERENCE_PIPELINE_SOLR_URL", server.solr_url),
+    ]
+    previous = []
+    for config, key, value in targets:
+        if config is not None:
+            previous.append((config, key, config.get(key)))
+            config[key] = value
+    try:
+        yield
+    finally:
+        for config, key, value in previous:
+            if value is None:
+                config.pop(key, None)
+            else:
+                config[key] = value
+
+
+@contextmanager
+def _local_resolver_server(args):
+    if args.mode != "local":
+        yield None
+        return
+    server = perf_resolver.start_resolver_server(perf_resolver.profile_from_args(args, prefix="resolver-"))
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def _resolver_requests_delta(before: Dict[str, Any], after: Dict[str, Any]) -> Dict[str, Dict[str, int]]:
+    delta = {}
+    for route, counts in after["requests"].items():
+        previous = before["requests"].get(route, {})
+        changed = {status: count - previous.get(status, 0) for status, count in counts.items() if count - previous.get(status, 0)}
+        if changed:
+            delta[route] = changed
+    return delta
+
+
 @contextmanager
 def benchmark_environment(
     run_id: str,
@@ -145,6 +227,11 @@ def benchmark_environment(
     events_path: str,
     mode: str,
     config: Optional[dict] = None,
+    regex_profile: bool = False,
+    tracemalloc: bool = False,
+    profile: bool = False,
+    task_concurrency: int = 1,
+    metrics_stages: Optional[str] = None,
 ):
     previous = {}
     updates = {
@@ -155,6 +242,16 @@ def benchmark_environment(
         "PERF_BENCHMARK_MODE": str(mode),
         "PERF_BENCHMARK_CONTINUE_ON_ERROR": "true",
     }
+    if regex_profile:
+        updates["PERF_REGEX_PROFILE"] = "true"
+    if tracemalloc:
+        updates["PERF_TRACEMALLOC"] = "true"
+    if profile:
+        updates["PERF_PROFILE"] = "true"
+    if task_concurrency > 1:
+        updates["PERF_BENCHMARK_TASK_CONCURRENCY"] = str(task_concurrency)
+    if metrics_stages:
+        updates["PERF_METRICS_STAGES"] = metrics_stages
     context_dir = perf_metrics.metrics_context_dir(config=config)
     if context_dir:
         updates["PERF_METRICS_CONTEXT_DIR"] = context_dir
@@ -194,11 +291,11 @@ def _write_run_artifacts(summary: Dict[str, object], output_dir: str) -> Dict[st
     return {"json": json_path, "markdown": md_path, "source_type_csv": csv_path}
 
 
-def _run_warmup(files: List[str], mode: str) -> None:
+def _run_warmup(files: List[str], mode: str, resolver_server: Optional[perf_resolver.ResolverServer] = None) -> None:
     if not files:
         return
     try:
-        with mock_resolver(mode == "mock"):
+        with mock_resolver(mode == "mock"), local_resolver(resolver_server if mode == "local" else None):
             _pipeline_run_module().process_files(files[:1])
     except Exception:
         # Warmup is best-effort and should not prevent the measured run from
@@ -206,6 +303,54 @@ def _run_warmup(files: List[str], mode: str) -> None:
         return
 
 
+# connection pools a forked worker inherited, kept referenced so that their connections are never closed by the worker
+_INHERITED_POOLS = []
+
+
+def _detach_inherited_pools(pipeline_run) -> None:
+    # the pooled connections of a forked worker are the sockets of the parent, mid protocol, the worker opens its own,
+    # closing the inherited ones, as engine.dispose does in sqlalchemy 1.3, would end the sessions of the parent too
+    tasks_module = getattr(pipeline_run, "tasks", None)
+    apps = {id(app): app for app in (getattr(pipeline_run, "app", None), getattr(tasks_module, "app", None)) if app is not None}
+    for app in apps.values():
+        engine = getattr(app, "_engine", None)
+        if engine is None:
+            continue
+        _INHERITED_POOLS.append(engine.pool)
+        engine.pool = engine.pool.recreate()
+
+
+def _worker_process_files(files: List[str]) -> None:
+    try:
+        pipeline_run = _pipeline_run_module()
+        _detach_inherited_pools(pipeline_run)
+        pipeline_run.process_files(files)
+    finally:
+        # a multiprocessing child leaves with os._exit, the atexit flush does not run
+        perf_metrics.flush_events()
+
+
+def _process_files(files: List[str], workers: int = 1) -> None:
+    if workers <= 1:
+        _pipeline_run_module().process_files(files)
+        return
+    import multiprocessing
+
+    # forked, so that the children share the environment and the mocks of the run, the files are dealt round robin
+    context = multiprocessing.get_context("fork")
+    processes = [
+        context.Process(target=_worker_process_files, args=(files[index::workers],), name="benchmark-worker-%d" % index)
+        for index in range(min(workers, len(files)))
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    failed = [process.name for process in processes if process.exitcode != 0]
+    if failed:
+        raise RuntimeError("benchmark workers failed: %s" % ", ".join(failed))
+
+
 def _run_case(
     input_path: str,
     extensions: List[str],
@@ -216,6 +361,15 @@ def _run_case(
     system_load_enabled: bool,
     warmup: bool,
     group_by: str,
+    regex_profile: bool = False,
+    process_pids: Optional[List[int]] = None,
+    tracemalloc: bool = False,
+    profile_dir: Optional[str] = None,
+    workers: int = 1,
+    task_concurrency: int = 1,
+    metrics_stages: Optional[str] = None,
+    resolver_latency_ms: float = 0.0,
+    resolver_server: Optional[perf_resolver.ResolverServer] = None,
 ) -> Dict[str, Any]:
     config = load_config(proj_home=os.path.realpath(os.path.join(os.path.dirname(__file__), "../")))
     all_files = collect_candidate_files(input_path, extensions)
@@ -225,28 +379,48 @@ def _run_case(
         raise RuntimeError("No benchmark candidate files found under %s" % input_path)
 
     if warmup:
-        _run_warmup(selected_files, mode=mode)
+        _run_warmup(selected_files, mode=mode, resolver_server=resolver_server)
 
     run_id = uuid.uuid4().hex
     context_id = uuid.uuid4().hex
     system_samples = []
+    process_samples = []
+    sampler_threads = {}
     sampler_stop = threading.Event()
 
+    def _collect_samples() -> None:
+        system_samples.append(perf_metrics.collect_system_sample())
+        process_samples.extend(perf_metrics.collect_process_samples(process_pids, threads=sampler_threads))
+
     def _sample_loop() -> None:
+        # the sampler costs CPU too, it is reported on its own
+        if hasattr(threading, "get_native_id"):
+            sampler_threads["sampler"] = threading.get_native_id()
         while not sampler_stop.wait(system_sample_interval_s):
-            system_samples.append(perf_metrics.collect_system_sample())
+            _collect_samples()
 
+    if mode == "local" and resolver_server is None:
+        raise RuntimeError("local mode needs a running local resolver")
+    resolver_before = resolver_server.stats() if resolver_server is not None else None
     sampler_thread = None
+    sampling_settings = None
+    writer_before = perf_metrics.event_writer_stats()
     start_wall = time.time()
-    with benchmark_environment(run_id=run_id, context_id=context_id, events_path=events_path, mode=mode, config=config):
+    if profile_dir:
+        perf_profile.SAMPLER.snapshot(reset=True)
+    with benchmark_environment(run_id=run_id, context_id=context_id, events_path=events_path, mode=mode, config=config,
+                               regex_profile=regex_profile, tracemalloc=tracemalloc, profile=bool(profile_dir),
+                               task_concurrency=task_concurrency, metrics_stages=metrics_stages):
         try:
             if system_load_enabled:
-                system_samples.append(perf_metrics.collect_system_sample())
+                _collect_samples()
                 sampler_thread = threading.Thread(target=_sample_loop, daemon=True)
                 sampler_thread.start()
 
-            with mock_resolver(mode == "mock"):
-                _pipeline_run_module().process_files(selected_files)
+            sampling_settings = perf_metrics.sampling_settings(config=config)
+            with mock_resolver(mode == "mock", latency_ms=resolver_latency_ms), \
+                    local_resolver(resolver_server if mode == "local" else None):
+                _process_files(selected_files, workers=workers)
         finally:
             if system_load_enabled:
                 sampler_stop.set()
@@ -261,12 +435,25 @@ def _run_case(
                                 "context_id": context_id,
                             },
                         )
-                system_samples.append(perf_metrics.collect_system_sample())
+                _collect_samples()
+            if tracemalloc:
+                import tracemalloc as tracemalloc_module
+
+                # started by the first traced stage, it slows down every allocation until stopped
+                tracemalloc_module.stop()
     end_wall = time.time()
+    profile_summary = None
+    if profile_dir:
+        perf_profile.SAMPLER.stop()
+        sampler_s = perf_profile.SAMPLER.sample_s
+        stacks = perf_profile.SAMPLER.snapshot(reset=True)
+        profile_summary = perf_profile.summarize_profile(stacks)
+        profile_summary["sampler_s"] = sampler_s
+        profile_summary["collapsed_files"] = perf_profile.write_collapsed(profile_dir, stacks, suffix=run_id)
+        profile_summary["combined_file"] = perf_profile.write_combined(os.path.join(profile_dir, "all.%s.folded" % run_id), stacks)
 
-    events = perf_metrics.load_events(events_path, run_id=run_id, context_id=context_id)
     summary = perf_metrics.aggregate_ads_events(
-        events,
+        perf_metrics.iter_events(events_path, run_id=run_id, context_id=context_id),
         started_at=start_wall,
         ended_at=end_wall,
         expected_files=len(selected_files),
@@ -284,18 +471,474 @@ def _run_case(
         "system_sample_interval_s": system_sample_interval_s,
         "system_load_enabled": system_load_enabled,
         "warmup": bool(warmup),
+        "regex_profile": bool(regex_profile),
+        "process_pids": list(process_pids or []),
+        "tracemalloc": bool(tracemalloc),
+        "profile": bool(profile_dir),
+        "workers": workers,
+        "task_concurrency": task_concurrency,
+        "metrics_stages": metrics_stages,
+        "mock_resolver_latency_ms": resolver_latency_ms if mode == "mock" else None,
     }
+    if profile_summary is not None:
+        summary["profile"] = profile_summary
+    if resolver_before is not None:
+        # the requests of the forked workers too, the server counts them all
+        summary["local_resolver"] = {
+            "url": resolver_server.url,
+            "profile": resolver_server.profile.describe(),
+            "requests": _resolver_requests_delta(resolver_before, resolver_server.stats()),
+        }
     summary["selected_files"] = selected_files
     summary["counts"]["files_selected"] = len(selected_files)
+    if sampling_settings is not None:
+        summary.setdefault("sampling", {})["settings"] = {
+            key: sorted(value) if isinstance(value, frozenset) else value for key, value in sampling_settings.items()
+        }
+    # iter_events flushed the buffer, so this covers all the events of the run
+    writer_after = perf_metrics.event_writer_stats()
+    summary["event_writer"] = {
+        key: round(writer_after[key] - writer_before[key], 3)
+        for key in ("events_buffered", "events_written", "flushes", "flush_ms", "write_errors")
+    }
     summary["system_load"] = perf_metrics.aggregate_system_samples(
         system_samples if system_load_enabled else [],
         enabled=system_load_enabled,
         sample_interval_s=system_sample_interval_s,
     )
+    summary["process_load"] = perf_metrics.aggregate_process_samples(
+        process_samples if system_load_enabled else [],
+        enabled=system_load_enabled,
+        sample_interval_s=system_sample_interval_s,
+    )
     perf_metrics.apply_system_load_adjustment(summary)
     return summary
 
 
+# Measured in a fresh interpreter so that nothing is already imported or loaded.
+_STARTUP_PROBE = """
+import json, resource, sys, time
+started = time.perf_counter()
+from adsrefpipe.refparsers.reference import unicode_handler, LatexReference
+imported = time.perf_counter()
+unicode_handler.u2asc(u'caf\\u00e9')
+LatexReference.get_aas_macros()
+loaded = time.perf_counter()
+sys.stdout.write(json.dumps({
+    "import_ms": (imported - started) * 1000.0,
+    "tables_ms": (loaded - imported) * 1000.0,
+    "total_ms": (loaded - started) * 1000.0,
+    "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+}))
+"""
+
+
+def _run_startup_probe(cache_enabled: bool) -> Dict[str, float]:
+    import subprocess
+    import sys
+
+    env = dict(os.environ)
+    env["REFERENCE_PIPELINE_DATA_CACHE_ENABLED"] = "true" if cache_enabled else "false"
+    proc = subprocess.run(
+        [sys.executable, "-c", _STARTUP_PROBE],
+        capture_output=True,
+        text=True,
+        check=True,
+        env=env,
+        cwd=os.path.realpath(os.path.join(os.path.dirname(__file__), "../")),
+    )
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def _run_startup_case(repeat: int) -> Dict[str, Any]:
+    from adsrefpipe.refparsers import datacache
+
+    # compile the caches up front, as the build step would
+    compiled = datacache.compile_all()
+    results = {}
+    for label, cache_enabled in (("parse_data_files", False), ("compiled_cache", True)):
+        samples = [_run_startup_probe(cache_enabled) for _ in range(repeat)]
+        results[label] = {
+            metric: perf_metrics._numeric_stats([sample[metric] for sample in samples])
+            for metric in ("import_ms", "tables_ms", "total_ms", "max_rss_kb")
+        }
+    baseline = results["parse_data_files"]["tables_ms"]["p50"]
+    cached = results["compiled_cache"]["tables_ms"]["p50"]
+    return {
+        "repeat": repeat,
+        "compiled_caches": compiled,
+        "startup": results,
+        "tables_speedup": (baseline / cached) if baseline and cached else None,
+        "timestamp_utc": _utc_timestamp(),
+        "git_commit": _safe_git_commit(),
+    }
+
+
+def cmd_startup(args) -> int:
+    summary = _run_startup_case(repeat=args.repeat)
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+        json_path = os.path.join(args.output_dir, "ads_reference_startup_%s.json" % summary["timestamp_utc"])
+        perf_metrics.write_json(json_path, summary)
+        summary["json"] = json_path
+    print(json.dumps(summary, indent=2, sort_keys=True))
+    return 0
+
+
+IMPORTTIME_TARGETS = {
+    "adsrefpipe.tasks": "import adsrefpipe.tasks",
+    "run.py": "import run",
+}
+
+
+def parse_importtime(stderr: str) -> List[Dict[str, Any]]:
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3:
+            continue
+        try:
+            self_us = int(parts[0].strip())
+            cumulative_us = int(parts[1].strip())
+        except ValueError:
+            # header line
+            continue
+        name = parts[2].rstrip()
+        rows.append({
+            "module": name.strip(),
+            "depth": (len(name) - len(name.lstrip()) - 1) // 2,
+            "self_us": self_us,
+            "cumulative_us": cumulative_us,
+        })
+    return rows
+
+
+def _run_importtime_probe(statement: str) -> List[Dict[str, Any]]:
+    import subprocess
+    import sys
+
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=os.path.realpath(os.path.join(os.path.dirname(__file__), "../")),
+    )
+    return parse_importtime(proc.stderr)
+
+
+def _run_importtime_case(repeat: int, top: int) -> Dict[str, Any]:
+    results = {}
+    for target, statement in IMPORTTIME_TARGETS.items():
+        totals = []
+        modules = {}
+        for _ in range(repeat):
+            rows = _run_importtime_probe(statement)
+            totals.append(sum(row["self_us"] for row in rows) / 1000.0)
+            for row in rows:
+                modules.setdefault(row["module"], []).append(row)
+        last_run = {name: entries[-1] for name, entries in modules.items()}
+        results[target] = {
+            "total_ms": perf_metrics._numeric_stats(totals),
+            "module_count": len(last_run),
+            "refparser_modules": sorted(name for name in last_run if name.startswith("adsrefpipe.refparsers.")),
+            "test_modules": sorted(name for name in last_run if name.startswith("adsrefpipe.tests")),
+            "top_self_ms": [
+                {"module": name, "self_ms": sum(entry["self_us"] for entry in entries) / 1000.0 / len(entries)}
+                for name, entries in sorted(
+                    modules.items(),
+                    key=lambda item: sum(entry["self_us"] for entry in item[1]) / len(item[1]),
+                    reverse=True,
+                )[:top]
+            ],
+        }
+    return {
+        "repeat": repeat,
+        "imports": results,
+        "timestamp_utc": _utc_timestamp(),
+        "git_commit": _safe_git_commit(),
+    }
+
+
+def cmd_importtime(args) -> int:
+    summary = _run_importtime_case(repeat=args.repeat, top=args.top)
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+        json_path = os.path.join(args.output_dir, "ads_reference_importtime_%s.json" % summary["timestamp_utc"])
+        perf_metrics.write_json(json_path, summary)
+        summary["json"] = json_path
+    print(json.dumps(summary, indent=2, sort_keys=True))
+    return 0
+
+
+# stubdata the cleanup lists of each parser family are applied to, relative to the input path
+CLEANUP_FAMILY_INPUTS = {
+    "txt": "txt",
+    "ocr": "ocr",
+    "tex": "tex",
+    "html": "html",
+    "xml": "",
+}
+
+
+def _cleanup_family(cls: type) -> str:
+    from adsrefpipe.refparsers.toREFs import TXTtoREFs, OCRtoREFs, TEXtoREFs, HTMLtoREFs
+    from adsrefpipe.refparsers.reference import LatexReference
+
+    for family, bases in (("txt", (TXTtoREFs,)), ("ocr", (OCRtoREFs,)), ("tex", (TEXtoREFs, LatexReference)), ("html", (HTMLtoREFs,))):
+        if issubclass(cls, bases):
+            return family
+    return "xml"
+
+
+def _cleanup_texts(input_path: str, family: str) -> List[str]:
+    subdir = CLEANUP_FAMILY_INPUTS[family]
+    if subdir:
+        filenames = [
+            os.path.join(root, name)
+            for root, _, names in os.walk(os.path.join(input_path, subdir))
+            for name in sorted(names)
+        ]
+    else:
+        filenames = [
+            os.path.join(input_path, name)
+            for name in sorted(os.listdir(input_path))
+            if name.endswith(".xml")
+        ]
+    texts = []
+    for filename in sorted(filenames):
+        with open(filename, "r", encoding="latin-1") as handle:
+            content = handle.read()
+        # block cleanups see the whole buffer, reference cleanups see one reference at a time
+        texts.append(content)
+        texts.extend(line for line in content.splitlines() if line.strip())
+    return texts
+
+
+def _run_cleanup_case(input_path: str, repeat: int) -> Dict[str, Any]:
+    from adsrefpipe.refparsers import cleanup
+
+    grouped = {}
+    for (cls, name), rules in sorted(cleanup.find_cleanup_lists().items(), key=lambda item: (item[0][0].__name__, item[0][1])):
+        grouped.setdefault(_cleanup_family(cls), []).append(("%s.%s" % (cls.__name__, name), rules))
+
+    results = {}
+    for family, named_lists in sorted(grouped.items()):
+        texts = _cleanup_texts(input_path, family)
+        chains = [cleanup.compile_cleanup(rules) for _, rules in named_lists]
+        mismatches = [
+            owner
+            for (owner, rules), chain in zip(named_lists, chains)
+            if any(cleanup.apply_sequential(rules, text) != chain.apply(text) for text in texts)
+        ]
+        sequential_ms, engine_ms = [], []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            for _, rules in named_lists:
+                for text in texts:
+                    cleanup.apply_sequential(rules, text)
+            sequential_ms.append((time.perf_counter() - started) * 1000.0)
+            started = time.perf_counter()
+            for chain in chains:
+                for text in texts:
+                    chain.apply(text)
+            engine_ms.append((time.perf_counter() - started) * 1000.0)
+        steps = {}
+        for chain in chains:
+            for kind, count in chain.describe().items():
+                steps[kind] = steps.get(kind, 0) + count
+        sequential = perf_metrics._numeric_stats(sequential_ms)
+        engine = perf_metrics._numeric_stats(engine_ms)
+        results[family] = {
+            "cleanup_lists": [owner for owner, _ in named_lists],
+            "texts": len(texts),
+            "chains": steps,
+            "sequential_ms": sequential,
+            "engine_ms": engine,
+            "speedup": (sequential["p50"] / engine["p50"]) if sequential["p50"] and engine["p50"] else None,
+            "mismatches": mismatches,
+        }
+    return {
+        "repeat": repeat,
+        "input_path": input_path,
+        "families": results,
+        "timestamp_utc": _utc_timestamp(),
+        "git_commit": _safe_git_commit(),
+    }
+
+
+def cmd_cleanup(args) -> int:
+    summary = _run_cleanup_case(input_path=args.input_path, repeat=args.repeat)
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+        json_path = os.path.join(args.output_dir, "ads_reference_cleanup_%s.json" % summary["timestamp_utc"])
+        perf_metrics.write_json(json_path, summary)
+        summary["json"] = json_path
+    print(json.dumps(summary, indent=2, sort_keys=True))
+    # any difference from the ordered application is a bug in the engine
+    return 1 if any(family["mismatches"] for family in summary["families"].values()) else 0
+
+
+def _run_event_overhead_case(events: int, repeat: int) -> Dict[str, Any]:
+    import tempfile
+
+    extra = perf_metrics.build_event_extra(source_filename="0000A&A.....0.....Z.raw", parser_name="AnAtxt", record_count=1)
+    results = {}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for writer, buffered in (("direct", "false"), ("buffered", "true")):
+            events_path = os.path.join(tmpdir, "%s.jsonl" % writer)
+            per_event_us, flush_ms = [], []
+            for _ in range(repeat):
+                run_id, context_id = uuid.uuid4().hex, uuid.uuid4().hex
+                with benchmark_environment(run_id=run_id, context_id=context_id, events_path=events_path, mode="mock",
+                                           config={"PERF_METRICS_CONTEXT_DIR": os.path.join(tmpdir, "context")}):
+                    previous = os.environ.get("PERF_METRICS_BUFFERED")
+                    os.environ["PERF_METRICS_BUFFERED"] = buffered
+                    try:
+                        perf_metrics.flush_events()
+                        started = time.perf_counter()
+                        for index in range(events):
+                            perf_metrics.emit_event("record_wall", record_id="rec-%d" % index, duration_ms=1.0, extra=extra)
+                        emitted = time.perf_counter()
+                        perf_metrics.flush_events()
+                        flushed = time.perf_counter()
+                    finally:
+                        if previous is None:
+                            os.environ.pop("PERF_METRICS_BUFFERED", None)
+                        else:
+                            os.environ["PERF_METRICS_BUFFERED"] = previous
+                # the flush is part of the cost, whether the flusher thread or the caller pays it
+                per_event_us.append((flushed - started) * 1e6 / events)
+                flush_ms.append((flushed - emitted) * 1000.0)
+                written = len(perf_metrics.load_events(events_path, run_id=run_id, context_id=context_id))
+                if written != events:
+                    raise RuntimeError("%s writer wrote %d of %d events" % (writer, written, events))
+            results[writer] = {
+                "per_event_us": perf_metrics._numeric_stats(per_event_us),
+                "final_flush_ms": perf_metrics._numeric_stats(flush_ms),
+            }
+        # the live metrics are recorded on every event, whether or not the events file is written
+        live = perf_prometheus.LiveMetrics()
+        live.configure(os.path.join(tmpdir, "live"))
+        observe_us = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            for index in range(events):
+                live.observe("record_wall", 1.0, "AnAtxt", ".raw")
+            observe_us.append((time.perf_counter() - started) * 1e6 / events)
+        live.dumper = None
+    direct, buffered = results["direct"]["per_event_us"]["p50"], results["buffered"]["per_event_us"]["p50"]
+    return {
+        "events": events,
+        "repeat": repeat,
+        "writers": results,
+        "live_metrics": {"per_event_us": perf_metrics._numeric_stats(observe_us)},
+        "speedup": (direct / buffered) if direct and buffered else None,
+        "timestamp_utc": _utc_timestamp(),
+        "git_commit": _safe_git_commit(),
+    }
+
+
+def cmd_events(args) -> int:
+    summary = _run_event_overhead_case(events=args.events, repeat=args.repeat)
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+        json_path = os.path.join(args.output_dir, "ads_reference_events_%s.json" % summary["timestamp_utc"])
+        perf_metrics.write_json(json_path, summary)
+        summary["json"] = json_path
+    print(json.dumps(summary, indent=2, sort_keys=True))
+    return 0
+
+
+def _synthetic_events(count: int) -> List[Dict[str, Any]]:
+    run_id, context_id = uuid.uuid4().hex, uuid.uuid4().hex
+    stages = ("record_wall", "resolver_http", "post_resolved_db")
+    events = []
+    for index in range(count):
+        file_index = index // 60
+        extra = perf_metrics.build_event_extra(
+            source_filename="/proj/ads/references/sources/A+A/%d/%05d.raw" % (file_index % 7, file_index),
+            parser_name="AnAtxt",
+            source_bibcode="2020A&A...%03d..%03dA" % (file_index % 1000, file_index % 997),
+            record_count=1,
+        )
+        events.append({
+            "ts": 1700000000.0 + index * 0.001,
+            "stage": stages[index % 3],
+            "run_id": run_id,
+            "context_id": context_id,
+            "record_id": "H%dI%d" % (file_index, (index // 3) % 20),
+            "duration_ms": 0.5 + (index * 7919 % 1000) / 100.0,
+            "status": "ok",
+            "extra": extra,
+        })
+    return events
+
+
+def _run_eventlog_case(events: int, repeat: int, events_path: Optional[str] = None) -> Dict[str, Any]:
+    import tempfile
+    import adsrefpipe.perf_eventlog as perf_eventlog
+
+    payloads = list(perf_metrics.iter_events(events_path)) if events_path else _synthetic_events(events)
+    timings = {"jsonl_encode_ms": [], "jsonl_decode_ms": [], "segments_encode_ms": [], "segments_decode_ms": []}
+    sizes = {}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for attempt in range(repeat):
+            jsonl_path = os.path.join(tmpdir, "events_%d.jsonl" % attempt)
+            segment_root = os.path.join(tmpdir, "segments_%d" % attempt)
+
+            started = time.perf_counter()
+            with open(jsonl_path, "w") as handle:
+                handle.write("".join(json.dumps(payload, sort_keys=True) + "\n" for payload in payloads))
+            timings["jsonl_encode_ms"].append((time.perf_counter() - started) * 1000.0)
+
+            started = time.perf_counter()
+            perf_eventlog.append_events(segment_root, payloads)
+            timings["segments_encode_ms"].append((time.perf_counter() - started) * 1000.0)
+
+            started = time.perf_counter()
+            with open(jsonl_path, "r") as handle:
+                from_jsonl = [json.loads(line) for line in handle]
+            timings["jsonl_decode_ms"].append((time.perf_counter() - started) * 1000.0)
+
+            started = time.perf_counter()
+            from_segments = list(perf_eventlog.iter_segment_events(segment_root))
+            timings["segments_decode_ms"].append((time.perf_counter() - started) * 1000.0)
+
+            if from_segments != from_jsonl:
+                raise RuntimeError("segment events differ from the JSONL events")
+            sizes = {
+                "jsonl_bytes": os.path.getsize(jsonl_path),
+                "segments_bytes": sum(os.path.getsize(path) for path in perf_eventlog.segment_files(segment_root)),
+            }
+    stats = {name: perf_metrics._numeric_stats(values) for name, values in timings.items()}
+    return {
+        "events": len(payloads),
+        "repeat": repeat,
+        "source": events_path or "synthetic",
+        "sizes": sizes,
+        "size_ratio": (float(sizes["jsonl_bytes"]) / sizes["segments_bytes"]) if sizes.get("segments_bytes") else None,
+        "timings_ms": stats,
+        "decode_speedup": (stats["jsonl_decode_ms"]["p50"] / stats["segments_decode_ms"]["p50"])
+        if stats["segments_decode_ms"]["p50"] else None,
+        "timestamp_utc": _utc_timestamp(),
+        "git_commit": _safe_git_commit(),
+    }
+
+
+def cmd_eventlog(args) -> int:
+    summary = _run_eventlog_case(events=args.events, repeat=args.repeat, events_path=args.events_path)
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+        json_path = os.path.join(args.output_dir, "ads_reference_eventlog_%s.json" % summary["timestamp_utc"])
+        perf_metrics.write_json(json_path, summary)
+        summary["json"] = json_path
+    print(json.dumps(summary, indent=2, sort_keys=True))
+    return 0
+
+
 def cmd_run(args) -> int:
     config = load_config(proj_home=os.path.realpath(os.path.join(os.path.dirname(__file__), "../")))
     output_dir = args.output_dir or config.get("PERF_METRICS_OUTPUT_DIR", os.path.join("logs", "benchmarks"))
@@ -303,17 +946,23 @@ def cmd_run(args) -> int:
     events_path = args.events_path or os.path.join(output_dir, "perf_events.jsonl")
     extensions = _parse_csv_list(args.extensions) or _parse_csv_list(DEFAULT_EXTENSIONS)
 
-    summary = _run_case(
-        input_path=args.input_path,
-        extensions=extensions,
-        max_files=args.max_files,
-        mode=args.mode,
-        events_path=events_path,
-        system_sample_interval_s=args.system_sample_interval,
-        system_load_enabled=not bool(args.disable_system_load),
-        warmup=bool(args.warmup),
-        group_by=args.group_by,
-    )
+    with _local_resolver_server(args) as resolver_server:
+        summary = _run_case(
+            input_path=args.input_path,
+            extensions=extensions,
+            max_files=args.max_files,
+            mode=args.mode,
+            events_path=events_path,
+            system_sample_interval_s=args.system_sample_interval,
+            system_load_enabled=not bool(args.disable_system_load),
+            warmup=bool(args.warmup),
+            group_by=args.group_by,
+            regex_profile=bool(args.regex_profile),
+            process_pids=[int(pid) for pid in _parse_csv_list(args.process_pids)],
+            tracemalloc=bool(args.tracemalloc),
+            profile_dir=os.path.join(output_dir, "profiles") if args.profile else None,
+            resolver_server=resolver_server,
+        )
 
     artifacts = _write_run_artifacts(summary, output_dir=output_dir)
     print(json.dumps({
@@ -327,6 +976,282 @@ def cmd_run(args) -> int:
     return 0 if summary.get("status") == "complete" else 2
 
 
+def _positive_int_list(value: str) -> List[int]:
+    try:
+        parsed = [int(item) for item in _parse_csv_list(value)]
+    except ValueError:
+        parsed = []
+    if not parsed or any(item < 1 for item in parsed):
+        raise argparse.ArgumentTypeError("expected a comma separated list of positive integers, got %r" % value)
+    return sorted(set(parsed))
+
+
+def _metrics_list(value: str) -> List[str]:
+    parsed = _parse_csv_list(value)
+    if not parsed or any(item not in {"full", "minimal"} for item in parsed):
+        raise argparse.ArgumentTypeError("expected a comma separated list of full and minimal, got %r" % value)
+    return sorted(set(parsed))
+
+
+def _run_sweep(args, events_path: str, resolver_server: Optional[perf_resolver.ResolverServer] = None) -> Dict[str, Any]:
+    extensions = _parse_csv_list(args.extensions) or _parse_csv_list(DEFAULT_EXTENSIONS)
+    grid = [
+        {"workers": workers, "task_concurrency": task_concurrency, "metrics": metrics}
+        for metrics in args.metrics
+        for workers in args.workers
+        for task_concurrency in args.task_concurrency
+    ]
+    points, selected_files = [], []
+    for index, settings in enumerate(grid):
+        runs = []
+        for repeat in range(args.repeat):
+            summary = _run_case(
+                input_path=args.input_path,
+                extensions=extensions,
+                max_files=args.max_files,
+                mode=args.mode,
+                events_path=events_path,
+                system_sample_interval_s=args.system_sample_interval,
+                system_load_enabled=not bool(args.disable_system_load),
+                # the caches are warm after the first run
+                warmup=bool(args.warmup) and index == 0 and repeat == 0,
+                group_by="none",
+                workers=settings["workers"],
+                task_concurrency=settings["task_concurrency"],
+                metrics_stages=MINIMAL_METRICS_STAGES if settings["metrics"] == "minimal" else None,
+                resolver_latency_ms=args.mock_resolver_latency_ms,
+                resolver_server=resolver_server,
+            )
+            selected_files = summary["selected_files"]
+            runs.append(perf_sweep.sweep_point(summary))
+            LOGGER.info("sweep point %s run %d: %s records/min", settings, repeat + 1, runs[-1]["records_per_minute"])
+        points.append(perf_sweep.combine_repeats(settings, runs))
+    sweep = perf_sweep.analyze_sweep(points, saturation=args.saturation)
+    sweep["settings"] = {
+        "input_path": args.input_path,
+        "extensions": extensions,
+        "selected_files": selected_files,
+        "mode": args.mode,
+        "mock_resolver_latency_ms": args.mock_resolver_latency_ms if args.mode == "mock" else None,
+        "local_resolver": resolver_server.profile.describe() if resolver_server is not None else None,
+        "repeat": args.repeat,
+        "warmup": bool(args.warmup),
+        "grid": {"workers": args.workers, "task_concurrency": args.task_concurrency, "metrics": args.metrics},
+    }
+    sweep["timestamp_utc"] = _utc_timestamp()
+    sweep["git_commit"] = _safe_git_commit()
+    return sweep
+
+
+def cmd_sweep(args) -> int:
+    config = load_config(proj_home=os.path.realpath(os.path.join(os.path.dirname(__file__), "../")))
+    output_dir = args.output_dir or config.get("PERF_METRICS_OUTPUT_DIR", os.path.join("logs", "benchmarks"))
+    os.makedirs(output_dir, exist_ok=True)
+    with _local_resolver_server(args) as resolver_server:
+        sweep = _run_sweep(args, events_path=args.events_path or os.path.join(output_dir, "perf_events.jsonl"),
+                           resolver_server=resolver_server)
+    stem = os.path.join(output_dir, "ads_reference_sweep_%s" % sweep["timestamp_utc"])
+    perf_metrics.write_json("%s.json" % stem, sweep)
+    perf_sweep.render_sweep_markdown(sweep, "%s.md" % stem)
+    print(json.dumps({
+        "best": sweep["best"],
+        "saturation": {
+            "%s %s %s" % (curve["metrics"], curve["dimension"], curve["fixed"]): curve["saturates_at"] for curve in sweep["curves"]
+        },
+        "json": "%s.json" % stem,
+        "markdown": "%s.md" % stem,
+    }, indent=2, sort_keys=True))
+    return 0 if all(point["status"] == "complete" for point in sweep["points"]) else 2
+
+
+def cmd_compare(args) -> int:
+    with open(args.baseline) as handle:
+        baseline = json.load(handle)
+    with open(args.candidate) as handle:
+        candidate = json.load(handle)
+    result = perf_compare.compare_summaries(
+        baseline,
+        candidate,
+        threshold=args.threshold / 100.0,
+        statistic=args.statistic,
+        iterations=args.iterations,
+        confidence=args.confidence,
+        min_samples=args.min_samples,
+        seed=args.seed,
+    )
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+        stem = os.path.join(args.output_dir, "ads_reference_compare_%s" % _utc_timestamp())
+        perf_metrics.write_json("%s.json" % stem, result)
+        perf_compare.render_comparison_markdown(result, "%s.md" % stem)
+        result["json"], result["markdown"] = "%s.json" % stem, "%s.md" % stem
+    print(json.dumps({
+        key: result.get(key)
+        for key in ("comparable", "problems", "warnings", "throughput", "regressions", "improvements", "json", "markdown")
+        if key in result
+    }, indent=2, sort_keys=True))
+    if not result["comparable"] and not args.allow_incomparable:
+        return 2
+    return 1 if result["regressions"] else 0
+
+
+def _families_arg(value: str) -> List[str]:
+    parsed = _parse_csv_list(value)
+    unknown = [name for name in parsed if name not in perf_corpus.FAMILIES]
+    if not parsed or unknown:
+        raise argparse.ArgumentTypeError("expected a comma separated list of %s, got %r" % (", ".join(sorted(perf_corpus.FAMILIES)), value))
+    return parsed
+
+
+def cmd_corpus(args) -> int:
+    manifest = perf_corpus.generate_corpus(
+        args.output_dir,
+        families=args.families,
+        files=args.files,
+        blocks=args.blocks,
+        references=args.references,
+        noise=args.noise,
+        scales=args.scales,
+        seed=args.seed,
+    )
+    totals: Dict[str, Dict[str, int]] = {}
+    for entry in manifest["files"]:
+        total = totals.setdefault("%dx" % entry["scale"], {"files": 0, "references": 0, "bytes": 0})
+        total["files"] += 1
+        total["references"] += entry["references"]
+        total["bytes"] += entry["bytes"]
+    print(json.dumps({
+        "manifest": os.path.join(args.output_dir, "manifest.json"),
+        "families": manifest["settings"]["families"],
+        "scales": totals,
+    }, indent=2, sort_keys=True))
+    return 0
+
+
+def cmd_parsers(args) -> int:
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as handle:
+            baseline = json.load(handle)
+    corpus_dir = args.corpus_dir or tempfile.mkdtemp(prefix="ads_reference_corpus_")
+    try:
+        summary = perf_parsers.run_parser_benchmarks(
+            corpus_dir,
+            families=args.families,
+            scales=args.scales,
+            blocks=args.blocks,
+            references=args.references,
+            repeat=args.repeat,
+            max_exponent=args.max_exponent,
+            seed=args.seed,
+            baseline=baseline,
+            threshold=args.threshold,
+        )
+    finally:
+        if not args.corpus_dir:
+            shutil.rmtree(corpus_dir, ignore_errors=True)
+    summary["timestamp_utc"] = _utc_timestamp()
+    summary["git_commit"] = _safe_git_commit()
+    if args.save_baseline:
+        perf_metrics.write_json(args.save_baseline, perf_parsers.baseline_from_summary(summary))
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+        stem = os.path.join(args.output_dir, "ads_reference_parsers_%s" % summary["timestamp_utc"])
+        perf_metrics.write_json("%s.json" % stem, summary)
+        perf_parsers.render_parsers_markdown(summary, "%s.md" % stem)
+        summary["json"], summary["markdown"] = "%s.json" % stem, "%s.md" % stem
+    print(json.dumps({
+        "exponents": {family: result["exponent"] for family, result in summary["parsers"].items()},
+        "superlinear": summary["superlinear"],
+        "regressions": summary.get("regressions", []),
+        "uncovered": [item["class"] for item in summary["uncovered"]],
+        "json": summary.get("json"),
+        "markdown": summary.get("markdown"),
+    }, indent=2, sort_keys=True))
+    # a parser that grows faster than linearly, or slowed down against the baseline, fails the run
+    return 1 if summary["superlinear"] or summary.get("regressions") else 0
+
+
+def _masked_url(url: str) -> str:
+    # keep the password of the database out of the report
+    scheme, _, rest = url.partition("://")
+    credentials, at, host = rest.rpartition("@")
+    if not at or ":" not in credentials:
+        return url
+    return "%s://%s:***@%s" % (scheme, credentials.split(":", 1)[0], host)
+
+
+def _db_app(db_url: str):
+    from adsrefpipe.app import ADSReferencePipelineCelery
+
+    return ADSReferencePipelineCelery("reference-pipeline-db-benchmark", local_config={"SQLALCHEMY_URL": db_url, "SQLALCHEMY_ECHO": False})
+
+
+def cmd_db_seed(args) -> int:
+    app = _db_app(args.db_url)
+    seeded = perf_db.seed_database(
+        app._engine,
+        sources=args.sources,
+        retries=args.retries,
+        references=args.references,
+        duplicates=args.duplicates,
+        compare=args.compare,
+        failed=args.failed,
+        unresolved=args.unresolved,
+        days=args.days,
+        seed=args.seed,
+        chunk=args.chunk,
+        reset=args.reset,
+        progress=lambda message: LOGGER.info("seed %s", message),
+    )
+    seeded["tables"] = perf_db.table_sizes(app._engine)
+    print(json.dumps(seeded, indent=2, sort_keys=True))
+    return 0
+
+
+def cmd_db_run(args) -> int:
+    config = load_config(proj_home=os.path.realpath(os.path.join(os.path.dirname(__file__), "../")))
+    output_dir = args.output_dir or config.get("PERF_METRICS_OUTPUT_DIR", os.path.join("logs", "benchmarks"))
+    app = _db_app(args.db_url)
+    engine = app._engine
+    inputs = perf_db.sample_inputs(engine, count=args.samples, seed=args.seed)
+    scratch_dir = tempfile.mkdtemp(prefix="ads_reference_db_")
+    try:
+        summary = perf_db.run_db_benchmark(app, inputs, scratch_dir, repeat=args.repeat, references=args.references,
+                                           explain=None if args.no_explain else perf_db.explain_statement)
+    finally:
+        removed = perf_db.remove_benchmark_writes(engine, inputs["history_id_floor"])
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+    summary["removed_rows"] = removed
+    summary["tables"] = perf_db.table_sizes(engine)
+    summary["inputs"] = inputs
+    summary["run_metadata"] = {
+        "timestamp_utc": _utc_timestamp(),
+        "git_commit": _safe_git_commit(),
+        "db_url": _masked_url(args.db_url),
+        "server_version": perf_db.server_version(engine),
+        "repeat": args.repeat,
+        "samples": args.samples,
+        "explain": not args.no_explain,
+    }
+    stem = os.path.join(output_dir, "ads_reference_db_%s" % summary["run_metadata"]["timestamp_utc"])
+    perf_metrics.write_json("%s.json" % stem, summary)
+    perf_db.render_db_markdown(summary, "%s.md" % stem)
+    slowest = sorted(summary["latency_ms"].items(), key=lambda item: -(item[1]["p50"] or 0.0))[:5]
+    print(json.dumps({
+        "status": summary["status"],
+        "slowest_p50_ms": {name: stats["p50"] for name, stats in slowest},
+        "seq_scans": {
+            name: sorted({relation for item in result["statements"] for relation in item.get("seq_scans", [])})
+            for name, result in summary["queries"].items()
+            if any(item.get("seq_scans") for item in result["statements"])
+        },
+        "json": "%s.json" % stem,
+        "markdown": "%s.md" % stem,
+    }, indent=2, sort_keys=True))
+    return 0 if summary["status"] == "complete" else 2
+
+
 def build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(description="ADS reference throughput benchmark CLI")
     subparsers = parser.add_subparsers(dest="command", required=True)
@@ -339,7 +1264,8 @@ def build_parser() -> argparse.ArgumentParser:
     )
     run_parser.add_argument("--extensions", default=DEFAULT_EXTENSIONS)
     run_parser.add_argument("--max-files", type=int, default=None)
-    run_parser.add_argument("--mode", choices=["real", "mock"], default="mock")
+    run_parser.add_argument("--mode", choices=["real", "mock", "local"], default="mock",
+                            help="real resolver, in-process mock, or the local HTTP stand-in (see --resolver-*)")
     run_parser.add_argument("--output-dir", default=None)
     run_parser.add_argument("--events-path", default=None)
     run_parser.add_argument("--timeout", type=int, default=900)
@@ -347,8 +1273,142 @@ def build_parser() -> argparse.ArgumentParser:
     run_parser.add_argument("--disable-system-load", action="store_true", default=False)
     run_parser.add_argument("--group-by", choices=["source_type", "parser", "none"], default="source_type")
     run_parser.add_argument("--no-warmup", dest="warmup", action="store_false")
+    run_parser.add_argument("--regex-profile", action="store_true", default=False, help="Record per-pattern regex timings (adds overhead)")
+    run_parser.add_argument("--process-pids", default="", help="Comma separated PIDs, ie Celery worker masters, sampled with their children")
+    run_parser.add_argument("--tracemalloc", action="store_true", default=False, help="Record the top allocation sites of each stage (adds overhead)")
+    run_parser.add_argument("--profile", action="store_true", default=False, help="Sample stacks per file and write collapsed-stack files for flamegraphs")
+    perf_resolver.add_profile_arguments(run_parser, prefix="resolver-")
     run_parser.set_defaults(warmup=True)
     run_parser.set_defaults(func=cmd_run)
+
+    startup_parser = subparsers.add_parser("startup", help="Measure parser startup with and without the compiled data file caches")
+    startup_parser.add_argument("--repeat", type=int, default=5)
+    startup_parser.add_argument("--output-dir", default=None)
+    startup_parser.set_defaults(func=cmd_startup)
+
+    importtime_parser = subparsers.add_parser("importtime", help="Report python -X importtime cold start for the worker and the CLI")
+    importtime_parser.add_argument("--repeat", type=int, default=3)
+    importtime_parser.add_argument("--top", type=int, default=15)
+    importtime_parser.add_argument("--output-dir", default=None)
+    importtime_parser.set_defaults(func=cmd_importtime)
+
+    cleanup_parser = subparsers.add_parser("cleanup", help="Verify and time the compiled cleanup chains against rule by rule application, per parser family")
+    cleanup_parser.add_argument(
+        "--input-path",
+        default=os.path.join(os.path.dirname(__file__), "tests", "unittests", "stubdata"),
+        help="Stubdata directory, with txt/ocr/tex/html subdirectories and xml files at the top",
+    )
+    cleanup_parser.add_argument("--repeat", type=int, default=5)
+    cleanup_parser.add_argument("--output-dir", default=None)
+    cleanup_parser.set_defaults(func=cmd_cleanup)
+
+    events_parser = subparsers.add_parser("events", help="Measure the per-event overhead of the perf event writer, direct vs buffered")
+    events_parser.add_argument("--events", type=int, default=5000)
+    events_parser.add_argument("--repeat", type=int, default=3)
+    events_parser.add_argument("--output-dir", default=None)
+    events_parser.set_defaults(func=cmd_events)
+
+    eventlog_parser = subparsers.add_parser("eventlog", help="Compare size and encode/decode time of JSONL and binary segment event logs")
+    eventlog_parser.add_argument("--events", type=int, default=30000, help="Number of synthetic events, when --events-path is not given")
+    eventlog_parser.add_argument("--events-path", default=None, help="Existing JSONL events file to convert instead of synthetic events")
+    eventlog_parser.add_argument("--repeat", type=int, default=3)
+    eventlog_parser.add_argument("--output-dir", default=None)
+    eventlog_parser.set_defaults(func=cmd_eventlog)
+
+    sweep_parser = subparsers.add_parser("sweep", help="Run the same files across a grid of parse workers, task concurrency and metrics settings")
+    sweep_parser.add_argument(
+        "--input-path",
+        default=os.path.join(os.path.dirname(__file__), "tests", "unittests", "stubdata"),
+        help="File or directory to benchmark",
+    )
+    sweep_parser.add_argument("--extensions", default=DEFAULT_EXTENSIONS)
+    sweep_parser.add_argument("--max-files", type=int, default=None)
+    sweep_parser.add_argument("--mode", choices=["real", "mock", "local"], default="mock",
+                              help="real resolver, in-process mock, or the local HTTP stand-in (see --resolver-*)")
+    sweep_parser.add_argument("--workers", type=_positive_int_list, default=[1, 2, 4], help="Parse worker processes, ie 1,2,4")
+    sweep_parser.add_argument("--task-concurrency", type=_positive_int_list, default=[1],
+                              help="Threads running the reference tasks of each worker, as many resolver calls in flight, ie 1,4,16")
+    sweep_parser.add_argument("--metrics", type=_metrics_list, default=["full"],
+                              help="full, minimal (file and enqueue events only), or both to measure the cost of the events")
+    sweep_parser.add_argument("--mock-resolver-latency-ms", type=float, default=0.0,
+                              help="Latency of each mocked resolver call, so that task concurrency has something to overlap")
+    sweep_parser.add_argument("--repeat", type=int, default=1, help="Runs per point, the median is reported")
+    sweep_parser.add_argument("--saturation", type=float, default=0.25,
+                              help="Marginal efficiency under which adding parallelism counts as saturated")
+    sweep_parser.add_argument("--output-dir", default=None)
+    sweep_parser.add_argument("--events-path", default=None)
+    sweep_parser.add_argument("--system-sample-interval", type=_sample_interval_arg, default=1.0)
+    sweep_parser.add_argument("--disable-system-load", action="store_true", default=False)
+    sweep_parser.add_argument("--no-warmup", dest="warmup", action="store_false")
+    perf_resolver.add_profile_arguments(sweep_parser, prefix="resolver-")
+    sweep_parser.set_defaults(warmup=True)
+    sweep_parser.set_defaults(func=cmd_sweep)
+
+    compare_parser = subparsers.add_parser("compare", help="Compare two run summaries and fail on regressions, for a pre-merge check")
+    compare_parser.add_argument("baseline", help="JSON summary of the baseline run")
+    compare_parser.add_argument("candidate", help="JSON summary of the candidate run")
+    compare_parser.add_argument("--threshold", type=_threshold_arg, default=10.0, help="Slowdown in percent flagged as a regression")
+    compare_parser.add_argument("--statistic", choices=sorted(perf_compare.STATISTICS), default="p50")
+    compare_parser.add_argument("--iterations", type=int, default=1000, help="Bootstrap resamples")
+    compare_parser.add_argument("--confidence", type=_confidence_arg, default=0.95)
+    compare_parser.add_argument("--min-samples", type=int, default=5, help="Fewer durations than this on either side get no interval")
+    compare_parser.add_argument("--seed", type=int, default=0)
+    compare_parser.add_argument("--allow-incomparable", action="store_true", default=False,
+                                help="Compare runs with different files, mode or warmup instead of exiting with 2")
+    compare_parser.add_argument("--output-dir", default=None)
+    compare_parser.set_defaults(func=cmd_compare)
+
+    corpus_parser = subparsers.add_parser("corpus", help="Write a synthetic corpus per parser family from the stubdata templates")
+    corpus_parser.add_argument("--output-dir", required=True, help="Directory the <scale>x/<family>/<journal>/<volume> tree and manifest.json go to")
+    corpus_parser.add_argument("--families", type=_families_arg, default=None, help="Comma separated parser families, all by default")
+    corpus_parser.add_argument("--files", type=int, default=1, help="Files per family and scale")
+    corpus_parser.add_argument("--blocks", type=int, default=10, help="Bibcode blocks per file")
+    corpus_parser.add_argument("--references", type=int, default=20, help="References per block at 1x")
+    corpus_parser.add_argument("--noise", type=float, default=0.0, help="Fraction of references given an OCR style defect")
+    corpus_parser.add_argument("--scales", type=_positive_int_list, default=[1], help="Comma separated multipliers of the references per block, e.g. 1,10,100")
+    corpus_parser.add_argument("--seed", type=int, default=0)
+    corpus_parser.set_defaults(func=cmd_corpus)
+
+    parsers_parser = subparsers.add_parser("parsers", help="Time every parser on the synthetic corpus at growing scales and check that parse time grows linearly")
+    parsers_parser.add_argument("--families", type=_families_arg, default=None, help="Comma separated corpus families, all by default")
+    parsers_parser.add_argument("--scales", type=_positive_int_list, default=[1, 10, 100], help="Comma separated multipliers of the references per block")
+    parsers_parser.add_argument("--blocks", type=int, default=2, help="Bibcode blocks per file")
+    parsers_parser.add_argument("--references", type=int, default=10, help="References per block at 1x")
+    parsers_parser.add_argument("--repeat", type=int, default=3, help="Runs per parser and scale, the best one is kept")
+    parsers_parser.add_argument("--max-exponent", type=float, default=1.35,
+                                help="Scaling exponent between the two largest scales above which a parser is superlinear")
+    parsers_parser.add_argument("--seed", type=int, default=0)
+    parsers_parser.add_argument("--baseline", default=None, help="Baseline written by --save-baseline to compare the references per second against")
+    parsers_parser.add_argument("--threshold", type=_threshold_arg, default=25.0, help="Drop in references per second, in percent, flagged as a regression")
+    parsers_parser.add_argument("--save-baseline", default=None, help="Write the references and bytes per second of this run as a baseline")
+    parsers_parser.add_argument("--corpus-dir", default=None, help="Keep the generated corpus here instead of a temporary directory")
+    parsers_parser.add_argument("--output-dir", default=None)
+    parsers_parser.set_defaults(func=cmd_parsers)
+
+    db_seed_parser = subparsers.add_parser("db-seed", help="Fill a scratch Postgres database with a synthetic dataset for the database benchmark")
+    db_seed_parser.add_argument("--db-url", required=True, help="SQLAlchemy URL of a scratch database, never the production one")
+    db_seed_parser.add_argument("--sources", type=int, default=100000, help="reference_source rows, the other tables follow from it")
+    db_seed_parser.add_argument("--retries", type=float, default=0.5, help="Mean number of retry runs per source file")
+    db_seed_parser.add_argument("--references", type=float, default=40.0, help="Median references per first run")
+    db_seed_parser.add_argument("--duplicates", type=float, default=0.3, help="Share of source files that are a second, arXiv, file of a bibcode")
+    db_seed_parser.add_argument("--compare", type=float, default=0.2, help="Share of runs with classic comparison rows")
+    db_seed_parser.add_argument("--failed", type=float, default=0.05, help="Share of references that failed to resolve")
+    db_seed_parser.add_argument("--unresolved", type=float, default=0.1, help="Share of references resolved with score 0")
+    db_seed_parser.add_argument("--days", type=int, default=730, help="Runs are dated over this many days")
+    db_seed_parser.add_argument("--seed", type=int, default=0)
+    db_seed_parser.add_argument("--chunk", type=int, default=20000, help="Runs per resolved_reference insert statement")
+    db_seed_parser.add_argument("--reset", action="store_true", default=False, help="Truncate the seeded pipeline tables first")
+    db_seed_parser.set_defaults(func=cmd_db_seed)
+
+    db_run_parser = subparsers.add_parser("db-run", help="Time every query and write method of the application against a seeded database, with query plans")
+    db_run_parser.add_argument("--db-url", required=True, help="SQLAlchemy URL of the seeded database")
+    db_run_parser.add_argument("--repeat", type=int, default=5, help="Calls per method")
+    db_run_parser.add_argument("--samples", type=int, default=5, help="Source files sampled as the inputs of the queries")
+    db_run_parser.add_argument("--references", type=int, default=40, help="References per run the write methods add")
+    db_run_parser.add_argument("--seed", type=int, default=0, help="Seed of the input sample")
+    db_run_parser.add_argument("--no-explain", action="store_true", default=False, help="Skip EXPLAIN (ANALYZE, BUFFERS) of the statements")
+    db_run_parser.add_argument("--output-dir", default=None)
+    db_run_parser.set_defaults(func=cmd_db_run)
     return parser
 
 
@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 
 
-from sqlalchemy import Integer, String, Column, ForeignKey, DateTime, func, Numeric, ForeignKeyConstraint
+from sqlalchemy import Integer, BigInteger, Boolean, String, Column, ForeignKey, DateTime, func, Numeric, ForeignKeyConstraint, Index, text
 from sqlalchemy.dialects.postgresql import JSONB, ARRAY
 from sqlalchemy.ext.declarative import declarative_base
 
@@ -158,7 +158,8 @@ class ProcessedHistory(Base):
     reference file timestamp, and the total number of references parsed.
     """
     __tablename__ = 'processed_history'
-    __table_args__ = (ForeignKeyConstraint( ['bibcode', 'source_filename'], ['reference_source.bibcode', 'reference_source.source_filename']),)
+    __table_args__ = (ForeignKeyConstraint( ['bibcode', 'source_filename'], ['reference_source.bibcode', 'reference_source.source_filename']),
+                      Index('ix_processed_history_bibcode_source_filename', 'bibcode', 'source_filename'))
     id = Column(Integer, primary_key=True)
     bibcode = Column(String)
     source_filename = Column(String)
@@ -308,3 +309,188 @@ class CompareClassic(Base):
             'score': self.score,
             'state': self.state,
         }
+
+
+class BestResolvedReference(Base):
+    """
+    This table keeps the highest scored resolved bibcode of each parser for every source bibcode, so that the
+    resolved references of a source bibcode are served from it instead of ranking its whole history on each query.
+    It is kept up to date when the resolved references are written, see populate_tables_post_resolved.
+    """
+    __tablename__ = 'best_resolved_reference'
+    source_bibcode = Column(String, primary_key=True)
+    parser_name = Column(String, primary_key=True)
+    resolved_bibcode = Column(String, primary_key=True)
+    history_id = Column(Integer, ForeignKey('processed_history.id'))
+    item_num = Column(Integer)
+    score = Column(Numeric)
+    parser_priority = Column(Integer)
+    date = Column(DateTime, index=True)
+
+    def __init__(self, source_bibcode: str, parser_name: str, resolved_bibcode: str, history_id: int, item_num: int,
+                 score: float, parser_priority: int, date: DateTime):
+        """
+        initializes a best resolved reference object
+
+        :param source_bibcode: bibcode of the reference source
+        :param parser_name: name of the parser that read the source file
+        :param resolved_bibcode: resolved bibcode
+        :param history_id: ID of the processed history entry the highest score came from
+        :param item_num: order of the reference within the source
+        :param score: highest confidence score of this resolved bibcode with this parser
+        :param parser_priority: rank of the parser when the same bibcode is resolved from several sources, higher wins
+        :param date: date of the processed history entry
+        """
+        self.source_bibcode = source_bibcode
+        self.parser_name = parser_name
+        self.resolved_bibcode = resolved_bibcode
+        self.history_id = history_id
+        self.item_num = item_num
+        self.score = score
+        self.parser_priority = parser_priority
+        self.date = date
+
+    def toJSON(self) -> dict:
+        """
+        converts the best resolved reference object to a JSON dictionary
+
+        :return: dictionary containing best resolved reference details
+        """
+        return {
+            'source_bibcode': self.source_bibcode,
+            'parser_name': self.parser_name,
+            'resolved_bibcode': self.resolved_bibcode,
+            'history_id': self.history_id,
+            'item_num': self.item_num,
+            'score': self.score,
+            'parser_priority': self.parser_priority,
+            'date': self.date,
+        }
+
+
+class ResolutionChange(Base):
+    """
+    This table is an append-only log of the changes to the resolved references, one row for each reference whose bibcode
+    or score differs from its previous resolution when the resolved references are written, so that downstream can pick
+    up only what changed since the last change it read.
+    """
+    __tablename__ = 'resolution_change'
+    __table_args__ = (Index('ix_resolution_change_txid_id', 'txid', 'id'),)
+    id = Column(Integer, primary_key=True)
+    history_id = Column(Integer, ForeignKey('processed_history.id'))
+    item_num = Column(Integer)
+    old_bibcode = Column(String)
+    new_bibcode = Column(String)
+    score = Column(Numeric)
+    ts = Column(DateTime, default=func.now())
+    # the transaction that wrote the change, the changes are read in transaction order once their transaction has finished
+    txid = Column(BigInteger, server_default=text('txid_current()'))
+
+    def __init__(self, history_id: int, item_num: int, old_bibcode: str, new_bibcode: str, score: float, ts: DateTime):
+        """
+        initializes a resolution change object
+
+        :param history_id: ID of the related processed history entry
+        :param item_num: order of the reference within the source
+        :param old_bibcode: bibcode before the change
+        :param new_bibcode: bibcode after the change
+        :param score: confidence score after the change
+        :param ts: date of the change
+        """
+        self.history_id = history_id
+        self.item_num = item_num
+        self.old_bibcode = old_bibcode
+        self.new_bibcode = new_bibcode
+        self.score = score
+        self.ts = ts
+
+    def toJSON(self) -> dict:
+        """
+        converts the resolution change object to a JSON dictionary
+
+        :return: dictionary containing resolution change details
+        """
+        return {
+            'id': self.id,
+            'history_id': self.history_id,
+            'item_num': self.item_num,
+            'old_bibcode': self.old_bibcode,
+            'new_bibcode': self.new_bibcode,
+            'score': self.score,
+            'ts': self.ts,
+            'txid': self.txid,
+        }
+
+
+class TableStatistics(Base):
+    """
+    This table holds the number of rows of the main tables, so that they are not counted on each request. A count is
+    either exact, counted by `STATS -c --exact` and then kept up to date with the rows of `table_count_delta` if so
+    configured, or an estimate from the postgres statistics, that is reused for a while.
+    """
+    __tablename__ = 'table_statistics'
+    table_name = Column(String, primary_key=True)
+    count = Column(BigInteger)
+    exact = Column(Boolean)
+    updated = Column(DateTime)
+
+    def __init__(self, table_name: str, count: int, exact: bool, updated: DateTime):
+        """
+        initializes a table statistics object
+
+        :param table_name: name of the counted table
+        :param count: number of rows
+        :param exact: True if counted, False if estimated
+        :param updated: date the count was taken or last kept up to date
+        """
+        self.table_name = table_name
+        self.count = count
+        self.exact = exact
+        self.updated = updated
+
+    def toJSON(self) -> dict:
+        """
+        converts the table statistics object to a JSON dictionary
+
+        :return: dictionary containing table statistics details
+        """
+        return {
+            'table_name': self.table_name,
+            'count': self.count,
+            'exact': self.exact,
+            'updated': self.updated,
+        }
+
+
+class TableCountDelta(Base):
+    """
+    This table is an append-only list of the rows each write added to, or deleted from, one of the main tables, so that
+    concurrent writers do not update the same row of `table_statistics`. The deltas are added to the exact counts, and
+    removed, when the counts are read.
+    """
+    __tablename__ = 'table_count_delta'
+    id = Column(BigInteger, primary_key=True)
+    table_name = Column(String, index=True)
+    delta = Column(BigInteger)
+
+    def __init__(self, table_name: str, delta: int):
+        """
+        initializes a table count delta object
+
+        :param table_name: name of the table written to
+        :param delta: number of rows inserted, negative for rows deleted
+        """
+        self.table_name = table_name
+        self.delta = delta
+
+    def toJSON(self) -> dict:
+        """
+        converts the table count delta object to a JSON dictionary
+
+        :return: dictionary containing table count delta details
+        """
+        return {
+            'id': self.id,
+            'table_name': self.table_name,
+            'delta': self.delta,
+        }
@@ -0,0 +1,277 @@
+"""Comparison of two benchmark run summaries with bootstrap confidence intervals.
+
+Stdlib-only. ``compare_summaries`` first checks that the runs measured the
+same thing (the same files, mode and warmup), then compares a statistic of
+the durations of every stage, and of the record wall and parse times of every
+parser, between a baseline and a candidate run. The relative delta of each
+comes with a percentile bootstrap confidence interval, computed from the
+duration samples (``duration_samples_ms``) that the summary of a run keeps.
+
+A row is a regression when the candidate is slower by more than the threshold
+and the whole interval is above zero, so that noise alone does not fail a
+comparison. Summaries without duration samples, from before they were kept,
+are compared on the point statistic only and never flagged. Sampled runs are
+only compared when their duration samples leave out the errors and slow
+events kept outside of the record sample.
+"""
+
+from __future__ import annotations
+
+import os
+import random
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from adsrefpipe.perf_metrics import percentile
+
+
+def _quantile(values: List[float], pct: float) -> Optional[float]:
+    # percentile without its float conversion, the bootstrap calls it twice per resample
+    if not values:
+        return None
+    data = sorted(values)
+    index = (len(data) - 1) * (pct / 100.0)
+    lower = int(index)
+    upper = min(lower + 1, len(data) - 1)
+    return data[lower] + (data[upper] - data[lower]) * (index - lower)
+
+
+STATISTICS: Dict[str, Callable[[List[float]], Optional[float]]] = {
+    "mean": lambda values: sum(values) / float(len(values)) if values else None,
+    "p50": lambda values: _quantile(values, 50),
+    "p95": lambda values: _quantile(values, 95),
+}
+
+# run options that change the timings, a difference is reported but does not stop the comparison
+_OVERHEAD_OPTIONS = ("regex_profile", "tracemalloc", "profile")
+
+
+def _relative_files(summary: Dict[str, Any]) -> List[str]:
+    metadata = summary.get("run_metadata") or {}
+    input_path = metadata.get("input_path") or ""
+    files = summary.get("selected_files") or []
+    # the runs can come from two checkouts, the files are the same relative to the input path or its directory
+    root = os.path.dirname(input_path) if input_path in files else input_path
+    return sorted(os.path.relpath(path, root) if root else path for path in files)
+
+
+def check_comparable(baseline: Dict[str, Any], candidate: Dict[str, Any]) -> Tuple[List[str], List[str]]:
+    problems, warnings = [], []
+    base_meta, cand_meta = baseline.get("run_metadata") or {}, candidate.get("run_metadata") or {}
+    base_files, cand_files = _relative_files(baseline), _relative_files(candidate)
+    if base_files != cand_files:
+        missing, added = sorted(set(base_files) - set(cand_files)), sorted(set(cand_files) - set(base_files))
+        problems.append("selected files differ: %d only in baseline, %d only in candidate" % (len(missing), len(added)))
+    for option in ("mode", "warmup"):
+        if base_meta.get(option) != cand_meta.get(option):
+            problems.append("%s differs: %r vs %r" % (option, base_meta.get(option), cand_meta.get(option)))
+    for summary, label in ((baseline, "baseline"), (candidate, "candidate")):
+        if summary.get("status") != "complete":
+            problems.append("%s run is %s" % (label, summary.get("status")))
+    for option in _OVERHEAD_OPTIONS:
+        if bool(base_meta.get(option)) != bool(cand_meta.get(option)):
+            warnings.append("%s differs: %r vs %r, it adds overhead to one run only" % (option, base_meta.get(option), cand_meta.get(option)))
+    for summary, label in ((baseline, "baseline"), (candidate, "candidate")):
+        # the duration samples of older sampled runs also hold the errors and slow events kept for every record
+        if (summary.get("sampling") or {}).get("extrapolated") and not (summary.get("duration_samples_ms") or {}).get("record_sample"):
+            problems.append("%s run is sampled and its duration samples are skewed by the kept errors and slow events" % label)
+    base_sampling = (baseline.get("sampling") or {}).get("settings")
+    cand_sampling = (candidate.get("sampling") or {}).get("settings")
+    if base_sampling != cand_sampling:
+        warnings.append("event sampling settings differ")
+    if base_meta.get("git_commit") and base_meta.get("git_commit") == cand_meta.get("git_commit"):
+        warnings.append("both runs are from commit %s" % base_meta.get("git_commit"))
+    return problems, warnings
+
+
+def bootstrap_delta(
+    baseline: List[float],
+    candidate: List[float],
+    statistic: str = "p50",
+    iterations: int = 1000,
+    confidence: float = 0.95,
+    rng: Optional[random.Random] = None,
+) -> Dict[str, Any]:
+    compute = STATISTICS[statistic]
+    rng = rng or random.Random(0)
+    base_value, cand_value = compute(baseline), compute(candidate)
+    deltas = []
+    for _ in range(iterations):
+        base_sample = compute(rng.choices(baseline, k=len(baseline)))
+        cand_sample = compute(rng.choices(candidate, k=len(candidate)))
+        if base_sample:
+            deltas.append(cand_sample / base_sample - 1.0)
+    tail = (1.0 - confidence) * 50.0
+    return {
+        "baseline": base_value,
+        "candidate": cand_value,
+        "delta": (cand_value / base_value - 1.0) if base_value else None,
+        "ci_low": percentile(deltas, tail),
+        "ci_high": percentile(deltas, 100.0 - tail),
+        "baseline_n": len(baseline),
+        "candidate_n": len(candidate),
+    }
+
+
+def _status(row: Dict[str, Any], threshold: float) -> str:
+    delta, low, high = row.get("delta"), row.get("ci_low"), row.get("ci_high")
+    if delta is None:
+        return "no_data"
+    if low is None or high is None:
+        return "no_ci"
+    if delta > threshold and low > 0:
+        return "regression"
+    if delta < -threshold and high < 0:
+        return "improvement"
+    return "ok"
+
+
+def _compare_samples(
+    base_values: Optional[List[float]],
+    cand_values: Optional[List[float]],
+    base_point: Optional[float],
+    cand_point: Optional[float],
+    settings: Dict[str, Any],
+    rng: random.Random,
+) -> Dict[str, Any]:
+    if base_values and cand_values and min(len(base_values), len(cand_values)) >= settings["min_samples"]:
+        row = bootstrap_delta(base_values, cand_values, statistic=settings["statistic"],
+                              iterations=settings["iterations"], confidence=settings["confidence"], rng=rng)
+    else:
+        # too few samples for an interval, or an older summary without them
+        row = {
+            "baseline": base_point,
+            "candidate": cand_point,
+            "delta": (cand_point / base_point - 1.0) if base_point and cand_point is not None else None,
+            "ci_low": None,
+            "ci_high": None,
+            "baseline_n": len(base_values or []),
+            "candidate_n": len(cand_values or []),
+        }
+    row["status"] = _status(row, settings["threshold"])
+    return row
+
+
+def compare_summaries(
+    baseline: Dict[str, Any],
+    candidate: Dict[str, Any],
+    threshold: float = 0.10,
+    statistic: str = "p50",
+    iterations: int = 1000,
+    confidence: float = 0.95,
+    min_samples: int = 5,
+    seed: int = 0,
+) -> Dict[str, Any]:
+    if statistic not in STATISTICS:
+        raise ValueError("unknown statistic %r, expected one of %s" % (statistic, ", ".join(sorted(STATISTICS))))
+    problems, warnings = check_comparable(baseline, candidate)
+    settings = {
+        "threshold": threshold,
+        "statistic": statistic,
+        "iterations": iterations,
+        "confidence": confidence,
+        "min_samples": min_samples,
+    }
+    rng = random.Random(seed)
+    base_samples = baseline.get("duration_samples_ms") or {}
+    cand_samples = candidate.get("duration_samples_ms") or {}
+    if not base_samples or not cand_samples:
+        warnings.append("a summary has no duration samples, deltas have no confidence interval")
+
+    stages = {}
+    base_latency, cand_latency = baseline.get("latency_ms") or {}, candidate.get("latency_ms") or {}
+    for stage in sorted(set(base_latency) & set(cand_latency)):
+        stages[stage] = _compare_samples(
+            (base_samples.get("stages") or {}).get(stage),
+            (cand_samples.get("stages") or {}).get(stage),
+            base_latency[stage].get(statistic),
+            cand_latency[stage].get(statistic),
+            settings,
+            rng,
+        )
+
+    parsers = {}
+    base_parsers, cand_parsers = baseline.get("parser_breakdown") or {}, candidate.get("parser_breakdown") or {}
+    for parser_name in sorted(set(base_parsers) & set(cand_parsers)):
+        for metric in ("wall_time_ms", "parse_stage_ms"):
+            base_point = (base_parsers[parser_name].get(metric) or {}).get(statistic)
+            cand_point = (cand_parsers[parser_name].get(metric) or {}).get(statistic)
+            base_values = ((base_samples.get("parsers") or {}).get(parser_name) or {}).get(metric)
+            cand_values = ((cand_samples.get("parsers") or {}).get(parser_name) or {}).get(metric)
+            if base_point is None and cand_point is None:
+                continue
+            parsers["%s|%s" % (parser_name, metric)] = dict(
+                _compare_samples(base_values, cand_values, base_point, cand_point, settings, rng),
+                parser_name=parser_name,
+                metric=metric,
+            )
+
+    # one value per run, reported but not gated on
+    base_throughput = (baseline.get("throughput") or {}).get("overall_records_per_minute")
+    cand_throughput = (candidate.get("throughput") or {}).get("overall_records_per_minute")
+    regressions = ["stage %s" % name for name, row in stages.items() if row["status"] == "regression"]
+    regressions += ["parser %s" % name for name, row in parsers.items() if row["status"] == "regression"]
+    return {
+        "baseline_run_id": (baseline.get("run_metadata") or {}).get("run_id"),
+        "candidate_run_id": (candidate.get("run_metadata") or {}).get("run_id"),
+        "comparable": not problems,
+        "problems": problems,
+        "warnings": warnings,
+        "settings": dict(settings, seed=seed),
+        "throughput": {
+            "baseline": base_throughput,
+            "candidate": cand_throughput,
+            "delta": (cand_throughput / base_throughput - 1.0) if base_throughput and cand_throughput is not None else None,
+        },
+        "stages": stages,
+        "parsers": parsers,
+        "regressions": regressions,
+        "improvements": sorted(
+            ["stage %s" % name for name, row in stages.items() if row["status"] == "improvement"]
+            + ["parser %s" % name for name, row in parsers.items() if row["status"] == "improvement"]
+        ),
+    }
+
+
+def _pct(value: Optional[float]) -> str:
+    return "" if value is None else "%+.1f" % (value * 100.0)
+
+
+def _ms(value: Optional[float]) -> str:
+    return "" if value is None else "%.2f" % value
+
+
+def _row_cells(row: Dict[str, Any]) -> str:
+    interval = "" if row.get("ci_low") is None else "%s to %s" % (_pct(row["ci_low"]), _pct(row["ci_high"]))
+    return "%s | %s | %s | %s | %s/%s | %s" % (
+        _ms(row.get("baseline")), _ms(row.get("candidate")), _pct(row.get("delta")), interval,
+        row.get("baseline_n"), row.get("candidate_n"), row["status"],
+    )
+
+
+def render_comparison_markdown(result: Dict[str, Any], output_path: str) -> None:
+    settings = result["settings"]
+    lines = [
+        "# ADS Reference Benchmark Comparison",
+        "",
+        "- Baseline run: `%s`" % result.get("baseline_run_id"),
+        "- Candidate run: `%s`" % result.get("candidate_run_id"),
+        "- Comparable: `%s`" % result["comparable"],
+        "- Statistic: `%s`, threshold %.1f%%, %d%% bootstrap interval over %d resamples" % (
+            settings["statistic"], settings["threshold"] * 100.0, round(settings["confidence"] * 100.0), settings["iterations"]),
+        "- Throughput (records/min): %s -> %s (%s%%)" % (
+            _ms(result["throughput"]["baseline"]), _ms(result["throughput"]["candidate"]), _pct(result["throughput"]["delta"])),
+        "",
+    ]
+    for title, items in (("Problems", result["problems"]), ("Warnings", result["warnings"]), ("Regressions", result["regressions"])):
+        if items:
+            lines.extend(["## %s" % title, ""] + ["- %s" % item for item in items] + [""])
+    header = "Baseline ms | Candidate ms | Delta % | CI % | N | Status |"
+    lines.extend(["## Stages", "", "| Stage | %s" % header, "|---|---:|---:|---:|---:|---:|---|"])
+    for stage, row in result["stages"].items():
+        lines.append("| %s | %s |" % (stage, _row_cells(row)))
+    lines.extend(["", "## Parsers", "", "| Parser | Metric | %s" % header, "|---|---|---:|---:|---:|---:|---:|---|"])
+    for row in result["parsers"].values():
+        lines.append("| %s | %s | %s |" % (row["parser_name"], row["metric"], _row_cells(row)))
+    lines.append("")
+    with open(output_path, "w") as handle:
+        handle.write("\n".join(lines))
@@ -0,0 +1,344 @@
+"""Synthetic reference corpus for scale testing the parsers.
+
+Stdlib-only. The stubdata files are a few hundred short inputs, too small to
+show how a parser behaves as a block grows. ``generate_corpus`` takes one
+stubdata file per parser family as a template and writes inputs of a chosen
+size: the template is cut into its blocks (one per source bibcode, found with
+the same markers the parsers use: ``%R``, ``<ADSBIBCODE>``, ``\\adsbibcode``
+and ``bibcode="``) and each block into its references, then every generated
+block gets a new bibcode and references drawn from the pool of the template.
+
+The files are laid out as ``<scale>x/<family>/<journal>/<volume>/<file>``,
+with the journal, volume and extension that ``app.get_parser`` maps to the
+parser of the family, so that ``benchmark run --input-path <out>/10x`` runs
+them through the pipeline. Each scale multiplies the references per block,
+the manifest records the blocks, references and bytes of every file.
+
+Noise is applied to a share of the references: doubled spaces, an upper case
+word, OCR confusable characters, and for the families that accept them,
+references wrapped over an indented continuation line. Markup is left intact.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import random
+import re
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+STUBDATA_DIR = os.path.join(os.path.dirname(__file__), "tests", "unittests", "stubdata")
+DATA_FILES_DIR = os.path.join(os.path.dirname(__file__), "refparsers", "data_files")
+
+# a reference is a line that does not start with white space or %, and its indented continuation lines
+_TEXT_ITEM = r"^[^\s%].*?(?=\n[^\s%]|\Z)"
+_TAGGED_START = r"^%Z\s*"
+
+
+def _xml_item(tag: str) -> str:
+    # the tag each parser cuts its blocks with, see the parser XMLtoREFs.__init__ calls
+    return r"<(?:%s)[\s>].*?</(?:%s)\s*>" % (tag, tag)
+
+
+# template, parser, and the journal/volume/extension get_parser maps to that parser
+FAMILIES: Dict[str, Dict[str, Any]] = {
+    "adstxt": {"template": "txt/ADS/0/0000ADSTEST.0.....Z.raw", "parser": "ADStxt",
+               "journal": "A+ARv", "volume": "2000", "extension": ".raw", "item": _TEXT_ITEM, "after": _TAGGED_START},
+    "arxiv": {"template": "txt/arXiv/0/00000.raw", "parser": "arXiv",
+              "journal": "arXiv", "volume": "2000", "extension": ".raw", "item": _TEXT_ITEM, "after": _TAGGED_START},
+    "threebibs": {"template": "txt/AnRFM/0/0000ADSTEST.0.....Z.ref.raw", "parser": "ThreeBibsTxt",
+                  "journal": "AnRFM", "volume": "35", "extension": ".ref.raw", "item": _TEXT_ITEM, "after": _TAGGED_START},
+    "pairs": {"template": "txt/ATel/0/0000.pairs", "parser": "PairsTXTE3",
+              "journal": "ATel", "volume": "2003", "extension": ".atel.pairs", "pairs": True},
+    "ocr": {"template": "ocr/ADS/0/0000ADSTEST.0.....Z.ref.ocr.txt", "parser": "ADSocr",
+            "journal": "A&A", "volume": "100", "extension": ".ref.ocr.txt", "item": _TEXT_ITEM,
+            "single": True, "wrap": True},
+    "tex": {"template": "tex/ADS/0/iss0.tex", "parser": "ADStex",
+            "journal": "A+AS", "volume": "100", "extension": ".raw", "item": r"\\\\bibitem.*?(?=\\\\bibitem|\Z)", "after": _TAGGED_START, "wrap": True,
+            # the second half of the template is in the \adsbibcode format, the first one is enough
+            "until": r"\\adsbibcode\{"},
+    "html": {"template": "html/A+A/0/0000A&A.....0.....Z.ref.txt", "parser": "AnAhtml",
+             "journal": "A+A", "volume": "400", "extension": ".ref.txt", "item": r"(?i)<LI>.*?(?=<LI>|</UL>)",
+             "single": True, "wrap": True},
+    "pasp": {"template": "html/PASP/0/iss0.raw", "parser": "PASPhtml",
+             "journal": "PASP", "volume": "122", "extension": ".raw", "item": _xml_item("CITATION"), "wrap": True},
+    "aas": {"template": "test.aas.raw", "parser": "AAS", "journal": "ApJ", "volume": "600", "extension": ".raw",
+            "item": _xml_item("CITATION"), "wrap": True},
+    "icarus": {"template": "test.icarus.raw", "parser": "ICARUS", "journal": "Icar", "volume": "200", "extension": ".raw",
+               "item": _xml_item("CITATION"), "wrap": True},
+    "ana": {"template": "test.ana.xml", "parser": "AnA", "journal": "A+A", "volume": "400", "extension": ".xml",
+            "item": _xml_item("bibliomixed"), "wrap": True},
+    "pasa": {"template": "test.pasa.xml", "parser": "PASA", "journal": "PASA", "volume": "27", "extension": ".xml",
+             "item": _xml_item("ref"), "wrap": True},
+    "pthph": {"template": "txt/PThPh/0/iss0.raw", "parser": "PThPhTXT", "journal": "PThPh", "volume": "128", "extension": ".raw",
+              "item": _TEXT_ITEM, "after": _TAGGED_START},
+    "obsocr": {"template": "ocr/Obs/0/0000ObsTEST.0.....Z.ref.ocr.txt", "parser": "ObsOCR", "journal": "Obs", "volume": "100",
+               "extension": ".ocr.txt", "item": _TEXT_ITEM, "single": True, "wrap": True},
+    # the parser reads the items followed by another one, the last one of the template is left in the suffix
+    "anas": {"template": "html/A+AS/0/0000A&AS....0.....Z.ref.txt", "parser": "AnAShtml", "journal": "A+AS", "volume": "121",
+             "extension": ".txt", "item": r"(?i)<LI>.*?(?=<LI>)", "single": True, "wrap": True},
+    # the bibcode is taken from the citation in the page, every block gets the one of the template
+    "aedrv": {"template": "html/AEdRv/0/0000.html", "parser": "AEdRvHTML", "journal": "AEdRv", "volume": "5", "extension": ".html",
+              "item": r'<p class="reference">.*?</p>', "exclude": r'in preparation|"refauth"></span>\s*</p>', "single": True, "wrap": True},
+    # the Annual Review pages, the bibcode is looked up from the DOI of the page, see perf_parsers.offline_lookups
+    "arana": {"template": "html/ARA+A/0/annurev.astro.00.html", "parser": "ARAnAhtml", "journal": "ARA+A", "volume": "44",
+              "extension": ".html", "item": r'<tr><td class="refnumber">.*?</td></tr>', "single": True, "wrap": True,
+              "doi_lookup": True},
+    "anrfm": {"template": "html/AnRFM/0/annurev.fluid.00.html", "parser": "AnRFMhtml", "journal": "AnRFM", "volume": "38",
+              "extension": ".html", "item": r'<tr><td class="refnumber">.*?</td></tr>', "single": True, "wrap": True,
+              "doi_lookup": True},
+    "areps": {"template": "html/AREPS/0/0000AREPS...0.....Z.refs.html", "parser": "AREPShtml", "journal": "AREPS", "volume": "30",
+              "extension": ".html", "item": r"<TR><TD[^<]*<A NAME=.*?</TR>", "single": True, "wrap": True},
+    "jlven": {"template": "html/JLVEn/0/0000JLVEn...0.....Z.raw", "parser": "JLVEnHTML", "journal": "JLVEn", "volume": "28",
+              "extension": ".raw", "item": r'<TR><TD valign="top">\(\d+\).*?</TD>', "single": True, "wrap": True},
+    "pasj": {"template": "html/PASJ/0/iss0.raw", "parser": "PASJhtml", "journal": "PASJ", "volume": "52", "extension": ".raw",
+             "item": r"(?i)<P>\s*\*&nbsp;.*?(?=\s*<P>)", "wrap": True},
+    # MNRAS is the parser name of the extension, for the Blackwell parser class
+    "blackwell": {"template": "test.blackwell.xml", "parser": "MNRAS", "journal": "MNRAS", "volume": "1", "extension": ".wiley.xml",
+                  "item": _xml_item("bb|reference"), "wrap": True},
+    # one reference per line, the parser closes the ref elements itself
+    "versita": {"template": "test.versita.xml", "parser": "VERSITA", "journal": "OPhy", "volume": "1", "extension": ".versita.xml",
+                "item": r"^[ \t]*<(?:ref|label)\b[^\n]*"},
+    # the bibcode is the one of the review the file is named after, the files are named after the reviews of LRR.dat
+    "living": {"template": "lrr-2014-6.living.xml", "parser": "LivingReviews", "journal": "LRR", "volume": "17",
+               "extension": ".living.xml", "item": _xml_item("refdb:record"), "single": True, "wrap": True,
+               "names": "living_reviews"},
+}
+
+# the publishers with an extension of their own, get_parser finds them by the extension alone
+for _name, _parser, _tag in (
+    ("agu", "AGU", "citation"), ("aip", "AIP", "ref|refitem"), ("aps", "APS", "ref|refitem"),
+    ("cup", "CUP", "citation"), ("edp", "EDP", "bibliomixed"), ("egu", "EGU", "reference"),
+    ("elsevier", "ELSEVIER", "ce:bib-reference"), ("iop", "IOP", "reference"), ("iopft", "IOPFT", "ref"),
+    ("ipap", "IPAP", "BibUnstructured"), ("jats", "JATS", "mixed-citation"), ("jst", "JSTAGE", "Citation"),
+    ("mdpi", "MDPI", "ref"), ("meta", "ONCP", "bibtext"), ("nature", "NATURE", "reftxt|REFTXT"),
+    ("nlm3", "NLM", "ref"), ("oup", "OUP", "ref"), ("rsc", "RSC", "citgroup"), ("spie", "SPIE", "ref"),
+    ("springer", "SPRINGER", "Citation"), ("ucp", "UCP", "ref"),
+    ("wiley2", "WILEY", "citation"), ("xref", "CrossRef", "citation"),
+):
+    FAMILIES[_name] = {"template": "test.%s.xml" % _name, "parser": _parser, "journal": _parser[:5], "volume": "1",
+                       "extension": ".%s.xml" % _name, "item": _xml_item(_tag), "wrap": True}
+
+# the block markers of toREFs.format_pattern, in the order the parsers try them
+_MARKERS = (
+    re.compile(r"<ADSBIBCODE>(?P<bibcode>.*?)</ADSBIBCODE>\s*"),
+    re.compile(r"\\adsbibcode\{(?P<bibcode>.*?)\}\s*"),
+    re.compile(r"(((^|\n)\%R\s+)|(\sbibcode=\"))(?P<bibcode>\S{18,19})[\s+\"]"),
+)
+
+def _living_reviews_names() -> List[str]:
+    # lrr-1998-3 for the line `1998LRR.....1....3R\t10.12942/lrr-1998-3`
+    with open(os.path.join(DATA_FILES_DIR, "LRR.dat")) as handle:
+        return [line.split()[-1].rsplit("/", 1)[-1] for line in handle if line.strip()]
+
+
+# the file names of the families whose parser takes the bibcode from the file name
+_NAMES = {"living_reviews": _living_reviews_names}
+
+_MARKUP = re.compile(r"<[^>]*>|&[#\w]+;")
+_CONFUSABLE = {"l": "1", "1": "l", "O": "0", "0": "O", "S": "5", "rn": "m"}
+
+
+def synthetic_bibcode(journal: str, volume: str, serial: int) -> str:
+    if not 0 <= serial < 1000000:
+        raise ValueError("a family holds at most 1000000 synthetic blocks")
+    page = serial % 10000
+    return "%04d%s%s.%sS" % (2000 + serial // 10000, journal[:5].ljust(5, "."), str(volume)[-4:].rjust(4, "."), str(page).rjust(4, "."))
+
+
+def _read(path: str) -> str:
+    # the templates are not all utf-8, surrogateescape writes back the bytes that were read
+    with open(path, encoding="utf-8", errors="surrogateescape") as handle:
+        return handle.read()
+
+
+def split_blocks(text: str) -> Tuple[str, List[Tuple[str, str, str]]]:
+    """The preamble and the (marker, bibcode, body) blocks of a file, one block without a marker when it has none."""
+    for marker in _MARKERS:
+        matches = list(marker.finditer(text))
+        if matches:
+            blocks = []
+            for match, following in zip(matches, matches[1:] + [None]):
+                body = text[match.end():following.start() if following else len(text)]
+                blocks.append((match.group(0), match.group("bibcode"), body))
+            return text[:matches[0].start()], blocks
+    return "", [("", "", text)]
+
+
+def split_items(body: str, item: str, after: Optional[str] = None) -> Tuple[str, List[str], str]:
+    """The text before the first reference of a block, the references, and the text after the last one."""
+    head = ""
+    if after:
+        # the references of a tagged block follow its %Z line, the header lines before it are not references
+        match = re.search(after, body, re.M)
+        if not match:
+            return body, [], ""
+        head, body = body[:match.end()], body[match.end():]
+        if not head.endswith("\n"):
+            # a reference on the %Z line itself moves to a line of its own
+            head = head.rstrip() + "\n"
+    spans = []
+    for match in re.finditer(item, body, re.M | re.S):
+        value = match.group(0).rstrip()
+        if value:
+            spans.append((match.start(), match.start() + len(value)))
+    if not spans:
+        return head + body, [], ""
+    return head + body[:spans[0][0]], [body[start:end] for start, end in spans], body[spans[-1][1]:]
+
+
+def _outside_markup(text: str) -> List[Tuple[int, int]]:
+    spans, position = [], 0
+    for match in _MARKUP.finditer(text):
+        if match.start() > position:
+            spans.append((position, match.start()))
+        position = match.end()
+    if position < len(text):
+        spans.append((position, len(text)))
+    return spans
+
+
+def add_noise(reference: str, rng: random.Random, wrap: bool = False) -> str:
+    """One perturbation of the text of a reference, outside of any markup and of its first word."""
+    # the first word is left alone, it is the number or the author that tells the parsers a reference starts
+    lead = len(reference.split(None, 1)[0]) if reference.strip() else 0
+    spans = [(max(start, lead), end) for start, end in _outside_markup(reference) if end > lead]
+    spaces = [index for start, end in spans for index in range(start, end) if reference[index] == " "]
+    kinds = ["case", "confusable"] + (["spacing"] if spaces else []) + (["wrap"] if wrap and spaces else [])
+    kind = rng.choice(kinds)
+    if kind == "spacing":
+        index = rng.choice(spaces)
+        return reference[:index] + " " * rng.randint(2, 4) + reference[index + 1:]
+    if kind == "wrap":
+        index = rng.choice(spaces)
+        return reference[:index] + "\n" + " " * rng.randint(2, 6) + reference[index + 1:]
+    if kind == "case":
+        words = [(start + match.start(), start + match.end()) for start, end in spans
+                 for match in re.finditer(r"[A-Za-z]{3,}", reference[start:end])]
+        if words:
+            begin, finish = rng.choice(words)
+            return reference[:begin] + reference[begin:finish].upper() + reference[finish:]
+        return reference
+    candidates = [(start + match.start(), start + match.end(), match.group(0)) for start, end in spans
+                  for match in re.finditer("|".join(_CONFUSABLE), reference[start:end])]
+    if candidates:
+        begin, finish, value = rng.choice(candidates)
+        return reference[:begin] + _CONFUSABLE[value] + reference[finish:]
+    return reference
+
+
+def _draw(pool: List[str], count: int, noise: float, rng: random.Random, wrap: bool) -> List[str]:
+    references = []
+    for _ in range(count):
+        reference = rng.choice(pool)
+        if noise and rng.random() < noise:
+            reference = add_noise(reference, rng, wrap=wrap)
+        references.append(reference)
+    return references
+
+
+def _write(path: str, text: str) -> int:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8", errors="surrogateescape") as handle:
+        handle.write(text)
+    return os.path.getsize(path)
+
+
+def _pairs_files(family: Dict[str, Any], text: str, files: int, blocks: int, references: int,
+                 noise: float, rng: random.Random) -> Iterable[Tuple[str, str, int]]:
+    # citing;cited;reference lines, a block is the lines of one citing bibcode
+    pool = [line.split(";", 1)[1] for line in text.splitlines() if line.count(";") >= 2]
+    for file_index in range(files):
+        lines = []
+        for block_index in range(blocks):
+            bibcode = synthetic_bibcode(family["journal"], family["volume"], file_index * blocks + block_index)
+            lines.extend("%s;%s" % (bibcode, reference) for reference in _draw(pool, references, noise, rng, False))
+        yield "synth%05d%s" % (file_index, family["extension"]), "\n".join(lines) + "\n", blocks
+
+
+def _family_files(family: Dict[str, Any], files: int, blocks: int, references: int,
+                  noise: float, rng: random.Random) -> Iterable[Tuple[str, str, int]]:
+    text = _read(os.path.join(STUBDATA_DIR, family["template"]))
+    if family.get("until"):
+        text = text[:re.search(family["until"], text).start()]
+    if family.get("pairs"):
+        yield from _pairs_files(family, text, files, blocks, references, noise, rng)
+        return
+    preamble, template_blocks = split_blocks(text)
+    # a generated block draws from the references of one template block, blocks mix numbering styles otherwise
+    layouts = [(marker, bibcode) + split_items(body, family["item"], family.get("after")) for marker, bibcode, body in template_blocks]
+    if family.get("exclude"):
+        # the template references the parser drops
+        layouts = [layout[:3] + ([item for item in layout[3] if not re.search(family["exclude"], item)],) + layout[4:]
+                   for layout in layouts]
+    layouts = [layout for layout in layouts if layout[3]]
+    if not layouts:
+        raise ValueError("no references found in the template %s" % family["template"])
+    wrap = bool(family.get("wrap"))
+
+    def block(serial: int) -> Tuple[str, str]:
+        marker, template_bibcode, prefix, pool, suffix = layouts[serial % len(layouts)]
+        bibcode = synthetic_bibcode(family["journal"], family["volume"], serial)
+        # a blank line between two blocks, some text parsers end a block there
+        suffix = "\n\n" if not suffix.strip() else suffix if suffix.endswith("\n") else suffix + "\n"
+        references_text = "\n".join(_draw(pool, references, noise, rng, wrap))
+        return bibcode, marker.replace(template_bibcode, bibcode, 1) + prefix + references_text + suffix
+
+    if family.get("single"):
+        # the bibcode is in the file name, one block per file
+        names = _NAMES[family["names"]]() if family.get("names") else None
+        if names is not None and files * blocks > len(names):
+            raise ValueError("the family %s has file names for at most %d blocks" % (family["parser"], len(names)))
+        for serial in range(files * blocks):
+            bibcode, content = block(serial)
+            yield (names[serial] if names else bibcode) + family["extension"], preamble + content, 1
+        return
+    for file_index in range(files):
+        parts = [preamble] + [block(file_index * blocks + block_index)[1] for block_index in range(blocks)]
+        yield "synth%05d%s" % (file_index, family["extension"]), "".join(parts), blocks
+
+
+def generate_corpus(
+    output_dir: str,
+    families: Optional[Iterable[str]] = None,
+    files: int = 1,
+    blocks: int = 10,
+    references: int = 20,
+    noise: float = 0.0,
+    scales: Iterable[int] = (1,),
+    seed: int = 0,
+) -> Dict[str, Any]:
+    names = list(families) if families else sorted(FAMILIES)
+    unknown = [name for name in names if name not in FAMILIES]
+    if unknown:
+        raise ValueError("unknown families %s, expected some of %s" % (", ".join(unknown), ", ".join(sorted(FAMILIES))))
+    if min(files, blocks, references) < 1 or not 0.0 <= noise <= 1.0:
+        raise ValueError("files, blocks and references must be positive, noise between 0 and 1")
+
+    entries = []
+    for scale in scales:
+        for name in names:
+            family = FAMILIES[name]
+            # the same seed writes the same bytes, whatever the other families and scales
+            rng = random.Random("%s:%s:%s" % (seed, name, scale))
+            directory = os.path.join(output_dir, "%dx" % scale, name, family["journal"], family["volume"])
+            for basename, text, file_blocks in _family_files(family, files, blocks, references * scale, noise, rng):
+                path = os.path.join(directory, basename)
+                entries.append({
+                    "family": name,
+                    "parser": family["parser"],
+                    "scale": scale,
+                    "path": os.path.relpath(path, output_dir),
+                    "blocks": file_blocks,
+                    "references": file_blocks * references * scale,
+                    "bytes": _write(path, text),
+                })
+    manifest = {
+        "settings": {"families": names, "files": files, "blocks": blocks, "references": references,
+                     "noise": noise, "scales": list(scales), "seed": seed},
+        "files": entries,
+    }
+    os.makedirs(output_dir, exist_ok=True)
+    with open(os.path.join(output_dir, "manifest.json"), "w") as handle:
+        json.dump(manifest, handle, indent=2, sort_keys=True)
+    return manifest
@@ -0,0 +1,612 @@
+"""Database benchmark of the queries and writes of the pipeline application.
+
+``seed_database`` fills a scratch Postgres database with a synthetic dataset
+of a chosen size, generated on the server with ``generate_series`` so that a
+few million rows take minutes rather than hours:
+
+- ``reference_source``: one row per source file, bibcodes skewed towards
+  recent years and the large journals, and a share of the bibcodes with a
+  second, arXiv, source file, as the same paper comes from several feeds.
+- ``processed_history``: a first run per source file and a geometric number
+  of retries, each retry with a fraction of the references, dated over the
+  last ``days`` days.
+- ``resolved_reference``: a log-normal number of references per run, cited
+  bibcodes drawn from a Zipf-like popularity, a share of failed (``0000``,
+  score -1) and unresolved (score 0) references, DOIs on some.
+- ``compare_classic``: the classic resolver comparison for a share of runs,
+  mostly ``MATCH``.
+- ``best_resolved_reference``: filled from the resolved references at the
+  end, as the alembic migration that added it backfills it.
+- ``resolution_change``, ``table_statistics`` and ``table_count_delta``: left
+  empty, as the migrations that added them do, the benchmark adds to them.
+
+``run_db_benchmark`` then times every public query and write method of
+``ADSReferencePipelineCelery`` with inputs sampled from the dataset, records
+the statements each one sends, and has Postgres run them again under
+``EXPLAIN (ANALYZE, BUFFERS)`` in a transaction that is rolled back. The
+rows a write method adds are removed at the end of the run.
+
+Seeding refuses a database that already has reference sources unless told
+to truncate them; point it at a scratch database, never at production.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from adsrefpipe.perf_metrics import _numeric_stats
+
+SEED_TABLES = ("reference_source", "processed_history", "resolved_reference", "compare_classic", "best_resolved_reference",
+               "resolution_change", "table_statistics", "table_count_delta")
+
+# skewed towards the first entries, as the journals and parsers of the archive are
+_BIBSTEMS = ("ApJ", "MNRAS", "A&A", "AJ", "ApJS", "PhRvD", "Icar", "JGRA", "PASP", "Natur",
+             "Sci", "SoPh", "JCAP", "PASJ", "AIPC", "SPIE", "P&SS", "NewA", "GeCoA", "AN")
+_PARSERS = (("arXiv", ".raw", "/text"), ("CrossRef", ".xref.xml", "/xml"), ("JATS", ".jats.xml", "/xml"),
+            ("ELSEVIER", ".elsevier.xml", "/xml"), ("SPRINGER", ".springer.xml", "/xml"), ("IOP", ".iop.xml", "/xml"),
+            ("WILEY", ".wiley2.xml", "/xml"), ("AGU", ".agu.xml", "/xml"), ("NATURE", ".nature.xml", "/xml"),
+            ("ADStxt", ".ref.raw", "/text"))
+_SURNAMES = ("Smith", "Wang", "Zhang", "Li", "Mueller", "Garcia", "Kim", "Rossi", "Martin", "Tanaka",
+             "Johnson", "Nguyen", "Silva", "Ivanov", "Brown", "Lee", "Chen", "Schmidt", "Dubois", "Kumar")
+# the bibcode serials fit the volume (n % 1000) and the page (n / 1000, five characters)
+MAX_SOURCES = 9999999
+MAX_CITED = 99997999
+# statements whose plan is a single row insert, running them again would only hit the primary key
+_NOT_EXPLAINED = ("INSERT",)
+
+
+def _array(values) -> str:
+    return "ARRAY[%s]" % ", ".join("'%s'" % value.replace("'", "''") for value in values)
+
+
+# odd 32 bit multipliers, one per derived value, so that the year, the journal and the parser of a serial are not correlated
+_MULTIPLIERS = (2654435761, 2246822519, 3266489917, 668265263)
+
+
+def _uniform(expression: str, salt: int) -> str:
+    # a deterministic uniform [0, 1) from an integer, a multiplicative hash of it
+    return "((((%s) * %d) %% 4294967296) / 4294967296.0)" % (expression, _MULTIPLIERS[salt])
+
+
+def _bibcode_parts(serial: str) -> Dict[str, str]:
+    """sql expressions of the year, bibstem, volume, page and bibcode of a synthetic paper, from its serial"""
+    parts = {
+        "year": "(2024 - floor(30 * power(%s, 2)))::int" % _uniform(serial, 1),
+        "bibstem": "(%s)[1 + floor(power(%s, 2) * %d)::int]" % (_array(_BIBSTEMS), _uniform(serial, 2), len(_BIBSTEMS)),
+        "volume": "((%s) %% 1000 + 1)" % serial,
+        "page": "((%s) / 1000 + 1)" % serial,
+    }
+    parts["bibcode"] = "%s::text || rpad(%s, 5, '.') || lpad(%s::text, 4, '.') || lpad(%s::text, 5, '.') || chr(65 + ((%s) %% 26)::int)" % (
+        parts["year"], parts["bibstem"], parts["volume"], parts["page"], serial)
+    return parts
+
+
+def _reference_source_sql() -> str:
+    source = _bibcode_parts("s.serial")
+    pick = "1 + floor(power(%s, 2) * %d)::int" % (_uniform("s.n", 3), len(_PARSERS))
+    return """
+        INSERT INTO reference_source (bibcode, source_filename, resolved_filename, parser_name)
+        SELECT bibcode, filename, filename || '.result', parser
+        FROM (
+            SELECT {bibcode} AS bibcode,
+                   '/proj/ads/references/sources/' || CASE WHEN s.duplicate THEN 'arXiv' ELSE rtrim({bibstem}) END
+                       || '/' || {volume} || '/' || s.n || CASE WHEN s.duplicate THEN '.raw' ELSE ({extensions})[{pick}] END AS filename,
+                   CASE WHEN s.duplicate THEN 'arXiv' ELSE ({parsers})[{pick}] END AS parser
+            FROM (
+                SELECT n, n > :primary AS duplicate, CASE WHEN n > :primary THEN n - :primary ELSE n END AS serial
+                FROM generate_series(1, :sources) AS n
+            ) AS s
+        ) AS rows
+    """.format(bibcode=source["bibcode"], bibstem=source["bibstem"], volume=source["volume"], pick=pick,
+               extensions=_array(ext for _, ext, _ in _PARSERS), parsers=_array(name for name, _, _ in _PARSERS))
+
+
+_PROCESSED_HISTORY_SQL = """
+    INSERT INTO processed_history (bibcode, source_filename, source_modified, status, date, total_ref)
+    SELECT s.bibcode, s.source_filename,
+           now() - interval '1 day' * (:days * s.age * (s.runs - run + 1) / s.runs + 1),
+           CASE WHEN run = 1 THEN 'initial' ELSE 'retry' END,
+           now() - interval '1 day' * (:days * s.age * (s.runs - run + 1) / s.runs),
+           CASE WHEN run = 1 THEN s.total_ref ELSE greatest(1, ceil(s.total_ref * random() / 4))::int END
+    FROM (
+        SELECT bibcode, source_filename, random() AS age,
+               1 + floor(-ln(1 - random()) * :retries)::int AS runs,
+               greatest(1, least(:max_references, round(exp(ln(:references) + 0.6 * sqrt(-2 * ln(1 - random())) * cos(2 * pi() * random())))))::int AS total_ref
+        FROM reference_source
+        ORDER BY bibcode, source_filename
+    ) AS s
+    CROSS JOIN LATERAL generate_series(1, s.runs) AS run
+"""
+
+
+def _resolved_reference_sql() -> str:
+    cited = _bibcode_parts("x.cited")
+    return """
+        INSERT INTO resolved_reference (history_id, item_num, reference_str, bibcode, score, reference_raw,
+                                        external_identifier, scix_id, publication_year, refereed_status)
+        SELECT history_id, item_num, reference_str,
+               CASE WHEN outcome < :failed THEN '0000' WHEN outcome < :failed + :unresolved THEN '...................' ELSE bibcode END,
+               CASE WHEN outcome < :failed THEN -1 WHEN outcome < :failed + :unresolved THEN 0
+                    ELSE round((1 - 0.6 * power(quality, 4))::numeric, 2) END,
+               CASE WHEN quality < 0.3 THEN '<ref>' || reference_str || '</ref>' END,
+               CASE WHEN quality < 0.4 THEN ARRAY['doi\\:10.' || (1000 + cited % 9000) || '/' || cited]::varchar[] ELSE ARRAY[]::varchar[] END,
+               CASE WHEN outcome >= :failed + :unresolved THEN 'scix:' || upper(to_hex(cited)) END,
+               CASE WHEN outcome >= :failed + :unresolved THEN year END,
+               CASE WHEN outcome >= :failed + :unresolved THEN (cited % 5 <> 0)::int END
+        FROM (
+            SELECT x.history_id, x.item_num, x.cited, x.outcome, x.quality, {year} AS year, {bibcode} AS bibcode,
+                   ({surnames})[1 + (x.cited % {surname_count})::int] || ', ' || chr(65 + ((x.cited / 7) % 26)::int) || '. '
+                       || {year} || ', ' || rtrim({bibstem}) || ', ' || {volume} || ', ' || {page} AS reference_str
+            FROM (
+                SELECT ph.id AS history_id, item AS item_num, random() AS outcome, random() AS quality,
+                       floor(power(random(), 3) * :cited_pool)::bigint + 1 AS cited
+                FROM processed_history AS ph
+                CROSS JOIN LATERAL generate_series(1, ph.total_ref) AS item
+                WHERE ph.id BETWEEN :low AND :high
+            ) AS x
+        ) AS rows
+    """.format(year=cited["year"], bibcode=cited["bibcode"], bibstem=cited["bibstem"], volume=cited["volume"],
+               page=cited["page"], surnames=_array(_SURNAMES), surname_count=len(_SURNAMES))
+
+
+_COMPARE_CLASSIC_SQL = """
+    INSERT INTO compare_classic (history_id, item_num, bibcode, score, state)
+    SELECT history_id, item_num,
+           CASE WHEN state < 0.7 THEN bibcode WHEN state < 0.8 THEN '...................'
+                ELSE overlay(bibcode placing 'X' from 19) END,
+           CASE WHEN state < 0.7 THEN 1 WHEN state < 0.8 THEN 0 ELSE 5 END,
+           CASE WHEN state < 0.7 THEN 'MATCH' WHEN state < 0.8 THEN 'MISS' WHEN state < 0.9 THEN 'NEW'
+                WHEN state < 0.95 THEN 'NEWU' ELSE 'DIFF' END
+    FROM (
+        SELECT history_id, item_num, bibcode, random() AS state
+        FROM resolved_reference
+        WHERE history_id BETWEEN :low AND :high AND (history_id * 2654435761) % 1000 < :compare_permille
+    ) AS rows
+"""
+
+
+# the same statement as the backfill of the migration that added the table
+_BEST_RESOLVED_REFERENCE_SQL = """
+    INSERT INTO best_resolved_reference (source_bibcode, parser_name, resolved_bibcode, history_id, item_num, score, parser_priority, date)
+    SELECT DISTINCT ON (reference_source.bibcode, reference_source.parser_name, resolved_reference.bibcode)
+           reference_source.bibcode, reference_source.parser_name, resolved_reference.bibcode,
+           resolved_reference.history_id, resolved_reference.item_num, resolved_reference.score,
+           CASE WHEN reference_source.parser_name IN ('arXiv', 'CrossRef') THEN 1
+                WHEN reference_source.parser_name = 'Arthur' THEN 3
+                ELSE 2 END,
+           processed_history.date
+    FROM resolved_reference
+    JOIN processed_history ON processed_history.id = resolved_reference.history_id
+    JOIN reference_source ON reference_source.bibcode = processed_history.bibcode
+                         AND reference_source.source_filename = processed_history.source_filename
+    WHERE resolved_reference.score != 0 AND resolved_reference.bibcode != '0000'
+    ORDER BY reference_source.bibcode, reference_source.parser_name, resolved_reference.bibcode,
+             resolved_reference.score DESC, resolved_reference.history_id
+"""
+
+
+def seed_database(
+    engine,
+    sources: int = 100000,
+    retries: float = 0.5,
+    references: float = 40.0,
+    duplicates: float = 0.3,
+    compare: float = 0.2,
+    failed: float = 0.05,
+    unresolved: float = 0.1,
+    days: int = 730,
+    seed: int = 0,
+    chunk: int = 20000,
+    reset: bool = False,
+    progress: Optional[Callable[[str], None]] = None,
+) -> Dict[str, Any]:
+    """fill the pipeline tables, sources is the number of source files, the other counts follow from it"""
+    from sqlalchemy import text
+    from adsrefpipe.models import Base
+
+    if not 1 <= sources <= MAX_SOURCES:
+        raise ValueError("sources must be between 1 and %d" % MAX_SOURCES)
+    if not (0 <= duplicates < 1 and 0 <= compare <= 1 and failed >= 0 and unresolved >= 0 and failed + unresolved <= 1):
+        raise ValueError("duplicates, compare, failed and unresolved are shares between 0 and 1")
+    if retries < 0 or references < 1 or chunk < 1:
+        raise ValueError("retries must be >= 0, references and chunk >= 1")
+    progress = progress or (lambda message: None)
+    settings = {"sources": sources, "retries": retries, "references": references, "duplicates": duplicates, "compare": compare,
+                "failed": failed, "unresolved": unresolved, "days": days, "seed": seed, "chunk": chunk}
+
+    Base.metadata.create_all(engine)
+    rows, seconds = {}, {}
+    with engine.connect() as connection:
+        existing = connection.execute(text("SELECT count(*) FROM (SELECT 1 FROM reference_source LIMIT 1) AS any_row")).scalar()
+        if existing and not reset:
+            raise ValueError("reference_source is not empty, seed a scratch database or pass reset to truncate the tables")
+        with connection.begin():
+            if existing:
+                connection.execute(text("TRUNCATE %s RESTART IDENTITY CASCADE" % ", ".join(reversed(SEED_TABLES))))
+            connection.execute(text("INSERT INTO action (status) VALUES ('initial'), ('retry'), ('delete') ON CONFLICT DO NOTHING"))
+            for name, extension, endpoint in _PARSERS:
+                connection.execute(text("INSERT INTO parser (name, extension_pattern, reference_service_endpoint, matches) "
+                                        "VALUES (:name, :extension, :endpoint, '[]') ON CONFLICT DO NOTHING"),
+                                   {"name": name, "extension": extension, "endpoint": endpoint})
+
+        def timed(table: str, statement: str, params: Dict[str, Any], salt: int) -> None:
+            started = time.perf_counter()
+            with connection.begin():
+                # random() is seeded per statement, the same settings write the same rows
+                connection.execute(text("SELECT setseed(:value)"), {"value": ((seed * 7919 + salt) % 20000) / 10000.0 - 1.0})
+                count = connection.execute(text(statement), params).rowcount
+            rows[table] = rows.get(table, 0) + count
+            seconds[table] = seconds.get(table, 0.0) + time.perf_counter() - started
+
+        primary = int(round(sources / (1.0 + duplicates)))
+        timed("reference_source", _reference_source_sql(), {"sources": sources, "primary": primary}, 0)
+        progress("reference_source: %d rows" % rows["reference_source"])
+        timed("processed_history", _PROCESSED_HISTORY_SQL,
+              {"days": days, "retries": retries, "references": references, "max_references": int(references * 25)}, 1)
+        progress("processed_history: %d rows" % rows["processed_history"])
+
+        low, high = connection.execute(text("SELECT min(id), max(id) FROM processed_history")).first()
+        resolved_sql = _resolved_reference_sql()
+        for index, start in enumerate(range(low, high + 1, chunk)):
+            params = {"low": start, "high": start + chunk - 1, "failed": failed, "unresolved": unresolved,
+                      "cited_pool": min(MAX_CITED, sources * 10), "compare_permille": int(round(compare * 1000))}
+            timed("resolved_reference", resolved_sql, params, 2 + 2 * index)
+            timed("compare_classic", _COMPARE_CLASSIC_SQL, params, 3 + 2 * index)
+            progress("resolved_reference: %d rows, compare_classic: %d rows, history %d of %d" % (
+                rows["resolved_reference"], rows["compare_classic"], min(start + chunk - 1, high), high))
+        timed("best_resolved_reference", _BEST_RESOLVED_REFERENCE_SQL, {}, 4 + 2 * index)
+        progress("best_resolved_reference: %d rows" % rows["best_resolved_reference"])
+
+    # outside of a transaction, so that the planner sees the new statistics at once
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        for table in SEED_TABLES:
+            connection.execute(text("VACUUM ANALYZE %s" % table))
+    return {"settings": settings, "rows": rows, "seconds": seconds}
+
+
+def server_version(engine) -> str:
+    from sqlalchemy import text
+
+    with engine.connect() as connection:
+        return connection.execute(text("SHOW server_version")).scalar()
+
+
+def table_sizes(engine) -> Dict[str, Dict[str, Any]]:
+    """the estimated rows and the size on disk of the seeded tables, from the catalog rather than a count"""
+    from sqlalchemy import text
+
+    with engine.connect() as connection:
+        result = connection.execute(text(
+            "SELECT relname, reltuples::bigint, pg_total_relation_size(oid) FROM pg_class WHERE relname = ANY(:tables)"
+        ), {"tables": list(SEED_TABLES)})
+        return {name: {"rows": rows, "bytes": size} for name, rows, size in result}
+
+
+def sample_inputs(engine, count: int = 5, seed: int = 0) -> Dict[str, Any]:
+    """source files, runs and a compared run to give the query methods, sampled from the seeded tables"""
+    from sqlalchemy import text
+
+    sizes = table_sizes(engine)
+
+    def percent(table: str, wanted: int) -> float:
+        estimated = max(1, (sizes.get(table) or {}).get("rows") or 1)
+        return min(100.0, max(0.0001, 100.0 * wanted * 20 / estimated))
+
+    with engine.connect() as connection:
+        sources = connection.execute(text(
+            "SELECT bibcode, source_filename, parser_name FROM reference_source TABLESAMPLE BERNOULLI (%f) REPEATABLE (%d) "
+            "ORDER BY bibcode LIMIT %d" % (percent("reference_source", count), seed, count))).fetchall()
+        if not sources:
+            raise ValueError("reference_source is empty, seed the database first")
+        bibcodes = [row[0] for row in sources]
+        history_ids = [row[0] for row in connection.execute(
+            text("SELECT max(id) FROM processed_history WHERE bibcode = ANY(:bibcodes) GROUP BY bibcode"), {"bibcodes": bibcodes})]
+        compared = connection.execute(text(
+            "SELECT ph.bibcode, ph.source_filename FROM compare_classic AS cc TABLESAMPLE BERNOULLI (%f) REPEATABLE (%d) "
+            "JOIN processed_history AS ph ON ph.id = cc.history_id LIMIT 1" % (percent("compare_classic", 1), seed))).first()
+        floor = connection.execute(text("SELECT coalesce(max(id), 0) FROM processed_history")).scalar()
+    return {
+        "bibcodes": bibcodes,
+        "source_filenames": [row[1] for row in sources],
+        "parser_name": sources[0][2],
+        "history_ids": history_ids,
+        "compare_bibcode": compared[0] if compared else bibcodes[0],
+        "compare_filename": compared[1] if compared else sources[0][1],
+        "bibstem": bibcodes[0][4:9],
+        "year": bibcodes[0][:4],
+        "history_id_floor": floor,
+    }
+
+
+class StatementRecorder:
+    """the statements a block of code sends to the database, with the parameters of their first execution"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements: List[Dict[str, Any]] = []
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        if executemany:
+            parameters = parameters[0] if parameters else None
+        self.statements.append({"statement": statement, "parameters": parameters, "executemany": bool(executemany)})
+
+    def __enter__(self) -> "StatementRecorder":
+        from sqlalchemy import event
+
+        event.listen(self.engine, "before_cursor_execute", self._record)
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        from sqlalchemy import event
+
+        event.remove(self.engine, "before_cursor_execute", self._record)
+
+    def unique(self) -> List[Dict[str, Any]]:
+        seen, statements = set(), []
+        for item in self.statements:
+            if item["statement"] not in seen:
+                seen.add(item["statement"])
+                statements.append(dict(item, executions=sum(1 for other in self.statements if other["statement"] == item["statement"])))
+        return statements
+
+
+def explain_statement(engine, statement: str, parameters: Any) -> List[Dict[str, Any]]:
+    """run a statement again under EXPLAIN (ANALYZE, BUFFERS) and roll it back, the plan in json"""
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + statement, parameters)
+        plan = cursor.fetchone()[0]
+        cursor.close()
+    finally:
+        connection.rollback()
+        connection.close()
+    return plan
+
+
+def _plan_nodes(node: Dict[str, Any]) -> List[Dict[str, Any]]:
+    nodes = [node]
+    for child in node.get("Plans") or []:
+        nodes.extend(_plan_nodes(child))
+    return nodes
+
+
+def summarize_plan(plan: List[Dict[str, Any]]) -> Dict[str, Any]:
+    root = plan[0]
+    top = root["Plan"]
+    nodes = _plan_nodes(top)
+
+    def relations(*types: str) -> List[str]:
+        return sorted({node["Relation Name"] for node in nodes if node.get("Node Type") in types and node.get("Relation Name")})
+
+    return {
+        "execution_ms": root.get("Execution Time"),
+        "planning_ms": root.get("Planning Time"),
+        "top_node": top.get("Node Type"),
+        "rows": top.get("Actual Rows"),
+        "seq_scans": relations("Seq Scan"),
+        "index_scans": relations("Index Scan", "Index Only Scan", "Bitmap Heap Scan"),
+        # the buffers of the top node include the ones of the nodes under it
+        "shared_hit_blocks": top.get("Shared Hit Blocks"),
+        "shared_read_blocks": top.get("Shared Read Blocks"),
+        "temp_written_blocks": top.get("Temp Written Blocks"),
+    }
+
+
+def _references(count: int, tag: str) -> List[Dict[str, Any]]:
+    return [{"refstr": "Smith, J. 2020, ApJ, %d, %d %s" % (index, index, tag), "refraw": "<ref>Smith, J. 2020, ApJ, %d, %d</ref>" % (index, index)}
+            for index in range(1, count + 1)]
+
+
+def benchmark_cases(app, inputs: Dict[str, Any], scratch_dir: str, references: int = 40) -> List[Dict[str, Any]]:
+    """every public query and write method of the application, with its inputs; setup is not timed"""
+    from adsrefpipe.utils import ReprocessQueryType
+
+    bibcodes, filenames = inputs["bibcodes"], inputs["source_filenames"]
+
+    def new_source(index: int, tag: str) -> tuple:
+        bibcode = "2099BENCH%s%s%s" % (str(index % 10000).rjust(4, "."), str(os.getpid() % 100000).rjust(5, "."), tag)
+        filename = os.path.join(scratch_dir, "BENCH", str(index), "%s.raw" % bibcode)
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        with open(filename, "w") as handle:
+            handle.write("%R " + bibcode + "\n")
+        return bibcode, filename
+
+    def initial(index: int) -> tuple:
+        bibcode, filename = new_source(index, "I")
+        return bibcode, filename, "arXiv", _references(references, bibcode)
+
+    def retry(index: int) -> tuple:
+        return bibcodes[index % len(bibcodes)], filenames[index % len(filenames)], "2024/01/01 00:00:00", _references(max(1, references // 4), "retry")
+
+    def post_resolved(index: int) -> tuple:
+        bibcode, filename = new_source(index, "P")
+        parsed = app.populate_tables_pre_resolved_initial_status(bibcode, filename, "arXiv", _references(references, bibcode))
+        resolved = [{"id": reference["id"], "refstring": reference["refstr"], "bibcode": "2020ApJ...%s....1S" % str(position).rjust(3, "."),
+                     "score": 1.0, "external_identifier": []} for position, reference in enumerate(parsed, 1)]
+        return resolved, bibcode, None
+
+    reprocess_days = 30
+    return [
+        {"name": "get_parser", "kind": "read", "call": lambda: app.get_parser(filenames[0])},
+        {"name": "get_reference_service_endpoint", "kind": "read", "call": lambda: app.get_reference_service_endpoint(inputs["parser_name"])},
+        {"name": "query_reference_source_tbl[bibcode]", "kind": "read", "call": lambda: app.query_reference_source_tbl(bibcode_list=bibcodes)},
+        {"name": "query_reference_source_tbl[source_filename]", "kind": "read", "call": lambda: app.query_reference_source_tbl(source_filename_list=filenames)},
+        {"name": "query_reference_source_tbl[parsername]", "kind": "read", "call": lambda: app.query_reference_source_tbl(parsername=inputs["parser_name"])},
+        {"name": "query_processed_history_tbl[bibcode]", "kind": "read", "call": lambda: app.query_processed_history_tbl(bibcode_list=bibcodes)},
+        {"name": "query_processed_history_tbl[source_filename]", "kind": "read", "call": lambda: app.query_processed_history_tbl(source_filename_list=filenames)},
+        {"name": "query_resolved_reference_tbl", "kind": "read", "call": lambda: app.query_resolved_reference_tbl(history_id_list=inputs["history_ids"])},
+        {"name": "diagnostic_query", "kind": "read", "call": lambda: app.diagnostic_query(bibcode_list=bibcodes)},
+        {"name": "iter_diagnostics[source_filename]", "kind": "read", "call": lambda: list(app.iter_diagnostics(source_filename_list=filenames))},
+        {"name": "get_count_records", "kind": "read", "call": app.get_count_records},
+        {"name": "get_count_records[exact]", "kind": "read", "call": lambda: app.get_count_records(exact=True)},
+        {"name": "get_service_classic_compare_stats_grid", "kind": "read",
+         "call": lambda: app.get_service_classic_compare_stats_grid(inputs["compare_bibcode"], inputs["compare_filename"])},
+        {"name": "get_reprocess_records[score]", "kind": "read", "call": lambda: app.get_reprocess_records(ReprocessQueryType.score, 0.5, "", reprocess_days)},
+        {"name": "get_reprocess_records[bibstem]", "kind": "read", "call": lambda: app.get_reprocess_records(ReprocessQueryType.bibstem, 0, inputs["bibstem"], reprocess_days)},
+        {"name": "get_reprocess_records[year]", "kind": "read", "call": lambda: app.get_reprocess_records(ReprocessQueryType.year, 0, inputs["year"], reprocess_days)},
+        {"name": "get_reprocess_records[failed]", "kind": "read", "call": lambda: app.get_reprocess_records(ReprocessQueryType.failed, 0, "", reprocess_days)},
+        {"name": "get_resolved_references_all", "kind": "read", "call": lambda: app.get_resolved_references_all(bibcodes[0])},
+        {"name": "get_resolved_references", "kind": "read", "call": lambda: app.get_resolved_references(bibcodes[0])},
+        {"name": "export_resolved_references[bibcode]", "kind": "read", "call": lambda: list(app.export_resolved_references(bibcodes))},
+        {"name": "export_resolved_references[since]", "kind": "read",
+         "call": lambda: list(app.export_resolved_references(since=datetime.now() - timedelta(days=1)))},
+        {"name": "get_resolution_changes", "kind": "read", "call": lambda: app.get_resolution_changes()},
+        {"name": "populate_tables_pre_resolved_initial_status", "kind": "write", "setup": initial,
+         "call": app.populate_tables_pre_resolved_initial_status},
+        {"name": "populate_tables_pre_resolved_retry_status", "kind": "write", "setup": retry,
+         "call": app.populate_tables_pre_resolved_retry_status},
+        {"name": "populate_tables_post_resolved", "kind": "write", "setup": post_resolved,
+         "call": app.populate_tables_post_resolved},
+    ]
+
+
+def _result_rows(result: Any) -> Optional[int]:
+    if isinstance(result, list):
+        return len(result)
+    # the compare grid returns the drawn table, the rows and the resolved rows
+    if isinstance(result, tuple) and len(result) == 3 and isinstance(result[1], int):
+        return result[1]
+    return None
+
+
+def _explain_statements(engine, statements: List[Dict[str, Any]], explain: Callable) -> List[Dict[str, Any]]:
+    plans = []
+    for item in statements:
+        entry = {"statement": item["statement"], "executions": item["executions"], "executemany": item["executemany"]}
+        if item["statement"].lstrip().upper().startswith(_NOT_EXPLAINED):
+            entry["skipped"] = "single row insert"
+        else:
+            try:
+                plan = explain(engine, item["statement"], item["parameters"])
+                entry.update(summarize_plan(plan), plan=plan)
+            except Exception as error:
+                entry["error"] = str(error).strip()
+        plans.append(entry)
+    return plans
+
+
+def run_case(engine, case: Dict[str, Any], repeat: int, explain: Optional[Callable] = None,
+             clock: Callable[[], float] = time.perf_counter) -> Dict[str, Any]:
+    durations, rows, statements = [], None, []
+    try:
+        for index in range(repeat):
+            args = case["setup"](index) if case.get("setup") else ()
+            recorder = StatementRecorder(engine)
+            # only the first call is recorded, the listener stays out of the other timings
+            with recorder if index == 0 else contextlib.nullcontext():
+                started = clock()
+                result = case["call"](*args)
+                durations.append((clock() - started) * 1000.0)
+            if index == 0:
+                rows, statements = _result_rows(result), recorder.unique()
+    except Exception as error:
+        return {"kind": case["kind"], "status": "error", "error": "%s: %s" % (type(error).__name__, error),
+                "latency_ms": _numeric_stats(durations), "rows": rows, "statements": []}
+    return {
+        "kind": case["kind"],
+        "status": "complete",
+        "latency_ms": _numeric_stats(durations),
+        "rows": rows,
+        "statements": _explain_statements(engine, statements, explain) if explain else
+                      [{"statement": item["statement"], "executions": item["executions"], "executemany": item["executemany"]} for item in statements],
+    }
+
+
+def remove_benchmark_writes(engine, history_id_floor: int) -> Dict[str, int]:
+    """delete the runs and sources the write methods added, everything past the seeded history ids"""
+    from sqlalchemy import text
+
+    removed = {}
+    with engine.begin() as connection:
+        for table in ("resolution_change", "best_resolved_reference", "compare_classic", "resolved_reference"):
+            removed[table] = connection.execute(text("DELETE FROM %s WHERE history_id > :floor" % table), {"floor": history_id_floor}).rowcount
+        removed["processed_history"] = connection.execute(text("DELETE FROM processed_history WHERE id > :floor"), {"floor": history_id_floor}).rowcount
+        removed["reference_source"] = connection.execute(text("DELETE FROM reference_source WHERE bibcode LIKE '____BENCH%'")).rowcount
+        # taken off the exact counts when they are next read, the same way the pipeline records its own writes
+        for table in ("reference_source", "processed_history", "resolved_reference", "compare_classic"):
+            if removed[table]:
+                connection.execute(text("INSERT INTO table_count_delta (table_name, delta) VALUES (:table_name, :delta)"),
+                                   {"table_name": table, "delta": -removed[table]})
+    return removed
+
+
+def run_db_benchmark(app, inputs: Dict[str, Any], scratch_dir: str, repeat: int = 5, references: int = 40,
+                     explain: Optional[Callable] = explain_statement, cases: Optional[List[Dict[str, Any]]] = None,
+                     clock: Callable[[], float] = time.perf_counter) -> Dict[str, Any]:
+    engine = app._engine
+    cases = cases if cases is not None else benchmark_cases(app, inputs, scratch_dir, references=references)
+    results = {}
+    for case in cases:
+        results[case["name"]] = run_case(engine, case, repeat, explain=explain, clock=clock)
+    return {
+        "status": "complete" if all(result["status"] == "complete" for result in results.values()) else "incomplete",
+        "latency_ms": {name: result["latency_ms"] for name, result in results.items()},
+        "queries": results,
+    }
+
+
+def _fmt(value: Optional[float], places: int = 2) -> str:
+    return "n/a" if value is None else ("%0." + str(places) + "f") % float(value)
+
+
+def render_db_markdown(summary: Dict[str, Any], output_path: str) -> None:
+    run_metadata = summary.get("run_metadata") or {}
+    lines = ["# ADS Reference Database Benchmark Report", "", "## Run Config", ""]
+    for key in sorted(run_metadata.keys()):
+        lines.append("- **%s**: `%s`" % (key, run_metadata[key]))
+    lines.extend([
+        "",
+        "## Top-Line Results",
+        "",
+        "- **Status**: `%s`" % summary.get("status", "unknown"),
+        "- **Methods**: `%d`" % len(summary.get("queries") or {}),
+        "",
+        "## Dataset",
+        "",
+        "| Table | Rows (estimate) | Size MiB |",
+        "|---|---:|---:|",
+    ])
+    for table, size in sorted((summary.get("tables") or {}).items()):
+        lines.append("| %s | %s | %s |" % (table, size.get("rows"), _fmt((size.get("bytes") or 0) / 1048576.0)))
+    lines.extend([
+        "",
+        "## Method Latency (ms)",
+        "",
+        "| Method | Kind | Count | p50 | p95 | Mean | Rows | Statements | Status |",
+        "|---|---|---:|---:|---:|---:|---:|---:|---|",
+    ])
+    for name, result in summary["queries"].items():
+        stats = result["latency_ms"]
+        lines.append("| %s | %s | %s | %s | %s | %s | %s | %s | %s |" % (
+            name, result["kind"], stats.get("count", 0), _fmt(stats.get("p50")), _fmt(stats.get("p95")), _fmt(stats.get("mean")),
+            "" if result.get("rows") is None else result["rows"], len(result["statements"]), result.get("error") or result["status"]))
+    lines.extend([
+        "",
+        "## Query Plans",
+        "",
+        "From `EXPLAIN (ANALYZE, BUFFERS)` of the statements of the first call, run again and rolled back.",
+        "",
+        "| Method | # | Executions | Exec ms | Plan ms | Top Node | Rows | Seq Scans | Index Scans | Hit Blocks | Read Blocks |",
+        "|---|---:|---:|---:|---:|---|---:|---|---|---:|---:|",
+    ])
+    for name, result in summary["queries"].items():
+        for position, item in enumerate(result["statements"], 1):
+            if "top_node" not in item:
+                lines.append("| %s | %d | %d | | | %s | | | | | |" % (name, position, item["executions"], item.get("skipped") or item.get("error") or "not explained"))
+                continue
+            lines.append("| %s | %d | %d | %s | %s | %s | %s | %s | %s | %s | %s |" % (
+                name, position, item["executions"], _fmt(item["execution_ms"]), _fmt(item["planning_ms"]), item["top_node"], item["rows"],
+                ", ".join(item["seq_scans"]), ", ".join(item["index_scans"]),
+                _blank(item["shared_hit_blocks"]), _blank(item["shared_read_blocks"])))
+    lines.append("")
+    with open(output_path, "w") as handle:
+        handle.write("\n".join(lines))
+
+
+def _blank(value: Any) -> Any:
+    return "" if value is None else value
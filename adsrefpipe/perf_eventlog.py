@@ -0,0 +1,283 @@
+"""Compact binary segment files for perf events.
+
+Stdlib-only alternative to the shared JSONL events file. Each process
+appends the events of a run to its own segment file under
+``<segment_root>/run_<run_id>/``, so reading one run never touches the
+events of the others.
+
+A segment file is the magic header followed by length-prefixed records
+(``<I`` byte length, then a one byte record kind):
+
+- ``STRING``: ``<I`` id and the UTF-8 text, defines an interned string
+- ``EVENT``: ``<dIIIIIdI`` ts, stage, status, run_id, context_id and
+  record_id string ids (0 for None), duration_ms (NaN for None), and the
+  string id of the extra fields as compact JSON
+- ``EVENT_JSON``: the compact JSON of an event that does not fit ``EVENT``,
+  ie one with a non string id or more top level fields
+
+Strings are interned per segment file, so the stage, the run and context ids,
+and the extra fields, which are the same for all the events of a source file,
+are stored once and then referenced by id.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import struct
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+MAGIC = b"ADSPEV1\n"
+SEGMENT_SUFFIX = ".seg"
+
+STRING, EVENT, EVENT_JSON = 0, 1, 2
+
+# a segment is closed and the next one started past either limit, to bound the string table of the writer
+MAX_SEGMENT_BYTES = 64 * 1024 * 1024
+MAX_SEGMENT_STRINGS = 200000
+
+_EVENT_FIELDS = {"ts", "stage", "status", "run_id", "context_id", "record_id", "duration_ms", "extra"}
+
+_LENGTH = struct.Struct("<I")
+_HEADER = struct.Struct("<IB")
+_STRING_ID = struct.Struct("<I")
+_EVENT = struct.Struct("<dIIIIIdI")
+
+_NAN = float("nan")
+
+
+def segment_root_for(events_path: str) -> str:
+    env_dir = os.getenv("PERF_METRICS_SEGMENT_DIR")
+    if env_dir:
+        return env_dir
+    return os.path.join(os.path.dirname(os.path.abspath(events_path)), "perf_segments")
+
+
+def run_directory(segment_root: str, run_id: Optional[Any]) -> str:
+    return os.path.join(segment_root, "run_%s" % (run_id if run_id is not None else "unknown"))
+
+
+class SegmentWriter:
+    """Appends events to the segment files of one process for one run."""
+
+    def __init__(self, directory: str, prefix: Optional[str] = None) -> None:
+        self.directory = directory
+        self.prefix = prefix or "%d" % os.getpid()
+        self.sequence = 0
+        self.path: Optional[str] = None
+        self.size = 0
+        self.strings: Dict[str, int] = {}
+        self._open_next()
+
+    def _open_next(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        while True:
+            self.sequence += 1
+            path = os.path.join(self.directory, "%s-%05d%s" % (self.prefix, self.sequence, SEGMENT_SUFFIX))
+            if not os.path.exists(path):
+                break
+        with open(path, "wb") as handle:
+            handle.write(MAGIC)
+        self.path = path
+        self.size = len(MAGIC)
+        self.strings = {}
+
+    def _intern(self, text: Optional[str], chunks: List[bytes]) -> int:
+        if text is None:
+            return 0
+        string_id = self.strings.get(text)
+        if string_id is None:
+            string_id = self.strings[text] = len(self.strings) + 1
+            body = _STRING_ID.pack(string_id) + text.encode("utf-8")
+            chunks.append(_HEADER.pack(len(body) + 1, STRING) + body)
+        return string_id
+
+    def encode(self, event: Dict[str, Any]) -> bytes:
+        chunks: List[bytes] = []
+        ts, duration_ms = event.get("ts"), event.get("duration_ms")
+        fits = (
+            isinstance(ts, float)
+            and isinstance(event.get("stage"), str)
+            and isinstance(event.get("status"), str)
+            and all(event.get(key) is None or isinstance(event.get(key), str) for key in ("run_id", "context_id", "record_id"))
+            and (duration_ms is None or (isinstance(duration_ms, float) and duration_ms == duration_ms))
+            and isinstance(event.get("extra"), dict)
+            and _EVENT_FIELDS.issuperset(event)
+        )
+        if not fits:
+            body = json.dumps(event, separators=(",", ":"), sort_keys=True).encode("utf-8")
+            chunks.append(_HEADER.pack(len(body) + 1, EVENT_JSON) + body)
+            return b"".join(chunks)
+        body = _EVENT.pack(
+            ts,
+            self._intern(event["stage"], chunks),
+            self._intern(event["status"], chunks),
+            self._intern(event.get("run_id"), chunks),
+            self._intern(event.get("context_id"), chunks),
+            self._intern(event.get("record_id"), chunks),
+            _NAN if duration_ms is None else duration_ms,
+            self._intern(json.dumps(event["extra"], separators=(",", ":"), sort_keys=True), chunks),
+        )
+        chunks.append(_HEADER.pack(len(body) + 1, EVENT) + body)
+        return b"".join(chunks)
+
+    def write(self, events: List[Dict[str, Any]]) -> int:
+        if self.size >= MAX_SEGMENT_BYTES or len(self.strings) >= MAX_SEGMENT_STRINGS:
+            self._open_next()
+        data = b"".join(self.encode(event) for event in events)
+        with open(self.path, "ab") as handle:
+            handle.write(data)
+        self.size += len(data)
+        return len(events)
+
+
+_WRITERS: Dict[str, SegmentWriter] = {}
+_WRITERS_LOCK = threading.Lock()
+
+
+def append_events(segment_root: str, events: List[Dict[str, Any]]) -> int:
+    by_run: Dict[Any, List[Dict[str, Any]]] = {}
+    for event in events:
+        by_run.setdefault(event.get("run_id"), []).append(event)
+    written = 0
+    with _WRITERS_LOCK:
+        for run_id, run_events in by_run.items():
+            directory = run_directory(segment_root, run_id)
+            writer = _WRITERS.get(directory)
+            if writer is None or writer.prefix != "%d" % os.getpid():
+                writer = _WRITERS[directory] = SegmentWriter(directory)
+            written += writer.write(run_events)
+    return written
+
+
+def read_segment(path: str) -> Iterator[Dict[str, Any]]:
+    with open(path, "rb") as handle:
+        data = handle.read()
+    if not data.startswith(MAGIC):
+        raise ValueError("%s is not a perf event segment" % path)
+    strings: List[Optional[str]] = [None]
+    # parsed extra fields by string id, each event gets its own copy
+    extras: Dict[int, Dict[str, Any]] = {}
+    unpack_header, unpack_event = _HEADER.unpack_from, _EVENT.unpack_from
+    header_size = _HEADER.size
+    offset, end = len(MAGIC), len(data)
+    while offset + header_size <= end:
+        length, kind = unpack_header(data, offset)
+        start, offset = offset + header_size, offset + _LENGTH.size + length
+        if offset > end:
+            # a record cut short by a process that died while appending
+            break
+        if kind == EVENT:
+            ts, stage_id, status_id, run_id, context_id, record_id, duration_ms, extra_id = unpack_event(data, start)
+            extra = extras.get(extra_id)
+            if extra is None:
+                extra = extras[extra_id] = json.loads(strings[extra_id])
+            yield {
+                "ts": ts,
+                "stage": strings[stage_id],
+                "run_id": strings[run_id],
+                "context_id": strings[context_id],
+                "record_id": strings[record_id],
+                "duration_ms": None if duration_ms != duration_ms else duration_ms,
+                "status": strings[status_id],
+                "extra": dict(extra),
+            }
+        elif kind == STRING:
+            # ids are given in order, starting from 1
+            strings.append(data[start + _STRING_ID.size:offset].decode("utf-8"))
+        elif kind == EVENT_JSON:
+            yield json.loads(data[start:offset].decode("utf-8"))
+
+
+def segment_files(segment_root: str, run_id: Optional[Any] = None) -> List[str]:
+    if run_id is not None:
+        directories = [run_directory(segment_root, run_id)]
+    elif os.path.isdir(segment_root):
+        directories = [
+            os.path.join(segment_root, name) for name in sorted(os.listdir(segment_root)) if name.startswith("run_")
+        ]
+    else:
+        directories = []
+    files = []
+    for directory in directories:
+        if os.path.isdir(directory):
+            files.extend(
+                os.path.join(directory, name) for name in sorted(os.listdir(directory)) if name.endswith(SEGMENT_SUFFIX)
+            )
+    return files
+
+
+def iter_segment_events(segment_root: str, run_id: Optional[Any] = None, context_id: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    run_id_str = str(run_id) if run_id is not None else None
+    context_id_str = str(context_id) if context_id is not None else None
+    for path in segment_files(segment_root, run_id=run_id_str):
+        for event in read_segment(path):
+            if run_id_str is not None and event.get("run_id") != run_id_str:
+                continue
+            if context_id_str is not None and event.get("context_id") != context_id_str:
+                continue
+            yield event
+
+
+def jsonl_to_segments(jsonl_path: str, segment_root: str) -> int:
+    writers: Dict[str, SegmentWriter] = {}
+    written = 0
+    batch: Dict[str, List[Dict[str, Any]]] = {}
+
+    def _flush() -> None:
+        for directory, events in batch.items():
+            writer = writers.get(directory)
+            if writer is None:
+                writer = writers[directory] = SegmentWriter(directory, prefix="converted")
+            writer.write(events)
+        batch.clear()
+
+    with open(jsonl_path, "r") as handle:
+        for line in handle:
+            line = line.strip()
+            if not line:
+                continue
+            event = json.loads(line)
+            batch.setdefault(run_directory(segment_root, event.get("run_id")), []).append(event)
+            written += 1
+            if written % 10000 == 0:
+                _flush()
+    _flush()
+    return written
+
+
+def segments_to_jsonl(segment_root: str, jsonl_path: str, run_id: Optional[Any] = None) -> int:
+    written = 0
+    directory = os.path.dirname(jsonl_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(jsonl_path, "a") as handle:
+        for event in iter_segment_events(segment_root, run_id=run_id):
+            handle.write(json.dumps(event, sort_keys=True) + "\n")
+            written += 1
+    return written
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Convert perf events between JSONL and binary segment files")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    to_segments = subparsers.add_parser("from-jsonl", help="Append the events of a JSONL file to segment files")
+    to_segments.add_argument("jsonl_path")
+    to_segments.add_argument("segment_root")
+    to_jsonl = subparsers.add_parser("to-jsonl", help="Append the events of segment files to a JSONL file")
+    to_jsonl.add_argument("segment_root")
+    to_jsonl.add_argument("jsonl_path")
+    to_jsonl.add_argument("--run-id", default=None)
+    args = parser.parse_args(argv)
+    if args.command == "from-jsonl":
+        count = jsonl_to_segments(args.jsonl_path, args.segment_root)
+    else:
+        count = segments_to_jsonl(args.segment_root, args.jsonl_path, run_id=args.run_id)
+    print(json.dumps({"command": args.command, "events": count}))
+    return 0
+
+
+if __name__ == "__main__":  # pragma: no cover
+    raise SystemExit(main())
@@ -6,20 +6,31 @@ instrumentation remains lightweight and safe to leave disabled by default.
 
 from __future__ import annotations
 
+import atexit
+import contextvars
 import json
 import logging
+import math
 import os
 import platform
+import random
 import re
 import threading
 import time
+import zlib
 from contextlib import contextmanager
 from functools import wraps
-from typing import Any, Dict, Iterable, List, Optional, TypedDict
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, TypedDict
+
+import adsrefpipe.perf_eventlog as perf_eventlog
+from adsrefpipe.perf_prometheus import LIVE_METRICS
 
 LOGGER = logging.getLogger(__name__)
 _EVENT_WRITE_LOCK = threading.Lock()
 
+_DEFAULT_FLUSH_INTERVAL_S = 1.0
+_DEFAULT_BUFFER_MAX_EVENTS = 512
+
 
 class AdsBenchmarkSummary(TypedDict):
     counts: Dict[str, Any]
@@ -36,6 +47,12 @@ class AdsBenchmarkSummary(TypedDict):
     status: str
     selected_files: List[str]
     file_wall_ms: Dict[str, Any]
+    regex_profile: Dict[str, Any]
+    regex_timeouts: List[Dict[str, Any]]
+    sampling: Dict[str, Any]
+    tracing: Dict[str, Any]
+    allocations: Dict[str, Any]
+    duration_samples_ms: Dict[str, Any]
 
 
 _PROGRESS_MESSAGE_RE = re.compile(
@@ -308,6 +325,7 @@ def register_run_metrics_context(
                 os.makedirs(directory, exist_ok=True)
             with open(current_target, "w") as handle:
                 json.dump(payload, handle, sort_keys=True)
+            _RUN_CONTEXT_CACHE.pop(current_target, None)
     except Exception as exc:
         _metrics_debug(
             "Failed to register metrics context",
@@ -320,24 +338,48 @@ def register_run_metrics_context(
         return
 
 
+# run context files by path, with the (inode, mtime, size) they were read at, so that a file is only
+# parsed again after it changes
+_RUN_CONTEXT_CACHE: Dict[str, Tuple[Tuple[int, int, int], Dict[str, Any]]] = {}
+
+
+def _read_run_context(target: Optional[str]) -> Optional[Dict[str, Any]]:
+    if not target:
+        return None
+    try:
+        stat = os.stat(target)
+    except OSError:
+        _RUN_CONTEXT_CACHE.pop(target, None)
+        return None
+    stamp = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    cached = _RUN_CONTEXT_CACHE.get(target)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    with open(target, "r") as handle:
+        payload = json.load(handle)
+    context = {
+        "enabled": payload.get("enabled"),
+        "path": payload.get("path"),
+        "context_id": payload.get("context_id"),
+    }
+    _RUN_CONTEXT_CACHE[target] = (stamp, context)
+    return context
+
+
 def resolve_run_metrics_context(
     run_id: Any,
     config: Optional[dict] = None,
     context_id: Optional[str] = None,
 ) -> Dict[str, Any]:
     target = _run_context_path(run_id, config=config, context_id=context_id)
-    if (not target or not os.path.exists(target)) and context_id is not None:
-        target = _run_context_path(run_id, config=config)
-    if not target or not os.path.exists(target):
-        return {"enabled": None, "path": None, "context_id": None}
     try:
-        with open(target, "r") as handle:
-            payload = json.load(handle)
-        return {
-            "enabled": payload.get("enabled"),
-            "path": payload.get("path"),
-            "context_id": payload.get("context_id"),
-        }
+        context = _read_run_context(target)
+        if context is None and context_id is not None:
+            target = _run_context_path(run_id, config=config)
+            context = _read_run_context(target)
+        if context is None:
+            return {"enabled": None, "path": None, "context_id": None}
+        return dict(context)
     except Exception as exc:
         _metrics_debug(
             "Failed to resolve metrics context",
@@ -349,8 +391,18 @@ def resolve_run_metrics_context(
         return {"enabled": None, "path": None, "context_id": None}
 
 
-def _append_jsonl_record(target_path: str, payload: Dict[str, Any]) -> None:
-    serialized_line = json.dumps(payload, sort_keys=True) + "\n"
+# directories the events files were already created in
+_KNOWN_DIRECTORIES = set()
+
+
+def _ensure_directory(target_path: str) -> None:
+    directory = os.path.dirname(target_path)
+    if directory and directory not in _KNOWN_DIRECTORIES:
+        os.makedirs(directory, exist_ok=True)
+        _KNOWN_DIRECTORIES.add(directory)
+
+
+def _append_jsonl_lines(target_path: str, lines: List[str]) -> None:
     with _EVENT_WRITE_LOCK:
         with open(target_path, "a") as handle:
             try:
@@ -367,7 +419,7 @@ def _append_jsonl_record(target_path: str, payload: Dict[str, Any]) -> None:
                         error=str(exc),
                     )
             try:
-                handle.write(serialized_line)
+                handle.write("".join(lines))
             finally:
                 if fcntl is not None:
                     try:
@@ -376,6 +428,200 @@ def _append_jsonl_record(target_path: str, payload: Dict[str, Any]) -> None:
                         pass
 
 
+def _append_jsonl_record(target_path: str, payload: Dict[str, Any]) -> None:
+    _append_jsonl_lines(target_path, [json.dumps(payload, sort_keys=True) + "\n"])
+
+
+def buffering_enabled(config: Optional[dict] = None) -> bool:
+    env_value = os.getenv("PERF_METRICS_BUFFERED")
+    if env_value is not None:
+        return _as_bool(env_value)
+    if config is not None and config.get("PERF_METRICS_BUFFERED") is not None:
+        return _as_bool(config.get("PERF_METRICS_BUFFERED"))
+    return True
+
+
+def _float_setting(name: str, default: float, config: Optional[dict] = None) -> float:
+    value = os.getenv(name)
+    if value is None and config is not None:
+        value = config.get(name)
+    try:
+        return float(value) if value is not None else default
+    except (TypeError, ValueError):
+        return default
+
+
+def _list_setting(name: str, config: Optional[dict] = None, default: Optional[str] = None) -> Optional[frozenset]:
+    value = os.getenv(name)
+    if value is None and config is not None:
+        value = config.get(name)
+    if value is None:
+        value = default
+    if value is None:
+        return None
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return frozenset(str(item).strip() for item in value if str(item).strip())
+    return frozenset(item.strip() for item in str(value).split(",") if item.strip())
+
+
+# per-record stages, sampled together by record_id so that a sampled record keeps all its stages
+_DEFAULT_SAMPLED_STAGES = "queue_wait,record_wall,resolver_http,post_resolved_db"
+
+
+def sampling_settings(config: Optional[dict] = None) -> Dict[str, Any]:
+    slow_ms = _float_setting("PERF_METRICS_SLOW_MS", 0.0, config)
+    return {
+        "sample_every": max(1, int(_float_setting("PERF_METRICS_SAMPLE_EVERY", 1, config))),
+        "enabled_stages": _list_setting("PERF_METRICS_STAGES", config),
+        "sampled_stages": _list_setting("PERF_METRICS_SAMPLED_STAGES", config, default=_DEFAULT_SAMPLED_STAGES),
+        "slow_ms": slow_ms if slow_ms > 0 else None,
+    }
+
+
+# the environment variables sampling_settings reads
+_SAMPLING_ENV = ("PERF_METRICS_SAMPLE_EVERY", "PERF_METRICS_STAGES", "PERF_METRICS_SAMPLED_STAGES", "PERF_METRICS_SLOW_MS")
+
+# sampling settings by config identity, with the config and the environment values they were parsed from,
+# so that they are only parsed again after one of these changes
+_SAMPLING_SETTINGS_CACHE: Dict[int, Tuple[Optional[dict], Tuple[Optional[str], ...], Dict[str, Any]]] = {}
+
+
+def _cached_sampling_settings(config: Optional[dict] = None) -> Dict[str, Any]:
+    stamp = tuple(os.environ.get(name) for name in _SAMPLING_ENV)
+    cached = _SAMPLING_SETTINGS_CACHE.get(id(config))
+    if cached is not None and cached[0] is config and cached[1] == stamp:
+        return cached[2]
+    settings = sampling_settings(config=config)
+    _SAMPLING_SETTINGS_CACHE[id(config)] = (config, stamp, settings)
+    return settings
+
+
+def sample_event(
+    stage: str,
+    record_id: Optional[str],
+    status: str,
+    duration_ms: Optional[float],
+    config: Optional[dict] = None,
+) -> Optional[Dict[str, Any]]:
+    # None to drop the event, otherwise the fields to add to its extra
+    settings = _cached_sampling_settings(config=config)
+    if settings["enabled_stages"] is not None and stage not in settings["enabled_stages"]:
+        return None
+    sample_every = settings["sample_every"]
+    if sample_every == 1 or stage not in settings["sampled_stages"] or record_id is None:
+        return {}
+    in_sample = zlib.crc32(str(record_id).encode("utf-8")) % sample_every == 0
+    # errors and slow outliers are always kept, and stand for themselves only,
+    # those of a sampled record are marked so that the duration samples can tell them apart
+    if status != "ok":
+        return {"sample_reason": "error", "in_sample": True} if in_sample else {"sample_reason": "error"}
+    if settings["slow_ms"] is not None and duration_ms is not None and duration_ms >= settings["slow_ms"]:
+        return {"sample_reason": "slow", "in_sample": True} if in_sample else {"sample_reason": "slow"}
+    if in_sample:
+        return {"sample_rate": sample_every}
+    return None
+
+
+def event_sink(config: Optional[dict] = None) -> str:
+    value = os.getenv("PERF_METRICS_FORMAT")
+    if value is None and config is not None:
+        value = config.get("PERF_METRICS_FORMAT")
+    return "segments" if str(value or "").strip().lower() == "segments" else "jsonl"
+
+
+def _write_events(sink: str, target: str, items: List[Any]) -> None:
+    if sink == "segments":
+        perf_eventlog.append_events(target, items)
+        return
+    _ensure_directory(target)
+    _append_jsonl_lines(target, items)
+
+
+class _EventBuffer:
+    """Events waiting to be appended to their JSONL or segment files, one append per file per flush."""
+
+    def __init__(self) -> None:
+        self._reset()
+
+    def _reset(self) -> None:
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        # (sink, target) to JSONL lines for the "jsonl" sink, and to event payloads for the "segments" sink
+        self.pending: Dict[Tuple[str, str], List[Any]] = {}
+        self.pending_count = 0
+        self.thread: Optional[threading.Thread] = None
+        self.flush_interval_s = _DEFAULT_FLUSH_INTERVAL_S
+        self.max_events = _DEFAULT_BUFFER_MAX_EVENTS
+        self.stats = {"events_buffered": 0, "events_written": 0, "flushes": 0, "flush_ms": 0.0, "write_errors": 0}
+
+    def add(self, sink: str, target: str, item: Any, config: Optional[dict] = None) -> None:
+        with self.lock:
+            self.pending.setdefault((sink, target), []).append(item)
+            self.pending_count += 1
+            self.stats["events_buffered"] += 1
+            full = self.pending_count >= self.max_events
+            if self.thread is None:
+                self._start(config)
+        if full:
+            self.wakeup.set()
+
+    def _start(self, config: Optional[dict]) -> None:
+        self.flush_interval_s = max(0.01, _float_setting("PERF_METRICS_FLUSH_INTERVAL_S", _DEFAULT_FLUSH_INTERVAL_S, config))
+        self.max_events = max(1, int(_float_setting("PERF_METRICS_BUFFER_MAX_EVENTS", _DEFAULT_BUFFER_MAX_EVENTS, config)))
+        self.thread = threading.Thread(target=self._run, name="perf-metrics-flusher", daemon=True)
+        self.thread.start()
+
+    def _run(self) -> None:
+        while True:
+            self.wakeup.wait(self.flush_interval_s)
+            self.wakeup.clear()
+            self.flush()
+
+    def flush(self) -> int:
+        with self.lock:
+            pending, self.pending, self.pending_count = self.pending, {}, 0
+        written = 0
+        for (sink, target), items in pending.items():
+            start = time.perf_counter()
+            try:
+                _write_events(sink, target, items)
+                written += len(items)
+            except Exception as exc:
+                self.stats["write_errors"] += 1
+                _metrics_debug(
+                    "Failed to flush metrics events",
+                    path=target,
+                    events=len(items),
+                    error=str(exc),
+                )
+            self.stats["flushes"] += 1
+            self.stats["flush_ms"] += (time.perf_counter() - start) * 1000.0
+        self.stats["events_written"] += written
+        return written
+
+
+_EVENT_BUFFER = _EventBuffer()
+
+
+def flush_events() -> int:
+    """Write out the buffered events, returns the number of events written."""
+    return _EVENT_BUFFER.flush()
+
+
+def event_writer_stats() -> Dict[str, Any]:
+    stats = dict(_EVENT_BUFFER.stats)
+    stats["flush_ms"] = round(stats["flush_ms"], 3)
+    stats["pending"] = _EVENT_BUFFER.pending_count
+    return stats
+
+
+atexit.register(flush_events)
+if hasattr(os, "register_at_fork"):
+    # the flusher thread does not survive a fork, and the events buffered
+    # before it belong to the parent
+    os.register_at_fork(after_in_child=_EVENT_BUFFER._reset)
+
+
 def emit_event(
     stage: str,
     run_id: Optional[Any] = None,
@@ -388,6 +634,18 @@ def emit_event(
     path: Optional[str] = None,
 ) -> None:
     try:
+        if LIVE_METRICS.enabled and duration_ms is not None:
+            # live metrics see every event, the events file may be off or sampled
+            live_extra = extra or {}
+            LIVE_METRICS.observe(
+                stage,
+                duration_ms,
+                live_extra.get("parser_name"),
+                live_extra.get("source_type"),
+                status=status,
+                records=live_extra.get("record_count", 1),
+            )
+
         resolved_run_id = run_id if run_id is not None else current_run_id()
         resolved_context_id = context_id or current_context_id()
         run_context = (
@@ -405,6 +663,15 @@ def emit_event(
         if not target_path:
             return
 
+        sampled = sample_event(stage, record_id, status, duration_ms, config=config)
+        if sampled is None:
+            return
+        if sampled:
+            extra = dict(extra or {}, **sampled)
+        trace = _TRACE.get()
+        if trace is not None and not (extra or {}).get("trace_id"):
+            extra = dict(extra or {}, trace_id=trace[0], parent_span_id=trace[1])
+
         payload = {
             "ts": time.time(),
             "stage": stage,
@@ -416,10 +683,20 @@ def emit_event(
             "extra": extra or {},
         }
 
-        directory = os.path.dirname(target_path)
-        if directory:
-            os.makedirs(directory, exist_ok=True)
+        if event_sink(config=config) == "segments":
+            # the events file path only locates the segment files, one directory per run next to it
+            sink, target, item = "segments", perf_eventlog.segment_root_for(target_path), payload
+        else:
+            sink, target, item = "jsonl", target_path, json.dumps(payload, sort_keys=True) + "\n"
+
+        if buffering_enabled(config=config):
+            _EVENT_BUFFER.add(sink, target, item, config=config)
+            return
 
+        if sink == "segments":
+            _write_events(sink, target, [item])
+            return
+        _ensure_directory(target_path)
         _append_jsonl_record(target_path, payload)
     except Exception as exc:
         _metrics_debug(
@@ -433,6 +710,123 @@ def emit_event(
         return
 
 
+# (trace_id, span_id of the innermost open stage) while a trace is active
+_TRACE: "contextvars.ContextVar[Optional[Tuple[str, Optional[str]]]]" = contextvars.ContextVar("perf_trace", default=None)
+
+
+def _new_trace_id(size: int = 8) -> str:
+    return os.urandom(size).hex()
+
+
+def current_trace() -> Optional[Dict[str, Optional[str]]]:
+    trace = _TRACE.get()
+    if trace is None:
+        return None
+    return {"trace_id": trace[0], "span_id": trace[1]}
+
+
+@contextmanager
+def trace_scope(carrier: Optional[Dict[str, Any]] = None):
+    """Makes the stages timed inside it spans of one trace, the one of the carrier or a new one."""
+    carrier = carrier or {}
+    trace_id = str(carrier.get("trace_id") or _new_trace_id(16))
+    token = _TRACE.set((trace_id, carrier.get("parent_span_id")))
+    try:
+        yield trace_id
+    finally:
+        _TRACE.reset(token)
+
+
+def trace_carrier() -> Optional[Dict[str, Any]]:
+    # what a queued task needs to continue the trace, its spans become children of the innermost open stage
+    trace = _TRACE.get()
+    if trace is None:
+        return None
+    return {"trace_id": trace[0], "parent_span_id": trace[1], "enqueued_at": time.time()}
+
+
+def emit_queue_wait(
+    carrier: Optional[Dict[str, Any]],
+    record_id: Optional[str] = None,
+    extra: Optional[dict] = None,
+    config: Optional[dict] = None,
+) -> None:
+    if not carrier or carrier.get("enqueued_at") is None:
+        return
+    try:
+        waited_ms = max(0.0, (time.time() - float(carrier["enqueued_at"])) * 1000.0)
+    except (TypeError, ValueError):
+        return
+    emit_event(
+        stage="queue_wait",
+        record_id=record_id,
+        duration_ms=waited_ms,
+        extra=dict(extra or {}, trace_id=carrier.get("trace_id"), span_id=_new_trace_id(),
+                   parent_span_id=carrier.get("parent_span_id")),
+        config=config,
+    )
+
+
+# file level stages, a snapshot costs about as much as the stage itself
+_DEFAULT_TRACEMALLOC_STAGES = "parser_init,parse_dispatch,pre_resolved_db,queue_references"
+_PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def tracemalloc_stages(config: Optional[dict] = None) -> Optional[frozenset]:
+    value = os.getenv("PERF_TRACEMALLOC")
+    if value is None and config is not None:
+        value = config.get("PERF_TRACEMALLOC")
+    if not _as_bool(value):
+        return None
+    return _list_setting("PERF_TRACEMALLOC_STAGES", config, default=_DEFAULT_TRACEMALLOC_STAGES)
+
+
+def _allocation_site(filename: str, lineno: int) -> str:
+    if "site-packages" + os.sep in filename:
+        filename = filename.split("site-packages" + os.sep, 1)[1]
+    elif filename.startswith(_PROJECT_ROOT + os.sep):
+        filename = os.path.relpath(filename, _PROJECT_ROOT)
+    return "%s:%d" % (filename, lineno)
+
+
+def _allocation_snapshot() -> Any:
+    import tracemalloc
+
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+    return tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+    ))
+
+
+def _emit_allocation_sites(stage: str, before: Any, record_id: Optional[str], extra: Optional[dict],
+                           config: Optional[dict], path: Optional[str]) -> None:
+    try:
+        differences = _allocation_snapshot().compare_to(before, "lineno")
+    except Exception as exc:
+        _metrics_debug("Failed to snapshot allocations", stage=stage, error=str(exc))
+        return
+    top = int(_float_setting("PERF_TRACEMALLOC_TOP", 10, config=config))
+    sites = [
+        {
+            "site": _allocation_site(difference.traceback[0].filename, difference.traceback[0].lineno),
+            "size_diff": difference.size_diff,
+            "count_diff": difference.count_diff,
+        }
+        for difference in sorted(differences, key=lambda item: item.size_diff, reverse=True)[:top]
+        if difference.size_diff > 0
+    ]
+    emit_event(
+        stage="tracemalloc",
+        record_id=record_id,
+        extra=dict(extra or {}, stage=stage, net_bytes=sum(difference.size_diff for difference in differences), sites=sites),
+        config=config,
+        path=path,
+    )
+
+
 @contextmanager
 def timed_stage(
     stage: str,
@@ -444,6 +838,15 @@ def timed_stage(
     config: Optional[dict] = None,
     path: Optional[str] = None,
 ):
+    trace = _TRACE.get()
+    token = None
+    if trace is not None:
+        span_id = _new_trace_id()
+        token = _TRACE.set((trace[0], span_id))
+    allocations_before = None
+    traced_stages = tracemalloc_stages(config=config)
+    if traced_stages and stage in traced_stages:
+        allocations_before = _allocation_snapshot()
     start = time.perf_counter()
     outcome = status
     try:
@@ -452,12 +855,19 @@ def timed_stage(
         outcome = "error"
         raise
     finally:
+        duration_ms = (time.perf_counter() - start) * 1000.0
+        if token is not None:
+            _TRACE.reset(token)
+            # copied when the stage ends, callers fill in their extra while it runs
+            extra = dict(extra or {}, trace_id=trace[0], span_id=span_id, parent_span_id=trace[1])
+        if allocations_before is not None:
+            _emit_allocation_sites(stage, allocations_before, record_id, extra, config, path)
         emit_event(
             stage=stage,
             run_id=run_id,
             context_id=context_id,
             record_id=record_id,
-            duration_ms=(time.perf_counter() - start) * 1000.0,
+            duration_ms=duration_ms,
             status=outcome,
             extra=extra,
             config=config,
@@ -528,13 +938,25 @@ def profiled_function(
     return decorator
 
 
-def load_events(path: str, run_id: Optional[Any] = None, context_id: Optional[str] = None) -> List[Dict[str, Any]]:
-    if not path or not os.path.exists(path):
-        return []
+def iter_events(path: str, run_id: Optional[Any] = None, context_id: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    # events of this process still in the buffer
+    flush_events()
+    if not path:
+        return
+    yield from _iter_jsonl_events(path, run_id=run_id, context_id=context_id)
+    # events written by the segments sink, only the directory of the run is read
+    try:
+        yield from perf_eventlog.iter_segment_events(perf_eventlog.segment_root_for(path), run_id=run_id, context_id=context_id)
+    except Exception as exc:
+        _metrics_debug("Failed to load metrics event segments", path=path, run_id=run_id, error=str(exc))
+
+
+def _iter_jsonl_events(path: str, run_id: Optional[Any] = None, context_id: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    if not os.path.exists(path):
+        return
 
     run_id_str = str(run_id) if run_id is not None else None
     context_id_str = str(context_id) if context_id is not None else None
-    output = []
     try:
         with open(path, "r") as handle:
             for line_number, line in enumerate(handle, start=1):
@@ -555,7 +977,7 @@ def load_events(path: str, run_id: Optional[Any] = None, context_id: Optional[st
                     continue
                 if context_id_str is not None and payload.get("context_id") != context_id_str:
                     continue
-                output.append(payload)
+                yield payload
     except Exception as exc:
         _metrics_debug(
             "Failed to load metrics events",
@@ -564,7 +986,12 @@ def load_events(path: str, run_id: Optional[Any] = None, context_id: Optional[st
             context_id=context_id_str,
             error=str(exc),
         )
-        return []
+
+
+def load_events(path: str, run_id: Optional[Any] = None, context_id: Optional[str] = None) -> List[Dict[str, Any]]:
+    output = []
+    for payload in iter_events(path, run_id=run_id, context_id=context_id):
+        output.append(payload)
     return output
 
 
@@ -610,6 +1037,148 @@ def _numeric_stats(values: List[float], include_p99: bool = True) -> Dict[str, A
     return output
 
 
+# values a sketch keeps as they are before it switches to log buckets, and the relative accuracy of the buckets
+_SKETCH_EXACT_LIMIT = 2048
+_SKETCH_RELATIVE_ACCURACY = 0.01
+
+
+class QuantileSketch:
+    """Mergeable quantile sketch, exact up to _SKETCH_EXACT_LIMIT values, then log-bucketed with bounded relative error."""
+
+    __slots__ = ("count", "total", "minimum", "maximum", "exact", "buckets", "zeros")
+
+    _gamma = (1.0 + _SKETCH_RELATIVE_ACCURACY) / (1.0 - _SKETCH_RELATIVE_ACCURACY)
+    _log_gamma = math.log(_gamma)
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.minimum: Optional[float] = None
+        self.maximum: Optional[float] = None
+        self.exact: Optional[List[float]] = []
+        self.buckets: Dict[int, int] = {}
+        self.zeros = 0
+
+    def add(self, value: float, weight: int = 1) -> None:
+        value = float(value)
+        self.count += weight
+        self.total += value * weight
+        if self.minimum is None or value < self.minimum:
+            self.minimum = value
+        if self.maximum is None or value > self.maximum:
+            self.maximum = value
+        if self.exact is not None and weight == 1:
+            self.exact.append(value)
+            if len(self.exact) > _SKETCH_EXACT_LIMIT:
+                self._collapse()
+            return
+        if self.exact is not None:
+            # a sampled value stands for weight values, only the buckets can count it that way
+            self._collapse()
+        self._bucket(value, weight)
+
+    def _bucket(self, value: float, weight: int) -> None:
+        if value <= 0.0:
+            self.zeros += weight
+            return
+        index = int(math.ceil(math.log(value) / self._log_gamma))
+        self.buckets[index] = self.buckets.get(index, 0) + weight
+
+    def _collapse(self) -> None:
+        exact, self.exact = self.exact, None
+        for value in exact:
+            self._bucket(value, 1)
+
+    def merge(self, other: "QuantileSketch") -> "QuantileSketch":
+        if not other.count:
+            return self
+        self.count += other.count
+        self.total += other.total
+        self.minimum = other.minimum if self.minimum is None else min(self.minimum, other.minimum)
+        self.maximum = other.maximum if self.maximum is None else max(self.maximum, other.maximum)
+        if self.exact is not None and other.exact is not None and len(self.exact) + len(other.exact) <= _SKETCH_EXACT_LIMIT:
+            self.exact.extend(other.exact)
+            return self
+        if self.exact is not None:
+            self._collapse()
+        if other.exact is not None:
+            for value in other.exact:
+                self._bucket(value, 1)
+        else:
+            self.zeros += other.zeros
+            for index, weight in other.buckets.items():
+                self.buckets[index] = self.buckets.get(index, 0) + weight
+        return self
+
+    def _value_at(self, rank: int, ordered: List[Tuple[int, int]]) -> float:
+        seen = self.zeros
+        if rank < seen:
+            return max(self.minimum, 0.0) if self.minimum is not None else 0.0
+        for index, weight in ordered:
+            seen += weight
+            if rank < seen:
+                # midpoint of the bucket, within the relative accuracy of every value in it
+                value = 2.0 * (self._gamma ** index) / (self._gamma + 1.0)
+                return min(max(value, self.minimum), self.maximum)
+        return self.maximum
+
+    def quantile(self, pct: float) -> Optional[float]:
+        if not self.count:
+            return None
+        if self.exact is not None:
+            return percentile(self.exact, pct)
+        if pct <= 0:
+            return self.minimum
+        if pct >= 100:
+            return self.maximum
+        ordered = sorted(self.buckets.items())
+        idx = (self.count - 1) * (pct / 100.0)
+        lower = int(idx)
+        upper = min(lower + 1, self.count - 1)
+        weight = idx - lower
+        return self._value_at(lower, ordered) * (1.0 - weight) + self._value_at(upper, ordered) * weight
+
+    def stats(self, include_p99: bool = True) -> Dict[str, Any]:
+        if self.exact is not None:
+            return _numeric_stats(self.exact, include_p99=include_p99)
+        output = {
+            "count": self.count,
+            "min": self.minimum,
+            "max": self.maximum,
+            "mean": self.total / float(self.count),
+            "p50": self.quantile(50),
+            "p95": self.quantile(95),
+        }
+        if include_p99:
+            output["p99"] = self.quantile(99)
+        return output
+
+
+# durations a reservoir keeps per stage and parser, for the bootstrap of benchmark compare
+_RESERVOIR_SIZE = 500
+
+
+class Reservoir:
+    """Uniform sample of at most size values out of all the values added, seeded so that a run is reproducible."""
+
+    __slots__ = ("size", "seen", "values", "random")
+
+    def __init__(self, name: str = "", size: int = _RESERVOIR_SIZE) -> None:
+        self.size = size
+        self.seen = 0
+        self.values: List[float] = []
+        self.random = random.Random(zlib.crc32(name.encode("utf-8")))
+
+    def add(self, value: float) -> None:
+        self.seen += 1
+        if len(self.values) < self.size:
+            self.values.append(round(float(value), 3))
+            return
+        index = self.random.randrange(self.seen)
+        if index < self.size:
+            self.values[index] = round(float(value), 3)
+
+
 def _read_linux_meminfo(path: str = "/proc/meminfo") -> Optional[Dict[str, float]]:
     try:
         values = {}
@@ -752,6 +1321,162 @@ def collect_system_sample() -> Dict[str, Optional[float]]:
     return sample
 
 
+_CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def _read_proc_stat(path: str) -> Optional[Tuple[str, int, float, int, int]]:
+    # (name, ppid, cpu seconds, threads, rss bytes), the name is in parentheses and can have spaces
+    try:
+        with open(path, "r") as handle:
+            data = handle.read()
+    except OSError:
+        return None
+    name_end = data.rfind(")")
+    fields = data[name_end + 2:].split()
+    if name_end < 0 or len(fields) < 22:
+        return None
+    name = data[data.find("(") + 1:name_end]
+    return (
+        name,
+        int(fields[1]),
+        (int(fields[11]) + int(fields[12])) / float(_CLOCK_TICKS),
+        int(fields[17]),
+        int(fields[21]) * _PAGE_SIZE,
+    )
+
+
+def _read_uss(pid: int) -> Optional[int]:
+    # private pages, ie what the process would give back if it exited
+    try:
+        total_kib = 0
+        with open("/proc/%d/smaps_rollup" % pid, "r") as handle:
+            for line in handle:
+                if line.startswith("Private_"):
+                    total_kib += int(line.split()[1])
+        return total_kib * 1024
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _count_fds(pid: int) -> Optional[int]:
+    try:
+        return len(os.listdir("/proc/%d/fd" % pid))
+    except OSError:
+        return None
+
+
+def _process_role(pid: int, name: str, root_pid: int) -> str:
+    if pid == root_pid:
+        return "benchmark"
+    try:
+        with open("/proc/%d/cmdline" % pid, "rb") as handle:
+            cmdline = handle.read().replace(b"\0", b" ").decode("utf-8", "replace")
+    except OSError:
+        cmdline = name
+    return "celery_worker" if "celery" in cmdline or "celery" in name else "child"
+
+
+def _descendant_pids(root_pids: Iterable[int]) -> List[int]:
+    children: Dict[int, List[int]] = {}
+    try:
+        entries = os.listdir("/proc")
+    except OSError:
+        return list(root_pids)
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        stat = _read_proc_stat("/proc/%s/stat" % entry)
+        if stat is not None:
+            children.setdefault(stat[1], []).append(int(entry))
+    found: List[int] = []
+    pending = list(root_pids)
+    while pending:
+        pid = pending.pop()
+        if pid in found:
+            continue
+        found.append(pid)
+        pending.extend(children.get(pid, []))
+    return sorted(found)
+
+
+def collect_process_samples(
+    root_pids: Optional[Iterable[int]] = None,
+    threads: Optional[Dict[str, int]] = None,
+) -> List[Dict[str, Any]]:
+    """Per-process CPU, RSS, USS and open file counts of this process, the given ones, and their descendants."""
+    ts = time.time()
+    own_pid = os.getpid()
+    if not os.path.isdir("/proc/%d" % own_pid):
+        # no procfs, only this process through getrusage
+        import resource
+
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        return [{
+            "ts": ts, "pid": own_pid, "role": "benchmark", "name": "python", "cpu_s": usage.ru_utime + usage.ru_stime,
+            "rss_bytes": None, "max_rss_bytes": usage.ru_maxrss * (1 if platform.system() == "Darwin" else 1024),
+            "uss_bytes": None, "open_fds": None, "threads": None, "probe": "getrusage",
+        }]
+    samples = []
+    for pid in _descendant_pids([own_pid] + [int(pid) for pid in (root_pids or [])]):
+        stat = _read_proc_stat("/proc/%d/stat" % pid)
+        if stat is None:
+            continue
+        name, _, cpu_s, thread_count, rss_bytes = stat
+        samples.append({
+            "ts": ts, "pid": pid, "role": _process_role(pid, name, own_pid), "name": name, "cpu_s": cpu_s,
+            "rss_bytes": rss_bytes, "uss_bytes": _read_uss(pid), "open_fds": _count_fds(pid), "threads": thread_count,
+            "probe": "procfs",
+        })
+    # threads of this process that are tracked on their own, ie the system load sampler
+    for role, thread_id in (threads or {}).items():
+        stat = _read_proc_stat("/proc/%d/task/%d/stat" % (own_pid, thread_id))
+        if stat is not None:
+            samples.append({"ts": ts, "pid": own_pid, "tid": thread_id, "role": role, "name": stat[0], "cpu_s": stat[2],
+                            "probe": "procfs"})
+    return samples
+
+
+def aggregate_process_samples(samples: List[Dict[str, Any]], enabled: bool = True, sample_interval_s: float = 1.0) -> Dict[str, Any]:
+    by_process: Dict[Tuple[int, Optional[int], str], List[Dict[str, Any]]] = {}
+    for sample in samples:
+        by_process.setdefault((sample.get("pid"), sample.get("tid"), sample.get("role")), []).append(sample)
+
+    processes = []
+    for (pid, tid, role), rows in by_process.items():
+        rows.sort(key=lambda row: row["ts"])
+        first, last = rows[0], rows[-1]
+        cpu_s = max(0.0, float(last.get("cpu_s") or 0.0) - float(first.get("cpu_s") or 0.0))
+        elapsed_s = float(last["ts"]) - float(first["ts"])
+        rss = [float(row["rss_bytes"]) for row in rows if row.get("rss_bytes") is not None]
+        processes.append({
+            "pid": pid,
+            "tid": tid,
+            "role": role,
+            "name": last.get("name"),
+            "sample_count": len(rows),
+            "cpu_s": cpu_s,
+            "cpu_percent": (cpu_s / elapsed_s * 100.0) if elapsed_s > 0 else None,
+            "rss_bytes": _numeric_stats(rss, include_p99=False),
+            "rss_growth_bytes": (rss[-1] - rss[0]) if rss else None,
+            "uss_bytes": _numeric_stats([float(row["uss_bytes"]) for row in rows if row.get("uss_bytes") is not None], include_p99=False),
+            "max_rss_bytes": max([row["max_rss_bytes"] for row in rows if row.get("max_rss_bytes") is not None], default=None),
+            "open_fds_max": max([row["open_fds"] for row in rows if row.get("open_fds") is not None], default=None),
+            "threads_max": max([row["threads"] for row in rows if row.get("threads") is not None], default=None),
+        })
+    processes.sort(key=lambda row: (row["role"] != "benchmark", -row["cpu_s"]))
+    return {
+        "collection": {
+            "enabled": bool(enabled),
+            "sample_interval_s": float(sample_interval_s),
+            "sample_count": len(samples),
+            "probe": samples[0].get("probe") if samples else None,
+        },
+        "samples": samples,
+        "processes": processes,
+    }
+
+
 def aggregate_system_samples(samples: List[Dict[str, Any]], enabled: bool = True, sample_interval_s: float = 1.0) -> Dict[str, Any]:
     platform_name = platform.system().lower()
     cpu_count = os.cpu_count()
@@ -802,44 +1527,210 @@ def apply_system_load_adjustment(summary: Dict[str, Any]) -> Dict[str, Any]:
     return summary
 
 
-def aggregate_ads_events(
-    events: List[Dict[str, Any]],
-    started_at: Optional[float] = None,
-    ended_at: Optional[float] = None,
-    expected_files: Optional[int] = None,
-) -> AdsBenchmarkSummary:
-    stage_timings = {}
-    task_timings = {}
-    app_timings = {}
-    errors_by_stage = {}
-    file_wall = []
-    record_wall = []
-    resolver_wall = []
-    db_wall = []
-
-    source_type_groups = {}
-    parser_groups = {}
-    raw_subfamily_groups = {}
-    file_names = set()
-    record_ids = set()
-    records_submitted = 0
-    failure_count = 0
-
-    event_timestamps = [event.get("ts") for event in events if event.get("ts") is not None]
-
-    def _group_entry(groups: Dict[str, Dict[str, Any]], key: Optional[str]) -> Dict[str, Any]:
-        group_key = str(key or "unknown")
-        groups.setdefault(group_key, {
-            "file_names": set(),
-            "record_ids": set(),
-            "wall": [],
-            "parse": [],
-            "resolver": [],
-            "db": [],
-        })
-        return groups[group_key]
+def _add_record(records: Dict[str, int], record_id: str, weight: int) -> None:
+    # a record seen in any event kept for itself, ie an error, is counted once
+    current = records.get(record_id)
+    if current is None or weight < current:
+        records[record_id] = weight
+
+
+def _sketch_group() -> Dict[str, Any]:
+    return {
+        "file_names": set(),
+        # record id to the number of records it stands for, more than one for sampled records
+        "record_ids": {},
+        "wall": QuantileSketch(),
+        "parse": QuantileSketch(),
+        "resolver": QuantileSketch(),
+        "db": QuantileSketch(),
+    }
+
+
+def _accumulate_allocations(extra: Dict[str, Any], allocations: Dict[str, Dict[str, Any]]) -> None:
+    row = allocations.setdefault(str(extra.get("stage") or "unknown"), {"snapshots": 0, "net_bytes": 0, "sites": {}})
+    row["snapshots"] += 1
+    row["net_bytes"] += int(extra.get("net_bytes") or 0)
+    for site in extra.get("sites") or []:
+        totals = row["sites"].setdefault(site.get("site"), [0, 0])
+        totals[0] += int(site.get("size_diff") or 0)
+        totals[1] += int(site.get("count_diff") or 0)
+
+
+def _serialize_allocations(allocations: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    output = {}
+    for stage, row in sorted(allocations.items(), key=lambda item: item[1]["net_bytes"], reverse=True):
+        sites = sorted(row["sites"].items(), key=lambda item: item[1][0], reverse=True)[:10]
+        output[stage] = {
+            "snapshots": row["snapshots"],
+            "net_bytes": row["net_bytes"],
+            "top_sites": [{"site": site, "size_diff": size, "count_diff": count} for site, (size, count) in sites],
+        }
+    return output
+
+
+# spans kept for the critical paths, past this the traces still get their end-to-end latency
+_DEFAULT_TRACE_MAX_SPANS = 200000
+
+Span = Tuple[float, float, Optional[str], Optional[str], str]
+
+
+def _critical_path(spans: List[Span]) -> Dict[str, float]:
+    # walks back from the end of the trace, through the child that ends last and then the ones that end before the
+    # previous one starts, time not covered by a child goes to the span itself and time covered by no span to "untraced"
+    by_id = {span[2]: span for span in spans if span[2]}
+    children: Dict[Optional[str], List[Span]] = {}
+    for span in spans:
+        parent = span[3] if span[3] in by_id else None
+        children.setdefault(parent, []).append(span)
+    effective_end: Dict[int, float] = {}
+
+    def _end(span: Span) -> float:
+        # a task queued by a stage can end after the stage itself
+        key = id(span)
+        if key not in effective_end:
+            effective_end[key] = max([span[1]] + [_end(child) for child in children.get(span[2], [])])
+        return effective_end[key]
+
+    breakdown: Dict[str, float] = {}
+
+    def _walk(label: str, start: float, cursor: float, kids: List[Span]) -> None:
+        for child in sorted(kids, key=_end, reverse=True):
+            # a child still running at the cursor ran alongside the one already on the path
+            if _end(child) > cursor:
+                continue
+            child_end = _end(child)
+            if cursor > child_end:
+                breakdown[label] = breakdown.get(label, 0.0) + (cursor - child_end) * 1000.0
+            _walk(child[4], child[0], child_end, children.get(child[2], []))
+            cursor = child[0]
+        if cursor > start:
+            breakdown[label] = breakdown.get(label, 0.0) + (cursor - start) * 1000.0
+
+    roots = children.get(None, [])
+    if roots:
+        _walk("untraced", min(span[0] for span in roots), max(_end(span) for span in roots), roots)
+    return breakdown
+
+
+class EventAggregator:
+    """Accumulates perf events one at a time into the per-stage and per-group sketches of an AdsBenchmarkSummary."""
+
+    def __init__(self) -> None:
+        self.stage_timings: Dict[str, QuantileSketch] = {}
+        self.task_timings: Dict[str, QuantileSketch] = {}
+        self.app_timings: Dict[str, QuantileSketch] = {}
+        self.errors_by_stage: Dict[str, int] = {}
+        self.file_wall = QuantileSketch()
+        self.record_wall = QuantileSketch()
+        self.resolver_wall = QuantileSketch()
+        self.db_wall = QuantileSketch()
+        self.source_type_groups: Dict[str, Dict[str, Any]] = {}
+        self.parser_groups: Dict[str, Dict[str, Any]] = {}
+        self.raw_subfamily_groups: Dict[str, Dict[str, Any]] = {}
+        self.file_names = set()
+        # record id to the number of records it stands for, more than one for sampled records
+        self.record_ids: Dict[str, int] = {}
+        self.records_submitted = 0
+        self.sample_rates: Dict[int, int] = {}
+        self.sample_reasons: Dict[str, int] = {}
+        self.failure_count = 0
+        self.regex_patterns: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self.regex_parsers: Dict[str, Dict[str, Any]] = {}
+        self.regex_timeouts: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self.first_ts: Optional[float] = None
+        self.last_ts: Optional[float] = None
+        self.allocations: Dict[str, Dict[str, Any]] = {}
+        # raw durations, sampled, for the confidence intervals of benchmark compare
+        self.stage_samples: Dict[str, Reservoir] = {}
+        self.parser_samples: Dict[Tuple[str, str], Reservoir] = {}
+        self.traces: Dict[str, Dict[str, Any]] = {}
+        self.trace_spans = 0
+        self.trace_spans_dropped = 0
+        self.max_trace_spans = _DEFAULT_TRACE_MAX_SPANS
+
+    def _add_span(self, stage: str, extra: Dict[str, Any], ts: Optional[float], duration: float,
+                  source_filename: Optional[str]) -> None:
+        end = float(ts)
+        start = end - duration / 1000.0
+        trace = self.traces.get(extra["trace_id"])
+        if trace is None:
+            trace = self.traces[extra["trace_id"]] = {"start": start, "end": end, "source_filename": None, "spans": []}
+        else:
+            trace["start"] = min(trace["start"], start)
+            trace["end"] = max(trace["end"], end)
+        if source_filename and (stage == "file_wall" or not trace["source_filename"]):
+            trace["source_filename"] = source_filename
+        if not extra.get("span_id"):
+            return
+        if self.trace_spans >= self.max_trace_spans:
+            self.trace_spans_dropped += 1
+            return
+        self.trace_spans += 1
+        label = "%s:%s" % (stage, extra.get("name")) if stage in {"task_timing", "app_timing"} else stage
+        trace["spans"].append((start, end, extra.get("span_id"), extra.get("parent_span_id"), label))
+
+    @staticmethod
+    def _add_sample(reservoirs: Dict[Any, Reservoir], key: Any, name: str, value: float) -> None:
+        reservoir = reservoirs.get(key)
+        if reservoir is None:
+            reservoir = reservoirs[key] = Reservoir(name)
+        reservoir.add(value)
+
+    def duration_samples(self) -> Dict[str, Any]:
+        parsers: Dict[str, Dict[str, List[float]]] = {}
+        for (parser_name, metric), reservoir in sorted(self.parser_samples.items()):
+            parsers.setdefault(parser_name, {})[metric] = reservoir.values
+        return {
+            "size": _RESERVOIR_SIZE,
+            # the errors and slow events kept outside of the record sample are left out
+            "record_sample": True,
+            "stages": {
+                stage: reservoir.values
+                for stage, reservoir in sorted(self.stage_samples.items())
+                if stage not in {"task_timing", "app_timing"}
+            },
+            "parsers": parsers,
+        }
+
+    def tracing(self) -> Dict[str, Any]:
+        end_to_end = QuantileSketch()
+        totals: Dict[str, float] = {}
+        files = []
+        for trace_id, trace in self.traces.items():
+            end_to_end_ms = (trace["end"] - trace["start"]) * 1000.0
+            end_to_end.add(end_to_end_ms)
+            breakdown = _critical_path(trace["spans"])
+            for label, value in breakdown.items():
+                totals[label] = totals.get(label, 0.0) + value
+            files.append({
+                "trace_id": trace_id,
+                "source_filename": trace["source_filename"],
+                "end_to_end_ms": end_to_end_ms,
+                "spans": len(trace["spans"]),
+                "critical_path_ms": dict(sorted(breakdown.items(), key=lambda item: item[1], reverse=True)),
+            })
+        files.sort(key=lambda row: row["end_to_end_ms"], reverse=True)
+        total_ms = sum(totals.values())
+        return {
+            "traces": len(self.traces),
+            "queue_wait_ms": self.stage_timings.get("queue_wait", QuantileSketch()).stats(include_p99=True),
+            "end_to_end_ms": end_to_end.stats(include_p99=True),
+            "critical_path_ms": {
+                label: {"total_ms": value, "share": (value / total_ms) if total_ms else None}
+                for label, value in sorted(totals.items(), key=lambda item: item[1], reverse=True)
+            },
+            "slowest_files": files[:20],
+            "spans_dropped": self.trace_spans_dropped,
+        }
+
+    def add(self, event: Dict[str, Any]) -> None:
+        ts = event.get("ts")
+        if ts is not None:
+            if self.first_ts is None or ts < self.first_ts:
+                self.first_ts = ts
+            if self.last_ts is None or ts > self.last_ts:
+                self.last_ts = ts
 
-    for event in events:
         stage = str(event.get("stage") or "unknown")
         status = str(event.get("status") or "ok")
         duration = event.get("duration_ms")
@@ -855,129 +1746,274 @@ def aggregate_ads_events(
             source_type=source_type,
         )
         record_id = event.get("record_id")
+        # a sampled event stands for sample_rate events, the ones kept for being errors or slow for themselves
+        weight = int(extra.get("sample_rate") or 1)
+        if weight > 1:
+            self.sample_rates[weight] = self.sample_rates.get(weight, 0) + 1
+        elif extra.get("sample_reason"):
+            reason = str(extra.get("sample_reason"))
+            self.sample_reasons[reason] = self.sample_reasons.get(reason, 0) + 1
 
         if source_filename:
-            file_names.add(source_filename)
+            self.file_names.add(source_filename)
         if record_id:
-            record_ids.add(record_id)
+            _add_record(self.record_ids, record_id, weight)
 
         if status != "ok":
-            failure_count += 1
-            errors_by_stage[stage] = errors_by_stage.get(stage, 0) + 1
+            self.failure_count += 1
+            self.errors_by_stage[stage] = self.errors_by_stage.get(stage, 0) + 1
 
         if stage == "ingest_enqueue":
-            records_submitted += int(extra.get("record_count", 1) or 1)
+            self.records_submitted += int(extra.get("record_count", 1) or 1)
+
+        if stage == "regex_profile":
+            _accumulate_regex_profile(extra.get("regex") or [], self.regex_patterns, self.regex_parsers)
+            return
+        if stage == "regex_timeout":
+            _accumulate_regex_timeout(extra, duration, self.regex_timeouts)
+            return
+        if stage == "tracemalloc":
+            _accumulate_allocations(extra, self.allocations)
+            return
 
         if duration is None:
-            continue
+            return
 
         duration_value = float(duration)
         normalized_value = duration_value / float(record_count) if record_count > 0 else duration_value
-        stage_timings.setdefault(stage, []).append(normalized_value)
+        # the duration samples are a uniform sample of the records, the errors and slow events kept
+        # for records outside of the 1 in N sample would skew them
+        in_sample = weight > 1 or not extra.get("sample_reason") or bool(extra.get("in_sample"))
+        self.stage_timings.setdefault(stage, QuantileSketch()).add(normalized_value, weight)
+        if in_sample:
+            self._add_sample(self.stage_samples, stage, stage, normalized_value)
+        if extra.get("trace_id") and ts is not None:
+            self._add_span(stage, extra, ts, duration_value, source_filename)
 
         if stage == "task_timing":
-            task_timings.setdefault(str(extra.get("name") or "unknown"), []).append(duration_value)
-            continue
+            self.task_timings.setdefault(str(extra.get("name") or "unknown"), QuantileSketch()).add(duration_value, weight)
+            return
         if stage == "app_timing":
-            app_timings.setdefault(str(extra.get("name") or "unknown"), []).append(duration_value)
-            continue
+            self.app_timings.setdefault(str(extra.get("name") or "unknown"), QuantileSketch()).add(duration_value, weight)
+            return
 
         if stage == "file_wall":
-            file_wall.append(normalized_value)
+            self.file_wall.add(normalized_value, weight)
         elif stage == "record_wall":
-            record_wall.append(duration_value)
+            self.record_wall.add(duration_value, weight)
         elif stage == "resolver_http":
-            resolver_wall.append(duration_value)
+            self.resolver_wall.add(duration_value, weight)
         elif stage in {"pre_resolved_db", "post_resolved_db"}:
-            db_wall.append(normalized_value)
+            self.db_wall.add(normalized_value, weight)
+
+        if in_sample and stage == "record_wall":
+            self._add_sample(self.parser_samples, (str(parser_name or "unknown"), "wall_time_ms"), "%s|wall" % parser_name, duration_value)
+        elif in_sample and stage == "parse_dispatch":
+            self._add_sample(self.parser_samples, (str(parser_name or "unknown"), "parse_stage_ms"), "%s|parse" % parser_name, normalized_value)
 
-        type_group = _group_entry(source_type_groups, source_type)
-        parser_group = _group_entry(parser_groups, parser_name)
-        raw_group = _group_entry(raw_subfamily_groups, raw_subfamily) if raw_subfamily else None
-        for group in tuple(group for group in (type_group, parser_group, raw_group) if group is not None):
+        groups = [
+            self.source_type_groups.setdefault(str(source_type or "unknown"), _sketch_group()),
+            self.parser_groups.setdefault(str(parser_name or "unknown"), _sketch_group()),
+        ]
+        if raw_subfamily:
+            groups.append(self.raw_subfamily_groups.setdefault(str(raw_subfamily), _sketch_group()))
+        for group in groups:
             if source_filename:
                 group["file_names"].add(source_filename)
             if record_id:
-                group["record_ids"].add(record_id)
+                _add_record(group["record_ids"], record_id, weight)
             if stage == "record_wall":
-                group["wall"].append(duration_value)
+                group["wall"].add(duration_value, weight)
             elif stage == "parse_dispatch":
-                group["parse"].append(normalized_value)
+                group["parse"].add(normalized_value, weight)
             elif stage == "resolver_http":
-                group["resolver"].append(duration_value)
+                group["resolver"].add(duration_value, weight)
             elif stage in {"pre_resolved_db", "post_resolved_db"}:
-                group["db"].append(normalized_value)
-
-    if started_at is None:
-        started_at = min(event_timestamps) if event_timestamps else None
-    if ended_at is None:
-        ended_at = max(event_timestamps) if event_timestamps else None
-    wall_duration_s = None if started_at is None or ended_at is None else max(0.0, float(ended_at) - float(started_at))
-
-    throughput = None
-    if wall_duration_s and wall_duration_s > 0:
-        throughput = (float(len(record_ids) or records_submitted) / float(wall_duration_s)) * 60.0
-
-    def _serialize_group(groups: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
-        output = {}
-        for key, payload in groups.items():
-            record_total = len(payload["record_ids"])
-            throughput_value = None
-            if wall_duration_s and wall_duration_s > 0 and record_total > 0:
-                throughput_value = (float(record_total) / float(wall_duration_s)) * 60.0
-            output[key] = {
-                "file_count": len(payload["file_names"]),
-                "record_count": record_total,
-                "wall_time_ms": _numeric_stats(payload["wall"], include_p99=True),
-                "parse_stage_ms": _numeric_stats(payload["parse"], include_p99=True),
-                "resolver_stage_ms": _numeric_stats(payload["resolver"], include_p99=True),
-                "db_stage_ms": _numeric_stats(payload["db"], include_p99=True),
-                "throughput_records_per_minute": throughput_value,
-            }
-        return output
+                group["db"].add(normalized_value, weight)
+
+    def summary(
+        self,
+        started_at: Optional[float] = None,
+        ended_at: Optional[float] = None,
+        expected_files: Optional[int] = None,
+    ) -> AdsBenchmarkSummary:
+        if started_at is None:
+            started_at = self.first_ts
+        if ended_at is None:
+            ended_at = self.last_ts
+        wall_duration_s = None if started_at is None or ended_at is None else max(0.0, float(ended_at) - float(started_at))
+
+        throughput = None
+        if wall_duration_s and wall_duration_s > 0:
+            throughput = (float(sum(self.record_ids.values()) or self.records_submitted) / float(wall_duration_s)) * 60.0
+
+        def _serialize_group(groups: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+            output = {}
+            for key, payload in groups.items():
+                record_total = sum(payload["record_ids"].values())
+                throughput_value = None
+                if wall_duration_s and wall_duration_s > 0 and record_total > 0:
+                    throughput_value = (float(record_total) / float(wall_duration_s)) * 60.0
+                output[key] = {
+                    "file_count": len(payload["file_names"]),
+                    "record_count": record_total,
+                    "wall_time_ms": payload["wall"].stats(include_p99=True),
+                    "parse_stage_ms": payload["parse"].stats(include_p99=True),
+                    "resolver_stage_ms": payload["resolver"].stats(include_p99=True),
+                    "db_stage_ms": payload["db"].stats(include_p99=True),
+                    "throughput_records_per_minute": throughput_value,
+                }
+            return output
+
+        status = "complete"
+        if expected_files is not None and len(self.file_names) < int(expected_files):
+            status = "incomplete"
+        if expected_files == 0:
+            status = "incomplete"
+
+        return {
+            "counts": {
+                "files_selected": int(expected_files or 0),
+                "files_processed": len(self.file_names),
+                "records_submitted": self.records_submitted,
+                "records_processed": sum(self.record_ids.values()),
+                "failures": self.failure_count,
+            },
+            "throughput": {
+                "overall_records_per_minute": throughput,
+            },
+            "latency_ms": {
+                stage: sketch.stats(include_p99=True)
+                for stage, sketch in self.stage_timings.items()
+                if stage not in {"task_timing", "app_timing"}
+            },
+            "task_timing_ms": {name: sketch.stats(include_p99=True) for name, sketch in self.task_timings.items()},
+            "app_timing_ms": {name: sketch.stats(include_p99=True) for name, sketch in self.app_timings.items()},
+            "duration_s": {
+                "wall_clock": wall_duration_s,
+            },
+            "per_record_metrics_ms": {
+                "wall_time": self.record_wall.stats(include_p99=True),
+                "parse_stage": self.stage_timings.get("parse_dispatch", QuantileSketch()).stats(include_p99=True),
+                "resolver_stage": self.resolver_wall.stats(include_p99=True),
+                "db_stage": self.db_wall.stats(include_p99=True),
+            },
+            "source_type_breakdown": _serialize_group(self.source_type_groups),
+            "parser_breakdown": _serialize_group(self.parser_groups),
+            "raw_subfamily_breakdown": _serialize_group(self.raw_subfamily_groups),
+            "errors": {
+                "by_stage": self.errors_by_stage,
+            },
+            "status": status,
+            "selected_files": sorted(self.file_names),
+            "file_wall_ms": self.file_wall.stats(include_p99=True),
+            "regex_profile": _serialize_regex_profile(self.regex_patterns, self.regex_parsers),
+            "regex_timeouts": sorted(self.regex_timeouts.values(), key=lambda row: row["count"], reverse=True),
+            "sampling": {
+                "sample_rates": {str(rate): count for rate, count in sorted(self.sample_rates.items())},
+                "sampled_events": sum(self.sample_rates.values()),
+                "kept_events": dict(sorted(self.sample_reasons.items())),
+                "sampled_records": sum(1 for weight in self.record_ids.values() if weight > 1),
+                "extrapolated": bool(self.sample_rates),
+            },
+            "tracing": self.tracing(),
+            "allocations": _serialize_allocations(self.allocations),
+            "duration_samples_ms": self.duration_samples(),
+        }
+
 
-    status = "complete"
-    if expected_files is not None and len(file_names) < int(expected_files):
-        status = "incomplete"
-    if expected_files == 0:
-        status = "incomplete"
+def aggregate_ads_events(
+    events: Iterable[Dict[str, Any]],
+    started_at: Optional[float] = None,
+    ended_at: Optional[float] = None,
+    expected_files: Optional[int] = None,
+) -> AdsBenchmarkSummary:
+    # events can be a generator, ie iter_events, so that they are never all in memory
+    aggregator = EventAggregator()
+    for event in events:
+        aggregator.add(event)
+    return aggregator.summary(started_at=started_at, ended_at=ended_at, expected_files=expected_files)
 
+
+def _accumulate_regex_timeout(
+    extra: Dict[str, Any],
+    duration: Optional[float],
+    timeouts: Dict[Tuple[str, str], Dict[str, Any]],
+) -> None:
+    owner = str(extra.get("owner") or "unknown")
+    source_filename = str(extra.get("source_filename") or "unknown")
+    row = timeouts.setdefault((owner, source_filename), {
+        "owner": owner,
+        "pattern": str(extra.get("pattern") or ""),
+        "source_filename": source_filename,
+        "parser_name": extra.get("parser_name"),
+        "count": 0,
+        "total_ms": 0.0,
+        "max_input_chars": 0,
+    })
+    row["count"] += 1
+    row["total_ms"] += float(duration or 0.0)
+    row["max_input_chars"] = max(row["max_input_chars"], int(extra.get("input_chars") or 0))
+
+
+def _accumulate_regex_profile(
+    rows: List[Dict[str, Any]],
+    patterns: Dict[Tuple[str, str], Dict[str, Any]],
+    parsers: Dict[str, Dict[str, Any]],
+) -> None:
+    for row in rows:
+        calls = int(row.get("calls") or 0)
+        total_ms = float(row.get("total_ms") or 0.0)
+        input_chars = int(row.get("input_chars") or 0)
+        key = (str(row.get("owner") or "unknown"), str(row.get("pattern") or ""))
+        pattern = patterns.setdefault(key, {"calls": 0, "total_ms": 0.0, "input_chars": 0, "max_input_chars": 0, "parsers": set()})
+        pattern["calls"] += calls
+        pattern["total_ms"] += total_ms
+        pattern["input_chars"] += input_chars
+        pattern["max_input_chars"] = max(pattern["max_input_chars"], int(row.get("max_input_chars") or 0))
+        parser_name = str(row.get("parser") or "unknown")
+        pattern["parsers"].add(parser_name)
+        parser = parsers.setdefault(parser_name, {"calls": 0, "total_ms": 0.0, "input_chars": 0, "patterns": set()})
+        parser["calls"] += calls
+        parser["total_ms"] += total_ms
+        parser["input_chars"] += input_chars
+        parser["patterns"].add(key)
+
+
+def _serialize_regex_profile(
+    patterns: Dict[Tuple[str, str], Dict[str, Any]],
+    parsers: Dict[str, Dict[str, Any]],
+) -> Dict[str, Any]:
+    if not patterns:
+        return {}
+    pattern_rows = []
+    for (owner, pattern_text), payload in patterns.items():
+        calls = payload["calls"]
+        pattern_rows.append({
+            "owner": owner,
+            "pattern": pattern_text,
+            "calls": calls,
+            "total_ms": payload["total_ms"],
+            "mean_us_per_call": (payload["total_ms"] * 1000.0 / calls) if calls else None,
+            "input_chars": payload["input_chars"],
+            "mean_input_chars": (float(payload["input_chars"]) / calls) if calls else None,
+            "max_input_chars": payload["max_input_chars"],
+            "parsers": sorted(payload["parsers"]),
+        })
+    pattern_rows.sort(key=lambda row: row["total_ms"], reverse=True)
     return {
-        "counts": {
-            "files_selected": int(expected_files or 0),
-            "files_processed": len(file_names),
-            "records_submitted": records_submitted,
-            "records_processed": len(record_ids),
-            "failures": failure_count,
-        },
-        "throughput": {
-            "overall_records_per_minute": throughput,
-        },
-        "latency_ms": {
-            stage: _numeric_stats(values, include_p99=True)
-            for stage, values in stage_timings.items()
-            if stage not in {"task_timing", "app_timing"}
-        },
-        "task_timing_ms": {name: _numeric_stats(values, include_p99=True) for name, values in task_timings.items()},
-        "app_timing_ms": {name: _numeric_stats(values, include_p99=True) for name, values in app_timings.items()},
-        "duration_s": {
-            "wall_clock": wall_duration_s,
-        },
-        "per_record_metrics_ms": {
-            "wall_time": _numeric_stats(record_wall, include_p99=True),
-            "parse_stage": _numeric_stats(stage_timings.get("parse_dispatch", []), include_p99=True),
-            "resolver_stage": _numeric_stats(resolver_wall, include_p99=True),
-            "db_stage": _numeric_stats(db_wall, include_p99=True),
-        },
-        "source_type_breakdown": _serialize_group(source_type_groups),
-        "parser_breakdown": _serialize_group(parser_groups),
-        "raw_subfamily_breakdown": _serialize_group(raw_subfamily_groups),
-        "errors": {
-            "by_stage": errors_by_stage,
+        "total_ms": sum(row["total_ms"] for row in pattern_rows),
+        "total_calls": sum(row["calls"] for row in pattern_rows),
+        "patterns": pattern_rows,
+        "parsers": {
+            parser_name: {
+                "calls": payload["calls"],
+                "total_ms": payload["total_ms"],
+                "input_chars": payload["input_chars"],
+                "pattern_count": len(payload["patterns"]),
+            }
+            for parser_name, payload in sorted(parsers.items())
         },
-        "status": status,
-        "selected_files": sorted(file_names),
-        "file_wall_ms": _numeric_stats(file_wall, include_p99=True),
     }
 
 
@@ -1020,6 +2056,14 @@ def render_markdown(summary: Dict[str, Any], output_path: str) -> None:
     parser_breakdown = summary.get("parser_breakdown", {}) or {}
     raw_subfamily_breakdown = summary.get("raw_subfamily_breakdown", {}) or {}
     system_load = summary.get("system_load", {}) or {}
+    process_load = summary.get("process_load", {}) or {}
+    allocations = summary.get("allocations", {}) or {}
+    regex_profile = summary.get("regex_profile", {}) or {}
+    regex_timeouts = summary.get("regex_timeouts", []) or []
+    event_writer = summary.get("event_writer", {}) or {}
+    sampling = summary.get("sampling", {}) or {}
+    tracing = summary.get("tracing", {}) or {}
+    local_resolver = summary.get("local_resolver", {}) or {}
     run_metadata = summary.get("run_metadata", {}) or {}
 
     lines = [
@@ -1182,6 +2226,201 @@ def render_markdown(summary: Dict[str, Any], output_path: str) -> None:
                 )
             )
 
+    profile = summary.get("profile", {}) or {}
+    if profile.get("samples"):
+        lines.extend([
+            "",
+            "## Hot Functions",
+            "",
+            "Stacks sampled every {interval} ms while the files were processed ({samples} samples, {sampler} s spent sampling). `Self` is the share of samples where the function was running, `Total` the share where it was on the stack. Collapsed stacks for flamegraphs: `{combined}`.".format(
+                interval=_fmt(profile.get("interval_ms")),
+                samples=profile.get("samples"),
+                sampler=_fmt(profile.get("sampler_s"), places=3),
+                combined=profile.get("combined_file"),
+            ),
+            "",
+            "| Function | Self % | Total % | Self Samples |",
+            "|---|---:|---:|---:|",
+        ])
+        for row in profile.get("top_functions", [])[:20]:
+            lines.append("| `{function}` | {self_share} | {total_share} | {samples} |".format(
+                function=row.get("function"),
+                self_share=_fmt((row.get("self_share") or 0.0) * 100.0),
+                total_share=_fmt((row.get("total_share") or 0.0) * 100.0),
+                samples=row.get("self_samples", 0),
+            ))
+        lines.extend([
+            "",
+            "| Parser | Source Type | Samples | Top Functions (self %) |",
+            "|---|---|---:|---|",
+        ])
+        for group in (profile.get("groups") or {}).values():
+            lines.append("| {parser} | {source_type} | {samples} | {functions} |".format(
+                parser=group.get("parser_name"),
+                source_type=group.get("source_type"),
+                samples=group.get("samples", 0),
+                functions=", ".join(
+                    "`%s` %s" % (row.get("function"), _fmt((row.get("self_share") or 0.0) * 100.0))
+                    for row in group.get("top_functions", [])[:3]
+                ),
+            ))
+
+    if regex_profile.get("patterns"):
+        lines.extend([
+            "",
+            "## Regex Hot Paths",
+            "",
+            "Collected when `PERF_REGEX_PROFILE` is enabled. Time is cumulative over all calls of the pattern, in milliseconds; input is the length of the string each call was applied to.",
+            "",
+            "- **Total Regex Time**: `%s ms`" % _fmt(regex_profile.get("total_ms")),
+            "- **Total Regex Calls**: `%s`" % regex_profile.get("total_calls", 0),
+            "",
+            "| Pattern Owner | Pattern | Calls | Total ms | Mean us / call | Mean input chars | Max input chars |",
+            "|---|---|---:|---:|---:|---:|---:|",
+        ])
+        for row in regex_profile["patterns"][:20]:
+            lines.append(
+                "| {owner} | `{pattern}` | {calls} | {total} | {mean} | {mean_input} | {max_input} |".format(
+                    owner=row.get("owner"),
+                    pattern=str(row.get("pattern") or "")[:60].replace("|", "\\|").replace("`", "'"),
+                    calls=row.get("calls", 0),
+                    total=_fmt(row.get("total_ms")),
+                    mean=_fmt(row.get("mean_us_per_call")),
+                    mean_input=_fmt(row.get("mean_input_chars"), places=1),
+                    max_input=row.get("max_input_chars", 0),
+                )
+            )
+        lines.extend([
+            "",
+            "### Regex Time by Parser",
+            "",
+            "| Parser | Patterns | Calls | Total ms |",
+            "|---|---:|---:|---:|",
+        ])
+        for parser_name, stats in sorted(
+            (regex_profile.get("parsers") or {}).items(),
+            key=lambda item: item[1].get("total_ms") or 0.0,
+            reverse=True,
+        ):
+            lines.append(
+                "| {parser_name} | {patterns} | {calls} | {total} |".format(
+                    parser_name=parser_name,
+                    patterns=stats.get("pattern_count", 0),
+                    calls=stats.get("calls", 0),
+                    total=_fmt(stats.get("total_ms")),
+                )
+            )
+
+    if regex_timeouts:
+        lines.extend([
+            "",
+            "## Regex Timeouts",
+            "",
+            "Patterns that used up the per-reference regex time budget (`REFERENCE_PIPELINE_REGEX_TIME_BUDGET`). The reference took the fallback path or was flagged incomplete.",
+            "",
+            "| Pattern Owner | Source File | Parser | Timeouts | Total ms | Max input chars |",
+            "|---|---|---|---:|---:|---:|",
+        ])
+        for row in regex_timeouts[:20]:
+            lines.append(
+                "| {owner} | {source_filename} | {parser_name} | {count} | {total} | {max_input} |".format(
+                    owner=row.get("owner"),
+                    source_filename=row.get("source_filename"),
+                    parser_name=_blank_if_none(row.get("parser_name")),
+                    count=row.get("count", 0),
+                    total=_fmt(row.get("total_ms")),
+                    max_input=row.get("max_input_chars", 0),
+                )
+            )
+
+    if sampling.get("extrapolated"):
+        lines.extend([
+            "",
+            "## Sampling",
+            "",
+            "Record-level stages were sampled 1 in N by record id; counts, throughput, and percentiles are extrapolated. Errors and slow outliers were kept for every record.",
+            "",
+            "| Sample Rates | Sampled Events | Sampled Records | Kept Errors | Kept Slow |",
+            "|---|---:|---:|---:|---:|",
+            "| {rates} | {events} | {records} | {errors} | {slow} |".format(
+                rates=", ".join("1/%s" % rate for rate in sorted(sampling.get("sample_rates", {}), key=int)),
+                events=sampling.get("sampled_events", 0),
+                records=sampling.get("sampled_records", 0),
+                errors=(sampling.get("kept_events") or {}).get("error", 0),
+                slow=(sampling.get("kept_events") or {}).get("slow", 0),
+            ),
+        ])
+
+    if tracing.get("traces"):
+        lines.extend([
+            "",
+            "## Tracing",
+            "",
+            "One trace per source file, from the file read to the last resolved reference. The critical path follows the stages that ended last; time no stage covers is `untraced`.",
+            "",
+            "| Traces | Queue Wait p50 ms | Queue Wait p95 ms | End-to-End p50 ms | End-to-End p95 ms | Spans Dropped |",
+            "|---:|---:|---:|---:|---:|---:|",
+            "| {traces} | {wait_p50} | {wait_p95} | {e2e_p50} | {e2e_p95} | {dropped} |".format(
+                traces=tracing.get("traces"),
+                wait_p50=_fmt(_deep_get(tracing, "queue_wait_ms", "p50")),
+                wait_p95=_fmt(_deep_get(tracing, "queue_wait_ms", "p95")),
+                e2e_p50=_fmt(_deep_get(tracing, "end_to_end_ms", "p50")),
+                e2e_p95=_fmt(_deep_get(tracing, "end_to_end_ms", "p95")),
+                dropped=tracing.get("spans_dropped", 0),
+            ),
+            "",
+            "| Critical Path Stage | Total ms | Share |",
+            "|---|---:|---:|",
+        ])
+        for label, row in (tracing.get("critical_path_ms") or {}).items():
+            lines.append("| {label} | {total} | {share} |".format(label=label, total=_fmt(row.get("total_ms")), share=_fmt(row.get("share"))))
+        lines.extend([
+            "",
+            "| Slowest Source File | End-to-End ms | Spans | Critical Path |",
+            "|---|---:|---:|---|",
+        ])
+        for row in (tracing.get("slowest_files") or [])[:10]:
+            lines.append(
+                "| {source_filename} | {e2e} | {spans} | {path} |".format(
+                    source_filename=_blank_if_none(row.get("source_filename")),
+                    e2e=_fmt(row.get("end_to_end_ms")),
+                    spans=row.get("spans", 0),
+                    path=", ".join("%s %s" % (label, _fmt(value)) for label, value in list(row.get("critical_path_ms", {}).items())[:3]),
+                )
+            )
+
+    if event_writer:
+        lines.extend([
+            "",
+            "## Event Writer",
+            "",
+            "| Events Buffered | Events Written | Flushes | Flush ms | Write Errors |",
+            "|---:|---:|---:|---:|---:|",
+            "| {buffered} | {written} | {flushes} | {flush_ms} | {errors} |".format(
+                buffered=event_writer.get("events_buffered", 0),
+                written=event_writer.get("events_written", 0),
+                flushes=event_writer.get("flushes", 0),
+                flush_ms=_fmt(event_writer.get("flush_ms")),
+                errors=event_writer.get("write_errors", 0),
+            ),
+        ])
+
+    if local_resolver:
+        profile = local_resolver.get("profile", {}) or {}
+        lines.extend([
+            "",
+            "## Local Resolver",
+            "",
+            "- URL: `%s`" % local_resolver.get("url"),
+            "- Profile: %s" % ", ".join("%s `%s`" % (key, profile[key]) for key in sorted(profile)),
+            "",
+            "| Route | Status | Requests |",
+            "|---|---:|---:|",
+        ])
+        for route, counts in sorted((local_resolver.get("requests") or {}).items()):
+            for status, count in sorted(counts.items()):
+                lines.append("| %s | %s | %s |" % (route, status, count))
+
     if system_load:
         collection = system_load.get("collection", {}) or {}
         load_summary = system_load.get("summary", {}) or {}
@@ -1254,6 +2493,56 @@ def render_markdown(summary: Dict[str, Any], output_path: str) -> None:
                 )
             )
 
+    if process_load.get("processes"):
+        lines.extend([
+            "",
+            "## Process Load",
+            "",
+            "CPU time and memory of the benchmark process, its children (ie prefork Celery workers), and the load sampler thread, over the run. `RSS Growth` is the change from the first to the last sample; a steady climb across runs points to a leak.",
+            "",
+            "| Role | PID | Name | CPU s | CPU % | Mean RSS | Max RSS | RSS Growth | Max USS | Max FDs | Max Threads |",
+            "|---|---:|---|---:|---:|---:|---:|---:|---:|---:|---:|",
+        ])
+        for row in process_load["processes"]:
+            lines.append(
+                "| {role} | {pid} | {name} | {cpu_s} | {cpu_percent} | {rss_mean} | {rss_max} | {growth} | {uss} | {fds} | {threads} |".format(
+                    role=row.get("role"),
+                    pid=row.get("pid") if row.get("tid") is None else "%s/%s" % (row.get("pid"), row.get("tid")),
+                    name=_blank_if_none(row.get("name")),
+                    cpu_s=_fmt(row.get("cpu_s")),
+                    cpu_percent=_fmt(row.get("cpu_percent")),
+                    rss_mean=_fmt_bytes(_deep_get(row, "rss_bytes", "mean")),
+                    rss_max=_fmt_bytes(_deep_get(row, "rss_bytes", "max") or row.get("max_rss_bytes")),
+                    growth=_fmt_bytes(row.get("rss_growth_bytes")),
+                    uss=_fmt_bytes(_deep_get(row, "uss_bytes", "max")),
+                    fds=_blank_if_none(row.get("open_fds_max")),
+                    threads=_blank_if_none(row.get("threads_max")),
+                )
+            )
+
+    if allocations:
+        lines.extend([
+            "",
+            "## Allocation Sites",
+            "",
+            "Collected when `PERF_TRACEMALLOC` is enabled. Bytes still allocated at the end of each stage, compared to its start, summed over the snapshots of the stage, with the source lines that hold the most.",
+            "",
+            "| Stage | Snapshots | Net Bytes | Site | Site Bytes | Site Blocks |",
+            "|---|---:|---:|---|---:|---:|",
+        ])
+        for stage, row in allocations.items():
+            for index, site in enumerate(row.get("top_sites", [])[:5] or [{}]):
+                lines.append(
+                    "| {stage} | {snapshots} | {net} | {site} | {size} | {count} |".format(
+                        stage=stage if index == 0 else "",
+                        snapshots=row.get("snapshots", 0) if index == 0 else "",
+                        net=_fmt_bytes(row.get("net_bytes")) if index == 0 else "",
+                        site=_blank_if_none(site.get("site")),
+                        size=_fmt_bytes(site.get("size_diff")),
+                        count=_blank_if_none(site.get("count_diff")),
+                    )
+                )
+
     directory = os.path.dirname(output_path)
     if directory:
         os.makedirs(directory, exist_ok=True)
@@ -0,0 +1,262 @@
+"""Per-parser micro-benchmark with a check on how parse time grows.
+
+Stdlib-only at import time. ``run_parser_benchmarks`` writes the synthetic
+corpus of ``perf_corpus`` for every family whose parser is registered in
+``handler.name_to_parser_dict``, at several scales of the references per
+block (1x, 10x and 100x by default), and times the parser on each scale:
+the best of a few runs of ``process_and_dispatch`` on the same files, with
+the garbage collector off as ``timeit`` does, in references and bytes per
+second.
+
+Parse time should grow linearly with the input. The scaling exponent of a
+step between two scales is ``log(time ratio) / log(bytes ratio)``: about 1
+for a linear parser, about 2 for one that removes from a list in a loop or
+rescans the whole buffer once per reference. A parser is flagged when the
+exponent of the step between its two largest scales, where the fixed cost
+of a call matters least, is over ``max_exponent``.
+
+A previous summary can be given as a baseline, a parser is then also
+flagged when its references per second at a scale fell by more than the
+threshold. Baselines are only meaningful on the same host.
+"""
+
+from __future__ import annotations
+
+import gc
+import math
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import adsrefpipe.perf_corpus as perf_corpus
+
+# under this the timing of the largest scale is mostly clock resolution and call overhead
+MIN_MEASURABLE_S = 0.001
+
+
+def _load_parser(parser_name: str):
+    from adsrefpipe.refparsers.handler import verify
+
+    return verify(parser_name)
+
+
+@contextmanager
+def offline_lookups(family: str):
+    """the Annual Review parsers look up the bibcode of the DOI of the page on solr, the family bibcode is given instead"""
+    spec = perf_corpus.FAMILIES[family]
+    if not spec.get("doi_lookup"):
+        yield
+        return
+    import adsrefpipe.refparsers.ADShtml as ADShtml
+
+    original = ADShtml.get_bibcode_from_doi
+    ADShtml.get_bibcode_from_doi = lambda doi: perf_corpus.synthetic_bibcode(spec["journal"], spec["volume"], 0)
+    try:
+        yield
+    finally:
+        ADShtml.get_bibcode_from_doi = original
+
+
+def parser_cases(families: Optional[Iterable[str]] = None) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """the corpus families to time, and the registered parser classes that no family exercises"""
+    from adsrefpipe.refparsers.handler import name_to_parser_dict
+
+    aliases: Dict[str, List[str]] = {}
+    for name, class_path in sorted(name_to_parser_dict.items()):
+        aliases.setdefault(class_path, []).append(name)
+    names = list(families) if families else sorted(perf_corpus.FAMILIES)
+    cases, covered = [], set()
+    for family in names:
+        parser = perf_corpus.FAMILIES[family]["parser"]
+        class_path = name_to_parser_dict.get(parser)
+        if class_path is None:
+            continue
+        covered.add(class_path)
+        cases.append({"family": family, "parser": parser, "class": class_path, "aliases": aliases[class_path]})
+    uncovered = [
+        {"class": class_path, "aliases": names_of_class}
+        for class_path, names_of_class in sorted(aliases.items())
+        if class_path not in covered
+    ]
+    return cases, uncovered
+
+
+def time_parse(
+    parser_class: type,
+    paths: List[str],
+    repeat: int,
+    clock: Callable[[], float] = time.perf_counter,
+) -> Tuple[float, int, int]:
+    """best wall time of parsing all the files, and the blocks and references the parser returned"""
+    best, blocks, references = None, 0, 0
+    gc_was_enabled = gc.isenabled()
+    try:
+        for _ in range(repeat):
+            gc.collect()
+            gc.disable()
+            started = clock()
+            results = [parser_class(filename=path, buffer=None).process_and_dispatch() for path in paths]
+            elapsed = clock() - started
+            if gc_was_enabled:
+                gc.enable()
+            best = elapsed if best is None else min(best, elapsed)
+            blocks = sum(len(result) for result in results)
+            references = sum(len(block.get("references") or []) for result in results for block in result)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return best or 0.0, blocks, references
+
+
+def scaling_exponents(points: List[Dict[str, Any]]) -> List[Optional[float]]:
+    """the exponent of each step between consecutive scales, from the bytes and the best time"""
+    exponents = []
+    for lower, upper in zip(points, points[1:]):
+        if lower["seconds"] > 0 and upper["seconds"] > 0 and upper["bytes"] > lower["bytes"] > 0:
+            exponents.append(math.log(upper["seconds"] / lower["seconds"]) / math.log(float(upper["bytes"]) / lower["bytes"]))
+        else:
+            exponents.append(None)
+    return exponents
+
+
+def _scaling_status(points: List[Dict[str, Any]], exponent: Optional[float], max_exponent: float) -> str:
+    if len(points) < 2:
+        return "single_scale"
+    if points[-1]["seconds"] < MIN_MEASURABLE_S or exponent is None:
+        return "unmeasured"
+    return "superlinear" if exponent > max_exponent else "linear"
+
+
+def compare_to_baseline(summary: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[Dict[str, Any]]:
+    """the parsers and scales whose references per second fell by more than threshold percent"""
+    regressions = []
+    for family, result in sorted(summary["parsers"].items()):
+        previous = ((baseline.get("parsers") or {}).get(family) or {}).get("scales") or {}
+        for point in result["scales"]:
+            before = (previous.get(str(point["scale"])) or {}).get("references_per_s")
+            if not before or point["references_per_s"] is None:
+                continue
+            delta = (point["references_per_s"] - before) / before * 100.0
+            point["baseline_references_per_s"] = before
+            point["delta_pct"] = delta
+            if delta < -threshold:
+                regressions.append({"family": family, "parser": result["parser"], "scale": point["scale"], "delta_pct": delta})
+    return regressions
+
+
+def run_parser_benchmarks(
+    output_dir: str,
+    families: Optional[Iterable[str]] = None,
+    scales: Iterable[int] = (1, 10, 100),
+    blocks: int = 2,
+    references: int = 10,
+    repeat: int = 3,
+    max_exponent: float = 1.35,
+    seed: int = 0,
+    baseline: Optional[Dict[str, Any]] = None,
+    threshold: float = 25.0,
+    loader: Callable[[str], Optional[type]] = _load_parser,
+    clock: Callable[[], float] = time.perf_counter,
+) -> Dict[str, Any]:
+    scales = sorted(set(scales))
+    cases, uncovered = parser_cases(families)
+    manifest = perf_corpus.generate_corpus(output_dir, families=[case["family"] for case in cases], blocks=blocks,
+                                           references=references, scales=scales, seed=seed)
+    files: Dict[Tuple[str, int], List[Dict[str, Any]]] = {}
+    for entry in manifest["files"]:
+        files.setdefault((entry["family"], entry["scale"]), []).append(entry)
+
+    results = {}
+    for case in cases:
+        parser_class = loader(case["parser"])
+        points = []
+        for scale in scales:
+            entries = files.get((case["family"], scale)) or []
+            with offline_lookups(case["family"]):
+                seconds, parsed_blocks, parsed_references = time_parse(
+                    parser_class, [os.path.join(output_dir, entry["path"]) for entry in entries], repeat, clock=clock)
+            size = sum(entry["bytes"] for entry in entries)
+            points.append({
+                "scale": scale,
+                "bytes": size,
+                "written_references": sum(entry["references"] for entry in entries),
+                "blocks": parsed_blocks,
+                "references": parsed_references,
+                "seconds": seconds,
+                "references_per_s": parsed_references / seconds if seconds > 0 else None,
+                "bytes_per_s": size / seconds if seconds > 0 else None,
+            })
+        exponents = scaling_exponents(points)
+        exponent = exponents[-1] if exponents else None
+        results[case["family"]] = dict(
+            case,
+            scales=points,
+            step_exponents=exponents,
+            exponent=exponent,
+            status=_scaling_status(points, exponent, max_exponent),
+        )
+
+    summary = {
+        "settings": {"scales": scales, "blocks": blocks, "references": references, "repeat": repeat,
+                     "max_exponent": max_exponent, "seed": seed, "threshold": threshold},
+        "parsers": results,
+        "uncovered": uncovered,
+        "superlinear": sorted(family for family, result in results.items() if result["status"] == "superlinear"),
+    }
+    if baseline is not None:
+        summary["regressions"] = compare_to_baseline(summary, baseline, threshold)
+    return summary
+
+
+def baseline_from_summary(summary: Dict[str, Any]) -> Dict[str, Any]:
+    """the references and bytes per second of every parser and scale, to compare later runs against"""
+    return {
+        "settings": summary["settings"],
+        "parsers": {
+            family: {
+                "parser": result["parser"],
+                "scales": {
+                    str(point["scale"]): {"references_per_s": point["references_per_s"], "bytes_per_s": point["bytes_per_s"]}
+                    for point in result["scales"]
+                },
+            }
+            for family, result in summary["parsers"].items()
+        },
+    }
+
+
+def _fmt(value: Optional[float], places: int = 0) -> str:
+    return "-" if value is None else "%.*f" % (places, value)
+
+
+def render_parsers_markdown(summary: Dict[str, Any], output_path: str) -> None:
+    settings = summary["settings"]
+    scales = settings["scales"]
+    lines = [
+        "# ADS Reference Parser Micro-Benchmark",
+        "",
+        "- Scales: %s, %s blocks of %s references at 1x, best of %s runs" % (
+            ", ".join("%sx" % scale for scale in scales), settings["blocks"], settings["references"], settings["repeat"]),
+        "- Superlinear: exponent over %s between the two largest scales" % settings["max_exponent"],
+        "",
+        "| Family | Parser | %s | Exponent | Status |" % " | ".join("%sx refs/s | %sx KB/s" % (scale, scale) for scale in scales),
+        "|---|---|%s---:|---|" % ("---:|---:|" * len(scales)),
+    ]
+    for family, result in sorted(summary["parsers"].items()):
+        cells = []
+        for point in result["scales"]:
+            cells.append(_fmt(point["references_per_s"]))
+            cells.append(_fmt(point["bytes_per_s"] / 1024.0 if point["bytes_per_s"] is not None else None))
+        lines.append("| %s | %s | %s | %s | %s |" % (family, result["parser"], " | ".join(cells), _fmt(result["exponent"], 2), result["status"]))
+    if summary.get("regressions"):
+        lines.extend(["", "## Regressions Against the Baseline", "", "| Family | Parser | Scale | Refs/s Delta % |", "|---|---|---:|---:|"])
+        for regression in summary["regressions"]:
+            lines.append("| %s | %s | %sx | %s |" % (regression["family"], regression["parser"], regression["scale"], _fmt(regression["delta_pct"], 1)))
+    if summary["uncovered"]:
+        lines.extend(["", "## Not Covered", "", "No corpus family for these parser classes:", ""])
+        for item in summary["uncovered"]:
+            lines.append("- `%s` (%s)" % (item["class"], ", ".join(item["aliases"])))
+    lines.append("")
+    with open(output_path, "w") as handle:
+        handle.write("\n".join(lines))
@@ -0,0 +1,262 @@
+"""Low overhead statistical profiler for the pipeline stages.
+
+Stdlib-only. While ``PERF_PROFILE`` is on, a daemon thread samples the stack
+of every thread that is inside a ``profile_scope`` (a source file in the CLI,
+a reference task in a worker) every ``PERF_PROFILE_INTERVAL_MS`` milliseconds,
+and counts the collapsed stacks by parser and source type. The counts are
+written as collapsed-stack (``.folded``) files, one line per stack
+``frame;frame;frame count``, that flamegraph.pl and speedscope read directly,
+and summarized into a hot function table for the benchmark report.
+
+The sampler needs the GIL, so time spent in C code that holds it, ie a long
+regex match, is credited to the frame that runs next in that thread.
+"""
+
+from __future__ import annotations
+
+import atexit
+import os
+import re
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+_DEFAULT_INTERVAL_MS = 5.0
+_DEFAULT_DUMP_INTERVAL_S = 60.0
+
+GroupKey = Tuple[str, str]
+
+
+def _setting(name: str, config: Optional[dict] = None) -> Optional[str]:
+    value = os.getenv(name)
+    if value is None and config is not None:
+        value = config.get(name)
+    return str(value) if value not in (None, "") else None
+
+
+def profile_enabled(config: Optional[dict] = None) -> bool:
+    return (_setting("PERF_PROFILE", config) or "").strip().lower() in {"1", "true", "yes", "on"}
+
+
+class ProfileScope:
+    """Marks the calling thread as profiled until exit; parser_name and source_type can be set once known."""
+
+    def __init__(self, parser_name: Optional[str] = None, source_type: Optional[str] = None) -> None:
+        self.parser_name = parser_name
+        self.source_type = source_type
+        self.frame = None
+        self.outer: Optional[ProfileScope] = None
+
+    def __enter__(self) -> "ProfileScope":
+        # stacks are cut at the frame that opened the scope
+        self.frame = sys._getframe(1)
+        SAMPLER.enter(self)
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        SAMPLER.exit(self)
+        self.frame = None
+
+
+class _NullScope:
+    parser_name = source_type = None
+
+    def __enter__(self) -> "_NullScope":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        return None
+
+
+_NULL_SCOPE = _NullScope()
+
+
+def profile_scope(parser_name: Optional[str] = None, source_type: Optional[str] = None, config: Optional[dict] = None):
+    if not profile_enabled(config):
+        return _NULL_SCOPE
+    return ProfileScope(parser_name, source_type)
+
+
+class StackSampler:
+    """Samples the stacks of the threads in a profile scope and counts them by (parser, source_type)."""
+
+    def __init__(self) -> None:
+        self._reset()
+
+    def _reset(self) -> None:
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+        self.scopes: Dict[int, ProfileScope] = {}
+        self.stacks: Dict[GroupKey, Dict[str, int]] = {}
+        self.samples = 0
+        self.sample_s = 0.0
+        self.thread: Optional[threading.Thread] = None
+        self.labels: Dict[Any, str] = {}
+        self.last_dump = time.monotonic()
+
+    def enter(self, scope: ProfileScope) -> None:
+        thread_id = threading.get_ident()
+        with self.lock:
+            if self.pid != os.getpid():
+                # a forked child, the scopes and counts belong to the parent
+                self._reset()
+            scope.outer = self.scopes.get(thread_id)
+            self.scopes[thread_id] = scope
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="perf-profile-sampler", daemon=True)
+                self.thread.start()
+
+    def exit(self, scope: ProfileScope) -> None:
+        thread_id = threading.get_ident()
+        with self.lock:
+            if self.scopes.get(thread_id) is scope:
+                if scope.outer is not None:
+                    self.scopes[thread_id] = scope.outer
+                else:
+                    del self.scopes[thread_id]
+
+    def stop(self) -> None:
+        # the thread exits after its current sleep, the next scope starts a new one
+        with self.lock:
+            self.thread = None
+
+    def _label(self, code: Any, module: Optional[str]) -> str:
+        label = self.labels.get(code)
+        if label is None:
+            label = self.labels[code] = "%s:%s" % (module or os.path.basename(code.co_filename), code.co_name)
+        return label
+
+    def sample(self) -> None:
+        if not self.scopes:
+            return
+        started = time.perf_counter()
+        frames = sys._current_frames()
+        with self.lock:
+            for thread_id, scope in self.scopes.items():
+                frame = frames.get(thread_id)
+                if frame is None:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(self._label(frame.f_code, frame.f_globals.get("__name__")))
+                    if frame is scope.frame:
+                        break
+                    frame = frame.f_back
+                key = (scope.parser_name or "unknown", scope.source_type or "unknown")
+                counts = self.stacks.setdefault(key, {})
+                collapsed = ";".join(reversed(stack))
+                counts[collapsed] = counts.get(collapsed, 0) + 1
+                self.samples += 1
+        self.sample_s += time.perf_counter() - started
+
+    def _run(self) -> None:
+        interval_s = max(0.001, float(_setting("PERF_PROFILE_INTERVAL_MS") or _DEFAULT_INTERVAL_MS) / 1000.0)
+        dump_interval_s = float(_setting("PERF_PROFILE_DUMP_INTERVAL_S") or _DEFAULT_DUMP_INTERVAL_S)
+        while self.thread is threading.current_thread():
+            time.sleep(interval_s)
+            self.sample()
+            if _setting("PERF_PROFILE_DIR") and time.monotonic() - self.last_dump >= dump_interval_s:
+                self.last_dump = time.monotonic()
+                try:
+                    write_collapsed(_setting("PERF_PROFILE_DIR"), self.snapshot())
+                except OSError:
+                    pass
+
+    def snapshot(self, reset: bool = False) -> Dict[GroupKey, Dict[str, int]]:
+        with self.lock:
+            stacks = {key: dict(counts) for key, counts in self.stacks.items()}
+            if reset:
+                self.stacks = {}
+                self.samples = 0
+                self.sample_s = 0.0
+        return stacks
+
+
+SAMPLER = StackSampler()
+
+
+def _dump_at_exit() -> None:
+    directory = _setting("PERF_PROFILE_DIR")
+    if directory and SAMPLER.stacks and SAMPLER.pid == os.getpid():
+        try:
+            write_collapsed(directory, SAMPLER.snapshot())
+        except OSError:
+            pass
+
+
+atexit.register(_dump_at_exit)
+
+
+def _file_part(value: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.+-]", "_", value).strip(".") or "unknown"
+
+
+def write_collapsed(directory: str, stacks: Dict[GroupKey, Dict[str, int]], suffix: Optional[str] = None) -> List[str]:
+    # one file per group and process, the counts of a process are cumulative so each dump replaces the last one
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for (parser_name, source_type), counts in sorted(stacks.items()):
+        path = os.path.join(directory, "%s.%s.%s.folded" % (_file_part(parser_name), _file_part(source_type.lstrip(".")), suffix or os.getpid()))
+        temp_path = "%s.tmp" % path
+        with open(temp_path, "w") as handle:
+            for stack, count in sorted(counts.items(), key=lambda item: item[1], reverse=True):
+                handle.write("%s %d\n" % (stack, count))
+        os.replace(temp_path, path)
+        paths.append(path)
+    return paths
+
+
+def write_combined(path: str, stacks: Dict[GroupKey, Dict[str, int]]) -> str:
+    # all the groups in one file, under a parser and a source type root frame
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w") as handle:
+        for (parser_name, source_type), counts in sorted(stacks.items()):
+            for stack, count in sorted(counts.items(), key=lambda item: item[1], reverse=True):
+                handle.write("%s;%s;%s %d\n" % (parser_name, source_type, stack, count))
+    return path
+
+
+def _hot_functions(counts: Dict[str, int], top: int) -> List[Dict[str, Any]]:
+    total = sum(counts.values())
+    self_samples: Dict[str, int] = {}
+    total_samples: Dict[str, int] = {}
+    for stack, count in counts.items():
+        frames = stack.split(";")
+        self_samples[frames[-1]] = self_samples.get(frames[-1], 0) + count
+        # a recursive function is counted once per stack
+        for function in set(frames):
+            total_samples[function] = total_samples.get(function, 0) + count
+    rows = sorted(total_samples, key=lambda function: (self_samples.get(function, 0), total_samples[function]), reverse=True)
+    return [
+        {
+            "function": function,
+            "self_samples": self_samples.get(function, 0),
+            "total_samples": total_samples[function],
+            "self_share": self_samples.get(function, 0) / float(total) if total else None,
+            "total_share": total_samples[function] / float(total) if total else None,
+        }
+        for function in rows[:top]
+    ]
+
+
+def summarize_profile(stacks: Dict[GroupKey, Dict[str, int]], interval_ms: Optional[float] = None, top: int = 20) -> Dict[str, Any]:
+    overall: Dict[str, int] = {}
+    groups = {}
+    for (parser_name, source_type), counts in sorted(stacks.items(), key=lambda item: sum(item[1].values()), reverse=True):
+        for stack, count in counts.items():
+            overall[stack] = overall.get(stack, 0) + count
+        groups["%s|%s" % (parser_name, source_type)] = {
+            "parser_name": parser_name,
+            "source_type": source_type,
+            "samples": sum(counts.values()),
+            "top_functions": _hot_functions(counts, top=10),
+        }
+    return {
+        "interval_ms": interval_ms if interval_ms is not None else float(_setting("PERF_PROFILE_INTERVAL_MS") or _DEFAULT_INTERVAL_MS),
+        "samples": sum(overall.values()),
+        "top_functions": _hot_functions(overall, top=top),
+        "groups": groups,
+    }
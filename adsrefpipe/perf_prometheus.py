@@ -0,0 +1,279 @@
+"""Live Prometheus-style metrics for the pipeline stages.
+
+Stdlib-only. Every process keeps in-memory counters and latency histograms
+of the stages, labelled by stage, parser, source_type and status, and
+dumps them every few seconds to its own ``live_<pid>.json`` file in the
+metrics directory. The files are merged when the metrics are exposed, either
+written as a node_exporter textfile or served over HTTP, so the forked
+Celery worker processes never share state.
+"""
+
+from __future__ import annotations
+
+import argparse
+import atexit
+import bisect
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+METRIC_PREFIX = "adsrefpipe"
+
+# stages with live metrics
+LIVE_STAGES = frozenset({
+    "record_wall",
+    "resolver_http",
+    "post_resolved_db",
+    "parse_dispatch",
+    "pre_resolved_db",
+    "queue_references",
+})
+
+# upper bounds of the latency histogram buckets, in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_DEFAULT_DUMP_INTERVAL_S = 10.0
+
+SeriesKey = Tuple[str, str, str, str]
+
+
+def _setting(name: str, config: Optional[dict] = None) -> Optional[str]:
+    value = os.getenv(name)
+    if value is None and config is not None:
+        value = config.get(name)
+    return str(value) if value not in (None, "") else None
+
+
+class LiveMetrics:
+    """Counters and histograms of one process, keyed by (stage, parser, source_type, status)."""
+
+    def __init__(self) -> None:
+        self._reset()
+
+    def _reset(self) -> None:
+        self.lock = threading.Lock()
+        self.enabled = False
+        self.directory: Optional[str] = None
+        self.dump_interval_s = _DEFAULT_DUMP_INTERVAL_S
+        self.dirty = False
+        self.dumper: Optional[threading.Thread] = None
+        # [bucket counts (the last one is +Inf), sum of seconds, observations, records]
+        self.series: Dict[SeriesKey, List[Any]] = {}
+
+    def configure(self, directory: Optional[str], dump_interval_s: Optional[float] = None) -> None:
+        self.directory = directory
+        self.enabled = bool(directory)
+        if dump_interval_s is not None:
+            self.dump_interval_s = max(0.1, float(dump_interval_s))
+
+    def observe(self, stage: str, duration_ms: float, parser: Optional[str], source_type: Optional[str],
+                status: str = "ok", records: int = 1) -> None:
+        if stage not in LIVE_STAGES:
+            return
+        seconds = duration_ms / 1000.0
+        key = (stage, parser or "unknown", source_type or "unknown", status)
+        index = bisect.bisect_left(BUCKETS, seconds)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [[0] * (len(BUCKETS) + 1), 0.0, 0, 0]
+            series[0][index] += 1
+            series[1] += seconds
+            series[2] += 1
+            series[3] += records
+            self.dirty = True
+            if self.dumper is None:
+                self._start_dumper()
+
+    def _start_dumper(self) -> None:
+        self.dumper = threading.Thread(target=self._dump_loop, name="perf-prometheus-dump", daemon=True)
+        self.dumper.start()
+
+    def _dump_loop(self) -> None:
+        while self.dumper is threading.current_thread():
+            time.sleep(self.dump_interval_s)
+            if self.dirty:
+                try:
+                    self.dump()
+                except OSError:
+                    pass
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self.lock:
+            self.dirty = False
+            rows = [list(key) + [list(series[0]), series[1], series[2], series[3]] for key, series in self.series.items()]
+        return {"pid": os.getpid(), "updated_at": time.time(), "buckets": list(BUCKETS), "series": rows}
+
+    def dump(self) -> Optional[str]:
+        if not self.directory:
+            return None
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, "live_%d.json" % os.getpid())
+        temp_path = "%s.tmp" % path
+        with open(temp_path, "w") as handle:
+            json.dump(self.snapshot(), handle)
+        os.replace(temp_path, path)
+        return path
+
+
+LIVE_METRICS = LiveMetrics()
+
+
+def configure_live_metrics(config: Optional[dict] = None) -> bool:
+    interval = _setting("PERF_PROMETHEUS_DUMP_INTERVAL_S", config)
+    LIVE_METRICS.configure(_setting("PERF_PROMETHEUS_DIR", config), float(interval) if interval else None)
+    return LIVE_METRICS.enabled
+
+
+def _dump_at_exit() -> None:
+    if LIVE_METRICS.enabled and LIVE_METRICS.dirty:
+        try:
+            LIVE_METRICS.dump()
+        except OSError:
+            pass
+
+
+def _after_fork() -> None:
+    # the counts of the parent are in its own file, the child starts from zero with the same settings and
+    # its own dump thread, the one of the parent does not exist in the child
+    directory, interval = LIVE_METRICS.directory, LIVE_METRICS.dump_interval_s
+    LIVE_METRICS._reset()
+    LIVE_METRICS.configure(directory, interval)
+
+
+configure_live_metrics()
+atexit.register(_dump_at_exit)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+def merge_dumps(directory: str) -> Dict[SeriesKey, List[Any]]:
+    merged: Dict[SeriesKey, List[Any]] = {}
+    if not directory or not os.path.isdir(directory):
+        return merged
+    for name in sorted(os.listdir(directory)):
+        if not (name.startswith("live_") and name.endswith(".json")):
+            continue
+        try:
+            with open(os.path.join(directory, name), "r") as handle:
+                dump = json.load(handle)
+        except (OSError, ValueError):
+            continue
+        if tuple(dump.get("buckets") or ()) != BUCKETS:
+            continue
+        for stage, parser, source_type, status, counts, total, observations, records in dump.get("series", []):
+            key = (stage, parser, source_type, status)
+            series = merged.get(key)
+            if series is None:
+                merged[key] = [list(counts), total, observations, records]
+                continue
+            series[0] = [current + count for current, count in zip(series[0], counts)]
+            series[1] += total
+            series[2] += observations
+            series[3] += records
+    return merged
+
+
+def _labels(key: SeriesKey, **more: str) -> str:
+    stage, parser, source_type, status = key
+    pairs = [("stage", stage), ("parser", parser), ("source_type", source_type), ("status", status)] + sorted(more.items())
+    return ",".join('%s="%s"' % (name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+                    for name, value in pairs)
+
+
+def render_prometheus(series: Dict[SeriesKey, List[Any]]) -> str:
+    histogram = "%s_stage_duration_seconds" % METRIC_PREFIX
+    records = "%s_stage_records_total" % METRIC_PREFIX
+    lines = [
+        "# HELP %s Duration of the pipeline stages." % histogram,
+        "# TYPE %s histogram" % histogram,
+    ]
+    for key in sorted(series):
+        counts, total, observations, _ = series[key]
+        cumulative = 0
+        for bound, count in zip(BUCKETS, counts):
+            cumulative += count
+            lines.append("%s_bucket{%s} %d" % (histogram, _labels(key, le=repr(bound)), cumulative))
+        lines.append("%s_bucket{%s} %d" % (histogram, _labels(key, le="+Inf"), observations))
+        lines.append("%s_sum{%s} %r" % (histogram, _labels(key), total))
+        lines.append("%s_count{%s} %d" % (histogram, _labels(key), observations))
+    lines.extend([
+        "# HELP %s References processed by the pipeline stages." % records,
+        "# TYPE %s counter" % records,
+    ])
+    for key in sorted(series):
+        lines.append("%s{%s} %d" % (records, _labels(key), series[key][3]))
+    return "\n".join(lines) + "\n"
+
+
+def write_textfile(directory: str, output_path: str) -> str:
+    text = render_prometheus(merge_dumps(directory))
+    temp_path = "%s.%d.tmp" % (output_path, os.getpid())
+    with open(temp_path, "w") as handle:
+        handle.write(text)
+    # node_exporter must never read a partly written file
+    os.replace(temp_path, output_path)
+    return output_path
+
+
+def _handler(directory: str):
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            if LIVE_METRICS.enabled and LIVE_METRICS.directory == directory:
+                LIVE_METRICS.dump()
+            body = render_prometheus(merge_dumps(directory)).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args: Any) -> None:
+            return
+
+    return MetricsHandler
+
+
+def start_http_server(directory: str, port: int, host: str = "") -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, int(port)), _handler(directory))
+    thread = threading.Thread(target=server.serve_forever, name="perf-prometheus-http", daemon=True)
+    thread.start()
+    return server
+
+
+def main(argv: Optional[Iterable[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Expose the live pipeline metrics in the Prometheus text format")
+    parser.add_argument("--dir", default=_setting("PERF_PROMETHEUS_DIR"), help="Directory the worker processes dump their metrics to")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    textfile = subparsers.add_parser("textfile", help="Write the merged metrics for the node_exporter textfile collector")
+    textfile.add_argument("--output", required=True)
+    textfile.add_argument("--interval", type=float, default=0, help="Seconds between writes, 0 to write once")
+    serve = subparsers.add_parser("serve", help="Serve the merged metrics over HTTP on /metrics")
+    serve.add_argument("--port", type=int, default=9108)
+    serve.add_argument("--host", default="")
+    args = parser.parse_args(list(argv) if argv is not None else None)
+    if not args.dir:
+        parser.error("--dir or PERF_PROMETHEUS_DIR is required")
+    if args.command == "textfile":
+        while True:
+            write_textfile(args.dir, args.output)
+            if args.interval <= 0:
+                return 0
+            time.sleep(args.interval)
+    server = start_http_server(args.dir, args.port, host=args.host)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":  # pragma: no cover
+    raise SystemExit(main())
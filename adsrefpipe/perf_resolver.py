@@ -0,0 +1,338 @@
+"""Local stand-in for the reference resolver and Solr services.
+
+Stdlib-only. ``ResolverServer`` answers the ``/text`` and ``/xml`` requests of
+``utils.post_request_resolved_reference`` with the ``resolved`` payload of the
+reference service, and the ``/search/query`` requests of ``get_bibcode`` and
+``verify_bibcode`` with a Solr response, so that the benchmark goes through
+the HTTP client, the serialization and the connection handling without the
+ADS API.
+
+A ``ResolverProfile`` shapes the answers: a latency distribution, a rate of
+500 errors, a rate of 429 answers and a token bucket rate limit that answers
+429 with ``Retry-After`` once exceeded, and a rate of unresolved references.
+The answers are deterministic for a seed, the reference ids decide the
+bibcodes. ``GET /stats`` returns the requests served by route and status.
+
+Run it on its own for the Celery workers with
+``python -m adsrefpipe.perf_resolver --port 8765 --latency lognormal:20:0.5``
+and point ``REFERENCE_PIPELINE_SERVICE_URL`` and ``REFERENCE_PIPELINE_SOLR_URL``
+at the URLs it prints.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+SERVICE_PATH = "/v1/reference"
+SOLR_PATH = "/v1/search/query"
+
+UNRESOLVED_BIBCODE = "..................."
+
+_QUERY_RE = re.compile(r'^(?P<field>\w+):"(?P<value>.*)"$')
+
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """Latency in milliseconds from ``fixed:MS``, ``uniform:LOW:HIGH`` or ``lognormal:MEDIAN:SIGMA``; a bare number is fixed."""
+    parts = str(spec or "0").strip().split(":")
+    try:
+        if len(parts) == 1:
+            value = float(parts[0])
+            kind, params = "fixed", [value]
+        else:
+            kind, params = parts[0], [float(part) for part in parts[1:]]
+    except ValueError:
+        raise ValueError("invalid latency %r" % spec)
+    if kind == "fixed" and len(params) == 1 and params[0] >= 0:
+        return lambda rng: params[0]
+    if kind == "uniform" and len(params) == 2 and 0 <= params[0] <= params[1]:
+        return lambda rng: rng.uniform(params[0], params[1])
+    if kind == "lognormal" and len(params) == 2 and params[0] > 0 and params[1] >= 0:
+        mu = math.log(params[0])
+        return lambda rng: rng.lognormvariate(mu, params[1])
+    raise ValueError("invalid latency %r, expected fixed:MS, uniform:LOW:HIGH or lognormal:MEDIAN:SIGMA" % spec)
+
+
+class ResolverProfile:
+    """How the stand-in answers: latency, failures, throttling and unresolved references."""
+
+    def __init__(
+        self,
+        latency: str = "0",
+        error_rate: float = 0.0,
+        throttle_rate: float = 0.0,
+        rate_limit: float = 0.0,
+        retry_after_s: float = 1.0,
+        unresolved_rate: float = 0.0,
+        solr_latency: str = "0",
+        solr_miss_rate: float = 0.0,
+        seed: int = 0,
+    ) -> None:
+        for name, rate in (("error_rate", error_rate), ("throttle_rate", throttle_rate),
+                           ("unresolved_rate", unresolved_rate), ("solr_miss_rate", solr_miss_rate)):
+            if not 0.0 <= rate <= 1.0:
+                raise ValueError("%s must be between 0 and 1" % name)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.rate_limit = rate_limit
+        self.retry_after_s = retry_after_s
+        self.unresolved_rate = unresolved_rate
+        self.solr_latency = solr_latency
+        self.solr_miss_rate = solr_miss_rate
+        self.seed = seed
+        self.resolver_latency_ms = parse_latency(latency)
+        self.solr_latency_ms = parse_latency(solr_latency)
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "latency": self.latency,
+            "error_rate": self.error_rate,
+            "throttle_rate": self.throttle_rate,
+            "rate_limit": self.rate_limit,
+            "retry_after_s": self.retry_after_s,
+            "unresolved_rate": self.unresolved_rate,
+            "solr_latency": self.solr_latency,
+            "solr_miss_rate": self.solr_miss_rate,
+            "seed": self.seed,
+        }
+
+
+def _fraction(value: str, seed: int) -> float:
+    # the same reference gets the same answer in every run
+    return (zlib.crc32(("%s:%s" % (seed, value)).encode("utf-8")) % 100000) / 100000.0
+
+
+def _bibcode(value: str) -> str:
+    return "2000LOCAL%09dL" % (zlib.crc32(value.encode("utf-8")) % 1000000000)
+
+
+def resolve_reference(reference: Dict[str, Any], profile: ResolverProfile) -> Dict[str, Any]:
+    reference_id = str(reference.get("id") or "")
+    refstring = reference.get("refstr") or reference.get("refplaintext") or reference.get("refraw") or ""
+    if _fraction(reference_id + refstring, profile.seed) < profile.unresolved_rate:
+        return {"id": reference_id, "refstring": refstring, "bibcode": UNRESOLVED_BIBCODE, "score": 0.0}
+    bibcode = _bibcode(reference_id + refstring)
+    return {
+        "id": reference_id,
+        "refstring": refstring,
+        "bibcode": bibcode,
+        "scix_id": "scix:%s" % bibcode[-10:],
+        "score": 1.0,
+        "external_identifier": ["local:%s" % bibcode],
+        "publication_year": reference.get("year"),
+        "refereed_status": 1,
+    }
+
+
+class ResolverServer(ThreadingHTTPServer):
+    """Threaded HTTP server holding the profile, the random state and the counters of the stand-in."""
+
+    def __init__(self, address: Any, profile: ResolverProfile) -> None:
+        super().__init__(address, ResolverHandler)
+        self.profile = profile
+        self.lock = threading.Lock()
+        self.random = random.Random(profile.seed)
+        self.tokens = max(1.0, profile.rate_limit)
+        self.refilled_at = time.monotonic()
+        self.requests: Dict[str, Dict[str, int]] = {}
+        self.injected_ms = 0.0
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return "http://%s:%d" % (host, port)
+
+    @property
+    def service_url(self) -> str:
+        return self.url + SERVICE_PATH
+
+    @property
+    def solr_url(self) -> str:
+        return self.url + SOLR_PATH
+
+    def draw(self, latency: Callable[[random.Random], float]) -> Dict[str, Any]:
+        # the fate of one request, drawn under the lock so that a seed replays the same sequence
+        with self.lock:
+            throttled = False
+            if self.profile.rate_limit > 0:
+                now = time.monotonic()
+                self.tokens = min(max(1.0, self.profile.rate_limit), self.tokens + (now - self.refilled_at) * self.profile.rate_limit)
+                self.refilled_at = now
+                if self.tokens < 1.0:
+                    throttled = True
+                else:
+                    self.tokens -= 1.0
+            throttled = throttled or self.random.random() < self.profile.throttle_rate
+            failed = self.random.random() < self.profile.error_rate
+            latency_ms = latency(self.random)
+        return {"throttled": throttled, "failed": failed, "latency_ms": latency_ms}
+
+    def count(self, route: str, status: int, latency_ms: float = 0.0) -> None:
+        with self.lock:
+            counts = self.requests.setdefault(route, {})
+            counts[str(status)] = counts.get(str(status), 0) + 1
+            self.injected_ms += latency_ms
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "requests": {route: dict(counts) for route, counts in self.requests.items()},
+                "injected_latency_ms": round(self.injected_ms, 3),
+                "profile": self.profile.describe(),
+            }
+
+
+class ResolverHandler(BaseHTTPRequestHandler):
+    server: ResolverServer
+    protocol_version = "HTTP/1.1"
+
+    def _send_json(self, status: int, payload: Any, headers: Optional[Dict[str, str]] = None) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _answer(self, route: str, latency: Callable[[random.Random], float], respond: Callable[[], Any]) -> None:
+        fate = self.server.draw(latency)
+        if fate["throttled"]:
+            # throttled requests are answered at once, as a gateway would
+            self.server.count(route, 429)
+            retry_after = self.server.profile.retry_after_s
+            self._send_json(429, {"error": "too many requests"}, headers={"Retry-After": "%g" % retry_after})
+            return
+        time.sleep(fate["latency_ms"] / 1000.0)
+        if fate["failed"]:
+            self.server.count(route, 500, fate["latency_ms"])
+            self._send_json(500, {"error": "internal error"})
+            return
+        self.server.count(route, 200, fate["latency_ms"])
+        self._send_json(200, respond())
+
+    def do_POST(self) -> None:
+        path = urlparse(self.path).path.rstrip("/")
+        service = path.rsplit("/", 1)[-1]
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        if service not in ("text", "xml"):
+            self.server.count("unknown", 404)
+            self._send_json(404, {"error": "unknown service %s" % path})
+            return
+        try:
+            payload = json.loads(raw.decode("utf-8") or "{}")
+            if service == "text":
+                references = [{"id": reference_id, "refstr": refstr}
+                              for refstr, reference_id in zip(payload["reference"], payload["id"])]
+            else:
+                references = list(payload["parsed_reference"])
+        except (ValueError, KeyError, TypeError):
+            self.server.count(service, 400)
+            self._send_json(400, {"error": "malformed %s payload" % service})
+            return
+        self._answer(service, self.server.profile.resolver_latency_ms, lambda: {
+            "resolved": [resolve_reference(reference, self.server.profile) for reference in references],
+        })
+
+    def do_GET(self) -> None:
+        parsed = urlparse(self.path)
+        path = parsed.path.rstrip("/")
+        if path == "/stats":
+            self._send_json(200, self.server.stats())
+            return
+        if not path.endswith("/search/query"):
+            self.server.count("unknown", 404)
+            self._send_json(404, {"error": "unknown path %s" % path})
+            return
+        match = _QUERY_RE.match((parse_qs(parsed.query).get("q") or [""])[0])
+        if not match:
+            self.server.count("solr", 400)
+            self._send_json(400, {"error": "unsupported query"})
+            return
+
+        def respond() -> Dict[str, Any]:
+            value = match.group("value")
+            if _fraction(value, self.server.profile.seed) < self.server.profile.solr_miss_rate:
+                docs = []
+            else:
+                # an identifier query verifies a bibcode, a doi query looks one up
+                docs = [{"bibcode": value if match.group("field") == "identifier" else _bibcode(value)}]
+            return {"responseHeader": {"status": 0}, "response": {"numFound": len(docs), "start": 0, "docs": docs}}
+
+        self._answer("solr", self.server.profile.solr_latency_ms, respond)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        return
+
+
+def start_resolver_server(profile: Optional[ResolverProfile] = None, port: int = 0, host: str = "127.0.0.1") -> ResolverServer:
+    server = ResolverServer((host, int(port)), profile or ResolverProfile())
+    thread = threading.Thread(target=server.serve_forever, name="perf-resolver-http", daemon=True)
+    thread.start()
+    return server
+
+
+def add_profile_arguments(parser: argparse.ArgumentParser, prefix: str = "") -> None:
+    parser.add_argument("--%slatency" % prefix, default="0",
+                        help="Latency in ms of the resolver: MS, fixed:MS, uniform:LOW:HIGH or lognormal:MEDIAN:SIGMA")
+    parser.add_argument("--%serror-rate" % prefix, type=float, default=0.0, help="Share of requests answered with 500")
+    parser.add_argument("--%sthrottle-rate" % prefix, type=float, default=0.0, help="Share of requests answered with 429")
+    parser.add_argument("--%srate-limit" % prefix, type=float, default=0.0,
+                        help="Requests per second served before answering 429, 0 for no limit")
+    parser.add_argument("--%sretry-after" % prefix, type=float, default=1.0, help="Retry-After seconds of the 429 answers")
+    parser.add_argument("--%sunresolved-rate" % prefix, type=float, default=0.0, help="Share of references left unresolved")
+    parser.add_argument("--%ssolr-latency" % prefix, default="0", help="Latency in ms of the Solr queries, as --latency")
+    parser.add_argument("--%ssolr-miss-rate" % prefix, type=float, default=0.0, help="Share of Solr queries with no match")
+    parser.add_argument("--%sseed" % prefix, type=int, default=0)
+
+
+def profile_from_args(args: argparse.Namespace, prefix: str = "") -> ResolverProfile:
+    prefix = prefix.replace("-", "_")
+    return ResolverProfile(
+        latency=getattr(args, prefix + "latency"),
+        error_rate=getattr(args, prefix + "error_rate"),
+        throttle_rate=getattr(args, prefix + "throttle_rate"),
+        rate_limit=getattr(args, prefix + "rate_limit"),
+        retry_after_s=getattr(args, prefix + "retry_after"),
+        unresolved_rate=getattr(args, prefix + "unresolved_rate"),
+        solr_latency=getattr(args, prefix + "solr_latency"),
+        solr_miss_rate=getattr(args, prefix + "solr_miss_rate"),
+        seed=getattr(args, prefix + "seed"),
+    )
+
+
+def main(argv: Optional[Iterable[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Serve a local stand-in for the reference resolver and Solr services")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--host", default="127.0.0.1")
+    add_profile_arguments(parser)
+    args = parser.parse_args(list(argv) if argv is not None else None)
+    try:
+        profile = profile_from_args(args)
+    except ValueError as exc:
+        parser.error(str(exc))
+    server = start_resolver_server(profile, port=args.port, host=args.host)
+    print("REFERENCE_PIPELINE_SERVICE_URL=%s" % server.service_url)
+    print("REFERENCE_PIPELINE_SOLR_URL=%s" % server.solr_url, flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":  # pragma: no cover
+    raise SystemExit(main())
@@ -0,0 +1,178 @@
+"""Scaling analysis of a benchmark sweep.
+
+Stdlib-only. A sweep runs the same files once per point of a grid of parse
+workers, task concurrency and metrics settings; ``analyze_sweep`` turns the
+points into a scaling table, with the speedup and parallel efficiency of each
+point against the least parallel one, and into throughput curves along each
+dimension, with the point where adding parallelism stops paying off.
+
+Parallelism is workers times task concurrency. A curve saturates at the last
+point before a step whose marginal efficiency, the relative throughput gain
+over the relative parallelism gain, falls under the saturation threshold.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional
+
+DIMENSIONS = ("workers", "task_concurrency")
+
+_BAR_WIDTH = 40
+
+
+def sweep_point(summary: Dict[str, Any]) -> Dict[str, Any]:
+    metadata = summary.get("run_metadata") or {}
+    counts = summary.get("counts") or {}
+    return {
+        "run_id": metadata.get("run_id"),
+        "status": summary.get("status"),
+        "records_per_minute": (summary.get("throughput") or {}).get("overall_records_per_minute"),
+        "wall_s": (summary.get("duration_s") or {}).get("wall_clock"),
+        "records": counts.get("records_processed") or counts.get("records_submitted"),
+        "failures": counts.get("failures"),
+        "record_wall_p50_ms": ((summary.get("per_record_metrics_ms") or {}).get("wall_time") or {}).get("p50"),
+    }
+
+
+def _median(values: List[float]) -> Optional[float]:
+    values = sorted(value for value in values if value is not None)
+    if not values:
+        return None
+    middle = len(values) // 2
+    return values[middle] if len(values) % 2 else (values[middle - 1] + values[middle]) / 2.0
+
+
+def combine_repeats(settings: Dict[str, Any], runs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    # the median of the repeats of a point, the runs are kept for the spread
+    return dict(
+        settings,
+        parallelism=settings["workers"] * settings["task_concurrency"],
+        repeats=len(runs),
+        status="complete" if all(run["status"] == "complete" for run in runs) else "incomplete",
+        records_per_minute=_median([run["records_per_minute"] for run in runs]),
+        wall_s=_median([run["wall_s"] for run in runs]),
+        records=max((run["records"] or 0) for run in runs) if runs else 0,
+        failures=sum(run["failures"] or 0 for run in runs),
+        record_wall_p50_ms=_median([run["record_wall_p50_ms"] for run in runs]),
+        runs=runs,
+    )
+
+
+def _ratio(numerator: Optional[float], denominator: Optional[float]) -> Optional[float]:
+    return numerator / denominator if numerator is not None and denominator else None
+
+
+def _curve(points: List[Dict[str, Any]], dimension: str, saturation: float) -> Dict[str, Any]:
+    points = sorted(points, key=lambda point: point[dimension])
+    steps, saturates_at = [], None
+    for previous, point in zip(points, points[1:]):
+        gain = _ratio(point["records_per_minute"], previous["records_per_minute"])
+        marginal = (gain - 1.0) / (point[dimension] / float(previous[dimension]) - 1.0) if gain is not None else None
+        steps.append(marginal)
+        if saturates_at is None and marginal is not None and marginal < saturation:
+            saturates_at = previous[dimension]
+    return {
+        "values": [point[dimension] for point in points],
+        "records_per_minute": [point["records_per_minute"] for point in points],
+        "marginal_efficiency": [None] + steps,
+        "saturates_at": saturates_at,
+    }
+
+
+def analyze_sweep(points: List[Dict[str, Any]], saturation: float = 0.25) -> Dict[str, Any]:
+    by_metrics: Dict[str, List[Dict[str, Any]]] = {}
+    for point in points:
+        by_metrics.setdefault(point["metrics"], []).append(point)
+
+    curves = []
+    for metrics, group in sorted(by_metrics.items()):
+        baseline = min(group, key=lambda point: (point["parallelism"], point["workers"]))
+        for point in group:
+            point["speedup"] = _ratio(point["records_per_minute"], baseline["records_per_minute"])
+            point["efficiency"] = (
+                point["speedup"] / (point["parallelism"] / float(baseline["parallelism"])) if point["speedup"] is not None else None
+            )
+        for dimension in DIMENSIONS:
+            other = DIMENSIONS[1 - DIMENSIONS.index(dimension)]
+            lines: Dict[int, List[Dict[str, Any]]] = {}
+            for point in group:
+                lines.setdefault(point[other], []).append(point)
+            for fixed, line in sorted(lines.items()):
+                if len(line) > 1:
+                    curves.append(dict(_curve(line, dimension, saturation), dimension=dimension, metrics=metrics, fixed={other: fixed}))
+
+    # the cost of the events, for the points run with the full and with the minimal metrics
+    full = {(point["workers"], point["task_concurrency"]): point for point in by_metrics.get("full", [])}
+    for point in by_metrics.get("minimal", []):
+        match = full.get((point["workers"], point["task_concurrency"]))
+        if match is not None and match["records_per_minute"] is not None and point["records_per_minute"]:
+            match["metrics_overhead"] = 1.0 - match["records_per_minute"] / point["records_per_minute"]
+
+    best = max((point for point in points if point["records_per_minute"] is not None),
+               key=lambda point: point["records_per_minute"], default=None)
+    return {
+        "points": sorted(points, key=lambda point: (point["metrics"], point["parallelism"], point["workers"])),
+        "curves": curves,
+        "best": None if best is None else {key: best[key] for key in ("workers", "task_concurrency", "metrics", "records_per_minute")},
+        "saturation_threshold": saturation,
+    }
+
+
+def _fmt(value: Optional[float], places: int = 2) -> str:
+    return "" if value is None else "%.*f" % (places, value)
+
+
+def _pct(value: Optional[float]) -> str:
+    return "" if value is None else "%.1f" % (value * 100.0)
+
+
+def render_sweep_markdown(sweep: Dict[str, Any], output_path: str) -> None:
+    settings = sweep.get("settings") or {}
+    lines = [
+        "# ADS Reference Benchmark Sweep",
+        "",
+        "- Input: `%s` (%d files)" % (settings.get("input_path"), len(settings.get("selected_files") or [])),
+        "- Mode: `%s`%s" % (settings.get("mode"), "" if settings.get("mock_resolver_latency_ms") is None
+                            else ", mock resolver latency %s ms" % _fmt(settings["mock_resolver_latency_ms"], 1)),
+        "- Repeats per point: %s, warmup: `%s`" % (settings.get("repeat"), settings.get("warmup")),
+        "- Saturation: marginal efficiency under %s%%" % _pct(sweep["saturation_threshold"]),
+    ]
+    if sweep.get("best"):
+        best = sweep["best"]
+        lines.append("- Best: %s workers x %s task concurrency, metrics `%s`, %s records/min" % (
+            best["workers"], best["task_concurrency"], best["metrics"], _fmt(best["records_per_minute"])))
+    lines.extend([
+        "",
+        "## Scaling",
+        "",
+        "| Workers | Task Concurrency | Metrics | Parallelism | Records/min | Speedup | Efficiency % | Metrics Overhead % | Wall s | Record p50 ms | Failures | Status |",
+        "|---:|---:|---|---:|---:|---:|---:|---:|---:|---:|---:|---|",
+    ])
+    for point in sweep["points"]:
+        lines.append("| %s | %s | %s | %s | %s | %s | %s | %s | %s | %s | %s | %s |" % (
+            point["workers"], point["task_concurrency"], point["metrics"], point["parallelism"],
+            _fmt(point["records_per_minute"]), _fmt(point.get("speedup")), _pct(point.get("efficiency")),
+            _pct(point.get("metrics_overhead")), _fmt(point["wall_s"], 3), _fmt(point["record_wall_p50_ms"], 3),
+            point["failures"], point["status"],
+        ))
+    lines.extend(["", "## Scaling Curves", ""])
+    if not sweep["curves"]:
+        lines.extend(["No dimension has more than one value.", ""])
+    for curve in sweep["curves"]:
+        fixed = ", ".join("%s=%s" % item for item in curve["fixed"].items())
+        peak = max((value for value in curve["records_per_minute"] if value is not None), default=None)
+        lines.extend([
+            "### %s (metrics `%s`, %s)" % (curve["dimension"], curve["metrics"], fixed),
+            "",
+            "Saturates at %s=%s." % (curve["dimension"], curve["saturates_at"]) if curve["saturates_at"] is not None
+            else "Does not saturate within the grid.",
+            "",
+            "| %s | Records/min | Marginal Efficiency %% | |" % curve["dimension"],
+            "|---:|---:|---:|---|",
+        ])
+        for value, throughput, marginal in zip(curve["values"], curve["records_per_minute"], curve["marginal_efficiency"]):
+            bar = "#" * int(round(_BAR_WIDTH * throughput / peak)) if throughput and peak else ""
+            lines.append("| %s | %s | %s | %s |" % (value, _fmt(throughput), _pct(marginal), "`%s`" % bar if bar else ""))
+        lines.append("")
+    with open(output_path, "w") as handle:
+        handle.write("\n".join(lines))
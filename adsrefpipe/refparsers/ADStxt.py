@@ -11,6 +11,7 @@ config.update(load_config())
 
 from adsrefpipe.refparsers.toREFs import TXTtoREFs
 from adsrefpipe.refparsers.reference import unicode_handler, LatexReference
+from adsrefpipe.refparsers.cleanup import apply_cleanup
 
 
 class ADStxtToREFs(TXTtoREFs):
@@ -84,8 +85,7 @@ class ARAnATXTtoREFs(ADStxtToREFs):
             with open(filename, 'r', encoding=encoding, errors='ignore') as f:
                 reader = f.readlines()
                 for i in range(len((reader))):
-                    for (compiled_re, replace_str) in self.block_cleanup:
-                        reader[i] = compiled_re.sub(replace_str, reader[i])
+                    reader[i] = apply_cleanup(self.block_cleanup, reader[i])
 
                 bibcode = None
                 match = self.re_bibcode.match(os.path.basename(filename))
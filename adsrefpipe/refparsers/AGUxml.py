@@ -148,8 +148,8 @@ class AGUtoREFs(XMLtoREFs):
 # It allows parsing references from either a file or a buffer, and if no input is provided,
 # it runs a source test file to verify the functionality against expected parsed results.
 # The test results are printed to indicate whether the parsing is successful or not.
-from adsrefpipe.tests.unittests.stubdata import parsed_references
 if __name__ == '__main__':      # pragma: no cover
+    from adsrefpipe.tests.unittests.stubdata import parsed_references
     parser = argparse.ArgumentParser(description='Parse AGU references')
     parser.add_argument('-f', '--filename', help='the path to source file')
     parser.add_argument('-b', '--buffer', help='xml reference(s)')
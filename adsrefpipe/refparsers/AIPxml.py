@@ -12,6 +12,7 @@ config.update(load_config())
 from adsrefpipe.refparsers.reference import XMLreference, ReferenceError
 from adsrefpipe.refparsers.toREFs import XMLtoREFs
 from adsrefpipe.refparsers.unicode import tounicode
+from adsrefpipe.refparsers.cleanup import apply_cleanup
 
 
 class AIPreference(XMLreference):
@@ -176,8 +177,7 @@ class AIPtoREFs(XMLtoREFs):
         #    <tag_whatever>...
         # We just need to be careful to catch both <tag>...</tag>
         # and <tag /> and to close them properly
-        for (compiled_re, replace_str) in self.reference_cleanup:
-            reference = compiled_re.sub(replace_str, reference)
+        reference = apply_cleanup(self.reference_cleanup, reference)
 
         # take care of previous author tag
         if prev_reference:
@@ -219,8 +219,8 @@ class AIPtoREFs(XMLtoREFs):
 # It allows parsing references from either a file or a buffer, and if no input is provided,
 # it runs a source test file to verify the functionality against expected parsed results.
 # The test results are printed to indicate whether the parsing is successful or not.
-from adsrefpipe.tests.unittests.stubdata import parsed_references
 if __name__ == '__main__':      # pragma: no cover
+    from adsrefpipe.tests.unittests.stubdata import parsed_references
     parser = argparse.ArgumentParser(description='Parse AIP references')
     parser.add_argument('-f', '--filename', help='the path to source file')
     parser.add_argument('-b', '--buffer', help='xml reference(s)')
@@ -11,6 +11,7 @@ config.update(load_config())
 
 from adsrefpipe.refparsers.reference import XMLreference, ReferenceError
 from adsrefpipe.refparsers.toREFs import XMLtoREFs
+from adsrefpipe.refparsers.cleanup import apply_cleanup
 
 
 class APSreference(XMLreference):
@@ -168,8 +169,7 @@ class APStoREFs(XMLtoREFs):
         :param prev_reference: the previous reference to use in cleanup
         :return: the cleaned-up reference string and the previous reference
         """
-        for (compiled_re, replace_str) in self.reference_cleanup:
-            reference = compiled_re.sub(replace_str, reference)
+        reference = apply_cleanup(self.reference_cleanup, reference)
 
         # take care of previous author tag
         if prev_reference:
@@ -215,8 +215,8 @@ class APStoREFs(XMLtoREFs):
 # It allows parsing references from either a file or a buffer, and if no input is provided,
 # it runs a source test file to verify the functionality against expected parsed results.
 # The test results are printed to indicate whether the parsing is successful or not.
-from adsrefpipe.tests.unittests.stubdata import parsed_references
 if __name__ == '__main__':      # pragma: no cover
+    from adsrefpipe.tests.unittests.stubdata import parsed_references
     parser = argparse.ArgumentParser(description='Parse APS references')
     parser.add_argument('-f', '--filename', help='the path to source file')
     parser.add_argument('-b', '--buffer', help='xml reference(s)')
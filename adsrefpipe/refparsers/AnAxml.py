@@ -11,6 +11,7 @@ config.update(load_config())
 
 from adsrefpipe.refparsers.reference import XMLreference, ReferenceError
 from adsrefpipe.refparsers.toREFs import XMLtoREFs
+from adsrefpipe.refparsers.cleanup import apply_cleanup
 
 
 class AnAreference(XMLreference):
@@ -93,8 +94,7 @@ class AnAtoREFs(XMLtoREFs):
         :param reference: the raw reference string to clean
         :return: cleaned reference string
         """
-        for (compiled_re, replace_str) in self.reference_cleanup:
-            reference = compiled_re.sub(replace_str, reference)
+        reference = apply_cleanup(self.reference_cleanup, reference)
 
         return reference
 
@@ -131,8 +131,8 @@ class AnAtoREFs(XMLtoREFs):
 # It allows parsing references from either a file or a buffer, and if no input is provided,
 # it runs a source test file to verify the functionality against expected parsed results.
 # The test results are printed to indicate whether the parsing is successful or not.
-from adsrefpipe.tests.unittests.stubdata import parsed_references
 if __name__ == '__main__':      # pragma: no cover
+    from adsrefpipe.tests.unittests.stubdata import parsed_references
     parser = argparse.ArgumentParser(description='Parse AnA references')
     parser.add_argument('-f', '--filename', help='the path to source file')
     parser.add_argument('-b', '--buffer', help='xml reference(s)')
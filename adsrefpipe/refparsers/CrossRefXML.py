@@ -11,6 +11,8 @@ config.update(load_config())
 
 from adsrefpipe.refparsers.reference import XMLreference, ReferenceError
 from adsrefpipe.refparsers.toREFs import XMLtoREFs
+from adsrefpipe.refparsers.patterns import compile_cached
+from adsrefpipe.refparsers.cleanup import apply_cleanup
 
 
 class CrossRefreference(XMLreference):
@@ -126,8 +128,8 @@ class CrossRefreference(XMLreference):
         separator = input_separator if input_separator != [] else [',', r'\band\b', '&']
         space = input_space if input_space != [] else [' ']
 
-        re_separator = re.compile(r'\s*(?:' + '|'.join(separator) + r')\s*')
-        re_space = re.compile(r'\s*(?:' + '|'.join(space) + r')\s*')
+        re_separator = compile_cached(r'\s*(?:' + '|'.join(separator) + r')\s*')
+        re_space = compile_cached(r'\s*(?:' + '|'.join(space) + r')\s*')
 
         formatted = []
         etal = ''
@@ -248,8 +250,7 @@ class CrossRefToREFs(XMLtoREFs):
         :param reference: the raw reference string to clean
         :return: cleaned reference string
         """
-        for (compiled_re, replace_str) in self.reference_cleanup:
-            reference = compiled_re.sub(replace_str, reference)
+        reference = apply_cleanup(self.reference_cleanup, reference)
         return reference
 
     def process_and_dispatch(self) -> List[Dict[str, List[Dict[str, str]]]]:
@@ -287,8 +288,8 @@ class CrossRefToREFs(XMLtoREFs):
 # It allows parsing references from either a file or a buffer, and if no input is provided,
 # it runs a source test file to verify the functionality against expected parsed results.
 # The test results are printed to indicate whether the parsing is successful or not.
-from adsrefpipe.tests.unittests.stubdata import parsed_references
 if __name__ == '__main__':      # pragma: no cover
+    from adsrefpipe.tests.unittests.stubdata import parsed_references
     parser = argparse.ArgumentParser(description='Parse CrossRef references')
     parser.add_argument('-f', '--filename', help='the path to source file')
     parser.add_argument('-b', '--buffer', help='xml reference(s)')
@@ -12,6 +12,7 @@ config.update(load_config())
 from adsrefpipe.refparsers.reference import XMLreference, ReferenceError
 from adsrefpipe.refparsers.toREFs import XMLtoREFs
 from adsrefpipe.refparsers.reference import unicode_handler
+from adsrefpipe.refparsers.cleanup import apply_cleanup
 
 
 class EGUreference(XMLreference):
@@ -74,8 +75,7 @@ class EGUtoREFs(XMLtoREFs):
         :param reference: the raw reference string to clean
         :return: cleaned reference string
         """
-        for (compiled_re, replace_str) in self.reference_cleanup:
-            reference = compiled_re.sub(replace_str, reference)
+        reference = apply_cleanup(self.reference_cleanup, reference)
 
         return reference
 
@@ -113,8 +113,8 @@ class EGUtoREFs(XMLtoREFs):
 # It allows parsing references from either a file or a buffer, and if no input is provided,
 # it runs a source test file to verify the functionality against expected parsed results.
 # The test results are printed to indicate whether the parsing is successful or not.
-from adsrefpipe.tests.unittests.stubdata import parsed_references
 if __name__ == '__main__':  # pragma: no cover
+    from adsrefpipe.tests.unittests.stubdata import parsed_references
     parser = argparse.ArgumentParser(description='Parse EGU references')
     parser.add_argument('-f', '--filename', help='the path to source file')
     parser.add_argument('-b', '--buffer', help='xml reference(s)')
@@ -11,6 +11,11 @@ config.update(load_config())
 
 from adsrefpipe.refparsers.reference import XMLreference, ReferenceError
 from adsrefpipe.refparsers.toREFs import XMLtoREFs
+from adsrefpipe.refparsers import datacache
+
+# data files mapping bibcodes to Living Reviews DOIs
+LLR_id = os.path.dirname(__file__) + '/data_files/LRR.dat'
+LRSP_id = os.path.dirname(__file__) + '/data_files/LRSP.dat'
 
 
 def read_data_files() -> Dict:
@@ -24,8 +29,6 @@ def read_data_files() -> Dict:
     :return: a dictionary mapping LR codes to bibcodes
     """
 
-    LLR_id = os.path.dirname(__file__) + '/data_files/LRR.dat'
-    LRSP_id = os.path.dirname(__file__) + '/data_files/LRSP.dat'
     LR2bibcode = {}
     entries = open(LLR_id).read().strip().split('\n')
     entries += open(LRSP_id).read().strip().split('\n')
@@ -38,8 +41,19 @@ def read_data_files() -> Dict:
             continue
     return LR2bibcode
 
-# global lookup table
-LR2bibcode = read_data_files()
+# global lookup table, loaded on first use by get_LR2bibcode
+LR2bibcode = None
+
+def get_LR2bibcode() -> Dict:
+    """
+    load the LR codes to bibcodes lookup table if not already loaded
+
+    :return: a dictionary mapping LR codes to bibcodes
+    """
+    global LR2bibcode
+    if LR2bibcode is None:
+        LR2bibcode = datacache.load_table([LLR_id, LRSP_id], 'LR2bibcode', read_data_files)
+    return LR2bibcode
 
 
 class LivingReviewsreference(XMLreference):
@@ -192,7 +206,7 @@ class LivingReviewsToREFs(XMLtoREFs):
 
         if filename:
             code = os.path.basename(filename).replace('.living.xml', '').strip()
-            bibcode = LR2bibcode.get(code, 'NA')
+            bibcode = get_LR2bibcode().get(code, 'NA')
             if bibcode:
                 try:
                     buffer = open(filename, encoding=encoding, errors='ignore').read()
@@ -233,8 +247,8 @@ class LivingReviewsToREFs(XMLtoREFs):
 # It allows parsing references from either a file or a buffer, and if no input is provided,
 # it runs a source test file to verify the functionality against expected parsed results.
 # The test results are printed to indicate whether the parsing is successful or not.
-from adsrefpipe.tests.unittests.stubdata import parsed_references
 if __name__ == '__main__':  # pragma: no cover
+    from adsrefpipe.tests.unittests.stubdata import parsed_references
     parser = argparse.ArgumentParser(description='Parse Living Reviews references')
     parser.add_argument('-f', '--filename', help='the path to source file')
     parser.add_argument('-b', '--buffer', help='xml reference(s)')
@@ -11,6 +11,7 @@ config.update(load_config())
 from adsrefpipe.refparsers.reference import XMLreference, ReferenceError
 from adsrefpipe.refparsers.toREFs import XMLtoREFs
 from adsrefpipe.refparsers.reference import unicode_handler
+from adsrefpipe.refparsers.cleanup import apply_cleanup
 
 
 class ONCPreference(XMLreference):
@@ -114,8 +115,7 @@ class ONCPtoREFs(XMLtoREFs):
         match = self.re_parse_line.search(reference)
         if match:
             reference = self.citation_format % unicode_handler.ent2asc(match.group('citation').strip())
-            for (compiled_re, replace_str) in self.reference_cleanup:
-                reference = compiled_re.sub(replace_str, reference)
+            reference = apply_cleanup(self.reference_cleanup, reference)
         return reference
 
     def process_and_dispatch(self) -> List[Dict[str, List[Dict[str, str]]]]:
@@ -151,8 +151,8 @@ class ONCPtoREFs(XMLtoREFs):
 # It allows parsing references from either a file or a buffer, and if no input is provided,
 # it runs a source test file to verify the functionality against expected parsed results.
 # The test results are printed to indicate whether the parsing is successful or not.
-from adsrefpipe.tests.unittests.stubdata import parsed_references
 if __name__ == '__main__':  # pragma: no cover
+    from adsrefpipe.tests.unittests.stubdata import parsed_references
     parser = argparse.ArgumentParser(description='Parse ONCP references')
     parser.add_argument('-f', '--filename', help='the path to source file')
     parser.add_argument('-b', '--buffer', help='xml reference(s)')
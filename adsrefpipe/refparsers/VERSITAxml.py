@@ -12,6 +12,7 @@ config.update(load_config())
 from adsrefpipe.refparsers.reference import XMLreference, ReferenceError
 from adsrefpipe.refparsers.toREFs import XMLtoREFs, toREFs
 from adsrefpipe.refparsers.unicode import tostr
+from adsrefpipe.refparsers.cleanup import apply_cleanup
 
 
 class VERSITAreference(XMLreference):
@@ -185,8 +186,7 @@ class VERSITAtoREFs(XMLtoREFs):
                 buffer = list(filter(None, [ref.strip() for ref in buffer.split('\n')]))
                 buffer = ' '.join(['%s </ref>'%ref if ref.startswith('<ref') else '<ref id="no id"> %s </ref>'%ref for ref in buffer])
                 if self.block_cleanup:
-                    for (compiled_re, replace_str) in self.block_cleanup:
-                        buffer = compiled_re.sub(replace_str, buffer)
+                    buffer = apply_cleanup(self.block_cleanup, buffer)
 
                 block_references = self.get_xml_block(buffer, tag='ref')
                 self.raw_references.append({'bibcode':bibcode, 'block_references':block_references})
@@ -198,8 +198,7 @@ class VERSITAtoREFs(XMLtoREFs):
         :param reference: the raw reference string to clean
         :return: cleaned reference string
         """
-        for (compiled_re, replace_str) in self.reference_cleanup:
-            reference = compiled_re.sub(replace_str, reference)
+        reference = apply_cleanup(self.reference_cleanup, reference)
         return reference
 
     def process_and_dispatch(self) -> List[Dict[str, List[Dict[str, str]]]]:
@@ -235,8 +234,8 @@ class VERSITAtoREFs(XMLtoREFs):
 # It allows parsing references from either a file or a buffer, and if no input is provided,
 # it runs a source test file to verify the functionality against expected parsed results.
 # The test results are printed to indicate whether the parsing is successful or not.
-from adsrefpipe.tests.unittests.stubdata import parsed_references
 if __name__ == '__main__':      # pragma: no cover
+    from adsrefpipe.tests.unittests.stubdata import parsed_references
     parser = argparse.ArgumentParser(description='Parse VERSITA references')
     parser.add_argument('-f', '--filename', help='the path to source file')
     parser.add_argument('-b', '--buffer', help='xml reference(s)')
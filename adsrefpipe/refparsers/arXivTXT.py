@@ -11,6 +11,7 @@ config.update(load_config())
 
 from adsrefpipe.refparsers.toREFs import TXTtoREFs
 from adsrefpipe.refparsers.reference import unicode_handler
+from adsrefpipe.refparsers.cleanup import apply_cleanup
 
 
 class ARXIVtoREFs(TXTtoREFs):
@@ -63,11 +64,9 @@ class ARXIVtoREFs(TXTtoREFs):
         :param reference: the raw reference string to clean up
         :return: the cleaned reference string
         """
-        for (compiled_re, replace_str) in self.reference_cleanup_1:
-            reference = compiled_re.sub(replace_str, reference)
+        reference = apply_cleanup(self.reference_cleanup_1, reference)
         reference = unicode_handler.ent2asc(reference)
-        for (compiled_re, replace_str) in self.reference_cleanup_2:
-            reference = compiled_re.sub(replace_str, reference)
+        reference = apply_cleanup(self.reference_cleanup_2, reference)
         return reference
 
     def process_and_dispatch(self) -> List[Dict[str, List[Dict[str, str]]]]:
@@ -99,8 +98,8 @@ class ARXIVtoREFs(TXTtoREFs):
 # It allows parsing references from either a file or a buffer, and if no input is provided,
 # it runs a source test file to verify the functionality against expected parsed results.
 # The test results are printed to indicate whether the parsing is successful or not.
-from adsrefpipe.tests.unittests.stubdata import parsed_references
 if __name__ == '__main__':      # pragma: no cover
+    from adsrefpipe.tests.unittests.stubdata import parsed_references
     parser = argparse.ArgumentParser(description='Parse arXiv references')
     parser.add_argument('-f', '--filename', help='the path to source file')
     parser.add_argument('-b', '--buffer', help='text reference(s)')
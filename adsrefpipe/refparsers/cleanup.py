@@ -0,0 +1,513 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+
+"""
+engine for the cleanup lists of the refparsers
+
+a cleanup list, ie block_cleanup or reference_cleanup, is [(compiled_re, replace_str), ...] applied in order,
+so each reference is rescanned once per rule. compile_cleanup turns the list into a CleanupChain that produces
+the same output as the ordered application, with fewer and cheaper passes over the text:
+
+- a rule whose pattern is a plain literal is applied with str.replace
+- consecutive literal rules that cannot affect each other's matches are merged into one alternation,
+  with a dispatch table from the matched literal to its replacement
+- any other rule keeps its pattern, but is skipped when a literal that every match has to contain is not in the text
+
+apply_sequential is the reference implementation the chains are verified against, see `benchmark cleanup`
+"""
+
+from typing import Dict, List, Optional, Tuple
+
+import regex as re
+
+from adsputils import load_config
+config = {}
+config.update(load_config())
+
+
+# set to False to apply the cleanup lists rule by rule
+CLEANUP_ENGINE_ENABLED = bool(config.get('REFERENCE_PIPELINE_CLEANUP_ENGINE', True))
+
+# least number of consecutive independent literal rules merged into one alternation,
+# for fewer rules chained str.replace calls are faster
+FUSE_MIN_RULES = 4
+
+# escapes that stand for a single non literal token
+SIMPLE_ESCAPES = set('dDsSwWbBAZntrfv')
+
+# flags under which the text of the pattern is not matched as is
+UNANALYZABLE_FLAGS = re.VERBOSE
+
+# letters that match a non ascii character when ignoring case (ie, the dotted capital i, the kelvin sign and the long s),
+# which the lowercased text does not contain as the letter, case insensitive patterns are only anchored on ascii
+# literals without them
+re_case_unsafe = re.compile(r'[iIkKsS]|[^\x00-\x7F]')
+
+# to match a counted quantifier
+re_counted_quantifier = re.compile(r'\{(\d*)(,(\d*))?\}')
+
+# kinds of steps in a chain
+LITERAL, PATTERN, ANCHORED, ANCHORED_ANY, ANCHORED_NOCASE = range(5)
+
+
+class Unanalyzable(Exception):
+    """
+    raised when the pattern uses a construct the scanner does not handle
+    """
+    pass
+
+
+def best_requirement(requirements: List[Tuple[str, ...]]) -> Tuple[str, ...]:
+    """
+    :param requirements: list of requirements, each is a tuple of literals of which at least one is in every match
+    :return: the most selective requirement, the one with the longest shortest literal and the fewest literals
+    """
+    return max(requirements, key=lambda requirement: (min(len(literal) for literal in requirement), -len(requirement)))
+
+
+class PatternScanner:
+    """
+    scans the text of a regular expression for the literals that every match has to contain
+
+    the scan is conservative, whatever is optional, repeated zero times, negated, or not understood is ignored,
+    and constructs that change how the pattern text is matched (ie, inline flags) make the whole pattern unanalyzable
+    """
+
+    def __init__(self, pattern: str):
+        """
+        :param pattern: regular expression
+        """
+        self.pattern = pattern
+        self.n = len(pattern)
+        self.i = 0
+        # True as long as the pattern is nothing but literal characters
+        self.pure = True
+
+    def scan(self) -> List[Tuple[str, ...]]:
+        """
+        :return: list of requirements, each is a tuple of literals of which at least one is in every match
+        """
+        requirements = self.alternation()
+        if self.i != self.n:
+            # unbalanced parenthesis
+            raise Unanalyzable()
+        return requirements
+
+    def alternation(self) -> List[Tuple[str, ...]]:
+        """
+        scan alternatives separated by | up to the end of the enclosing group
+
+        :return: requirements of the alternation
+        """
+        alternatives = [self.sequence()]
+        while self.i < self.n and self.pattern[self.i] == '|':
+            self.i += 1
+            self.pure = False
+            alternatives.append(self.sequence())
+        if len(alternatives) == 1:
+            return alternatives[0]
+        # a match of the alternation contains a literal of at least one of the alternatives
+        combined = []
+        for requirements in alternatives:
+            if not requirements:
+                return []
+            combined.extend(best_requirement(requirements))
+        return [tuple(dict.fromkeys(combined))]
+
+    def sequence(self) -> List[Tuple[str, ...]]:
+        """
+        scan one alternative
+
+        :return: requirements of the alternative
+        """
+        pattern, n = self.pattern, self.n
+        requirements, run = [], []
+        # what the last token was, for the quantifier that may follow it
+        prev_literal, group_start = False, None
+
+        def end_run():
+            if run:
+                requirements.append((''.join(run),))
+                del run[:]
+
+        while self.i < n:
+            c = pattern[self.i]
+            if c in '|)':
+                break
+            if c == '{' and (self.i + 1 >= n or pattern[self.i + 1] not in '0123456789,}deis'):
+                # cannot start a counted or a fuzzy quantifier, so it is a literal
+                run.append(c)
+                prev_literal = True
+                self.i += 1
+                continue
+            if c in '*+?{':
+                if c == '{':
+                    match = re_counted_quantifier.match(pattern, self.i)
+                    if not match or (not match.group(1) and not match.group(2)):
+                        raise Unanalyzable()
+                    minimum = int(match.group(1) or 0)
+                    self.i = match.end()
+                else:
+                    minimum = 1 if c == '+' else 0
+                    self.i += 1
+                # lazy and possessive quantifiers
+                if self.i < n and pattern[self.i] in '?+':
+                    self.i += 1
+                if minimum == 0:
+                    if prev_literal:
+                        run.pop()
+                    elif group_start is not None:
+                        del requirements[group_start:]
+                end_run()
+                self.pure, prev_literal, group_start = False, False, None
+                continue
+            prev_literal, group_start = False, None
+            if c == '\\':
+                if self.i + 1 >= n:
+                    raise Unanalyzable()
+                escaped = pattern[self.i + 1]
+                self.i += 2
+                if escaped.isdigit() and escaped != '0':
+                    # backreference
+                    while self.i < n and pattern[self.i].isdigit():
+                        self.i += 1
+                elif escaped.isalnum() or escaped == '_':
+                    if escaped not in SIMPLE_ESCAPES:
+                        raise Unanalyzable()
+                else:
+                    run.append(escaped)
+                    prev_literal = True
+                    continue
+            elif c == '[':
+                self.skip_class()
+            elif c == '(':
+                end_run()
+                group_start = len(requirements)
+                requirements.extend(self.group())
+            elif c in '.^$':
+                self.i += 1
+            else:
+                run.append(c)
+                prev_literal = True
+                self.i += 1
+                continue
+            end_run()
+            self.pure = False
+        end_run()
+        return requirements
+
+    def group(self) -> List[Tuple[str, ...]]:
+        """
+        scan a group, from its opening to past its closing parenthesis
+
+        :return: requirements of the group, none for negative lookarounds, comments and backreferences
+        """
+        pattern, i = self.pattern, self.i
+        if not pattern.startswith('(?', i):
+            self.i = i + 1
+        elif pattern.startswith(('(?:', '(?>', '(?='), i):
+            self.i = i + 3
+        elif pattern.startswith('(?<=', i):
+            self.i = i + 4
+        elif pattern.startswith(('(?!', '(?<!', '(?#', '(?P='), i):
+            self.skip_group()
+            return []
+        elif pattern.startswith(('(?P<', '(?<'), i):
+            end = pattern.find('>', i)
+            if end < 0:
+                raise Unanalyzable()
+            self.i = end + 1
+        else:
+            # inline flags, recursion, conditionals
+            raise Unanalyzable()
+        requirements = self.alternation()
+        if self.i >= self.n or pattern[self.i] != ')':
+            raise Unanalyzable()
+        self.i += 1
+        return requirements
+
+    def skip_class(self):
+        """
+        move past a character class
+        """
+        pattern, n = self.pattern, self.n
+        i = self.i + 1
+        if i < n and pattern[i] == '^':
+            i += 1
+        # a closing bracket right after the opening one is a literal
+        if i < n and pattern[i] == ']':
+            i += 1
+        while i < n:
+            c = pattern[i]
+            if c == '\\':
+                i += 2
+                continue
+            if c == '[':
+                # nested sets and posix classes
+                raise Unanalyzable()
+            if c == ']':
+                self.i = i + 1
+                return
+            i += 1
+        raise Unanalyzable()
+
+    def skip_group(self):
+        """
+        move past a group without scanning it
+        """
+        pattern, n = self.pattern, self.n
+        depth = 0
+        while self.i < n:
+            c = pattern[self.i]
+            if c == '\\':
+                self.i += 2
+                continue
+            if c == '[':
+                self.skip_class()
+                continue
+            if c == '(':
+                depth += 1
+            elif c == ')':
+                depth -= 1
+                if depth == 0:
+                    self.i += 1
+                    return
+            self.i += 1
+        raise Unanalyzable()
+
+
+def required_literals(pattern: str) -> Optional[Tuple[List[Tuple[str, ...]], bool]]:
+    """
+    find the literals that every match of the pattern has to contain
+
+    :param pattern: regular expression
+    :return: list of requirements, each is a tuple of literals of which at least one is in every match,
+             and True if the whole pattern is one literal, or None if the pattern cannot be analyzed
+    """
+    scanner = PatternScanner(pattern)
+    try:
+        requirements = scanner.scan()
+    except Unanalyzable:
+        return None
+    return requirements, scanner.pure and len(requirements) == 1
+
+
+def case_safe_fragment(literal: str) -> str:
+    """
+    :param literal: literal of a case insensitive pattern
+    :return: the longest part of the literal, lowercased, that any match contains lowercased
+    """
+    fragments = re_case_unsafe.split(literal)
+    return max(fragments, key=len).lower()
+
+
+def analyze_rule(compiled_re, replace_str) -> Tuple[Optional[str], Optional[Tuple[str, ...]], bool]:
+    """
+    :param compiled_re: compiled pattern of the rule
+    :param replace_str: replacement of the rule
+    :return: the literal if the rule is a plain literal replacement,
+             the literals of which at least one is in every match, if any,
+             and True if the literals are lowercased, to be looked up in the lowercased text
+    """
+    flags = compiled_re.flags
+    if flags & UNANALYZABLE_FLAGS:
+        return None, None, False
+    nocase = bool(flags & re.IGNORECASE)
+    if nocase and flags & (re.FULLCASE | re.V1):
+        # full case folding matches ligatures and sharp s with more than one ascii letter
+        return None, None, False
+    analyzed = required_literals(compiled_re.pattern)
+    if not analyzed or not analyzed[0]:
+        return None, None, False
+    requirements, pure = analyzed
+    if nocase:
+        requirements = [tuple(case_safe_fragment(literal) for literal in requirement) for requirement in requirements]
+        requirements = [requirement for requirement in requirements if all(requirement)]
+        if not requirements:
+            return None, None, False
+        return None, best_requirement(requirements), True
+    anchor = best_requirement(requirements)
+    if pure and isinstance(replace_str, str) and '\\' not in replace_str:
+        return anchor[0], anchor, False
+    return None, anchor, False
+
+
+def independent(earlier: Tuple[str, str], later: Tuple[str, str]) -> bool:
+    """
+    check that applying two literal rules in one pass gives the same result as applying them in order
+
+    :param earlier: (literal, replacement) of the rule applied first
+    :param later: (literal, replacement) of the rule applied next
+    :return: True if neither rule can create, hide or share a match of the other
+    """
+    (literal_1, replacement_1), (literal_2, _) = earlier, later
+    if literal_1 in literal_2 or literal_2 in literal_1:
+        return False
+    for k in range(1, min(len(literal_1), len(literal_2))):
+        if literal_1[-k:] == literal_2[:k] or literal_2[-k:] == literal_1[:k]:
+            return False
+    # the first replacement could complete a match of the second literal
+    if set(replacement_1) & set(literal_2):
+        return False
+    # removing the first literal could join its neighbours into a match of the second
+    if not replacement_1 and len(literal_2) > 1:
+        return False
+    return True
+
+
+class CleanupChain:
+    """
+    a cleanup list compiled into steps
+    """
+
+    def __init__(self, rules: List):
+        """
+        :param rules: list of (compiled_re, replace_str)
+        """
+        self.rules = rules
+        self.size = len(rules)
+        self.steps = []
+        group = []
+        for compiled_re, replace_str in rules:
+            literal, anchor, nocase = analyze_rule(compiled_re, replace_str)
+            if literal is not None:
+                if all(independent(rule, (literal, replace_str)) for rule in group):
+                    group.append((literal, replace_str))
+                    continue
+                self.add_literals(group)
+                group = [(literal, replace_str)]
+                continue
+            self.add_literals(group)
+            group = []
+            if anchor is None:
+                self.steps.append((PATTERN, compiled_re, replace_str, None))
+            elif nocase:
+                self.steps.append((ANCHORED_NOCASE, compiled_re, replace_str, anchor))
+            elif len(anchor) == 1:
+                self.steps.append((ANCHORED, compiled_re, replace_str, anchor[0]))
+            else:
+                self.steps.append((ANCHORED_ANY, compiled_re, replace_str, anchor))
+        self.add_literals(group)
+
+    def add_literals(self, group: List[Tuple[str, str]]):
+        """
+        add a group of independent literal rules, fused into one alternation when there are enough of them
+
+        :param group: list of (literal, replacement)
+        """
+        if len(group) >= FUSE_MIN_RULES:
+            table = dict(group)
+            # no literal of the group is a prefix of another, so the order of the alternatives does not matter
+            alternation = re.compile('|'.join(re.escape(literal) for literal, _ in group))
+            self.steps.append((ANCHORED_ANY, alternation, lambda match: table[match.group()], tuple(table)))
+        else:
+            for literal, replacement in group:
+                self.steps.append((LITERAL, literal, replacement, None))
+
+    def apply(self, text: str) -> str:
+        """
+        :param text: string to clean up
+        :return: the string with all the rules applied
+        """
+        # lowercased text, for the case insensitive anchors, reset whenever the text changes
+        lowered = None
+        for kind, pattern, replacement, anchor in self.steps:
+            if kind == LITERAL:
+                text = text.replace(pattern, replacement)
+            elif kind == ANCHORED:
+                if anchor not in text:
+                    continue
+                text = pattern.sub(replacement, text)
+            elif kind == ANCHORED_ANY:
+                if not any(literal in text for literal in anchor):
+                    continue
+                text = pattern.sub(replacement, text)
+            elif kind == ANCHORED_NOCASE:
+                if lowered is None:
+                    lowered = text.lower()
+                if not any(literal in lowered for literal in anchor):
+                    continue
+                text = pattern.sub(replacement, text)
+            else:
+                text = pattern.sub(replacement, text)
+            lowered = None
+        return text
+
+    def describe(self) -> Dict[str, int]:
+        """
+        :return: number of rules and number of steps of each kind
+        """
+        kinds = [step[0] for step in self.steps]
+        return {
+            'rules': self.size,
+            'steps': len(self.steps),
+            'literal': kinds.count(LITERAL),
+            'anchored': kinds.count(ANCHORED) + kinds.count(ANCHORED_ANY) + kinds.count(ANCHORED_NOCASE),
+            'pattern': kinds.count(PATTERN),
+        }
+
+
+# compiled chains, keyed by id of the cleanup list, the list is kept so that its id is not reused
+chains = {}
+
+
+def compile_cleanup(rules: List) -> CleanupChain:
+    """
+    get the compiled chain of a cleanup list, compiling it on the first call
+
+    :param rules: list of (compiled_re, replace_str)
+    :return: the chain
+    """
+    entry = chains.get(id(rules))
+    if entry is None or entry.rules is not rules or entry.size != len(rules):
+        entry = chains[id(rules)] = CleanupChain(rules)
+    return entry
+
+
+def apply_sequential(rules: List, text: str) -> str:
+    """
+    apply the rules one after the other
+
+    :param rules: list of (compiled_re, replace_str)
+    :param text: string to clean up
+    :return: the string with all the rules applied
+    """
+    for (compiled_re, replace_str) in rules:
+        text = compiled_re.sub(replace_str, text)
+    return text
+
+
+def apply_cleanup(rules: List, text: str) -> str:
+    """
+    apply a cleanup list to the text, the result is the same as applying the rules one after the other
+
+    :param rules: list of (compiled_re, replace_str)
+    :param text: string to clean up
+    :return: the string with all the rules applied
+    """
+    if not CLEANUP_ENGINE_ENABLED:
+        return apply_sequential(rules, text)
+    return compile_cleanup(rules).apply(text)
+
+
+def find_cleanup_lists() -> Dict[Tuple[type, str], List]:
+    """
+    import all the refparsers modules and collect the cleanup lists that are class attributes
+
+    :return: dict of (class, attribute name) to cleanup list
+    """
+    import importlib
+    import pkgutil
+    import adsrefpipe.refparsers as refparsers
+
+    cleanup_lists = {}
+    for module_info in pkgutil.iter_modules(refparsers.__path__):
+        module = importlib.import_module('%s.%s' % (refparsers.__name__, module_info.name))
+        for cls in list(vars(module).values()):
+            if not isinstance(cls, type) or cls.__module__ != module.__name__:
+                continue
+            for name, value in vars(cls).items():
+                if isinstance(value, list) and value and \
+                        all(isinstance(rule, tuple) and len(rule) == 2 and hasattr(rule[0], 'sub') for rule in value):
+                    cleanup_lists[(cls, name)] = value
+    return cleanup_lists
@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+
+"""
+compiled cache for the lookup tables built from refparsers/data_files
+
+the data files (unicode.dat, aas_latex.dat, LRR.dat, LRSP.dat) are parsed into python structures
+by every worker and every CLI invocation. this module pickles the parsed structures into a versioned
+cache file next to the data files (or under REFERENCE_PIPELINE_DATA_CACHE_DIR), and reuses the cache
+as long as the source file has not changed since the cache was compiled.
+
+run `python -m adsrefpipe.refparsers.datacache` as a build step to compile all caches up front
+"""
+
+import os
+import sys
+import pickle
+import argparse
+from typing import Any, Callable, Dict, List
+
+from adsputils import setup_logging, load_config
+logger = setup_logging('refparsers')
+config = {}
+config.update(load_config())
+
+# bump this whenever the structure of any cached table changes
+CACHE_VERSION = 1
+
+# directory holding the source data files
+DATA_FILES_DIR = os.path.join(os.path.dirname(__file__), 'data_files')
+
+
+def cache_dir() -> str:
+    """
+    get the directory where compiled caches are stored
+
+    :return: cache directory, from env/config if set, otherwise data_files/__cache__
+    """
+    return os.environ.get('REFERENCE_PIPELINE_DATA_CACHE_DIR') or \
+           config.get('REFERENCE_PIPELINE_DATA_CACHE_DIR') or \
+           os.path.join(DATA_FILES_DIR, '__cache__')
+
+
+def cache_enabled() -> bool:
+    """
+    check if compiled caches are enabled, they can be turned off for debugging
+
+    :return: True if caches are to be read and written
+    """
+    value = os.environ.get('REFERENCE_PIPELINE_DATA_CACHE_ENABLED')
+    if value is None:
+        return bool(config.get('REFERENCE_PIPELINE_DATA_CACHE_ENABLED', True))
+    return value.strip().lower() not in ('0', 'false', 'no', 'off')
+
+
+def cache_filename(name: str) -> str:
+    """
+    get the cache filename for a table, the cache version and python version are part of the name
+
+    :param name: name of the table
+    :return: full path of the cache file
+    """
+    return os.path.join(cache_dir(), '%s.v%d.py%d%d.pickle' % (name, CACHE_VERSION, sys.version_info[0], sys.version_info[1]))
+
+
+def source_signature(source_filenames: List[str]) -> List:
+    """
+    get the signature of the source files, used to detect a stale cache
+
+    :param source_filenames: data files the table is built from
+    :return: list of (basename, mtime, size) for each file
+    """
+    signature = []
+    for filename in source_filenames:
+        stat = os.stat(filename)
+        signature.append((os.path.basename(filename), stat.st_mtime, stat.st_size))
+    return signature
+
+
+def read_cache(cache_file: str, signature: List) -> Any:
+    """
+    read a compiled table from the cache if it is current
+
+    :param cache_file: full path of the cache file
+    :param signature: signature of the source files
+    :return: the cached table, or None if missing, stale or unreadable
+    """
+    try:
+        with open(cache_file, 'rb') as f:
+            cached = pickle.load(f)
+        if cached.get('version') == CACHE_VERSION and cached.get('signature') == signature:
+            return cached['data']
+        logger.debug('Cache file %s is stale.' % cache_file)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.debug('Unable to read cache file %s: %s' % (cache_file, str(e)))
+    return None
+
+
+def write_cache(cache_file: str, signature: List, data: Any) -> bool:
+    """
+    write a compiled table to the cache, atomically, so that concurrent workers never see a partial file
+
+    :param cache_file: full path of the cache file
+    :param signature: signature of the source files
+    :param data: the table to cache
+    :return: True if the cache was written
+    """
+    try:
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        tmp_file = '%s.%d.tmp' % (cache_file, os.getpid())
+        with open(tmp_file, 'wb') as f:
+            pickle.dump({'version': CACHE_VERSION, 'signature': signature, 'data': data}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, cache_file)
+        return True
+    except Exception as e:
+        # read-only installs fall back to parsing the data files on each start
+        logger.debug('Unable to write cache file %s: %s' % (cache_file, str(e)))
+        return False
+
+
+def load_table(source_filenames: List[str], name: str, builder: Callable[[], Any]) -> Any:
+    """
+    load a table from its compiled cache, rebuilding and recompiling it if the cache is missing or stale
+
+    :param source_filenames: data files the table is built from
+    :param name: name of the table, used for the cache filename
+    :param builder: function that parses the data files and returns the table
+    :return: the table
+    """
+    if not cache_enabled():
+        return builder()
+    try:
+        signature = source_signature(source_filenames)
+    except OSError:
+        # source is not on disk (ie, mocked), there is nothing to validate the cache against
+        return builder()
+
+    cache_file = cache_filename(name)
+    data = read_cache(cache_file, signature)
+    if data is not None:
+        return data
+
+    data = builder()
+    write_cache(cache_file, signature, data)
+    return data
+
+
+def compile_all() -> Dict[str, str]:
+    """
+    rebuild the caches of all the data file tables from their source files
+
+    :return: dict of table name to cache filename, for the caches that were written
+    """
+    from adsrefpipe.refparsers.unicode import UnicodeHandler
+    from adsrefpipe.refparsers.reference import LatexReference
+    from adsrefpipe.refparsers.LivingReviewsXML import LLR_id, LRSP_id, read_data_files
+
+    unicode_filename = os.path.join(DATA_FILES_DIR, 'unicode.dat')
+    tables = {
+        'unicode': ([unicode_filename], lambda: UnicodeHandler.parse_data_file(unicode_filename)),
+        'aas_latex': ([LatexReference.macro_filename], lambda: LatexReference.parse_aas_macros(LatexReference.macro_filename)),
+        'LR2bibcode': ([LLR_id, LRSP_id], read_data_files),
+    }
+
+    compiled = {}
+    for name, (source_filenames, builder) in tables.items():
+        cache_file = cache_filename(name)
+        if write_cache(cache_file, source_signature(source_filenames), builder()):
+            compiled[name] = cache_file
+    return compiled
+
+
+if __name__ == '__main__':  # pragma: no cover
+    parser = argparse.ArgumentParser(description='Compile the refparsers data files into cached tables')
+    parser.parse_args()
+    for name, filename in compile_all().items():
+        print('%s -> %s' % (name, filename))
+    sys.exit(0)
@@ -1,122 +1,110 @@
+import importlib
+import threading
 
-# xml parsers
-from adsrefpipe.refparsers.AASxml import AAStoREFs
-from adsrefpipe.refparsers.AGUxml import AGUtoREFs
-from adsrefpipe.refparsers.AIPxml import AIPtoREFs
-from adsrefpipe.refparsers.AnAxml import AnAtoREFs
-from adsrefpipe.refparsers.APSxml import APStoREFs
-from adsrefpipe.refparsers.BlackwellXML import BLACKWELLtoREFs
-from adsrefpipe.refparsers.CrossRefXML import CrossRefToREFs
-from adsrefpipe.refparsers.CUPxml import CUPtoREFs
-from adsrefpipe.refparsers.EDPxml import EDPtoREFs
-from adsrefpipe.refparsers.EGUxml import EGUtoREFs
-from adsrefpipe.refparsers.ElsevierXML import ELSEVIERtoREFs
-from adsrefpipe.refparsers.IcarusXML import ICARUStoREFs
-from adsrefpipe.refparsers.IOPFTxml import IOPFTtoREFs
-from adsrefpipe.refparsers.IOPxml import IOPtoREFs
-from adsrefpipe.refparsers.IPAPxml import IPAPtoREFs
-from adsrefpipe.refparsers.JATSxml import JATStoREFs
-from adsrefpipe.refparsers.JSTAGExml import JSTAGEtoREFs
-from adsrefpipe.refparsers.LivingReviewsXML import LivingReviewsToREFs
-from adsrefpipe.refparsers.MDPIxml import MDPItoREFs
-from adsrefpipe.refparsers.NatureXML import NATUREtoREFs
-from adsrefpipe.refparsers.NLM3xml import NLMtoREFs
-from adsrefpipe.refparsers.ONCPxml import ONCPtoREFs
-from adsrefpipe.refparsers.OUPxml import OUPtoREFs
-from adsrefpipe.refparsers.PASAxml import PASAtoREFs
-from adsrefpipe.refparsers.RSCxml import RSCtoREFs
-from adsrefpipe.refparsers.SPIExml import SPIEtoREFs
-from adsrefpipe.refparsers.SpringerXML import SPRINGERtoREFs
-from adsrefpipe.refparsers.UCPxml import UCPtoREFs
-from adsrefpipe.refparsers.VERSITAxml import VERSITAtoREFs
-from adsrefpipe.refparsers.WileyXML import WILEYtoREFs
+from adsputils import setup_logging
+logger = setup_logging('refparsers')
 
-# html parsers
-from adsrefpipe.refparsers.ADShtml import AnAHTMLtoREFs, AnASHTMLtoREFs, AEdRvHTMLtoREFs, AnRFMHTMLtoREFs, \
-    ARAnAHTMLtoREFs, AREPSHTMLtoREFs, JLVEnHTMLtoREFs, PASJHTMLtoREFs, PASPHTMLtoREFs
+from adsrefpipe.refparsers import patterns
 
-# ocr parsers
-from adsrefpipe.refparsers.ADSocr import ADSocrToREFs, ObsOCRtoREFs
+# dictionary that maps parser names to their corresponding parser classes, as `module:class` strings,
+# the parser module is imported the first time the parser is asked for (see verify)
+name_to_parser_dict = {
+    'AAS': 'adsrefpipe.refparsers.AASxml:AAStoREFs',
+    'ADSocr': 'adsrefpipe.refparsers.ADSocr:ADSocrToREFs',
+    'ADStex': 'adsrefpipe.refparsers.ADStex:ADStexToREFs',
+    'ADStexE2': 'adsrefpipe.refparsers.ADStex:ADStexToREFs',
+    'ADStexE3': 'adsrefpipe.refparsers.ADStex:ADStexToREFs',
+    'ADStexE4': 'adsrefpipe.refparsers.ADStex:ADStexToREFs',  # note that all these go to ADStexToREFs supporting multiple extensions
+    'ADStxt': 'adsrefpipe.refparsers.ADStxt:ADStxtToREFs',
+    'ADStxtE2': 'adsrefpipe.refparsers.ADStxt:ADStxtToREFs',
+    'ADStxtE3': 'adsrefpipe.refparsers.ADStxt:ADStxtToREFs',
+    'ADStxtE4': 'adsrefpipe.refparsers.ADStxt:ADStxtToREFs',
+    'ADStxtE5': 'adsrefpipe.refparsers.ADStxt:ADStxtToREFs',  # note that all these go to ADStxtToREFs supporting multiple extensions
+    'AEdRvHTML': 'adsrefpipe.refparsers.ADShtml:AEdRvHTMLtoREFs',
+    'AGU': 'adsrefpipe.refparsers.AGUxml:AGUtoREFs',
+    'AIP': 'adsrefpipe.refparsers.AIPxml:AIPtoREFs',
+    'AIPE2': 'adsrefpipe.refparsers.AIPxml:AIPtoREFs', # with multiple extensions
+    'AnA': 'adsrefpipe.refparsers.AnAxml:AnAtoREFs',
+    'AnAhtml': 'adsrefpipe.refparsers.ADShtml:AnAHTMLtoREFs',
+    'AnAShtml': 'adsrefpipe.refparsers.ADShtml:AnASHTMLtoREFs',
+    'AnRFMhtml': 'adsrefpipe.refparsers.ADShtml:AnRFMHTMLtoREFs',
+    'APS': 'adsrefpipe.refparsers.APSxml:APStoREFs',
+    'APSE2': 'adsrefpipe.refparsers.APSxml:APStoREFs',
+    'APSE3': 'adsrefpipe.refparsers.APSxml:APStoREFs', # with multiple extensions
+    'ARAnAhtml': 'adsrefpipe.refparsers.ADShtml:ARAnAHTMLtoREFs',
+    'AREPShtml': 'adsrefpipe.refparsers.ADShtml:AREPSHTMLtoREFs',
+    'arXiv': 'adsrefpipe.refparsers.arXivTXT:ARXIVtoREFs',
+    'BLACKWELL': 'adsrefpipe.refparsers.BlackwellXML:BLACKWELLtoREFs', # this and MNRAS go to the same xml parser
+    'CrossRef': 'adsrefpipe.refparsers.CrossRefXML:CrossRefToREFs',
+    'CUP': 'adsrefpipe.refparsers.CUPxml:CUPtoREFs',
+    'EDP': 'adsrefpipe.refparsers.EDPxml:EDPtoREFs',
+    'EGU': 'adsrefpipe.refparsers.EGUxml:EGUtoREFs',
+    'ELSEVIER': 'adsrefpipe.refparsers.ElsevierXML:ELSEVIERtoREFs',
+    'ELSEVIERE2': 'adsrefpipe.refparsers.ElsevierXML:ELSEVIERtoREFs', # with multiple extensions
+    'ICARUS': 'adsrefpipe.refparsers.IcarusXML:ICARUStoREFs',
+    'IOP': 'adsrefpipe.refparsers.IOPxml:IOPtoREFs',
+    'IOPE2': 'adsrefpipe.refparsers.IOPxml:IOPtoREFs',
+    'IOPE3': 'adsrefpipe.refparsers.IOPxml:IOPtoREFs',  # with multiple extensions
+    'IOPFT': 'adsrefpipe.refparsers.IOPFTxml:IOPFTtoREFs',
+    'IPAP': 'adsrefpipe.refparsers.IPAPxml:IPAPtoREFs',
+    'JATS': 'adsrefpipe.refparsers.JATSxml:JATStoREFs',
+    'JLVEnHTML': 'adsrefpipe.refparsers.ADShtml:JLVEnHTMLtoREFs',
+    'JSTAGE': 'adsrefpipe.refparsers.JSTAGExml:JSTAGEtoREFs',
+    'LivingReviews': 'adsrefpipe.refparsers.LivingReviewsXML:LivingReviewsToREFs',
+    'MDPI': 'adsrefpipe.refparsers.MDPIxml:MDPItoREFs',
+    'MNRAS': 'adsrefpipe.refparsers.BlackwellXML:BLACKWELLtoREFs', # this and BLACKWELL go to the same xml parser
+    'NATURE': 'adsrefpipe.refparsers.NatureXML:NATUREtoREFs',
+    'NATUREE2': 'adsrefpipe.refparsers.NatureXML:NATUREtoREFs',  # with multiple extensions
+    'NLM': 'adsrefpipe.refparsers.NLM3xml:NLMtoREFs',
+    'ObsOCR': 'adsrefpipe.refparsers.ADSocr:ObsOCRtoREFs',
+    'ONCP': 'adsrefpipe.refparsers.ONCPxml:ONCPtoREFs',
+    'OUP': 'adsrefpipe.refparsers.OUPxml:OUPtoREFs',
+    'PairsTXT': 'adsrefpipe.refparsers.ADStxt:PairsTXTtoREFs',
+    'PairsTXTE2': 'adsrefpipe.refparsers.ADStxt:PairsTXTtoREFs',
+    'PairsTXTE3': 'adsrefpipe.refparsers.ADStxt:PairsTXTtoREFs',
+    'PairsTXTE4': 'adsrefpipe.refparsers.ADStxt:PairsTXTtoREFs',
+    'PairsTXTE5': 'adsrefpipe.refparsers.ADStxt:PairsTXTtoREFs',
+    'PairsTXTE6': 'adsrefpipe.refparsers.ADStxt:PairsTXTtoREFs',
+    'PASA': 'adsrefpipe.refparsers.PASAxml:PASAtoREFs',
+    'PASJhtml': 'adsrefpipe.refparsers.ADShtml:PASJHTMLtoREFs',
+    'PASPhtml': 'adsrefpipe.refparsers.ADShtml:PASPHTMLtoREFs',
+    'PThPhTXT': 'adsrefpipe.refparsers.ADStxt:PThPhTXTtoREFs',
+    'RSC': 'adsrefpipe.refparsers.RSCxml:RSCtoREFs',
+    'SPIE': 'adsrefpipe.refparsers.SPIExml:SPIEtoREFs',
+    'SPRINGER': 'adsrefpipe.refparsers.SpringerXML:SPRINGERtoREFs',
+    'ThreeBibsTxt': 'adsrefpipe.refparsers.ADStxt:ThreeBibstemsTXTtoREFs',
+    'ThreeBibsTxtE2': 'adsrefpipe.refparsers.ADStxt:ThreeBibstemsTXTtoREFs',
+    'ThreeBibsTxtE3': 'adsrefpipe.refparsers.ADStxt:ThreeBibstemsTXTtoREFs',
+    'UCP': 'adsrefpipe.refparsers.UCPxml:UCPtoREFs',
+    'VERSITA': 'adsrefpipe.refparsers.VERSITAxml:VERSITAtoREFs',
+    'WILEY': 'adsrefpipe.refparsers.WileyXML:WILEYtoREFs',
+}
 
-# latex parser
-from adsrefpipe.refparsers.ADStex import ADStexToREFs
+# parser classes that have already been imported, keyed by `module:class`
+parser_class_cache = {}
+parser_class_cache_lock = threading.Lock()
 
-# text parsers
-from adsrefpipe.refparsers.arXivTXT import ARXIVtoREFs
-from adsrefpipe.refparsers.ADStxt import ADStxtToREFs, PThPhTXTtoREFs, ThreeBibstemsTXTtoREFs, PairsTXTtoREFs
 
-# dictionary that maps parser names to their corresponding parser classes
-name_to_parser_dict = {
-    'AAS': AAStoREFs,
-    'ADSocr': ADSocrToREFs,
-    'ADStex': ADStexToREFs,
-    'ADStexE2': ADStexToREFs,
-    'ADStexE3': ADStexToREFs,
-    'ADStexE4': ADStexToREFs,  # note that all these go to ADStexToREFs supporting multiple extensions
-    'ADStxt': ADStxtToREFs,
-    'ADStxtE2': ADStxtToREFs,
-    'ADStxtE3': ADStxtToREFs,
-    'ADStxtE4': ADStxtToREFs,
-    'ADStxtE5': ADStxtToREFs,  # note that all these go to ADStxtToREFs supporting multiple extensions
-    'AEdRvHTML': AEdRvHTMLtoREFs,
-    'AGU': AGUtoREFs,
-    'AIP': AIPtoREFs,
-    'AIPE2': AIPtoREFs, # with multiple extensions
-    'AnA': AnAtoREFs,
-    'AnAhtml': AnAHTMLtoREFs,
-    'AnAShtml': AnASHTMLtoREFs,
-    'AnRFMhtml': AnRFMHTMLtoREFs,
-    'APS': APStoREFs,
-    'APSE2': APStoREFs,
-    'APSE3': APStoREFs, # with multiple extensions
-    'ARAnAhtml': ARAnAHTMLtoREFs,
-    'AREPShtml': AREPSHTMLtoREFs,
-    'arXiv': ARXIVtoREFs,
-    'BLACKWELL': BLACKWELLtoREFs, # this and MNRAS go to the same xml parser
-    'CrossRef': CrossRefToREFs,
-    'CUP': CUPtoREFs,
-    'EDP': EDPtoREFs,
-    'EGU': EGUtoREFs,
-    'ELSEVIER': ELSEVIERtoREFs,
-    'ELSEVIERE2': ELSEVIERtoREFs, # with multiple extensions
-    'ICARUS': ICARUStoREFs,
-    'IOP': IOPtoREFs,
-    'IOPE2': IOPtoREFs,
-    'IOPE3': IOPtoREFs,  # with multiple extensions
-    'IOPFT': IOPFTtoREFs,
-    'IPAP': IPAPtoREFs,
-    'JATS': JATStoREFs,
-    'JLVEnHTML': JLVEnHTMLtoREFs,
-    'JSTAGE': JSTAGEtoREFs,
-    'LivingReviews': LivingReviewsToREFs,
-    'MDPI': MDPItoREFs,
-    'MNRAS': BLACKWELLtoREFs, # this and BLACKWELL go to the same xml parser
-    'NATURE': NATUREtoREFs,
-    'NATUREE2': NATUREtoREFs,  # with multiple extensions
-    'NLM': NLMtoREFs,
-    'ObsOCR': ObsOCRtoREFs,
-    'ONCP': ONCPtoREFs,
-    'OUP': OUPtoREFs,
-    'PairsTXT': PairsTXTtoREFs,
-    'PairsTXTE2': PairsTXTtoREFs,
-    'PairsTXTE3': PairsTXTtoREFs,
-    'PairsTXTE4': PairsTXTtoREFs,
-    'PairsTXTE5': PairsTXTtoREFs,
-    'PairsTXTE6': PairsTXTtoREFs,
-    'PASA': PASAtoREFs,
-    'PASJhtml': PASJHTMLtoREFs,
-    'PASPhtml': PASPHTMLtoREFs,
-    'PThPhTXT': PThPhTXTtoREFs,
-    'RSC': RSCtoREFs,
-    'SPIE': SPIEtoREFs,
-    'SPRINGER': SPRINGERtoREFs,
-    'ThreeBibsTxt': ThreeBibstemsTXTtoREFs,
-    'ThreeBibsTxtE2': ThreeBibstemsTXTtoREFs,
-    'ThreeBibsTxtE3': ThreeBibstemsTXTtoREFs,
-    'UCP': UCPtoREFs,
-    'VERSITA': VERSITAtoREFs,
-    'WILEY': WILEYtoREFs,
-}
+def load_parser_class(class_path: str):
+    """
+    import the parser module and return the parser class, caching the class for later calls
+
+    :param class_path: parser class as a `module:class` string
+    :return: the parser class, or None if it cannot be imported
+    """
+    parser_class = parser_class_cache.get(class_path, None)
+    if parser_class is None:
+        module_name, class_name = class_path.split(':')
+        with parser_class_cache_lock:
+            try:
+                parser_class = getattr(importlib.import_module(module_name), class_name)
+            except (ImportError, AttributeError) as e:
+                logger.error('Unable to load parser class %s: %s' % (class_path, str(e)))
+                return None
+            if patterns.profiling_enabled():
+                patterns.instrument_parser(parser_class)
+            parser_class_cache[class_path] = parser_class
+    return parser_class
 
 def verify(parser_name: str):
     """
@@ -125,4 +113,7 @@ def verify(parser_name: str):
     :param parser_name: parser name from db
     :return: the parser class associated with the name, or None if not found
     """
-    return name_to_parser_dict.get(parser_name, None)
+    class_path = name_to_parser_dict.get(parser_name, None)
+    if class_path is None:
+        return None
+    return load_parser_class(class_path)
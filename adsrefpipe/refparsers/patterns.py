@@ -0,0 +1,387 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+
+"""
+compiled pattern cache and opt-in regex profiler for the refparsers package
+
+compile_cached keeps a bounded LRU cache of patterns that are built at runtime (ie, extract_tag, cut_apart),
+so that they are compiled once per process instead of once per call
+
+when PERF_REGEX_PROFILE is set, the compiled patterns of the parser classes are wrapped in ProfiledPattern,
+which records number of calls, cumulative time and input size per pattern and per parser. the counters are
+emitted to perf_metrics as a `regex_profile` event once a source file has been parsed
+
+guarded_call runs a pattern under a RegexBudget, using the timeout support of the regex module, so that
+catastrophic backtracking on a malformed reference gives up instead of pinning the worker. when the budget
+runs out a `regex_timeout` perf event naming the pattern and the source file is emitted, and the caller
+gets the default value back to take its fallback path
+"""
+
+import os
+import sys
+import time
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+import regex as re
+
+from adsputils import setup_logging, load_config
+logger = setup_logging('refparsers')
+config = {}
+config.update(load_config())
+
+from adsrefpipe import perf_metrics
+
+
+# max number of runtime built patterns to keep compiled
+PATTERN_CACHE_SIZE = int(config.get('REFERENCE_PIPELINE_PATTERN_CACHE_SIZE', 512))
+
+# methods of a compiled pattern that are timed when profiling
+PROFILED_METHODS = ('search', 'match', 'fullmatch', 'sub', 'subn', 'findall', 'finditer', 'split')
+
+# longest pattern text kept in the profile
+MAX_PATTERN_TEXT = 120
+
+# seconds of regex time the guarded patterns can spend on one reference, 0 turns the guard off
+REGEX_TIME_BUDGET = float(config.get('REFERENCE_PIPELINE_REGEX_TIME_BUDGET', 1.0))
+
+
+@lru_cache(maxsize=PATTERN_CACHE_SIZE)
+def _compile(pattern: str, flags: int) -> re.Pattern:
+    """
+    compile the pattern, results are kept in the LRU cache
+
+    :param pattern: regular expression
+    :param flags: regular expression flags
+    :return: compiled pattern
+    """
+    return re.compile(pattern, flags)
+
+
+def compile_cached(pattern: str, flags: int = 0):
+    """
+    return the compiled pattern from the LRU cache, compiling it on the first call
+
+    :param pattern: regular expression
+    :param flags: regular expression flags
+    :return: compiled pattern, wrapped in ProfiledPattern when profiling is enabled
+    """
+    compiled = _compile(pattern, flags)
+    if profiling_enabled():
+        return ProfiledPattern(compiled, 'dynamic')
+    return compiled
+
+
+def pattern_cache_info():
+    """
+    :return: hits, misses, maxsize and currsize of the compile cache
+    """
+    return _compile.cache_info()
+
+
+def profiling_enabled() -> bool:
+    """
+    check if regex profiling has been turned on
+
+    :return: True if PERF_REGEX_PROFILE is set to a true value
+    """
+    return os.environ.get('PERF_REGEX_PROFILE', '').strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+class RegexProfile:
+    """
+    thread safe counters of calls, cumulative time and input size, keyed by pattern owner, pattern text and parser
+    """
+
+    def __init__(self):
+        """
+        initialize empty counters
+        """
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.counters = {}
+
+    def current_parser(self) -> Optional[str]:
+        """
+        :return: name of the parser set by parser_scope in this thread, if any
+        """
+        return getattr(self.local, 'parser', None)
+
+    @contextmanager
+    def parser_scope(self, parser_name: str):
+        """
+        attribute the regex calls made in this block to the parser
+
+        :param parser_name: name of the parser
+        """
+        previous = self.current_parser()
+        self.local.parser = parser_name
+        try:
+            yield
+        finally:
+            self.local.parser = previous
+
+    def record(self, owner: str, pattern: str, method: str, duration_s: float, input_size: int):
+        """
+        add one call to the counters
+
+        :param owner: where the pattern is defined, ie `TXTtoREFs.re_prior_year`
+        :param pattern: pattern text
+        :param method: pattern method that was called
+        :param duration_s: time spent in the call
+        :param input_size: length of the input string
+        """
+        key = (owner, pattern, self.current_parser() or '')
+        with self.lock:
+            counter = self.counters.get(key)
+            if counter is None:
+                counter = self.counters[key] = {'calls': 0, 'total_s': 0.0, 'input_chars': 0, 'max_input_chars': 0, 'methods': {}}
+            counter['calls'] += 1
+            counter['total_s'] += duration_s
+            counter['input_chars'] += input_size
+            counter['max_input_chars'] = max(counter['max_input_chars'], input_size)
+            counter['methods'][method] = counter['methods'].get(method, 0) + 1
+
+    def snapshot(self, reset: bool = True) -> List[Dict[str, Any]]:
+        """
+        return the counters, slowest pattern first
+
+        :param reset: if True, clear the counters
+        :return: list of dicts, one per pattern and parser
+        """
+        with self.lock:
+            counters = self.counters
+            if reset:
+                self.counters = {}
+            else:
+                counters = dict(counters)
+        rows = []
+        for (owner, pattern, parser), counter in counters.items():
+            rows.append({
+                'owner': owner,
+                'pattern': pattern,
+                'parser': parser,
+                'calls': counter['calls'],
+                'total_ms': counter['total_s'] * 1000.0,
+                'input_chars': counter['input_chars'],
+                'max_input_chars': counter['max_input_chars'],
+                'methods': dict(counter['methods']),
+            })
+        return sorted(rows, key=lambda row: row['total_ms'], reverse=True)
+
+
+# process wide profile
+regex_profile = RegexProfile()
+
+
+def _input_size(args: tuple, method: str) -> int:
+    """
+    :return: length of the string argument the pattern is applied to
+    """
+    # for sub/subn the first argument is the replacement
+    index = 1 if method in ('sub', 'subn') else 0
+    if len(args) > index and isinstance(args[index], str):
+        return len(args[index])
+    return 0
+
+
+class ProfiledPattern:
+    """
+    wraps a compiled pattern and records every call to its matching methods in regex_profile
+
+    note that for finditer only creating the iterator is timed, not consuming it
+    """
+
+    def __init__(self, compiled, owner: str):
+        """
+        :param compiled: compiled pattern to wrap
+        :param owner: where the pattern is defined, ie `TXTtoREFs.re_prior_year`
+        """
+        self.compiled = compiled
+        self.owner = owner
+        self.pattern_text = compiled.pattern[:MAX_PATTERN_TEXT]
+
+    def __getattr__(self, name: str):
+        """
+        time the matching methods, forward everything else to the compiled pattern
+
+        :param name: attribute name
+        :return: attribute of the compiled pattern, or a timed wrapper of the method
+        """
+        attribute = getattr(self.compiled, name)
+        if name not in PROFILED_METHODS:
+            return attribute
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return attribute(*args, **kwargs)
+            finally:
+                regex_profile.record(self.owner, self.pattern_text, name, time.perf_counter() - start, _input_size(args, name))
+        return timed
+
+    def __repr__(self) -> str:
+        return 'ProfiledPattern(%r, %r)' % (self.compiled, self.owner)
+
+
+def _wrap(value: Any, owner: str) -> Any:
+    """
+    wrap a compiled pattern, or the compiled patterns held in a list/tuple (ie, cleanup lists)
+
+    :param value: attribute value
+    :param owner: name to record the pattern under
+    :return: the value with the compiled patterns wrapped, or the value itself if there is nothing to wrap
+    """
+    if isinstance(value, re.Pattern):
+        return ProfiledPattern(value, owner)
+    if isinstance(value, (list, tuple)) and any(isinstance(item, (re.Pattern, list, tuple)) for item in value):
+        wrapped = [_wrap(item, owner) for item in value]
+        if all(a is b for a, b in zip(wrapped, value)):
+            return value
+        return type(value)(wrapped)
+    return value
+
+
+# classes and modules whose patterns have been wrapped
+instrumented = set()
+
+
+def instrument_class(cls: type):
+    """
+    wrap the compiled patterns that are class attributes of the class and of its refparsers base classes
+
+    :param cls: the class to instrument
+    """
+    for klass in cls.__mro__:
+        if klass in instrumented or not klass.__module__.startswith('adsrefpipe.refparsers'):
+            continue
+        instrumented.add(klass)
+        for name, value in list(vars(klass).items()):
+            wrapped = _wrap(value, '%s.%s' % (klass.__name__, name))
+            if wrapped is not value:
+                setattr(klass, name, wrapped)
+
+
+def instrument_module(module_name: str):
+    """
+    wrap the compiled patterns of a refparsers module, both module globals and class attributes
+
+    :param module_name: name of an imported module
+    """
+    module = sys.modules.get(module_name)
+    if module is None or module_name in instrumented:
+        return
+    instrumented.add(module_name)
+    for name, value in list(vars(module).items()):
+        if isinstance(value, type) and value.__module__ == module_name:
+            instrument_class(value)
+        else:
+            wrapped = _wrap(value, '%s.%s' % (module_name.rsplit('.', 1)[-1], name))
+            if wrapped is not value:
+                setattr(module, name, wrapped)
+
+
+def instrument_parser(parser_class: type):
+    """
+    wrap the patterns used by a parser: the parser module, the modules of its base classes,
+    and the reference and unicode modules
+
+    :param parser_class: the toREFs parser class
+    """
+    module_names = {klass.__module__ for klass in parser_class.__mro__ if klass.__module__.startswith('adsrefpipe.refparsers')}
+    module_names.update(['adsrefpipe.refparsers.reference', 'adsrefpipe.refparsers.unicode'])
+    for module_name in sorted(module_names):
+        instrument_module(module_name)
+
+
+def emit_profile(extra: Dict = None):
+    """
+    emit the counters collected since the last call as a `regex_profile` perf event, and reset them
+
+    :param extra: event extra, ie source file and parser
+    """
+    rows = regex_profile.snapshot(reset=True)
+    if not rows:
+        return
+    event_extra = dict(extra or {})
+    event_extra['regex'] = rows
+    perf_metrics.emit_event(stage='regex_profile', duration_ms=sum(row['total_ms'] for row in rows), extra=event_extra)
+
+
+class RegexBudget:
+    """
+    regex time allowed for one reference, shared by all the guarded calls made for that reference
+    """
+
+    def __init__(self, budget_s: float = None):
+        """
+        :param budget_s: seconds allowed per reference, defaults to REGEX_TIME_BUDGET
+        """
+        self.budget_s = REGEX_TIME_BUDGET if budget_s is None else budget_s
+        self.reset()
+
+    def reset(self):
+        """
+        start the budget over, to be called when moving on to the next reference
+        """
+        self.deadline = time.perf_counter() + self.budget_s if self.budget_s > 0 else None
+
+    def remaining(self) -> Optional[float]:
+        """
+        :return: seconds left in the budget, or None if the guard is off
+        """
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.perf_counter())
+
+
+def guarded_call(compiled, method: str, *args, budget: RegexBudget = None, owner: str = None,
+                 source_filename: str = None, default: Any = None):
+    """
+    call a method of a compiled pattern, giving up when the budget is spent
+
+    :param compiled: compiled pattern, or ProfiledPattern
+    :param method: pattern method to call, ie `search`
+    :param args: arguments of the method
+    :param budget: the time budget of the current reference, if None the call is not guarded
+    :param owner: where the pattern is defined, ie `TXTtoREFs.re_prior_year`
+    :param source_filename: file the reference is coming from
+    :param default: returned when the call times out
+    :return: result of the call, or default if it timed out
+    """
+    remaining = budget.remaining() if budget is not None else None
+    if remaining is None:
+        return getattr(compiled, method)(*args)
+    start = time.perf_counter()
+    try:
+        if remaining <= 0:
+            raise TimeoutError('regex time budget already spent')
+        return getattr(compiled, method)(*args, timeout=remaining)
+    except TimeoutError:
+        report_timeout(compiled, method, args, owner, source_filename, budget, (time.perf_counter() - start) * 1000.0)
+        return default
+
+
+def report_timeout(compiled, method: str, args: tuple, owner: str, source_filename: str, budget: RegexBudget, duration_ms: float):
+    """
+    log the timeout and emit it as a `regex_timeout` perf event
+
+    :param compiled: compiled pattern that timed out
+    :param method: pattern method that was called
+    :param args: arguments of the method
+    :param owner: where the pattern is defined
+    :param source_filename: file the reference is coming from
+    :param budget: the time budget of the reference
+    :param duration_ms: time spent in the call before giving up
+    """
+    owner = owner or getattr(compiled, 'owner', None) or 'unknown'
+    pattern_text = compiled.pattern[:MAX_PATTERN_TEXT]
+    input_size = _input_size(args, method)
+    logger.warning('Regex %s timed out on %d chars of input from file %s, budget is %.3f seconds per reference.' %
+                   (owner, input_size, source_filename, budget.budget_s))
+    extra = perf_metrics.build_event_extra(source_filename=source_filename, parser_name=regex_profile.current_parser(),
+                                           extra={'owner': owner, 'pattern': pattern_text, 'method': method,
+                                                  'input_chars': input_size, 'budget_ms': budget.budget_s * 1000.0})
+    perf_metrics.emit_event(stage='regex_timeout', duration_ms=duration_ms, status='timeout', extra=extra)
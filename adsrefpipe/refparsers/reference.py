@@ -15,8 +15,12 @@ config = {}
 config.update(load_config())
 
 from adsrefpipe.refparsers.xmlFile import XmlString
-from adsrefpipe.refparsers.unicode import UnicodeHandler
-unicode_handler = UnicodeHandler()
+from adsrefpipe.refparsers.unicode import UnicodeHandler, LazyUnicodeHandler
+from adsrefpipe.refparsers import datacache
+from adsrefpipe.refparsers.patterns import compile_cached
+from adsrefpipe.refparsers.cleanup import apply_cleanup
+# the tables are loaded on first use, from the compiled cache when it is current
+unicode_handler = LazyUnicodeHandler()
 
 
 class ReferenceError(Exception):
@@ -720,7 +724,7 @@ class XMLreference(Reference):
             tagrx = r'(%s<%s%s>%s</%s>)' % ('(?i)' if foldcase else '', tag, attrs, mrx, tag)
         else:
             tagrx = r'%s<%s%s>(%s)</%s>' % ('(?i)' if foldcase else '', tag, attrs, mrx, tag)
-        match_start = re.search(tagrx, refstr)
+        match_start = compile_cached(tagrx).search(refstr)
         substr = None
         if match_start:
             substr = match_start.group(1)
@@ -756,19 +760,40 @@ class LatexReference(Reference):
 
     # path to the LaTeX macro file containing AAS-specific macros
     macro_filename = os.path.dirname(__file__) + '/data_files/aas_latex.dat'
-    # list of macros read from the LaTeX macro file
-    aas_macros = open(macro_filename).readlines()
-    # dictionary to store AAS macros and their definitions
-    aas_macro_dict = {}
-    # populate the aas_macro_dict with macros and their corresponding definitions
-    for line in aas_macros:
-        line = line.strip()
-        macro, means = line.split(None, 1)
-        aas_macro_dict[macro] = means
-    # sorted keys of the AAS macros for regex matching
-    aas_macro_keys = sorted(aas_macro_dict.keys(), key=len)
-    # regex pattern to match AAS macros in a string
-    re_aas_macro = re.compile(r'\b|'.join(map(re.escape, aas_macro_keys)) + r'\b')
+    # dictionary of AAS macros and their definitions, and the regex pattern to match them in a string,
+    # both loaded on first use by get_aas_macros
+    aas_macros = None
+
+    @staticmethod
+    def parse_aas_macros(macro_filename: str) -> Dict[str, str]:
+        """
+        read the AAS macros and their definitions from the LaTeX macro file
+
+        :param macro_filename: path to the LaTeX macro file
+        :return: dictionary of macros and their definitions
+        """
+        aas_macro_dict = {}
+        for line in open(macro_filename).readlines():
+            line = line.strip()
+            macro, means = line.split(None, 1)
+            aas_macro_dict[macro] = means
+        return aas_macro_dict
+
+    @classmethod
+    def get_aas_macros(cls) -> Tuple[Dict[str, str], re.Pattern]:
+        """
+        load the AAS macros if not already loaded
+
+        :return: tuple of the dictionary of macros and the regex pattern to match them
+        """
+        if cls.aas_macros is None:
+            aas_macro_dict = datacache.load_table([cls.macro_filename], 'aas_latex', lambda: cls.parse_aas_macros(cls.macro_filename))
+            # sorted keys of the AAS macros for regex matching
+            aas_macro_keys = sorted(aas_macro_dict.keys(), key=len)
+            re_aas_macro = re.compile(r'\b|'.join(map(re.escape, aas_macro_keys)) + r'\b')
+            cls.aas_macros = (aas_macro_dict, re_aas_macro)
+        return cls.aas_macros
+
     # dictionary of LaTeX macros and their replacements
     latex_macro_dict = {'newline': ' ',
                         'newblock': ' ',
@@ -834,10 +859,9 @@ class LatexReference(Reference):
         :param reference: the reference string to clean up
         :return: the cleaned reference string
         """
-        reference = self.re_aas_macro.sub(lambda match: self.aas_macro_dict[match.group(0)], reference)
-        for (compiled_re, replace_str) in self.reference_cleanup_1:
-            reference = compiled_re.sub(replace_str, reference)
+        aas_macro_dict, re_aas_macro = self.get_aas_macros()
+        reference = re_aas_macro.sub(lambda match: aas_macro_dict[match.group(0)], reference)
+        reference = apply_cleanup(self.reference_cleanup_1, reference)
         reference = self.re_latex_macro.sub(lambda match: self.latex_macro_dict[match.group('macro')], reference)
-        for (compiled_re, replace_str) in self.reference_cleanup_2:
-            reference = compiled_re.sub(replace_str, reference)
+        reference = apply_cleanup(self.reference_cleanup_2, reference)
         return reference
@@ -12,6 +12,8 @@ config = {}
 config.update(load_config())
 
 from adsrefpipe.refparsers.reference import unicode_handler
+from adsrefpipe.refparsers.patterns import compile_cached, guarded_call, RegexBudget
+from adsrefpipe.refparsers.cleanup import apply_cleanup
 
 
 class toREFs():
@@ -52,11 +54,55 @@ class toREFs():
     # to match the new arXiv identifier format
     re_arxiv_new_pattern = re.compile(r'\b(?:(?:arXiv\s*\W?\s*)|(?:(?:' + "|".join(arxiv_category) + r')\s*[:/]?\s*)|(?:http://.*?/abs/)|(?:))(\d{4})\.(\d{4,5})(?:v\d+)?\b', re.IGNORECASE)
 
+    # to match a capitalized word and a number, used when the full reference checks time out
+    re_capitalized_word = re.compile(r'\b[A-Z][a-z]+\b')
+    re_number = re.compile(r'\d+')
+
     def __init__(self):
         """
         initializes an empty list to store raw references
         """
         self.raw_references = []
+        self.regex_budget = RegexBudget()
+        self.regex_owners = {}
+
+    def regex_guard(self, pattern_name: str, method: str, *args, default=None):
+        """
+        call a method of a class pattern within the regex time budget of the current reference
+
+        :param pattern_name: name of the pattern attribute, ie `re_prior_year`
+        :param method: pattern method to call, ie `search`
+        :param args: arguments of the method
+        :param default: returned if the call times out
+        :return: result of the call, or default if it timed out
+        """
+        owners = getattr(self, 'regex_owners', None)
+        if owners is None:
+            owners = self.regex_owners = {}
+        owner = owners.get(pattern_name)
+        if owner is None:
+            # the class that defines the pattern, looked up once per pattern and not on every call
+            klass = next((klass.__name__ for klass in type(self).__mro__ if pattern_name in vars(klass)), type(self).__name__)
+            owner = owners[pattern_name] = '%s.%s' % (klass, pattern_name)
+        return guarded_call(getattr(self, pattern_name), method, *args, budget=getattr(self, 'regex_budget', None),
+                            owner=owner, source_filename=getattr(self, 'filename', None), default=default)
+
+    def reset_regex_budget(self):
+        """
+        start the regex time budget over for the next reference
+        """
+        if getattr(self, 'regex_budget', None) is None:
+            self.regex_budget = RegexBudget()
+        self.regex_budget.reset()
+
+    def looks_like_reference(self, reference: str) -> bool:
+        """
+        linear time check used when the reference patterns time out, a reference needs a name and at least two numbers
+
+        :param reference: reference string
+        :return: True if it has a capitalized word and two numbers
+        """
+        return bool(self.re_capitalized_word.search(reference)) and len(self.re_number.findall(reference)) >= 2
 
     def is_bibcode(self, text: str) -> bool:
         """
@@ -252,8 +298,7 @@ class TXTtoREFs(toREFs):
                     continue
 
                 if cleanup:
-                    for (compiled_re, replace_str) in cleanup:
-                        references = [compiled_re.sub(replace_str, ref) for ref in references]
+                    references = [apply_cleanup(cleanup, ref) for ref in references]
 
                 self.raw_references.append({'bibcode': bibcode, 'block_references': references})
 
@@ -266,11 +311,9 @@ class TXTtoREFs(toREFs):
         """
         if 'stacks.iop.org' in reference:
             reference = self.re_stacks_iop_org.sub('doi:10.1088', reference).replace('i=', '').replace('a=', '')
-        for (compiled_re, replace_str) in self.reference_cleanup_1:
-            reference = compiled_re.sub(replace_str, reference)
+        reference = apply_cleanup(self.reference_cleanup_1, reference)
         reference = unicode_handler.ent2asc(reference)
-        for (compiled_re, replace_str) in self.reference_cleanup_2:
-            reference = compiled_re.sub(replace_str, reference)
+        reference = apply_cleanup(self.reference_cleanup_2, reference)
         return reference
 
     def process_a_reference(self, is_enumerated: bool, line: str, next_line: str, reference: str, prev_reference: str, block_references: List) -> Tuple:
@@ -340,8 +383,7 @@ class TXTtoREFs(toREFs):
             with open(filename, 'r', encoding=encoding, errors='ignore') as f:
                 reader = f.readlines()
                 for i in range(len((reader))):
-                    for (compiled_re, replace_str) in self.block_cleanup:
-                        reader[i] = compiled_re.sub(replace_str, reader[i])
+                    reader[i] = apply_cleanup(self.block_cleanup, reader[i])
 
                 bibcode = None
                 ref_block = False
@@ -394,10 +436,15 @@ class TXTtoREFs(toREFs):
         """
         match = self.re_author_list_placeholder.match(cur_refstr)
         if match and prev_refstr:
+            # this can be called without is_reference, so start the budget over for this reference
+            self.reset_regex_budget()
             # find the year and return everything that came before it
-            prev_authors = self.re_prior_year.match(prev_refstr)
+            prev_authors = self.regex_guard('re_prior_year', 'match', prev_refstr, default=False)
             if prev_authors:
                 cur_refstr = prev_authors.group().strip() + " " + cur_refstr[match.end():].strip()
+            elif prev_authors is False:
+                # timed out, the authors are not known, keep the placeholder and flag the reference
+                cur_refstr = cur_refstr + config['INCOMPLETE_REFERENCE']
         return cur_refstr
 
     def is_reference(self, reference: str) -> bool:
@@ -408,9 +455,12 @@ class TXTtoREFs(toREFs):
         :param reference: The reference string to be validated
         :return: True if the reference is valid, otherwise False
         """
+        self.reset_regex_budget()
         if  self.re_year.search(reference) or self.re_doi.search(reference) or self.has_arXiv_id(reference):
             return True
-        match = self.re_a_reference.search(reference)
+        match = self.regex_guard('re_a_reference', 'search', reference, default=False)
+        if match is False:
+            return self.looks_like_reference(reference)
         if match:
             if match.group(1) and match.group(2) and match.group(3):
                 return True
@@ -456,8 +506,7 @@ class XMLtoREFs(toREFs):
                     continue
 
                 if cleanup:
-                    for (compiled_re, replace_str) in cleanup:
-                        references = compiled_re.sub(replace_str, references)
+                    references = apply_cleanup(cleanup, references)
 
                 block_references = self.get_xml_block(references, tag, encoding)
                 self.raw_references.append({'bibcode': bibcode, 'block_references': block_references})
@@ -552,8 +601,8 @@ class XMLtoREFs(toREFs):
         """
         references = []
 
-        re_start_tag = re.compile(start_tag)
-        re_end_tag = re.compile(end_tag)
+        re_start_tag = compile_cached(start_tag)
+        re_end_tag = compile_cached(end_tag)
 
         start_tag_match = re_start_tag.search(buffer)
         while start_tag_match:
@@ -625,7 +674,7 @@ class XMLtoREFs(toREFs):
             tagrx = r'(%s<%s%s>%s</%s>)' % ('(?i)' if foldcase else '', tag, attrs, mrx, tag)
         else:
             tagrx = r'%s<%s%s>(%s)</%s>' % ('(?i)' if foldcase else '', tag, attrs, mrx, tag)
-        match_start = re.search(tagrx, refstr)
+        match_start = compile_cached(tagrx).search(refstr)
         substr = None
         if match_start:
             substr = match_start.group(1)
@@ -723,8 +772,7 @@ class OCRtoREFs(toREFs):
                     continue
 
                 if cleanup:
-                    for (compiled_re, replace_str) in cleanup:
-                        references = [compiled_re.sub(replace_str, ref) for ref in references]
+                    references = [apply_cleanup(cleanup, ref) for ref in references]
 
                 self.raw_references.append({'bibcode': bibcode, 'block_references': references})
 
@@ -920,10 +968,15 @@ class OCRtoREFs(toREFs):
         """
         match = self.re_author_list_placeholder.match(cur_refstr)
         if match and prev_refstr:
+            # this can be called without is_reference, so start the budget over for this reference
+            self.reset_regex_budget()
             # find the year and return everything that came before it
-            prev_authors = self.re_prior_year.match(prev_refstr)
+            prev_authors = self.regex_guard('re_prior_year', 'match', prev_refstr, default=False)
             if prev_authors:
                 cur_refstr = prev_authors.group().strip() + " " + cur_refstr[match.end():].strip()
+            elif prev_authors is False:
+                # timed out, the authors are not known, keep the placeholder and flag the reference
+                cur_refstr = cur_refstr + config['INCOMPLETE_REFERENCE']
         return cur_refstr
 
     def is_reference(self, reference: str) -> bool:
@@ -933,9 +986,12 @@ class OCRtoREFs(toREFs):
         :param reference: reference string to be validated
         :return: true if the reference is valid, false otherwise
         """
+        self.reset_regex_budget()
         if self.re_year.search(reference) or self.re_doi.search(reference) or self.has_arXiv_id(reference):
             return True
-        match = self.re_a_reference.search(reference)
+        match = self.regex_guard('re_a_reference', 'search', reference, default=False)
+        if match is False:
+            return self.looks_like_reference(reference)
         if match:
             if match.group(1) and match.group(2) and match.group(3):
                 return True
@@ -1080,8 +1136,7 @@ class TEXtoREFs(toREFs):
                     continue
 
                 if cleanup:
-                    for (compiled_re, replace_str) in cleanup:
-                        references = [compiled_re.sub(replace_str, ref) for ref in references]
+                    references = [apply_cleanup(cleanup, ref) for ref in references]
 
                 self.raw_references.append({'bibcode': bibcode, 'block_references': references})
 
@@ -1115,8 +1170,7 @@ class TEXtoREFs(toREFs):
         :param reference: the reference string to be cleaned up
         :return: cleaned reference string
         """
-        for (compiled_re, replace_str) in self.re_cleanup:
-            reference = compiled_re.sub(replace_str, reference)
+        reference = apply_cleanup(self.re_cleanup, reference)
         references = []
         for clean_reference in self.split(reference):
             clean_reference = clean_reference.replace(':', ',').replace(r'\&', '&').\
@@ -1134,8 +1188,7 @@ class TEXtoREFs(toREFs):
         :param reference: reference string to be processed
         :return: de-bracketed reference string
         """
-        for (compiled_re, replace_str) in self.re_reference_debraket:
-            reference = compiled_re.sub(replace_str, reference)
+        reference = apply_cleanup(self.re_reference_debraket, reference)
         return reference
 
     def append(self, reference: str, bibcode: str, block_references: List, references: List) -> Tuple:
@@ -1198,18 +1251,20 @@ class TEXtoREFs(toREFs):
 
                         # if in reference block and line is non empty
                         if a_block and line:
+                            self.reset_regex_budget()
                             if self.re_reference_block_specifier.search(line):
                                 line = self.re_reference_block_specifier.sub('', self.re_reference_block_specifier_to_ignore.sub('', self.re_brackets_end.sub('', line)))
 
                             # if there is a comment
                             line = line.split('%')[0]
-                            match = self.re_reference_block.search(line)
+                            # if any of the guarded REs time out, they return None and the simpler anchored RE is used
+                            match = self.regex_guard('re_reference_block', 'search', line)
                             # if start of the reference and the part in this line is just the latex reference identifier and citation key
-                            if match and not match.group('content').strip() and self.re_reference_block_citiation_key_only.search(line):
+                            if match and not match.group('content').strip() and self.regex_guard('re_reference_block_citiation_key_only', 'search', line):
                                 pass
                             # if no match, or empty content or all punctuations, try another RE, more relaxed and see how that works?
                             elif not match or not match.group('content').strip() or self.re_only_punctuations.search(match.group('content')):
-                                match = self.re_reference_block_all_bracketed.search(line)
+                                match = self.regex_guard('re_reference_block_all_bracketed', 'search', line)
                                 if not match:
                                     match = self.re_reference_block_no_content.search(line)
                             # is it beginning of a reference
@@ -1355,8 +1410,7 @@ class HTMLtoREFs(toREFs):
         :return: cleaned reference string
         """
         if reference_cleanup:
-            for (compiled_re, replace_str) in reference_cleanup:
-                reference = compiled_re.sub(replace_str, reference)
+            reference = apply_cleanup(reference_cleanup, reference)
         return reference
 
     def get_references_single_record(self, filename: str, encoding: str, tag: str, bibcode: str) -> List:
@@ -1463,10 +1517,15 @@ class HTMLtoREFs(toREFs):
         """
         match = self.re_author_list_placeholder.match(cur_refstr)
         if match and prev_refstr:
+            # this can be called without is_reference, so start the budget over for this reference
+            self.reset_regex_budget()
             # find the year and return everything that came before it
-            prev_authors = self.re_prior_year.match(prev_refstr)
+            prev_authors = self.regex_guard('re_prior_year', 'match', prev_refstr, default=False)
             if prev_authors:
                 cur_refstr = prev_authors.group().strip() + " " + cur_refstr[match.end():].strip()
+            elif prev_authors is False:
+                # timed out, the authors are not known, keep the placeholder and flag the reference
+                cur_refstr = cur_refstr + config['INCOMPLETE_REFERENCE']
         return cur_refstr
 
     def is_reference(self, reference: str) -> bool:
@@ -1476,9 +1535,12 @@ class HTMLtoREFs(toREFs):
         :param reference: the reference string to be validated
         :return: True if the reference is valid, otherwise False
         """
+        self.reset_regex_budget()
         if  self.re_year.search(reference) or self.re_doi.search(reference) or self.has_arXiv_id(reference):
             return True
-        match = self.re_a_reference.search(reference)
+        match = self.regex_guard('re_a_reference', 'search', reference, default=False)
+        if match is False:
+            return self.looks_like_reference(reference)
         if match:
             if match.group(1) and match.group(2) and match.group(3):
                 return True
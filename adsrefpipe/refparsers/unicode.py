@@ -4,7 +4,8 @@
 import os
 import regex as re
 import html
-from typing import List
+import threading
+from typing import List, Dict, Tuple
 try:
     from UserDict import UserDict
 except ImportError:
@@ -16,6 +17,8 @@ logger = setup_logging('refparsers')
 config = {}
 config.update(load_config())
 
+from adsrefpipe.refparsers import datacache
+
 RE_HEX = re.compile('^[0-9a-fA-F]+$')
 
 # Courtesy of Chase Seibert.
@@ -151,10 +154,23 @@ class UnicodeHandler(UserDict):
         :param data_filename: path to the Unicode data file
         """
         self.data_filename = data_filename or os.path.dirname(__file__) + '/data_files/unicode.dat'
-        self.unicode = [None, ] * 65536
-
-        lines = open(self.data_filename).readlines()
         UserDict.__init__(self)
+        # entity table and code table are compiled once and then read from the cache
+        self.data, self.unicode = datacache.load_table([self.data_filename], 'unicode',
+                                                       lambda: self.parse_data_file(self.data_filename))
+
+    @staticmethod
+    def parse_data_file(data_filename: str) -> Tuple[Dict[str, 'UnicodeChar'], List]:
+        """
+        parse the Unicode data file into the entity and code tables
+
+        :param data_filename: path to the Unicode data file
+        :return: tuple of the entity table (entity -> UnicodeChar) and the code table (code -> UnicodeChar)
+        """
+        entities = {}
+        codes = [None, ] * 65536
+
+        lines = open(data_filename).readlines()
         for line in lines:
             fields = line.split()
             for i, field in enumerate(fields):
@@ -164,15 +180,16 @@ class UnicodeHandler(UserDict):
                 try:
                     code = int(fields[0].split(':')[0].split(';')[0])
                     entity = fields[1]
-                    self[entity] = UnicodeChar(fields)  # keep entity table
+                    entities[entity] = UnicodeChar(fields)  # keep entity table
 
                     if len(fields) > 4:  # keep code table
-                        if not self.unicode[code]:
-                            self.unicode[code] = self[entity]
+                        if not codes[code]:
+                            codes[code] = entities[entity]
                         else:
                             pass
                 except ValueError:
                     pass
+        return entities, codes
 
     def ent2asc(self, text: str) -> str:
         """
@@ -390,6 +407,9 @@ class UnicodeChar:
     represents a Unicode character with its entity, ASCII, and LaTeX representations
     """
 
+    # there are a few thousand of these per process, keep them small
+    __slots__ = ('code', 'entity', 'ascii', 'latex', 'type')
+
     def __init__(self, fields: List):
         """
         initialize a UnicodeChar instance
@@ -404,3 +424,67 @@ class UnicodeChar:
             self.type = fields[4].strip()
         else:
             self.type = ''
+
+
+class LazyUnicodeHandler:
+    """
+    stands in for a UnicodeHandler and defers loading the Unicode tables until the handler is first used,
+    so that importing the parsers does not pay for the tables
+    """
+
+    def __init__(self, data_filename: str = None):
+        """
+        initialize the lazy handler, nothing is loaded here
+
+        :param data_filename: path to the Unicode data file
+        """
+        self._data_filename = data_filename
+        self._handler = None
+        self._lock = threading.Lock()
+
+    def materialize(self) -> UnicodeHandler:
+        """
+        load the Unicode tables if not already loaded
+
+        :return: the underlying UnicodeHandler
+        """
+        if self._handler is None:
+            with self._lock:
+                if self._handler is None:
+                    self._handler = UnicodeHandler(self._data_filename)
+        return self._handler
+
+    def is_materialized(self) -> bool:
+        """
+        check if the Unicode tables have been loaded
+
+        :return: True if the underlying UnicodeHandler has been created
+        """
+        return self._handler is not None
+
+    def __getattr__(self, name: str):
+        """
+        forward attribute access to the underlying UnicodeHandler
+
+        :param name: attribute name
+        :return: the attribute of the underlying UnicodeHandler
+        """
+        return getattr(self.materialize(), name)
+
+    def __getitem__(self, key: str) -> 'UnicodeChar':
+        """
+        look up an entity in the underlying UnicodeHandler
+
+        :param key: entity name
+        :return: UnicodeChar for the entity
+        """
+        return self.materialize()[key]
+
+    def __contains__(self, key: str) -> bool:
+        """
+        check if an entity is in the underlying UnicodeHandler
+
+        :param key: entity name
+        :return: True if the entity is known
+        """
+        return key in self.materialize()
@@ -1,9 +1,12 @@
 from adsrefpipe import app as app_module
+from celery import signals
 from kombu import Queue
 
 import os
 
 import adsrefpipe.perf_metrics as perf_metrics
+import adsrefpipe.perf_profile as perf_profile
+import adsrefpipe.perf_prometheus as perf_prometheus
 import adsrefpipe.utils as utils
 
 from adsputils import load_config
@@ -54,12 +57,13 @@ def task_process_reference(reference_task: dict) -> bool:
         record_count=1,
     )
     record_id = reference_record.get('id')
+    # the trace of the source file, time spent in the broker queue is measured from when the task was queued
+    trace_carrier = reference_task.get('trace')
+    perf_metrics.emit_queue_wait(trace_carrier, record_id=record_id, extra=event_extra)
     try:
-        with perf_metrics.timed_stage(
-            stage='record_wall',
-            record_id=record_id,
-            extra=event_extra,
-        ):
+        with perf_metrics.trace_scope(trace_carrier), \
+             perf_profile.profile_scope(reference_task.get('parser_name'), event_extra.get('source_type')), \
+             perf_metrics.timed_stage(stage='record_wall', record_id=record_id, extra=event_extra):
             with perf_metrics.timed_stage(
                 stage='resolver_http',
                 record_id=record_id,
@@ -87,6 +91,40 @@ def task_process_reference(reference_task: dict) -> bool:
     except KeyError:
         return False
 
+@signals.task_postrun.connect
+def flush_perf_events(**kwargs):
+    """
+    write out the perf events buffered while the task ran
+
+    :param kwargs: signal arguments, not used
+    :return:
+    """
+    perf_metrics.flush_events()
+
+
+@signals.worker_init.connect
+def start_live_metrics(**kwargs):
+    """
+    turn on the live stage metrics of the worker, and serve them over http when a port is configured
+
+    the prefork children inherit the settings and dump their own counts to the metrics directory,
+    the server in the parent merges them on each scrape
+
+    :param kwargs: signal arguments, not used
+    :return: the http server, or None
+    """
+    if not perf_prometheus.configure_live_metrics(config):
+        return None
+    port = os.getenv('PERF_PROMETHEUS_PORT') or config.get('PERF_PROMETHEUS_PORT')
+    if not port:
+        return None
+    try:
+        return perf_prometheus.start_http_server(perf_prometheus.LIVE_METRICS.directory, int(port))
+    except (OSError, ValueError) as e:
+        logger.error('Unable to serve live metrics on port %s: %s' % (port, str(e)))
+        return None
+
+
 # dont know how to unittest this part
 # this (app.start()) the only line that is not unittested
 # and since i want all modules to be 100% covered,
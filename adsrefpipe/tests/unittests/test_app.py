@@ -11,9 +11,11 @@ from collections import namedtuple
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.sql import and_, func, case, column, table, literal
 from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import Query, Session
 
 from adsrefpipe import app
-from adsrefpipe.models import Base, Action, Parser, ReferenceSource, ProcessedHistory, ResolvedReference, CompareClassic
+from adsrefpipe.models import Action, Parser, ReferenceSource, ProcessedHistory, ResolvedReference, CompareClassic, \
+    BestResolvedReference, ResolutionChange, TableStatistics, TableCountDelta
 from adsrefpipe.utils import ReprocessQueryType
 from adsrefpipe.refparsers.CrossRefXML import CrossRefToREFs
 from adsrefpipe.refparsers.ElsevierXML import ELSEVIERtoREFs
@@ -1029,6 +1031,351 @@ class TestDatabase(unittest.TestCase):
                 assert results == []
                 mock_error.assert_called_with("Unable to fetch resolved references for source bibcode `2023A&A...657A...1X`.")
 
+    def test_get_resolved_references_highest_priority_per_resolved_bibcode(self):
+        """ test get_resolved_references keeps the first, highest priority and score, row of each resolved bibcode """
+
+        with patch.object(self.app, "session_scope") as mock_session_scope:
+            mock_session = MagicMock()
+            mock_session_scope.return_value = _make_session_scope_cm(mock_session)
+
+            MockRow = namedtuple("MockRow",
+                                 ["source_bibcode", "date", "id", "resolved_bibcode", "score", "parser_name",
+                                  "parser_priority"])
+            query = mock_session.query.return_value.filter.return_value.order_by
+            query.return_value.all.return_value = [
+                MockRow("2023A&A...657A...1X", datetime(2025, 1, 1), 3, "0001arXiv.........Z", 0.8, "Arthur", 3),
+                MockRow("2023A&A...657A...1X", datetime(2025, 1, 2), 1, "0001arXiv.........Z", 0.95, "JATS", 2),
+                MockRow("2023A&A...657A...1X", datetime(2025, 1, 3), 1, "0001arXiv.........Z", 1.0, "arXiv", 1),
+                MockRow("2023A&A...657A...1X", datetime(2025, 1, 3), 2, "0002arXiv.........Z", 1.0, "arXiv", 1),
+            ]
+
+            results = self.app.get_resolved_references("2023A&A...657A...1X")
+
+            self.assertEqual([(r['resolved_bibcode'], r['parser_name']) for r in results],
+                             [("0001arXiv.........Z", "Arthur"), ("0002arXiv.........Z", "arXiv")])
+            # a single lookup on the best resolved reference table, no window over the history
+            filtered = mock_session.query.return_value.filter.call_args[0][0]
+            self.assertEqual(str(filtered.compile(dialect=postgresql.dialect())),
+                             "best_resolved_reference.source_bibcode = %(source_bibcode_1)s")
+            order_by = [str(clause.compile(dialect=postgresql.dialect())) for clause in query.call_args[0]]
+            self.assertEqual(order_by, ["best_resolved_reference.resolved_bibcode",
+                                        "best_resolved_reference.parser_priority DESC",
+                                        "best_resolved_reference.score DESC"])
+
+    def test_update_best_resolved_reference_records(self):
+        """ test update_best_resolved_reference_records upserts the highest score per source, parser and resolved bibcode """
+        mock_session = MagicMock()
+        SourceRow = namedtuple("SourceRow", ["history_id", "date", "source_bibcode", "parser_name"])
+        mock_session.query.return_value.join.return_value.filter.return_value.all.return_value = [
+            SourceRow(1, datetime(2025, 1, 1), "2023A&A...657A...1X", "CrossRef"),
+        ]
+        resolved_records = [
+            ResolvedReference(history_id=1, item_num=1, reference_str="Reference 1", bibcode="2020ApJ...900....1S", score=0.6, reference_raw=None),
+            ResolvedReference(history_id=1, item_num=2, reference_str="Reference 2", bibcode="2020ApJ...900....1S", score=0.9, reference_raw=None),
+            ResolvedReference(history_id=1, item_num=3, reference_str="Reference 3", bibcode="...................", score=0, reference_raw=None),
+            ResolvedReference(history_id=1, item_num=4, reference_str="Reference 4", bibcode="0000", score=-1, reference_raw=None),
+            ResolvedReference(history_id=2, item_num=1, reference_str="Reference 5", bibcode="2021ApJ...901....2S", score=1.0, reference_raw=None),
+        ]
+
+        self.assertEqual(self.app.update_best_resolved_reference_records(mock_session, resolved_records), 1)
+
+        statement = mock_session.execute.call_args[0][0]
+        compiled = statement.compile(dialect=postgresql.dialect())
+        self.assertIn("ON CONFLICT (source_bibcode, parser_name, resolved_bibcode) DO UPDATE", str(compiled))
+        self.assertIn("WHERE excluded.score > best_resolved_reference.score", str(compiled))
+        self.assertEqual((compiled.params['resolved_bibcode_m0'], compiled.params['item_num_m0'], compiled.params['score_m0'],
+                          compiled.params['parser_priority_m0']), ("2020ApJ...900....1S", 2, 0.9, 1))
+
+        # nothing resolved, nothing to look up
+        mock_session.reset_mock()
+        self.assertEqual(self.app.update_best_resolved_reference_records(mock_session, resolved_records[2:4]), 0)
+        mock_session.query.assert_not_called()
+        mock_session.execute.assert_not_called()
+
+    def test_populate_tables_post_resolved_updates_best_resolved_reference(self):
+        """ test populate_tables_post_resolved keeps the best resolved references in the same transaction """
+        resolved_reference = [{'id': 'H1I1', 'refstring': 'Reference 1', 'bibcode': '2020ApJ...900....1S', 'score': 1.0}]
+        mock_session = MagicMock()
+        with patch.object(self.app, "session_scope", return_value=_make_session_scope_cm(mock_session)), \
+             patch.object(self.app, "update_resolved_reference_records"), \
+             patch.object(self.app, "update_best_resolved_reference_records") as mock_best:
+            self.assertTrue(self.app.populate_tables_post_resolved(resolved_reference, '2023A&A...657A...1X', None))
+        session, records = mock_best.call_args[0]
+        self.assertIs(session, mock_session)
+        self.assertEqual([(r.history_id, r.item_num, r.bibcode) for r in records], [(1, 1, '2020ApJ...900....1S')])
+        mock_session.commit.assert_called_once()
+
+    def test_export_resolved_references(self):
+        """ test export_resolved_references streams one set based query, deduplicated per resolved bibcode unless all parsers """
+        MockRow = namedtuple("MockRow", ["source_bibcode", "date", "id", "resolved_bibcode", "score", "parser_name", "parser_priority"])
+        rows = [
+            MockRow("2023A&A...657A...1X", datetime(2025, 1, 1), 3, "2020ApJ...900....1S", 0.8, "Arthur", 3),
+            MockRow("2023A&A...657A...1X", datetime(2025, 1, 2), 1, "2020ApJ...900....1S", 1.0, "arXiv", 1),
+            MockRow("2023A&A...657A...2X", datetime(2025, 1, 3), 1, "2020ApJ...900....1S", 1.0, "arXiv", 1),
+        ]
+        mock_session = MagicMock()
+        query = mock_session.query.return_value
+        query.filter.return_value = query
+        query.order_by.return_value = query
+        query.yield_per.side_effect = lambda batch_size: iter(rows)
+
+        with patch.object(self.app, "session_scope", return_value=_make_session_scope_cm(mock_session)):
+            exported = list(self.app.export_resolved_references(["2023A&A...657A...1X", "2023A&A...657A...2X"],
+                                                                since=datetime(2025, 1, 1), batch_size=500))
+            self.assertEqual([(r['source_bibcode'], r['parser_name']) for r in exported],
+                             [("2023A&A...657A...1X", "Arthur"), ("2023A&A...657A...2X", "arXiv")])
+            self.assertEqual(exported[0]['date'], "2025-01-01 00:00:00")
+            query.yield_per.assert_called_with(500)
+
+            # the bibcodes go in a single array parameter
+            by_bibcodes = query.filter.call_args_list[0][0][0].compile(dialect=postgresql.dialect())
+            self.assertEqual(str(by_bibcodes), "best_resolved_reference.source_bibcode = ANY (%(param_1)s)")
+            self.assertEqual(by_bibcodes.params['param_1'], ["2023A&A...657A...1X", "2023A&A...657A...2X"])
+            self.assertIn("best_resolved_reference.date >=", str(query.filter.call_args_list[1][0][0].compile(dialect=postgresql.dialect())))
+
+            self.assertEqual(len(list(self.app.export_resolved_references(all_parsers=True))), 3)
+
+    def test_iter_diagnostics(self):
+        """ test iter_diagnostics streams the combined view of many sources from one query with common table expressions """
+        MockRow = namedtuple("MockRow", ["bibcode", "source_filename", "resolved_filename", "parser_name", "num_runs",
+                                         "last_run_date", "num_references", "num_resolved_references"])
+        rows = [
+            MockRow("0001arXiv.........Z", "/a/00001.raw", "/a/00001.raw.result", "arXiv", 2, datetime(2020, 5, 11, 11, 13, 36), 2, 1),
+            MockRow("0002arXiv.........Z", "/a/00002.raw", "/a/00002.raw.result", "arXiv", None, None, None, None),
+        ]
+        queries = []
+
+        def yield_per(query, batch_size):
+            queries.append((query, batch_size))
+            return iter(rows)
+
+        bibcodes = ["%04darXiv.........Z" % index for index in range(1, 5001)]
+        # the statement is built on a session that is never connected, only the rows are mocked
+        with patch.object(self.app, "session_scope", return_value=_make_session_scope_cm(Session())), \
+             patch.object(Query, "yield_per", autospec=True, side_effect=yield_per):
+            results = self.app.iter_diagnostics(bibcode_list=bibcodes, batch_size=500)
+            self.assertEqual(queries, [])
+            self.assertEqual(list(results), [{
+                'bibcode': "0001arXiv.........Z", 'source_filename': "/a/00001.raw", 'resolved_filename': "/a/00001.raw.result",
+                'parser_name': "arXiv", 'num_runs': 2, 'last_run_date': "2020-05-11 11:13:36",
+                'last_run_num_references': 2, 'last_run_num_resolved_references': 1
+            }, {
+                'bibcode': "0002arXiv.........Z", 'source_filename': "/a/00002.raw", 'resolved_filename': "/a/00002.raw.result",
+                'parser_name': "arXiv", 'num_runs': 0, 'last_run_date': None,
+                'last_run_num_references': 0, 'last_run_num_resolved_references': 0
+            }])
+
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(queries[0][1], 500)
+        compiled = queries[0][0].statement.compile(dialect=postgresql.dialect())
+        statement = str(compiled)
+        self.assertTrue(statement.startswith("WITH sources AS"))
+        self.assertIn("runs AS", statement)
+        self.assertIn("last_run AS", statement)
+        self.assertIn("reference_source.bibcode = ANY (%(param_1)s)", statement)
+        self.assertNotIn("LIMIT", statement)
+        # one array parameter, however many bibcodes there are
+        self.assertEqual(compiled.params['param_1'], bibcodes)
+
+        with patch.object(self.app, "session_scope", return_value=_make_session_scope_cm(Session())), \
+             patch.object(Query, "yield_per", autospec=True, side_effect=yield_per):
+            list(self.app.iter_diagnostics(bibcode_list="0001arXiv.........Z", source_filename_list=["/a/00001.raw"]))
+        statement = str(queries[1][0].statement.compile(dialect=postgresql.dialect()))
+        self.assertIn("reference_source.bibcode = ANY", statement)
+        self.assertIn("reference_source.source_filename = ANY", statement)
+
+    def test_insert_resolution_change_records(self):
+        """ test insert_resolution_change_records logs only the references resolved differently than the previous time """
+        PreviousRow = namedtuple("PreviousRow", ["history_id", "item_num", "bibcode", "score"])
+        previous = []
+        queries = []
+
+        def all_rows(query):
+            queries.append(query)
+            return previous
+
+        mock_session = MagicMock()
+        # the statement is built on a session that is never connected, the previous resolutions are mocked
+        mock_session.query.side_effect = Session().query
+
+        def resolve(history_id, bibcodes):
+            mock_session.reset_mock()
+            records = [ResolvedReference(history_id=history_id, item_num=item_num, reference_str="Reference %d" % item_num,
+                                         bibcode=bibcode, score=score, reference_raw=None)
+                       for item_num, (bibcode, score) in enumerate(bibcodes, 1)]
+            with patch("adsrefpipe.app.get_date_now", return_value="2025/01/01 00:00:00"), \
+                 patch.object(Query, "all", autospec=True, side_effect=all_rows):
+                count = self.app.insert_resolution_change_records(mock_session, records)
+            changes = mock_session.bulk_save_objects.call_args[0][0] if mock_session.bulk_save_objects.called else []
+            return count, [(c.history_id, c.item_num, c.old_bibcode, c.new_bibcode, c.score) for c in changes]
+
+        # resolved the first time, there is no previous resolution
+        first = [("2020ApJ...900....1S", 1.0), ("2020ApJ...900....2S", 0.9)]
+        self.assertEqual(resolve(1, first), (2, [(1, 1, None, "2020ApJ...900....1S", 1.0), (1, 2, None, "2020ApJ...900....2S", 0.9)]))
+
+        # resolved again by the next run with the same result, nothing changed
+        previous = [PreviousRow(2, 1, "2020ApJ...900....1S", 1.0), PreviousRow(2, 2, "2020ApJ...900....2S", 0.9)]
+        self.assertEqual(resolve(2, first), (0, []))
+        mock_session.bulk_save_objects.assert_not_called()
+
+        # a new bibcode and a new score are changes, from the previous resolution
+        self.assertEqual(resolve(2, [("2021ApJ...901....1S", 1.0), ("2020ApJ...900....2S", 0.8)]),
+                         (2, [(2, 1, "2020ApJ...900....1S", "2021ApJ...901....1S", 1.0), (2, 2, "2020ApJ...900....2S", "2020ApJ...900....2S", 0.8)]))
+
+        # the previous resolution is the latest one of the same item of the same source file, placeholders are not one
+        statement = str(queries[-1].statement.compile(dialect=postgresql.dialect()))
+        self.assertIn("SELECT DISTINCT ON (processed_history_1.id, resolved_reference.item_num)", statement)
+        self.assertIn("processed_history_2.bibcode = processed_history_1.bibcode AND "
+                      "processed_history_2.source_filename = processed_history_1.source_filename AND "
+                      "processed_history_2.id <= processed_history_1.id", statement)
+        self.assertIn("resolved_reference.bibcode != %(bibcode_1)s", statement)
+        self.assertIn("ORDER BY processed_history_1.id, resolved_reference.item_num, resolved_reference.history_id DESC", statement)
+
+        mock_session.reset_mock()
+        self.assertEqual(self.app.insert_resolution_change_records(mock_session, []), 0)
+        mock_session.query.assert_not_called()
+
+    def test_populate_tables_post_resolved_logs_changes_before_updating(self):
+        """ test populate_tables_post_resolved reads the old bibcodes before they are overwritten, in the same transaction """
+        order = []
+        mock_session = MagicMock()
+        with patch.object(self.app, "session_scope", return_value=_make_session_scope_cm(mock_session)), \
+             patch.object(self.app, "insert_resolution_change_records", side_effect=lambda *args: order.append("log")), \
+             patch.object(self.app, "update_resolved_reference_records", side_effect=lambda *args: order.append("update")), \
+             patch.object(self.app, "update_best_resolved_reference_records"):
+            self.app.populate_tables_post_resolved([{'id': 'H1I1', 'bibcode': '2020ApJ...900....1S', 'score': 1.0}], '2023A&A...657A...1X', None)
+        self.assertEqual(order, ["log", "update"])
+        mock_session.commit.assert_called_once()
+
+    def test_get_resolution_changes(self):
+        """ test get_resolution_changes reads a page after the watermark, in transaction order, of the finished transactions only """
+        mock_session = MagicMock()
+        query = mock_session.query.return_value
+        query.filter.return_value = query
+        query.order_by.return_value = query
+        change = ResolutionChange(history_id=1, item_num=1, old_bibcode=None, new_bibcode="2020ApJ...900....1S", score=1.0,
+                                  ts=datetime(2025, 1, 1))
+        change.id, change.txid = 8, 1234
+        query.limit.return_value.all.return_value = [change]
+
+        with patch.object(self.app, "session_scope", return_value=_make_session_scope_cm(mock_session)):
+            changes = self.app.get_resolution_changes(since_txid=1200, since_id=7, limit=50)
+            self.assertEqual(changes, [{'txid': 1234, 'id': 8, 'history_id': 1, 'item_num': 1, 'old_bibcode': None,
+                                        'new_bibcode': "2020ApJ...900....1S", 'score': 1.0, 'ts': "2025-01-01 00:00:00"}])
+            filters = [str(call[0][0].compile(dialect=postgresql.dialect())) for call in query.filter.call_args_list]
+            self.assertEqual(filters, ["(resolution_change.txid, resolution_change.id) > (%(param_1)s, %(param_2)s)",
+                                       "resolution_change.txid < txid_snapshot_xmin(txid_current_snapshot())"])
+            order = [str(clause.compile(dialect=postgresql.dialect())) for clause in query.order_by.call_args[0]]
+            self.assertEqual(order, ["resolution_change.txid", "resolution_change.id"])
+            query.limit.assert_called_with(50)
+
+    def test_get_count_records_estimated_and_cached(self):
+        """ test get_count_records serves stored counts within the ttl and estimates the others from the postgres statistics """
+        mock_session = MagicMock()
+        now = datetime.now()
+        mock_session.query.return_value.all.return_value = [
+            TableStatistics(table_name='reference_source', count=30, exact=False, updated=now - timedelta(seconds=10)),
+            TableStatistics(table_name='processed_history', count=40, exact=False, updated=now - timedelta(days=1)),
+            TableStatistics(table_name='resolved_reference', count=70, exact=True, updated=now - timedelta(days=1)),
+        ]
+        EstimateRow = namedtuple("EstimateRow", ["table_name", "reltuples", "n_live_tup"])
+        mock_session.execute.return_value.fetchall.return_value = [
+            EstimateRow('processed_history', 41.0, 45),
+            EstimateRow('resolved_reference', 75.0, 0),
+            EstimateRow('compare_classic', -1.0, None),
+        ]
+
+        with patch.object(self.app, "session_scope", return_value=_make_session_scope_cm(mock_session)), \
+             patch.dict(self.app._config, {'REFERENCE_PIPELINE_STATS_CACHE_TTL': 300, 'REFERENCE_PIPELINE_MAINTAIN_EXACT_COUNTS': False}):
+            results = self.app.get_count_records()
+
+        self.assertEqual([(r['name'], r['count'], r['exact']) for r in results],
+                         [('ReferenceSource', 30, False), ('ProcessedHistory', 45, False),
+                          ('ResolvedReference', 75, False), ('CompareClassic', 0, False)])
+        # only the tables without a fresh count are estimated, and the estimates are stored
+        estimate, save = mock_session.execute.call_args_list
+        self.assertEqual(estimate[0][1], {'tables': ['processed_history', 'resolved_reference', 'compare_classic']})
+        compiled = save[0][0].compile(dialect=postgresql.dialect())
+        self.assertIn("ON CONFLICT (table_name) DO UPDATE", str(compiled))
+        self.assertNotIn("WHERE", str(compiled))
+        self.assertEqual((compiled.params['table_name_m1'], compiled.params['count_m1'], compiled.params['exact_m1']),
+                         ('resolved_reference', 75, False))
+        mock_session.query.return_value.filter.assert_not_called()
+
+    def test_get_count_records_maintained_exact(self):
+        """ test get_count_records adds the recorded deltas to the exact counts, and counts them atomically on request """
+        mock_session = MagicMock()
+        updated = datetime.now() - timedelta(days=3)
+        mock_session.query.return_value.all.return_value = [
+            TableStatistics(table_name=name, count=count, exact=True, updated=updated)
+            for name, count in [('reference_source', 3), ('processed_history', 4), ('resolved_reference', 7), ('compare_classic', 6)]
+        ]
+        with patch.object(self.app, "session_scope", return_value=_make_session_scope_cm(mock_session)), \
+             patch.dict(self.app._config, {'REFERENCE_PIPELINE_MAINTAIN_EXACT_COUNTS': True}):
+            results = self.app.get_count_records()
+            self.assertEqual([(r['count'], r['exact'], r['updated']) for r in results], [(count, True, updated) for count in (3, 4, 7, 6)])
+            # the deltas are folded into the counts before they are read, in one statement
+            fold = mock_session.execute.call_args_list
+            self.assertEqual(len(fold), 1)
+            self.assertIn("WITH consumed AS (DELETE FROM table_count_delta RETURNING table_name, delta)", str(fold[0][0][0]))
+            self.assertIn("AND table_statistics.exact", str(fold[0][0][0]))
+
+            mock_session.execute.reset_mock()
+            mock_session.execute.return_value.scalar.side_effect = [13, 14, 17, 16]
+            results = self.app.get_count_records(exact=True)
+            self.assertEqual([(r['count'], r['exact']) for r in results], [(13, True), (14, True), (17, True), (16, True)])
+            # each table is counted in the statement that removes its deltas, so that a concurrent write is in one or the other
+            statements = [(str(call[0][0]), call[0][1]['table_name']) for call in mock_session.execute.call_args_list]
+            self.assertEqual([table_name for _, table_name in statements],
+                             ['reference_source', 'processed_history', 'resolved_reference', 'compare_classic'])
+            for statement, table_name in statements:
+                self.assertIn("WITH consumed AS (DELETE FROM table_count_delta WHERE table_name = :table_name)", statement)
+                self.assertIn("SELECT :table_name, count(*), true, :now FROM %s ON CONFLICT" % table_name, statement)
+
+    def test_get_count_records_estimated_without_maintained_counts(self):
+        """ test get_count_records does not fold the deltas when the exact counts are not maintained """
+        mock_session = MagicMock()
+        mock_session.query.return_value.all.return_value = [
+            TableStatistics(table_name=name, count=1, exact=False, updated=datetime.now())
+            for name in ('reference_source', 'processed_history', 'resolved_reference', 'compare_classic')
+        ]
+        with patch.object(self.app, "session_scope", return_value=_make_session_scope_cm(mock_session)), \
+             patch.dict(self.app._config, {'REFERENCE_PIPELINE_STATS_CACHE_TTL': 300, 'REFERENCE_PIPELINE_MAINTAIN_EXACT_COUNTS': False}):
+            self.app.get_count_records()
+        mock_session.execute.assert_not_called()
+
+    def test_update_table_statistics(self):
+        """ test update_table_statistics records a delta row, inserts and deletes, only when the exact counts are maintained """
+        mock_session = MagicMock()
+        with patch.dict(self.app._config, {'REFERENCE_PIPELINE_MAINTAIN_EXACT_COUNTS': False}):
+            self.app.update_table_statistics(mock_session, 'resolved_reference', 5)
+        mock_session.add.assert_not_called()
+
+        with patch.dict(self.app._config, {'REFERENCE_PIPELINE_MAINTAIN_EXACT_COUNTS': True}):
+            self.app.update_table_statistics(mock_session, 'resolved_reference', 0)
+            mock_session.add.assert_not_called()
+            self.app.update_table_statistics(mock_session, 'resolved_reference', 5)
+            self.app.update_table_statistics(mock_session, 'processed_history', -2)
+        # no shared row is updated, concurrent writers do not wait on each other
+        mock_session.query.assert_not_called()
+        deltas = [call[0][0] for call in mock_session.add.call_args_list]
+        self.assertTrue(all(isinstance(delta, TableCountDelta) for delta in deltas))
+        self.assertEqual([(delta.table_name, delta.delta) for delta in deltas], [('resolved_reference', 5), ('processed_history', -2)])
+
+    def test_table_count_delta_model_toJSON(self):
+        """ test toJSON method of TableCountDelta class in model module """
+        record = TableCountDelta(table_name='resolved_reference', delta=-3)
+        record.id = 1
+        self.assertEqual(record.toJSON(), {'id': 1, 'table_name': 'resolved_reference', 'delta': -3})
+
+    def test_best_resolved_reference_model_toJSON(self):
+        """ test toJSON method of BestResolvedReference class in model module """
+        record = BestResolvedReference(source_bibcode="2023A&A...657A...1X", parser_name="arXiv", resolved_bibcode="2020ApJ...900....1S",
+                                       history_id=1, item_num=2, score=0.9, parser_priority=1, date=datetime(2025, 1, 1))
+        self.assertEqual(record.toJSON(), {'source_bibcode': "2023A&A...657A...1X", 'parser_name': "arXiv",
+                                           'resolved_bibcode': "2020ApJ...900....1S", 'history_id': 1, 'item_num': 2,
+                                           'score': 0.9, 'parser_priority': 1, 'date': datetime(2025, 1, 1)})
+
     def test_parser_model_get_name(self):
         """ test get_name method of Parser class in model module """
         parser = Parser(name="TestParser", extension_pattern=".xml", reference_service_endpoint="xml", matches=[])
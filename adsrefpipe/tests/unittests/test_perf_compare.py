@@ -0,0 +1,94 @@
+import os
+import random
+import tempfile
+import unittest
+
+import adsrefpipe.perf_compare as perf_compare
+import adsrefpipe.perf_metrics as perf_metrics
+
+
+def _summary(root, scale=1.0, seed=1, **metadata):
+    rng = random.Random(seed)
+    events = []
+    for index in range(300):
+        parser_name = "arXiv" if index % 2 else "CrossRef"
+        extra = {"source_filename": os.path.join(root, "%s.raw" % parser_name), "parser_name": parser_name}
+        duration = rng.gauss(20.0, 2.0) * (scale if parser_name == "arXiv" else 1.0)
+        events.append({"ts": 1.0, "stage": "record_wall", "record_id": "rec-%d" % index, "duration_ms": duration, "extra": extra})
+        events.append({"ts": 1.0, "stage": "resolver_http", "record_id": "rec-%d" % index, "duration_ms": rng.gauss(5.0, 0.5), "extra": extra})
+    summary = perf_metrics.aggregate_ads_events(events, started_at=0.0, ended_at=60.0, expected_files=2)
+    summary["run_metadata"] = dict({"run_id": seed, "input_path": root, "mode": "mock", "warmup": True}, **metadata)
+    return summary
+
+
+class TestPerfCompare(unittest.TestCase):
+
+    def test_bootstrap_delta_interval(self):
+        rng = random.Random(3)
+        baseline = [rng.gauss(10.0, 1.0) for _ in range(400)]
+        slower = perf_compare.bootstrap_delta(baseline, [value * 1.3 for value in baseline], iterations=300)
+        self.assertAlmostEqual(slower["delta"], 0.3)
+        self.assertTrue(0 < slower["ci_low"] < 0.3 < slower["ci_high"])
+        same = perf_compare.bootstrap_delta(baseline, [rng.gauss(10.0, 1.0) for _ in range(400)], statistic="mean", iterations=300)
+        self.assertLess(same["ci_low"], 0.05)
+        self.assertGreater(same["ci_high"], -0.05)
+        self.assertEqual((slower["baseline_n"], slower["candidate_n"]), (400, 400))
+
+    def test_compare_flags_only_the_slower_parser(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            baseline = _summary(os.path.join(tmpdir, "a"), seed=1)
+            candidate = _summary(os.path.join(tmpdir, "b"), scale=1.5, seed=2, git_commit="abc")
+
+        result = perf_compare.compare_summaries(baseline, candidate, iterations=200)
+        self.assertTrue(result["comparable"])
+        self.assertEqual(result["regressions"], ["stage record_wall", "parser arXiv|wall_time_ms"])
+        self.assertEqual(result["parsers"]["CrossRef|wall_time_ms"]["status"], "ok")
+        self.assertEqual(result["stages"]["resolver_http"]["status"], "ok")
+        self.assertAlmostEqual(result["parsers"]["arXiv|wall_time_ms"]["delta"], 0.5, delta=0.1)
+
+        reverse = perf_compare.compare_summaries(candidate, baseline, iterations=200)
+        self.assertEqual(reverse["regressions"], [])
+        self.assertIn("parser arXiv|wall_time_ms", reverse["improvements"])
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            markdown_path = os.path.join(tmpdir, "compare.md")
+            perf_compare.render_comparison_markdown(result, markdown_path)
+            with open(markdown_path) as handle:
+                markdown = handle.read()
+        self.assertIn("## Regressions", markdown)
+        self.assertIn("| arXiv | wall_time_ms |", markdown)
+
+    def test_compare_reports_incomparable_runs_and_missing_samples(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            baseline = _summary(tmpdir, seed=1, tracemalloc=True)
+            candidate = _summary(tmpdir, scale=1.5, seed=2, mode="real")
+        candidate["selected_files"] = candidate["selected_files"][:1]
+        for summary in (baseline, candidate):
+            del summary["duration_samples_ms"]
+
+        result = perf_compare.compare_summaries(baseline, candidate)
+        self.assertFalse(result["comparable"])
+        self.assertEqual(result["problems"], ["selected files differ: 1 only in baseline, 0 only in candidate", "mode differs: 'mock' vs 'real'"])
+        self.assertTrue(any(warning.startswith("tracemalloc differs") for warning in result["warnings"]))
+        row = result["parsers"]["arXiv|wall_time_ms"]
+        self.assertEqual(row["status"], "no_ci")
+        self.assertAlmostEqual(row["delta"], 0.5, delta=0.1)
+        self.assertEqual(result["regressions"], [])
+
+    def test_sampled_runs_need_duration_samples_of_the_record_sample(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            baseline = _summary(tmpdir, seed=1)
+            candidate = _summary(tmpdir, seed=2)
+        for summary in (baseline, candidate):
+            summary["sampling"]["extrapolated"] = True
+        self.assertTrue(perf_compare.compare_summaries(baseline, candidate, iterations=50)["comparable"])
+
+        # from before the kept errors and slow events were left out of the duration samples
+        del candidate["duration_samples_ms"]["record_sample"]
+        result = perf_compare.compare_summaries(baseline, candidate, iterations=50)
+        self.assertFalse(result["comparable"])
+        self.assertEqual(result["problems"], ["candidate run is sampled and its duration samples are skewed by the kept errors and slow events"])
+
+
+if __name__ == "__main__":
+    unittest.main()
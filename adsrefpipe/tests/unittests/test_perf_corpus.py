@@ -0,0 +1,84 @@
+import json
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+import adsrefpipe.perf_corpus as perf_corpus
+import adsrefpipe.perf_parsers as perf_parsers
+from adsrefpipe.refparsers.handler import verify
+
+
+class TestPerfCorpus(unittest.TestCase):
+
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.output_dir, True)
+
+    def _parse(self, entry):
+        parser = verify(entry["parser"])
+        with perf_parsers.offline_lookups(entry["family"]):
+            return parser(filename=os.path.join(self.output_dir, entry["path"]), buffer=None).process_and_dispatch()
+
+    def test_synthetic_bibcode(self):
+        self.assertEqual(perf_corpus.synthetic_bibcode("A&A", "100", 12), "2000A&A...100...12S")
+        self.assertEqual(perf_corpus.synthetic_bibcode("ApJ", "600", 10001), "2001ApJ...600....1S")
+        with self.assertRaises(ValueError):
+            perf_corpus.synthetic_bibcode("ApJ", "600", 1000000)
+
+    def test_parsers_read_back_what_was_written(self):
+        families = ["arxiv", "adstxt", "threebibs", "pairs", "ocr", "tex", "html", "pasp", "agu", "jats",
+                    "pthph", "obsocr", "anas", "aedrv", "arana", "anrfm", "areps", "jlven", "pasj",
+                    "blackwell", "versita", "living"]
+        manifest = perf_corpus.generate_corpus(self.output_dir, families=families, blocks=3, references=4)
+        self.assertEqual(sorted({entry["family"] for entry in manifest["files"]}), sorted(families))
+        for entry in manifest["files"]:
+            family = perf_corpus.FAMILIES[entry["family"]]
+            # laid out the way app.get_parser splits the path into journal, volume and file
+            self.assertEqual(entry["path"].split(os.sep)[-3:-1], [family["journal"], family["volume"]])
+            self.assertTrue(entry["path"].endswith(family["extension"]))
+            parsed = self._parse(entry)
+            self.assertEqual(len(parsed), entry["blocks"], entry["path"])
+            self.assertEqual(sum(len(block["references"]) for block in parsed), entry["references"], entry["path"])
+        with open(os.path.join(self.output_dir, "manifest.json")) as handle:
+            self.assertEqual(json.load(handle), manifest)
+
+    def test_same_seed_same_bytes_and_noise_changes_them(self):
+        def contents(output_dir, **kwargs):
+            manifest = perf_corpus.generate_corpus(output_dir, families=["arxiv"], blocks=2, references=10, **kwargs)
+            with open(os.path.join(output_dir, manifest["files"][0]["path"]), "rb") as handle:
+                return handle.read()
+
+        other_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, other_dir, True)
+        clean = contents(self.output_dir, seed=3)
+        self.assertEqual(contents(other_dir, seed=3), clean)
+        self.assertNotEqual(contents(other_dir, seed=3, noise=1.0), clean)
+
+    def test_scales_multiply_the_references_per_block(self):
+        manifest = perf_corpus.generate_corpus(self.output_dir, families=["pasp"], blocks=2, references=3, scales=(1, 10))
+        by_scale = {entry["scale"]: entry for entry in manifest["files"]}
+        self.assertEqual((by_scale[1]["references"], by_scale[10]["references"]), (6, 60))
+        self.assertTrue(by_scale[10]["path"].startswith("10x" + os.sep))
+        self.assertEqual(sum(len(block["references"]) for block in self._parse(by_scale[10])), 60)
+        self.assertGreater(by_scale[10]["bytes"], by_scale[1]["bytes"])
+
+    def test_add_noise_keeps_markup_and_the_first_word(self):
+        reference = "<ref>Smith, J. 2000, ApJ, 100, 1</ref>"
+        for seed in range(20):
+            noisy = perf_corpus.add_noise(reference, random.Random(seed), wrap=True)
+            self.assertTrue(noisy.startswith("<ref>Smith,"))
+            self.assertTrue(noisy.endswith("</ref>"))
+
+    def test_rejects_unknown_families_and_bad_numbers(self):
+        with self.assertRaises(ValueError):
+            perf_corpus.generate_corpus(self.output_dir, families=["nosuchparser"])
+        with self.assertRaises(ValueError):
+            perf_corpus.generate_corpus(self.output_dir, families=["arxiv"], noise=1.5)
+        with self.assertRaises(ValueError):
+            perf_corpus.generate_corpus(self.output_dir, families=["arxiv"], blocks=0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import adsrefpipe.perf_eventlog as perf_eventlog
+import adsrefpipe.perf_metrics as perf_metrics
+
+
+def _event(run_id, index, **overrides):
+    event = {
+        "ts": 1700000000.0 + index,
+        "stage": "record_wall",
+        "run_id": run_id,
+        "context_id": "ctx-1",
+        "record_id": "rec-%d" % index,
+        "duration_ms": 1.5 * index,
+        "status": "ok",
+        "extra": {"source_filename": "a.raw", "parser_name": "arXiv", "record_count": 1},
+    }
+    event.update(overrides)
+    return event
+
+
+class TestPerfEventlog(unittest.TestCase):
+
+    def test_segments_round_trip(self):
+        events = [
+            _event("run-1", 0),
+            _event("run-1", 1, duration_ms=None, record_id=None, status="error"),
+            # does not fit the fixed layout, stored as JSON
+            _event("run-1", 2, record_id=7, attempt=2),
+            _event("run-1", 3, extra={"regex": [{"owner": "A.re_x", "calls": 2}], "unicode": "café"}),
+        ]
+        with tempfile.TemporaryDirectory() as tmpdir:
+            self.assertEqual(perf_eventlog.append_events(tmpdir, events[:2]), 2)
+            self.assertEqual(perf_eventlog.append_events(tmpdir, events[2:]), 2)
+            files = perf_eventlog.segment_files(tmpdir, run_id="run-1")
+            self.assertEqual(len(files), 1)
+            self.assertEqual(list(perf_eventlog.read_segment(files[0])), events)
+
+            # a record cut short is dropped, the ones before it are kept
+            with open(files[0], "ab") as handle:
+                handle.write(b"\xff\x00\x00\x00\x01abc")
+            self.assertEqual(len(list(perf_eventlog.read_segment(files[0]))), 4)
+
+    def test_segments_are_read_by_run(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            perf_eventlog.append_events(tmpdir, [_event("run-1", 0), _event("run-2", 1), _event("run-2", 2)])
+            self.assertEqual([os.path.basename(os.path.dirname(path)) for path in perf_eventlog.segment_files(tmpdir)], ["run_run-1", "run_run-2"])
+            with patch.object(perf_eventlog, "read_segment", wraps=perf_eventlog.read_segment) as mock_read:
+                events = list(perf_eventlog.iter_segment_events(tmpdir, run_id="run-2"))
+            self.assertEqual([event["record_id"] for event in events], ["rec-1", "rec-2"])
+            mock_read.assert_called_once()
+            self.assertEqual(list(perf_eventlog.iter_segment_events(tmpdir, run_id="run-2", context_id="ctx-2")), [])
+
+    def test_convert_jsonl_and_segments(self):
+        events = [_event("run-1", 0), _event("run-2", 1), _event(None, 2)]
+        with tempfile.TemporaryDirectory() as tmpdir:
+            jsonl_path = os.path.join(tmpdir, "events.jsonl")
+            with open(jsonl_path, "w") as handle:
+                for event in events:
+                    handle.write(json.dumps(event, sort_keys=True) + "\n")
+            segment_root = os.path.join(tmpdir, "segments")
+            with patch("builtins.print"):
+                self.assertEqual(perf_eventlog.main(["from-jsonl", jsonl_path, segment_root]), 0)
+            self.assertEqual(len(perf_eventlog.segment_files(segment_root)), 3)
+
+            converted_path = os.path.join(tmpdir, "converted.jsonl")
+            self.assertEqual(perf_eventlog.segments_to_jsonl(segment_root, converted_path, run_id="run-2"), 1)
+            with open(converted_path) as handle:
+                self.assertEqual([json.loads(line) for line in handle], [events[1]])
+
+    def test_emit_event_to_segments(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            events_path = os.path.join(tmpdir, "perf_events.jsonl")
+            environment = {"PERF_METRICS_ENABLED": "true", "PERF_METRICS_FORMAT": "segments"}
+            for buffered in ("true", "false"):
+                environment["PERF_METRICS_BUFFERED"] = buffered
+                with patch.dict(os.environ, environment):
+                    perf_metrics.emit_event("record_wall", run_id="run-seg", context_id="ctx-seg", record_id=buffered,
+                                            duration_ms=2.0, extra={"source_type": ".raw"}, path=events_path)
+            self.assertFalse(os.path.exists(events_path))
+            events = perf_metrics.load_events(events_path, run_id="run-seg", context_id="ctx-seg")
+            self.assertEqual(sorted(event["record_id"] for event in events), ["false", "true"])
+            self.assertEqual(events[0]["extra"], {"source_type": ".raw"})
+            self.assertTrue(os.path.isdir(os.path.join(tmpdir, "perf_segments", "run_run-seg")))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -139,6 +139,7 @@ class TestPerfMetrics(unittest.TestCase):
                 thread.start()
             for thread in threads:
                 thread.join()
+            perf_metrics.flush_events()
 
             with open(events_path, "r") as handle:
                 lines = [line.strip() for line in handle if line.strip()]
@@ -147,6 +148,64 @@ class TestPerfMetrics(unittest.TestCase):
             payloads = [json.loads(line) for line in lines]
             self.assertEqual(len(payloads), 200)
 
+    def test_emit_event_buffers_until_flush(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            events_path = os.path.join(tmpdir, "nested", "events.jsonl")
+            context_dir = os.path.join(tmpdir, "context")
+            config = {"PERF_METRICS_ENABLED": False, "PERF_METRICS_FLUSH_INTERVAL_S": 60}
+            perf_metrics.register_run_metrics_context(
+                run_id="run-buffered",
+                enabled=True,
+                path=events_path,
+                context_id="ctx-buffered",
+                config=config,
+                context_dir=context_dir,
+            )
+            config["PERF_METRICS_CONTEXT_DIR"] = context_dir
+            perf_metrics.flush_events()
+            written = perf_metrics.event_writer_stats()["events_written"]
+            with patch("adsrefpipe.perf_metrics.json.load", wraps=json.load) as mock_load:
+                for index in range(3):
+                    perf_metrics.emit_event(
+                        stage="record_wall",
+                        run_id="run-buffered",
+                        context_id="ctx-buffered",
+                        record_id="rec-%d" % index,
+                        duration_ms=1.0,
+                        config=config,
+                    )
+                # the run context file is read once and cached until it changes
+                self.assertEqual(mock_load.call_count, 1)
+            self.assertFalse(os.path.exists(events_path))
+            self.assertEqual(perf_metrics.flush_events(), 3)
+            self.assertEqual(perf_metrics.event_writer_stats()["events_written"], written + 3)
+            self.assertEqual(len(perf_metrics.load_events(events_path, run_id="run-buffered")), 3)
+
+            # registering the run again, ie disabling it, is seen by the next event
+            perf_metrics.register_run_metrics_context(
+                run_id="run-buffered",
+                enabled=False,
+                path=events_path,
+                context_id="ctx-buffered",
+                config=config,
+                context_dir=context_dir,
+            )
+            perf_metrics.emit_event(stage="record_wall", run_id="run-buffered", context_id="ctx-buffered", config=config)
+            self.assertEqual(perf_metrics.flush_events(), 0)
+
+    def test_flush_events_logs_on_failure(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            events_path = os.path.join(tmpdir, "events.jsonl")
+            perf_metrics.flush_events()
+            errors = perf_metrics.event_writer_stats()["write_errors"]
+            with patch.dict(os.environ, {"PERF_METRICS_ENABLED": "true"}):
+                perf_metrics.emit_event(stage="record_wall", record_id="rec-1", duration_ms=1.0, path=events_path)
+            with self.assertLogs("adsrefpipe.perf_metrics", level="DEBUG") as logs:
+                with patch("adsrefpipe.perf_metrics._append_jsonl_lines", side_effect=OSError("append failed")):
+                    self.assertEqual(perf_metrics.flush_events(), 0)
+            self.assertIn("Failed to flush metrics events", "\n".join(logs.output))
+            self.assertEqual(perf_metrics.event_writer_stats()["write_errors"], errors + 1)
+
     def test_register_run_metrics_context_logs_on_failure(self):
         with self.assertLogs("adsrefpipe.perf_metrics", level="DEBUG") as logs:
             with patch("adsrefpipe.perf_metrics.json.dump", side_effect=OSError("boom")):
@@ -175,7 +234,8 @@ class TestPerfMetrics(unittest.TestCase):
                 config=config,
                 context_dir=context_dir,
             )
-            with self.assertLogs("adsrefpipe.perf_metrics", level="DEBUG") as logs:
+            with self.assertLogs("adsrefpipe.perf_metrics", level="DEBUG") as logs, \
+                    patch.dict(os.environ, {"PERF_METRICS_BUFFERED": "false"}):
                 with patch("adsrefpipe.perf_metrics._append_jsonl_record", side_effect=OSError("append failed")):
                     perf_metrics.emit_event(
                         stage="record_wall",
@@ -222,7 +282,8 @@ class TestPerfMetrics(unittest.TestCase):
                 config=config,
                 context_dir=context_dir,
             )
-            with self.assertLogs("adsrefpipe.perf_metrics", level="DEBUG") as logs:
+            with self.assertLogs("adsrefpipe.perf_metrics", level="DEBUG") as logs, \
+                    patch.dict(os.environ, {"PERF_METRICS_BUFFERED": "false"}):
                 with patch("adsrefpipe.perf_metrics._append_jsonl_record", side_effect=PermissionError("denied")):
                     perf_metrics.emit_event(
                         stage="record_wall",
@@ -234,6 +295,247 @@ class TestPerfMetrics(unittest.TestCase):
                     )
             self.assertIn("Failed to emit metrics event", "\n".join(logs.output))
 
+    def test_quantile_sketch_matches_exact_stats_when_small(self):
+        values = [float(value % 97) + 0.5 for value in range(500)]
+        sketch = perf_metrics.QuantileSketch()
+        for value in values:
+            sketch.add(value)
+        self.assertEqual(sketch.stats(), perf_metrics._numeric_stats(values))
+        self.assertEqual(perf_metrics.QuantileSketch().stats(include_p99=False), perf_metrics._numeric_stats([], include_p99=False))
+
+    def test_quantile_sketch_relative_error_and_merge(self):
+        import random
+
+        generator = random.Random(7)
+        values = [generator.lognormvariate(2.0, 1.0) for _ in range(20000)] + [0.0] * 50
+        first, second = perf_metrics.QuantileSketch(), perf_metrics.QuantileSketch()
+        for index, value in enumerate(values):
+            (first if index % 2 else second).add(value)
+        merged = perf_metrics.QuantileSketch().merge(first).merge(second)
+        self.assertIsNone(merged.exact)
+        self.assertLess(len(merged.buckets), 1000)
+
+        exact = perf_metrics._numeric_stats(values)
+        stats = merged.stats()
+        self.assertEqual(stats["count"], exact["count"])
+        self.assertEqual(stats["min"], exact["min"])
+        self.assertEqual(stats["max"], exact["max"])
+        self.assertAlmostEqual(stats["mean"], exact["mean"], places=6)
+        for key in ("p50", "p95", "p99"):
+            self.assertLess(abs(stats[key] - exact[key]) / exact[key], 0.02, key)
+
+    def test_aggregate_ads_events_streams_from_file(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            events_path = os.path.join(tmpdir, "events.jsonl")
+            with open(events_path, "w") as handle:
+                for run_id in ("run-1", "run-2"):
+                    for index in range(3):
+                        handle.write(json.dumps({
+                            "ts": float(index),
+                            "stage": "record_wall",
+                            "run_id": run_id,
+                            "record_id": "%s-rec-%d" % (run_id, index),
+                            "duration_ms": float(index + 1),
+                            "status": "ok",
+                            "extra": {"source_filename": "a.raw", "parser_name": "arXiv"},
+                        }) + "\n")
+
+            events = perf_metrics.iter_events(events_path, run_id="run-2")
+            self.assertNotIsInstance(events, list)
+            summary = perf_metrics.aggregate_ads_events(events, expected_files=1)
+
+        self.assertEqual(summary["counts"]["records_processed"], 3)
+        self.assertEqual(summary["duration_s"]["wall_clock"], 2.0)
+        self.assertEqual(summary["per_record_metrics_ms"]["wall_time"]["p50"], 2.0)
+        self.assertEqual(summary["parser_breakdown"]["arXiv"]["wall_time_ms"]["max"], 3.0)
+
+    def test_sample_event(self):
+        with patch.dict(os.environ, {"PERF_METRICS_SAMPLE_EVERY": "4", "PERF_METRICS_SLOW_MS": "100"}):
+            decisions = [perf_metrics.sample_event("record_wall", "rec-%d" % index, "ok", 1.0) for index in range(400)]
+            sampled = [decision for decision in decisions if decision is not None]
+            self.assertTrue(all(decision == {"sample_rate": 4} for decision in sampled))
+            self.assertTrue(60 < len(sampled) < 140)
+            # the same record is always sampled the same way, whatever the stage
+            self.assertEqual(
+                [perf_metrics.sample_event("resolver_http", "rec-%d" % index, "ok", 1.0) is None for index in range(400)],
+                [decision is None for decision in decisions],
+            )
+            self.assertEqual(perf_metrics.sample_event("file_wall", "rec-1", "ok", 1.0), {})
+            self.assertEqual(perf_metrics.sample_event("record_wall", None, "ok", 1.0), {})
+            unsampled = next(index for index, decision in enumerate(decisions) if decision is None)
+            self.assertEqual(perf_metrics.sample_event("record_wall", "rec-%d" % unsampled, "error", 1.0), {"sample_reason": "error"})
+            self.assertEqual(perf_metrics.sample_event("record_wall", "rec-%d" % unsampled, "ok", 250.0), {"sample_reason": "slow"})
+            # those of a sampled record are part of the sample too
+            sampled_id = next(index for index, decision in enumerate(decisions) if decision is not None)
+            self.assertEqual(perf_metrics.sample_event("record_wall", "rec-%d" % sampled_id, "error", 1.0),
+                             {"sample_reason": "error", "in_sample": True})
+            self.assertEqual(perf_metrics.sample_event("record_wall", "rec-%d" % sampled_id, "ok", 250.0),
+                             {"sample_reason": "slow", "in_sample": True})
+        with patch.dict(os.environ, {"PERF_METRICS_STAGES": "file_wall,record_wall"}):
+            self.assertIsNone(perf_metrics.sample_event("resolver_http", "rec-1", "ok", 1.0))
+            self.assertEqual(perf_metrics.sample_event("file_wall", None, "ok", 1.0), {})
+
+    def test_sample_event_parses_the_settings_once(self):
+        config = {"PERF_METRICS_SAMPLE_EVERY": 4}
+        with patch.object(perf_metrics, "sampling_settings", wraps=perf_metrics.sampling_settings) as mock_settings:
+            for index in range(100):
+                perf_metrics.sample_event("record_wall", "rec-%d" % index, "ok", 1.0, config=config)
+            self.assertEqual(mock_settings.call_count, 1)
+            # a change of the environment is picked up
+            with patch.dict(os.environ, {"PERF_METRICS_STAGES": "file_wall"}):
+                self.assertIsNone(perf_metrics.sample_event("record_wall", "rec-1", "ok", 1.0, config=config))
+            self.assertEqual(mock_settings.call_count, 2)
+            perf_metrics.sample_event("record_wall", "rec-1", "ok", 1.0, config=dict(config))
+            self.assertEqual(mock_settings.call_count, 3)
+
+    def test_aggregate_ads_events_extrapolates_sampled_events(self):
+        events = [{"ts": 0.0, "stage": "file_wall", "duration_ms": 10.0, "extra": {"source_filename": "a.raw"}}]
+        for index in range(10):
+            events.append({"ts": 1.0, "stage": "record_wall", "record_id": "rec-%d" % index, "duration_ms": 2.0,
+                           "extra": {"source_filename": "a.raw", "parser_name": "arXiv", "sample_rate": 8}})
+        events.append({"ts": 2.0, "stage": "record_wall", "record_id": "rec-slow", "duration_ms": 500.0,
+                       "extra": {"source_filename": "a.raw", "parser_name": "arXiv", "sample_reason": "slow"}})
+        events.append({"ts": 2.0, "stage": "record_wall", "record_id": "rec-error", "duration_ms": 3.0, "status": "error",
+                       "extra": {"source_filename": "a.raw", "parser_name": "arXiv", "sample_reason": "error"}})
+
+        summary = perf_metrics.aggregate_ads_events(events, started_at=0.0, ended_at=60.0, expected_files=1)
+
+        self.assertEqual(summary["counts"]["records_processed"], 82)
+        self.assertEqual(summary["counts"]["failures"], 1)
+        self.assertEqual(summary["throughput"]["overall_records_per_minute"], 82.0)
+        self.assertEqual(summary["per_record_metrics_ms"]["wall_time"]["count"], 82)
+        self.assertAlmostEqual(summary["per_record_metrics_ms"]["wall_time"]["p50"], 2.0, delta=0.05)
+        self.assertEqual(summary["per_record_metrics_ms"]["wall_time"]["max"], 500.0)
+        self.assertEqual(summary["file_wall_ms"]["count"], 1)
+        self.assertEqual(summary["parser_breakdown"]["arXiv"]["record_count"], 82)
+        self.assertEqual(summary["sampling"], {
+            "sample_rates": {"8": 10},
+            "sampled_events": 10,
+            "kept_events": {"error": 1, "slow": 1},
+            "sampled_records": 10,
+            "extrapolated": True,
+        })
+
+    def test_duration_samples_leave_out_the_events_kept_outside_of_the_sample(self):
+        events = []
+        for index in range(40):
+            events.append({"ts": 1.0, "stage": "record_wall", "record_id": "rec-%d" % index, "duration_ms": 2.0,
+                           "extra": {"parser_name": "arXiv", "sample_rate": 4}})
+        for index in range(40, 60):
+            # slow for every record, only the one of a sampled record stands for the others
+            extra = {"parser_name": "arXiv", "sample_reason": "slow"}
+            if index == 40:
+                extra["in_sample"] = True
+            events.append({"ts": 1.0, "stage": "record_wall", "record_id": "rec-%d" % index, "duration_ms": 500.0, "extra": extra})
+        events.append({"ts": 1.0, "stage": "record_wall", "record_id": "rec-error", "duration_ms": 3.0, "status": "error",
+                       "extra": {"parser_name": "arXiv", "sample_reason": "error"}})
+
+        samples = perf_metrics.aggregate_ads_events(events)["duration_samples_ms"]
+        self.assertTrue(samples["record_sample"])
+        self.assertEqual(sorted(samples["stages"]["record_wall"]), [2.0] * 40 + [500.0])
+        self.assertEqual(sorted(samples["parsers"]["arXiv"]["wall_time_ms"]), [2.0] * 40 + [500.0])
+
+    def test_aggregate_ads_events_keeps_duration_samples(self):
+        events = [{"ts": 0.0, "stage": "parse_dispatch", "duration_ms": 30.0,
+                   "extra": {"source_filename": "a.raw", "parser_name": "arXiv", "record_count": 3}}]
+        for index in range(2000):
+            events.append({"ts": 1.0, "stage": "record_wall", "record_id": "rec-%d" % index, "duration_ms": float(index),
+                           "extra": {"source_filename": "a.raw", "parser_name": "arXiv"}})
+
+        samples = perf_metrics.aggregate_ads_events(events)["duration_samples_ms"]
+        self.assertEqual(samples["stages"]["parse_dispatch"], [10.0])
+        self.assertEqual(samples["parsers"]["arXiv"]["parse_stage_ms"], [10.0])
+        record_wall = samples["stages"]["record_wall"]
+        self.assertEqual(len(record_wall), samples["size"])
+        self.assertEqual(len(set(record_wall)), samples["size"])
+        # uniform over all the values, not the first ones
+        self.assertGreater(max(record_wall), 1500.0)
+        self.assertAlmostEqual(perf_metrics.percentile(record_wall, 50), 1000.0, delta=150.0)
+        self.assertEqual(perf_metrics.aggregate_ads_events(events)["duration_samples_ms"]["stages"]["record_wall"], record_wall)
+
+    def test_emit_event_samples_record_stages(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            events_path = os.path.join(tmpdir, "events.jsonl")
+            environment = {"PERF_METRICS_ENABLED": "true", "PERF_METRICS_SAMPLE_EVERY": "10"}
+            with patch.dict(os.environ, environment):
+                for index in range(200):
+                    perf_metrics.emit_event("record_wall", record_id="rec-%d" % index, duration_ms=1.0, path=events_path)
+                perf_metrics.emit_event("file_wall", duration_ms=1.0, path=events_path)
+            events = perf_metrics.load_events(events_path)
+        record_events = [event for event in events if event["stage"] == "record_wall"]
+        self.assertTrue(5 < len(record_events) < 40)
+        self.assertTrue(all(event["extra"] == {"sample_rate": 10} for event in record_events))
+        self.assertEqual(len([event for event in events if event["stage"] == "file_wall"]), 1)
+
+    def test_trace_links_file_stages_and_tasks(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            events_path = os.path.join(tmpdir, "events.jsonl")
+            extra = {"source_filename": "a.raw"}
+            with patch.dict(os.environ, {"PERF_METRICS_ENABLED": "true"}):
+                with perf_metrics.trace_scope() as trace_id:
+                    with perf_metrics.timed_stage("file_wall", extra=extra, path=events_path):
+                        with perf_metrics.timed_stage("queue_references", extra=extra, path=events_path):
+                            carrier = perf_metrics.trace_carrier()
+                        perf_metrics.emit_event("ingest_enqueue", extra=extra, path=events_path)
+                self.assertIsNone(perf_metrics.current_trace())
+                # the worker side
+                carrier = json.loads(json.dumps(dict(carrier, enqueued_at=carrier["enqueued_at"] - 0.05)))
+                with patch.object(perf_metrics, "metrics_path", return_value=events_path):
+                    perf_metrics.emit_queue_wait(carrier, record_id="rec-1", extra=extra)
+                    with perf_metrics.trace_scope(carrier), perf_metrics.timed_stage("record_wall", record_id="rec-1", extra=extra):
+                        self.assertEqual(perf_metrics.current_trace()["trace_id"], trace_id)
+            events = {event["stage"]: event for event in perf_metrics.load_events(events_path)}
+
+        spans = {stage: event["extra"].get("span_id") for stage, event in events.items()}
+        self.assertEqual({event["extra"]["trace_id"] for event in events.values()}, {trace_id})
+        self.assertIsNone(events["file_wall"]["extra"]["parent_span_id"])
+        self.assertEqual(events["queue_references"]["extra"]["parent_span_id"], spans["file_wall"])
+        self.assertEqual(events["ingest_enqueue"]["extra"]["parent_span_id"], spans["file_wall"])
+        self.assertIsNone(spans["ingest_enqueue"])
+        self.assertEqual(events["queue_wait"]["extra"]["parent_span_id"], spans["queue_references"])
+        self.assertEqual(events["record_wall"]["extra"]["parent_span_id"], spans["queue_references"])
+        self.assertGreaterEqual(events["queue_wait"]["duration_ms"], 50.0)
+        self.assertEqual(extra, {"source_filename": "a.raw"})
+
+        tracing = perf_metrics.aggregate_ads_events(list(events.values()))["tracing"]
+        self.assertEqual(tracing["traces"], 1)
+        self.assertEqual(tracing["queue_wait_ms"]["count"], 1)
+        self.assertEqual(tracing["slowest_files"][0]["source_filename"], "a.raw")
+        self.assertEqual(tracing["slowest_files"][0]["spans"], 4)
+        self.assertIn("queue_wait", tracing["critical_path_ms"])
+
+    def test_aggregate_ads_events_critical_path(self):
+        def _span(stage, start, end, span_id, parent_span_id=None):
+            return {"ts": 1000.0 + end, "stage": stage, "duration_ms": (end - start) * 1000.0, "status": "ok",
+                    "extra": {"trace_id": "t1", "span_id": span_id, "parent_span_id": parent_span_id, "source_filename": "a.raw"}}
+
+        events = [
+            _span("file_wall", 0.0, 1.0, "f"),
+            _span("parse_dispatch", 0.1, 0.4, "p", "f"),
+            _span("queue_references", 0.5, 0.9, "q", "f"),
+            # tasks run by the workers after the file is done, the second one is on the critical path and the first
+            # one ran alongside it
+            _span("queue_wait", 0.6, 1.2, "w1", "q"),
+            _span("record_wall", 1.2, 1.5, "r1", "q"),
+            _span("queue_wait", 0.7, 1.4, "w2", "q"),
+            _span("record_wall", 1.4, 2.0, "r2", "q"),
+            _span("resolver_http", 1.5, 1.9, "h2", "r2"),
+        ]
+        tracing = perf_metrics.aggregate_ads_events(events)["tracing"]
+        path = {label: round(row["total_ms"]) for label, row in tracing["critical_path_ms"].items()}
+        self.assertEqual(path, {"queue_wait": 700, "resolver_http": 400, "parse_dispatch": 300, "file_wall": 200,
+                                "record_wall": 200, "queue_references": 200})
+        self.assertAlmostEqual(tracing["end_to_end_ms"]["max"], 2000.0)
+        self.assertEqual(tracing["slowest_files"][0]["spans"], 8)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            markdown_path = os.path.join(tmpdir, "report.md")
+            perf_metrics.render_markdown(perf_metrics.aggregate_ads_events(events), markdown_path)
+            with open(markdown_path) as handle:
+                markdown = handle.read()
+        self.assertIn("## Tracing", markdown)
+        self.assertIn("| a.raw | 2000.00 | 8 | queue_wait 700.00, resolver_http 400.00, parse_dispatch 300.00 |", markdown)
+
     def test_aggregate_ads_events_groups_by_source_type(self):
         events = [
             {
@@ -421,6 +723,131 @@ class TestPerfMetrics(unittest.TestCase):
         self.assertEqual(result["summary"]["memory_available_bytes"]["min"], 200.0)
         self.assertEqual(result["summary"]["memory_used_ratio"]["max"], 0.8)
 
+    @unittest.skipUnless(os.path.isdir("/proc/self"), "needs procfs")
+    def test_collect_process_samples_includes_children_and_threads(self):
+        import subprocess
+
+        child = subprocess.Popen(["sleep", "5"])
+        try:
+            samples = perf_metrics.collect_process_samples(threads={"sampler": threading.get_native_id()})
+        finally:
+            child.kill()
+            child.wait()
+        by_role = {sample["role"]: sample for sample in samples}
+        self.assertEqual(by_role["benchmark"]["pid"], os.getpid())
+        self.assertGreater(by_role["benchmark"]["rss_bytes"], 0)
+        self.assertGreater(by_role["benchmark"]["open_fds"], 0)
+        self.assertEqual(by_role["child"]["pid"], child.pid)
+        self.assertEqual(by_role["sampler"]["tid"], threading.get_native_id())
+
+    def test_aggregate_and_render_process_samples(self):
+        samples = [
+            {"ts": 10.0, "pid": 1, "role": "benchmark", "name": "python", "cpu_s": 1.0, "rss_bytes": 100.0, "uss_bytes": 80.0, "open_fds": 5, "threads": 3},
+            {"ts": 12.0, "pid": 1, "role": "benchmark", "name": "python", "cpu_s": 2.0, "rss_bytes": 300.0, "uss_bytes": 90.0, "open_fds": 7, "threads": 3},
+            {"ts": 10.0, "pid": 2, "role": "celery_worker", "name": "celery", "cpu_s": 0.0, "rss_bytes": 50.0},
+            {"ts": 12.0, "pid": 2, "role": "celery_worker", "name": "celery", "cpu_s": 4.0, "rss_bytes": 50.0},
+            {"ts": 10.0, "pid": 1, "tid": 9, "role": "sampler", "name": "python", "cpu_s": 0.1},
+        ]
+        result = perf_metrics.aggregate_process_samples(samples, sample_interval_s=2.0)
+        self.assertEqual([row["role"] for row in result["processes"]], ["benchmark", "celery_worker", "sampler"])
+        benchmark, worker = result["processes"][:2]
+        self.assertEqual((benchmark["cpu_s"], benchmark["cpu_percent"], benchmark["rss_growth_bytes"]), (1.0, 50.0, 200.0))
+        self.assertEqual((benchmark["open_fds_max"], benchmark["uss_bytes"]["max"]), (7, 90.0))
+        self.assertEqual(worker["cpu_percent"], 200.0)
+        self.assertIsNone(result["processes"][2]["cpu_percent"])
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            markdown_path = os.path.join(tmpdir, "report.md")
+            perf_metrics.render_markdown({"process_load": result}, markdown_path)
+            with open(markdown_path) as handle:
+                markdown = handle.read()
+        self.assertIn("## Process Load", markdown)
+        self.assertIn("| celery_worker | 2 | celery | 4.00 | 200.00 |", markdown)
+        self.assertIn("| sampler | 1/9 | python |", markdown)
+
+    def test_timed_stage_records_allocation_sites(self):
+        import tracemalloc
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            events_path = os.path.join(tmpdir, "events.jsonl")
+            environment = {"PERF_METRICS_ENABLED": "true", "PERF_TRACEMALLOC": "true", "PERF_TRACEMALLOC_STAGES": "parse_dispatch"}
+            retained = []
+            try:
+                with patch.dict(os.environ, environment):
+                    with perf_metrics.timed_stage("parse_dispatch", extra={"parser_name": "arXiv"}, path=events_path):
+                        retained.append(["reference %d" % index for index in range(5000)])
+                    with perf_metrics.timed_stage("parser_init", path=events_path):
+                        pass
+            finally:
+                tracemalloc.stop()
+            events = perf_metrics.load_events(events_path)
+
+        self.assertEqual([event["stage"] for event in events], ["tracemalloc", "parse_dispatch", "parser_init"])
+        extra = events[0]["extra"]
+        self.assertEqual((extra["stage"], extra["parser_name"]), ("parse_dispatch", "arXiv"))
+        self.assertGreater(extra["net_bytes"], 5000 * 50)
+        self.assertTrue(extra["sites"][0]["site"].startswith("adsrefpipe/tests/unittests/test_perf_metrics.py:"))
+
+        summary = perf_metrics.aggregate_ads_events(events)
+        self.assertEqual(list(summary["allocations"]), ["parse_dispatch"])
+        self.assertEqual(summary["allocations"]["parse_dispatch"]["top_sites"][0]["count_diff"], extra["sites"][0]["count_diff"])
+        self.assertNotIn("tracemalloc", summary["latency_ms"])
+
+    def test_aggregate_and_render_regex_profile(self):
+        events = [
+            {"stage": "regex_profile", "duration_ms": 3.0, "extra": {"source_filename": "a.raw", "regex": [
+                {"owner": "TXTtoREFs.re_prior_year", "pattern": "((\\S+\\s+){2,})", "parser": "arXiv", "calls": 10, "total_ms": 2.0, "input_chars": 500, "max_input_chars": 80},
+                {"owner": "dynamic", "pattern": "<year>(.*?)</year>", "parser": "arXiv", "calls": 4, "total_ms": 1.0, "input_chars": 100, "max_input_chars": 30},
+            ]}},
+            {"stage": "regex_profile", "duration_ms": 2.0, "extra": {"source_filename": "b.xml", "regex": [
+                {"owner": "TXTtoREFs.re_prior_year", "pattern": "((\\S+\\s+){2,})", "parser": "JATS", "calls": 10, "total_ms": 2.0, "input_chars": 300, "max_input_chars": 120},
+            ]}},
+        ]
+        summary = perf_metrics.aggregate_ads_events(events, started_at=0.0, ended_at=1.0)
+        profile = summary["regex_profile"]
+        self.assertEqual(profile["total_calls"], 24)
+        self.assertEqual(profile["patterns"][0]["owner"], "TXTtoREFs.re_prior_year")
+        self.assertEqual(profile["patterns"][0]["calls"], 20)
+        self.assertEqual(profile["patterns"][0]["max_input_chars"], 120)
+        self.assertEqual(profile["patterns"][0]["parsers"], ["JATS", "arXiv"])
+        self.assertEqual(profile["parsers"]["arXiv"], {"calls": 14, "total_ms": 3.0, "input_chars": 600, "pattern_count": 2})
+        # profile events are not stage latencies
+        self.assertNotIn("regex_profile", summary["latency_ms"])
+        self.assertEqual(perf_metrics.aggregate_ads_events([], started_at=0.0, ended_at=1.0)["regex_profile"], {})
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            md_path = os.path.join(tmpdir, "summary.md")
+            perf_metrics.render_markdown(summary, md_path)
+            with open(md_path, "r") as handle:
+                rendered = handle.read()
+            self.assertIn("## Regex Hot Paths", rendered)
+            self.assertIn("| TXTtoREFs.re_prior_year |", rendered)
+            self.assertIn("### Regex Time by Parser", rendered)
+
+    def test_aggregate_and_render_regex_timeouts(self):
+        extra = {"source_filename": "a.raw", "parser_name": "arXiv", "owner": "TXTtoREFs.re_prior_year", "pattern": "((\\S+\\s+){2,})", "input_chars": 4000}
+        events = [
+            {"stage": "regex_timeout", "status": "timeout", "duration_ms": 1000.0, "extra": extra},
+            {"stage": "regex_timeout", "status": "timeout", "duration_ms": 0.0, "extra": dict(extra, input_chars=200)},
+            {"stage": "parse_dispatch", "duration_ms": 1200.0, "extra": {"source_filename": "a.raw", "parser_name": "arXiv"}},
+        ]
+        summary = perf_metrics.aggregate_ads_events(events, started_at=0.0, ended_at=2.0)
+        self.assertEqual(summary["errors"]["by_stage"], {"regex_timeout": 2})
+        self.assertEqual(summary["regex_timeouts"], [{
+            "owner": "TXTtoREFs.re_prior_year", "pattern": "((\\S+\\s+){2,})", "source_filename": "a.raw",
+            "parser_name": "arXiv", "count": 2, "total_ms": 1000.0, "max_input_chars": 4000,
+        }])
+        # timeouts are not stage latencies
+        self.assertNotIn("regex_timeout", summary["latency_ms"])
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            md_path = os.path.join(tmpdir, "summary.md")
+            perf_metrics.render_markdown(summary, md_path)
+            with open(md_path, "r") as handle:
+                rendered = handle.read()
+            self.assertIn("## Regex Timeouts", rendered)
+            self.assertIn("| TXTtoREFs.re_prior_year | a.raw | arXiv | 2 |", rendered)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,113 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import adsrefpipe.perf_parsers as perf_parsers
+
+
+class _FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _fake_parser(clock, power):
+    # a parser that takes size ** power fake seconds, and returns one reference per line
+    class FakeToREFs:
+        def __init__(self, filename, buffer):
+            self.filename = filename
+
+        def process_and_dispatch(self):
+            size = os.path.getsize(self.filename)
+            clock.now += (size / 1000.0) ** power / 1000.0
+            with open(self.filename) as handle:
+                lines = [line for line in handle if line.strip()]
+            return [{"bibcode": "2000TEST...1....1S", "references": lines}]
+    return FakeToREFs
+
+
+class TestPerfParsers(unittest.TestCase):
+
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.output_dir, True)
+
+    def test_parser_cases_group_aliases_and_list_uncovered_classes(self):
+        cases, uncovered = perf_parsers.parser_cases(["adstxt", "pairs"])
+        self.assertEqual([case["parser"] for case in cases], ["ADStxt", "PairsTXTE3"])
+        self.assertIn("ADStxtE5", cases[0]["aliases"])
+        self.assertIn(["BLACKWELL", "MNRAS"], [item["aliases"] for item in uncovered])
+        self.assertNotIn("adsrefpipe.refparsers.ADStxt:ADStxtToREFs", [item["class"] for item in uncovered])
+
+    def test_every_parser_class_is_covered_by_a_family(self):
+        self.assertEqual(perf_parsers.parser_cases()[1], [])
+
+    def test_doi_lookups_are_answered_offline(self):
+        import adsrefpipe.refparsers.ADShtml as ADShtml
+        lookup = ADShtml.get_bibcode_from_doi
+        with perf_parsers.offline_lookups("arana"):
+            self.assertEqual(ADShtml.get_bibcode_from_doi("10.1146/annurev"), "2000ARA+A..44....0S")
+        self.assertIs(ADShtml.get_bibcode_from_doi, lookup)
+        with perf_parsers.offline_lookups("pasp"):
+            self.assertIs(ADShtml.get_bibcode_from_doi, lookup)
+
+    def test_scaling_exponents(self):
+        points = [{"bytes": 100, "seconds": 0.01}, {"bytes": 1000, "seconds": 0.1}, {"bytes": 10000, "seconds": 10.0}]
+        exponents = perf_parsers.scaling_exponents(points)
+        self.assertAlmostEqual(exponents[0], 1.0)
+        self.assertAlmostEqual(exponents[1], 2.0)
+        self.assertEqual(perf_parsers.scaling_exponents([{"bytes": 100, "seconds": 0.0}, {"bytes": 1000, "seconds": 0.1}]), [None])
+
+    def test_quadratic_parser_is_flagged(self):
+        clock = _FakeClock()
+        parsers = {"linear": _fake_parser(clock, 1), "quadratic": _fake_parser(clock, 2)}
+        for power, expected in (("linear", "linear"), ("quadratic", "superlinear")):
+            summary = perf_parsers.run_parser_benchmarks(
+                os.path.join(self.output_dir, power), families=["arxiv"], scales=(1, 10, 100), references=5, repeat=2,
+                loader=lambda name: parsers[power], clock=clock)
+            result = summary["parsers"]["arxiv"]
+            self.assertEqual(result["status"], expected, result["step_exponents"])
+            self.assertEqual(summary["superlinear"], ["arxiv"] if expected == "superlinear" else [])
+            self.assertEqual([point["scale"] for point in result["scales"]], [1, 10, 100])
+            self.assertGreater(result["scales"][-1]["bytes"], result["scales"][0]["bytes"] * 50)
+
+    def test_baseline_regressions_and_markdown(self):
+        clock = _FakeClock()
+        summary = perf_parsers.run_parser_benchmarks(
+            self.output_dir, families=["pairs"], scales=(1, 10), references=5, repeat=1,
+            loader=lambda name: _fake_parser(clock, 1), clock=clock)
+        baseline = perf_parsers.baseline_from_summary(summary)
+        rate = baseline["parsers"]["pairs"]["scales"]["10"]["references_per_s"]
+        self.assertEqual(perf_parsers.compare_to_baseline(summary, baseline, threshold=10.0), [])
+
+        baseline["parsers"]["pairs"]["scales"]["10"]["references_per_s"] = rate * 2
+        regressions = perf_parsers.compare_to_baseline(summary, baseline, threshold=10.0)
+        self.assertEqual([(item["family"], item["scale"]) for item in regressions], [("pairs", 10)])
+        self.assertAlmostEqual(regressions[0]["delta_pct"], -50.0)
+
+        summary["regressions"] = regressions
+        markdown_path = os.path.join(self.output_dir, "parsers.md")
+        perf_parsers.render_parsers_markdown(summary, markdown_path)
+        with open(markdown_path) as handle:
+            markdown = handle.read()
+        self.assertIn("| pairs | PairsTXTE3 |", markdown)
+        self.assertIn("## Regressions Against the Baseline", markdown)
+        self.assertIn("## Not Covered", markdown)
+
+    def test_parsers_scale_linearly(self):
+        # the real parsers, on a few families and a single 10x step; a quadratic parser shows an exponent near 2
+        summary = perf_parsers.run_parser_benchmarks(
+            self.output_dir, families=["adstxt", "arxiv", "pairs", "pasp", "jats"], scales=(2, 20), references=10, repeat=3,
+            max_exponent=1.6)
+        for family, result in summary["parsers"].items():
+            self.assertEqual(result["scales"][-1]["references"], result["scales"][-1]["written_references"], family)
+            self.assertGreater(result["scales"][-1]["references_per_s"], 0)
+            self.assertNotEqual(result["status"], "superlinear", "%s: %s" % (family, result["exponent"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
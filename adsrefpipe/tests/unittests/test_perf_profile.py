@@ -0,0 +1,88 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import adsrefpipe.perf_metrics as perf_metrics
+import adsrefpipe.perf_profile as perf_profile
+
+
+def _parse(sampler):
+    sampler.sample()
+
+
+class TestPerfProfile(unittest.TestCase):
+
+    def setUp(self):
+        self.sampler = perf_profile.StackSampler()
+        # the background thread sleeps through the test, samples are taken by hand
+        patcher = patch.dict(os.environ, {"PERF_PROFILE": "true", "PERF_PROFILE_INTERVAL_MS": "600000"})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch.object(perf_profile, "SAMPLER", self.sampler)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.sampler.stop()
+
+    def test_scope_counts_stacks_by_parser_and_source_type(self):
+        with perf_profile.profile_scope(source_type=".raw") as scope:
+            _parse(self.sampler)
+            scope.parser_name = "arXiv"
+            _parse(self.sampler)
+            with perf_profile.profile_scope("CrossRef", ".xref.xml"):
+                _parse(self.sampler)
+            _parse(self.sampler)
+        # outside of any scope
+        _parse(self.sampler)
+
+        stacks = self.sampler.snapshot()
+        prefix = "{module}:test_scope_counts_stacks_by_parser_and_source_type;{module}:_parse;adsrefpipe.perf_profile:sample".format(module=__name__)
+        self.assertEqual(stacks[("unknown", ".raw")], {prefix: 1})
+        self.assertEqual(stacks[("arXiv", ".raw")], {prefix: 2})
+        # cut at the frame that opened the inner scope
+        self.assertEqual(list(stacks[("CrossRef", ".xref.xml")].values()), [1])
+        self.assertEqual(self.sampler.samples, 4)
+        self.assertEqual(self.sampler.scopes, {})
+
+    def test_profile_scope_is_a_no_op_when_disabled(self):
+        with patch.dict(os.environ, {"PERF_PROFILE": "false"}):
+            with perf_profile.profile_scope("arXiv", ".raw") as scope:
+                _parse(self.sampler)
+        self.assertNotIsInstance(scope, perf_profile.ProfileScope)
+        self.assertEqual(self.sampler.snapshot(), {})
+        self.assertIsNone(self.sampler.thread)
+
+    def test_summarize_and_write_collapsed(self):
+        stacks = {
+            ("arXiv", ".raw"): {"run:main;toREFs:get_references;re:sub": 6, "run:main;toREFs:get_references": 2},
+            ("CrossRef", ".xref.xml"): {"run:main;xmlREFs:parse;re:sub": 2},
+        }
+        summary = perf_profile.summarize_profile(stacks, interval_ms=5.0)
+        self.assertEqual(summary["samples"], 10)
+        top = summary["top_functions"][0]
+        self.assertEqual((top["function"], top["self_samples"], top["total_samples"], top["self_share"]), ("re:sub", 8, 8, 0.8))
+        self.assertEqual(summary["groups"]["arXiv|.raw"]["top_functions"][1]["function"], "toREFs:get_references")
+        self.assertEqual(summary["groups"]["arXiv|.raw"]["top_functions"][1]["total_share"], 1.0)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            paths = perf_profile.write_collapsed(tmpdir, stacks, suffix="run1")
+            self.assertEqual([os.path.basename(path) for path in paths], ["CrossRef.xref.xml.run1.folded", "arXiv.raw.run1.folded"])
+            with open(paths[1]) as handle:
+                self.assertEqual(handle.read(), "run:main;toREFs:get_references;re:sub 6\nrun:main;toREFs:get_references 2\n")
+            combined = perf_profile.write_combined(os.path.join(tmpdir, "all.run1.folded"), stacks)
+            with open(combined) as handle:
+                self.assertEqual(handle.readline(), "CrossRef;.xref.xml;run:main;xmlREFs:parse;re:sub 2\n")
+
+            markdown_path = os.path.join(tmpdir, "report.md")
+            perf_metrics.render_markdown({"profile": dict(summary, combined_file=combined, sampler_s=0.01)}, markdown_path)
+            with open(markdown_path) as handle:
+                markdown = handle.read()
+        self.assertIn("## Hot Functions", markdown)
+        self.assertIn("| `re:sub` | 80.00 | 80.00 | 8 |", markdown)
+        self.assertIn("| arXiv | .raw | 8 | `re:sub` 75.00, `toREFs:get_references` 25.00, `run:main` 0.00 |", markdown)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+import json
+import os
+import tempfile
+import unittest
+import urllib.request
+from unittest.mock import patch
+
+import adsrefpipe.perf_metrics as perf_metrics
+import adsrefpipe.perf_prometheus as perf_prometheus
+
+
+class TestPerfPrometheus(unittest.TestCase):
+
+    def setUp(self):
+        self.live = perf_prometheus.LiveMetrics()
+
+    def tearDown(self):
+        # lets the dump thread exit
+        self.live.dumper = None
+
+    def test_observe_buckets_and_render(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            self.live.configure(tmpdir)
+            self.live.observe("record_wall", 0.5, "arXiv", ".raw")
+            self.live.observe("record_wall", 3.0, "arXiv", ".raw", records=4)
+            self.live.observe("record_wall", 120000.0, "arXiv", ".raw", status="error")
+            # not a live stage
+            self.live.observe("parse_file", 1.0, "arXiv", ".raw")
+            self.assertEqual(len(self.live.series), 2)
+            self.live.dump()
+            text = perf_prometheus.render_prometheus(perf_prometheus.merge_dumps(tmpdir))
+
+        labels = 'stage="record_wall",parser="arXiv",source_type=".raw",status="ok"'
+        self.assertIn('adsrefpipe_stage_duration_seconds_bucket{%s,le="0.001"} 1' % labels, text)
+        self.assertIn('adsrefpipe_stage_duration_seconds_bucket{%s,le="0.0025"} 1' % labels, text)
+        self.assertIn('adsrefpipe_stage_duration_seconds_bucket{%s,le="0.005"} 2' % labels, text)
+        self.assertIn('adsrefpipe_stage_duration_seconds_bucket{%s,le="+Inf"} 2' % labels, text)
+        self.assertIn('adsrefpipe_stage_duration_seconds_count{%s} 2' % labels, text)
+        self.assertIn('adsrefpipe_stage_records_total{%s} 5' % labels, text)
+        self.assertIn('adsrefpipe_stage_duration_seconds_bucket{stage="record_wall",parser="arXiv",source_type=".raw",'
+                      'status="error",le="60.0"} 0', text)
+        self.assertNotIn("parse_file", text)
+
+    def test_merge_dumps_of_processes(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            self.live.configure(tmpdir)
+            self.live.observe("resolver_http", 20.0, "CrossRef", ".xref.xml")
+            self.live.dump()
+            # the dump of another worker process, and files that are skipped
+            with open(os.path.join(tmpdir, "live_1.json"), "w") as handle:
+                json.dump(self.live.snapshot(), handle)
+            with open(os.path.join(tmpdir, "live_2.json"), "w") as handle:
+                json.dump(dict(self.live.snapshot(), buckets=[1.0]), handle)
+            with open(os.path.join(tmpdir, "live_3.json"), "w") as handle:
+                handle.write("{")
+            merged = perf_prometheus.merge_dumps(tmpdir)
+
+            output_path = os.path.join(tmpdir, "adsrefpipe.prom")
+            self.assertEqual(perf_prometheus.main(["--dir", tmpdir, "textfile", "--output", output_path]), 0)
+            with open(output_path) as handle:
+                text = handle.read()
+
+        counts, total, observations, records = merged[("resolver_http", "CrossRef", ".xref.xml", "ok")]
+        self.assertEqual((observations, records, counts[4]), (2, 2, 2))
+        self.assertAlmostEqual(total, 0.04)
+        self.assertIn('adsrefpipe_stage_duration_seconds_count{stage="resolver_http",parser="CrossRef",'
+                      'source_type=".xref.xml",status="ok"} 2', text)
+
+    def test_http_server(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            self.live.configure(tmpdir)
+            self.live.observe("post_resolved_db", 7.0, "AnAtxt", ".raw")
+            self.live.dump()
+            server = perf_prometheus.start_http_server(tmpdir, 0, host="127.0.0.1")
+            try:
+                url = "http://127.0.0.1:%d" % server.server_address[1]
+                with urllib.request.urlopen(url + "/metrics") as response:
+                    text = response.read().decode("utf-8")
+                with self.assertRaises(Exception):
+                    urllib.request.urlopen(url + "/other")
+            finally:
+                server.shutdown()
+                server.server_close()
+        self.assertIn('adsrefpipe_stage_records_total{stage="post_resolved_db",parser="AnAtxt",source_type=".raw",status="ok"} 1', text)
+
+    def test_emit_event_records_live_metrics(self):
+        extra = perf_metrics.build_event_extra(source_filename="/a/b.raw", parser_name="AnAtxt", record_count=3)
+        with patch.object(perf_metrics, "LIVE_METRICS", self.live), \
+                patch.dict(os.environ, {"PERF_METRICS_ENABLED": "false"}):
+            perf_metrics.emit_event("queue_references", duration_ms=2.0, extra=extra)
+            self.assertEqual(self.live.series, {})
+
+            self.live.configure("/unused")
+            perf_metrics.emit_event("queue_references", duration_ms=2.0, extra=extra)
+            perf_metrics.emit_event("queue_references", duration_ms=None, extra=extra)
+        self.assertEqual(self.live.series[("queue_references", "AnAtxt", ".raw", "ok")][2:], [1, 3])
+
+    def test_after_fork_starts_from_zero(self):
+        with patch.object(perf_prometheus, "LIVE_METRICS", self.live):
+            self.live.configure("/metrics", dump_interval_s=2.0)
+            self.live.observe("record_wall", 1.0, None, None)
+            perf_prometheus._after_fork()
+        self.assertEqual(self.live.series, {})
+        self.assertEqual((self.live.directory, self.live.dump_interval_s, self.live.enabled), ("/metrics", 2.0, True))
+        self.assertIsNone(self.live.dumper)
+
+
+if __name__ == "__main__":
+    unittest.main()
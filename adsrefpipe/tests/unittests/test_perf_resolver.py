@@ -0,0 +1,93 @@
+import argparse
+import json
+import random
+import unittest
+import urllib.error
+import urllib.parse
+import urllib.request
+
+import adsrefpipe.perf_resolver as perf_resolver
+
+
+def _request(url, payload=None):
+    data = json.dumps(payload).encode("utf-8") if payload is not None else None
+    request = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(request, timeout=5) as response:
+            return response.status, dict(response.headers), json.loads(response.read().decode("utf-8"))
+    except urllib.error.HTTPError as error:
+        return error.code, dict(error.headers), json.loads(error.read().decode("utf-8"))
+
+
+class TestPerfResolver(unittest.TestCase):
+
+    def _start(self, **profile):
+        server = perf_resolver.start_resolver_server(perf_resolver.ResolverProfile(**profile))
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server
+
+    def test_parse_latency(self):
+        rng = random.Random(0)
+        self.assertEqual(perf_resolver.parse_latency("15")(rng), 15.0)
+        self.assertEqual(perf_resolver.parse_latency("fixed:2.5")(rng), 2.5)
+        self.assertTrue(3.0 <= perf_resolver.parse_latency("uniform:3:4")(rng) <= 4.0)
+        self.assertGreater(perf_resolver.parse_latency("lognormal:20:0.5")(rng), 0.0)
+        for spec in ("uniform:4:3", "lognormal:0:1", "gamma:1:2", "fast"):
+            with self.assertRaises(ValueError):
+                perf_resolver.parse_latency(spec)
+        with self.assertRaises(ValueError):
+            perf_resolver.ResolverProfile(error_rate=1.5)
+
+    def test_resolves_text_xml_and_solr_queries(self):
+        server = self._start(unresolved_rate=0.0)
+        status, _, text = _request(server.service_url + "/text", {"reference": ["Smith 2000, ApJ, 1, 2"], "id": ["H1I1"]})
+        self.assertEqual(status, 200)
+        self.assertEqual(text["resolved"][0]["id"], "H1I1")
+        self.assertEqual(len(text["resolved"][0]["bibcode"]), 19)
+        # the same reference always gets the same bibcode
+        self.assertEqual(_request(server.service_url + "/text", {"reference": ["Smith 2000, ApJ, 1, 2"], "id": ["H1I1"]})[2], text)
+
+        status, _, xml = _request(server.service_url + "/xml", {"parsed_reference": [{"id": "H1I2", "refstr": "Jones 1999", "year": "1999"}]})
+        self.assertEqual((status, xml["resolved"][0]["publication_year"]), (200, "1999"))
+
+        query = urllib.parse.urlencode({"q": 'identifier:"2000ApJ.....1....2S"', "fl": "bibcode"})
+        status, _, solr = _request(server.solr_url + "?" + query)
+        self.assertEqual(solr["response"]["docs"], [{"bibcode": "2000ApJ.....1....2S"}])
+
+        self.assertEqual(_request(server.service_url + "/text", {"reference": "not a list"})[0], 400)
+        self.assertEqual(_request(server.url + "/v1/unknown", {})[0], 404)
+        stats = _request(server.url + "/stats")[2]
+        self.assertEqual(stats["requests"], {"text": {"200": 2, "400": 1}, "xml": {"200": 1}, "solr": {"200": 1}, "unknown": {"404": 1}})
+
+    def test_unresolved_errors_and_throttling(self):
+        unresolved = self._start(unresolved_rate=1.0, solr_miss_rate=1.0)
+        resolved = _request(unresolved.service_url + "/text", {"reference": ["Smith 2000"], "id": ["H1I1"]})[2]["resolved"]
+        self.assertEqual(resolved[0]["bibcode"], perf_resolver.UNRESOLVED_BIBCODE)
+        query = urllib.parse.urlencode({"q": 'doi:"10.1000/1"'})
+        self.assertEqual(_request(unresolved.solr_url + "?" + query)[2]["response"]["numFound"], 0)
+
+        failing = self._start(error_rate=1.0)
+        self.assertEqual(_request(failing.service_url + "/text", {"reference": ["Smith 2000"], "id": ["H1I1"]})[0], 500)
+
+        throttled = self._start(throttle_rate=1.0, retry_after_s=2.0)
+        status, headers, _ = _request(throttled.service_url + "/text", {"reference": ["Smith 2000"], "id": ["H1I1"]})
+        self.assertEqual((status, headers.get("Retry-After")), (429, "2"))
+
+        # a bucket of one request per second, the second request at once is over the limit
+        limited = self._start(rate_limit=1.0)
+        statuses = [_request(limited.service_url + "/text", {"reference": ["Smith 2000"], "id": ["H1I1"]})[0] for _ in range(2)]
+        self.assertEqual(statuses, [200, 429])
+        self.assertEqual(limited.stats()["requests"], {"text": {"200": 1, "429": 1}})
+
+    def test_profile_arguments_round_trip(self):
+        parser = argparse.ArgumentParser()
+        perf_resolver.add_profile_arguments(parser, prefix="resolver-")
+        args = parser.parse_args(["--resolver-latency", "uniform:1:2", "--resolver-error-rate", "0.1", "--resolver-seed", "7"])
+        profile = perf_resolver.profile_from_args(args, prefix="resolver-")
+        self.assertEqual(profile.describe()["latency"], "uniform:1:2")
+        self.assertEqual((profile.error_rate, profile.seed), (0.1, 7))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+import os
+import tempfile
+import unittest
+
+import adsrefpipe.perf_sweep as perf_sweep
+
+
+def _point(workers, task_concurrency, metrics, records_per_minute):
+    run = {"run_id": "r", "status": "complete", "records_per_minute": records_per_minute, "wall_s": 60.0 / records_per_minute,
+           "records": 10, "failures": 0, "record_wall_p50_ms": 2.0}
+    return perf_sweep.combine_repeats({"workers": workers, "task_concurrency": task_concurrency, "metrics": metrics}, [run])
+
+
+class TestPerfSweep(unittest.TestCase):
+
+    def test_combine_repeats_takes_the_median(self):
+        runs = [{"run_id": index, "status": "complete", "records_per_minute": value, "wall_s": 1.0, "records": 5,
+                 "failures": 1, "record_wall_p50_ms": None} for index, value in enumerate([90.0, 120.0, 100.0, 80.0])]
+        point = perf_sweep.combine_repeats({"workers": 2, "task_concurrency": 4, "metrics": "full"}, runs)
+        self.assertEqual(point["parallelism"], 8)
+        self.assertEqual(point["records_per_minute"], 95.0)
+        self.assertEqual(point["failures"], 4)
+        self.assertIsNone(point["record_wall_p50_ms"])
+
+    def test_analyze_sweep_speedup_and_saturation(self):
+        points = [
+            _point(1, 1, "full", 100.0),
+            _point(2, 1, "full", 190.0),
+            _point(4, 1, "full", 220.0),
+            _point(1, 4, "full", 380.0),
+            _point(1, 1, "minimal", 125.0),
+        ]
+        sweep = perf_sweep.analyze_sweep(points)
+
+        by_settings = {(point["workers"], point["task_concurrency"], point["metrics"]): point for point in sweep["points"]}
+        self.assertAlmostEqual(by_settings[(2, 1, "full")]["speedup"], 1.9)
+        self.assertAlmostEqual(by_settings[(4, 1, "full")]["efficiency"], 0.55)
+        self.assertAlmostEqual(by_settings[(1, 1, "full")]["metrics_overhead"], 0.2)
+        self.assertEqual(by_settings[(1, 1, "minimal")]["speedup"], 1.0)
+        self.assertEqual(sweep["best"], {"workers": 1, "task_concurrency": 4, "metrics": "full", "records_per_minute": 380.0})
+
+        curves = {(curve["dimension"], curve["metrics"]): curve for curve in sweep["curves"]}
+        self.assertEqual(sorted(curves), [("task_concurrency", "full"), ("workers", "full")])
+        workers = curves[("workers", "full")]
+        self.assertEqual(workers["values"], [1, 2, 4])
+        self.assertEqual(workers["fixed"], {"task_concurrency": 1})
+        # 190 to 220 is 16% more throughput for twice the workers
+        self.assertEqual(workers["saturates_at"], 2)
+        self.assertAlmostEqual(workers["marginal_efficiency"][2], 30.0 / 190.0)
+        self.assertIsNone(curves[("task_concurrency", "full")]["saturates_at"])
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            markdown_path = os.path.join(tmpdir, "sweep.md")
+            perf_sweep.render_sweep_markdown(dict(sweep, settings={"mode": "mock", "repeat": 1}), markdown_path)
+            with open(markdown_path) as handle:
+                markdown = handle.read()
+        self.assertIn("| 1 | 1 | full | 1 | 100.00 | 1.00 | 100.0 | 20.0 |", markdown)
+        self.assertIn("### workers (metrics `full`, task_concurrency=1)", markdown)
+        self.assertIn("Saturates at workers=2.", markdown)
+        # bars are scaled to the peak of the curve
+        self.assertIn("| 1 | 100.00 |  | `%s` |" % ("#" * 18), markdown)
+        self.assertIn("| 4 | 220.00 | 15.8 | `%s` |" % ("#" * 40), markdown)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -7,6 +7,8 @@ import unittest
 from unittest.mock import Mock, patch, mock_open, MagicMock
 import json
 import re
+import regex
+import tempfile
 
 from adsrefpipe.tests.unittests.stubdata import parsed_references
 from adsrefpipe.refparsers.arXivTXT import ARXIVtoREFs
@@ -14,7 +16,11 @@ from adsrefpipe.refparsers.ADStxt import ADStxtToREFs, ARAnATXTtoREFs, PThPhTXTt
     ThreeBibstemsTXTtoREFs, PairsTXTtoREFs
 
 from adsrefpipe.refparsers.handler import verify
-from adsrefpipe.refparsers.unicode import tostr, UnicodeHandler, UnicodeHandlerError
+from adsrefpipe.refparsers import handler
+from adsrefpipe.refparsers import patterns
+from adsrefpipe.refparsers import cleanup
+from adsrefpipe.refparsers.unicode import tostr, UnicodeHandler, UnicodeHandlerError, LazyUnicodeHandler
+from adsrefpipe.refparsers import datacache
 
 
 class TestReferenceParsers(unittest.TestCase):
@@ -244,6 +250,210 @@ class TestUnicode(unittest.TestCase):
         self.assertEqual(tostr(mock_value), "")
 
 
+class TestParserHandler(unittest.TestCase):
+    """
+    Testing the lazy parser registry
+    """
+    def test_verify_loads_parser_class_on_first_use(self):
+        """ test that verify imports the parser module and caches the class """
+        self.assertEqual(verify('arXiv'), ARXIVtoREFs)
+        self.assertIs(handler.parser_class_cache['adsrefpipe.refparsers.arXivTXT:ARXIVtoREFs'], ARXIVtoREFs)
+        self.assertIsNone(verify('NoSuchParser'))
+
+    def test_all_registered_parsers_load(self):
+        """ test that every registry entry points to an existing parser class """
+        for parser_name in handler.name_to_parser_dict:
+            self.assertIsNotNone(verify(parser_name), parser_name)
+
+    def test_load_parser_class_error(self):
+        """ test that a registry entry that cannot be imported returns None """
+        with patch.object(handler.logger, 'error') as mock_error:
+            self.assertIsNone(handler.load_parser_class('adsrefpipe.refparsers.NoSuchModule:NoSuchToREFs'))
+            self.assertIsNone(handler.load_parser_class('adsrefpipe.refparsers.arXivTXT:NoSuchToREFs'))
+            self.assertEqual(mock_error.call_count, 2)
+
+
+class TestRegexPatterns(unittest.TestCase):
+    """
+    Testing the compiled pattern cache and the regex profiler
+    """
+    def test_compile_cached(self):
+        """ test that runtime built patterns are compiled once """
+        patterns.compile_cached(r'<unique_tag_for_test>(.*?)</unique_tag_for_test>')
+        misses = patterns.pattern_cache_info().misses
+        compiled = patterns.compile_cached(r'<unique_tag_for_test>(.*?)</unique_tag_for_test>')
+        self.assertEqual(patterns.pattern_cache_info().misses, misses)
+        self.assertEqual(compiled.search('<unique_tag_for_test>a</unique_tag_for_test>').group(1), 'a')
+
+    def test_profiled_pattern(self):
+        """ test that a profiled pattern gives the same results and records the calls """
+        profile = patterns.RegexProfile()
+        compiled = re.compile(r'(\d+)')
+        with patch.object(patterns, 'regex_profile', profile):
+            profiled = patterns.ProfiledPattern(patterns._compile(r'(\d+)', 0), 'Test.re_number')
+            with profile.parser_scope('arXiv'):
+                self.assertEqual(profiled.sub('#', 'a 12 b 3'), compiled.sub('#', 'a 12 b 3'))
+                self.assertEqual(profiled.findall('a 12 b 3'), ['12', '3'])
+            self.assertEqual(profiled.pattern, r'(\d+)')
+            self.assertIsNone(profile.current_parser())
+            rows = profile.snapshot()
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['owner'], 'Test.re_number')
+        self.assertEqual(rows[0]['parser'], 'arXiv')
+        self.assertEqual(rows[0]['calls'], 2)
+        self.assertEqual(rows[0]['input_chars'], 16)
+        self.assertEqual(rows[0]['methods'], {'sub': 1, 'findall': 1})
+        self.assertEqual(profile.snapshot(), [])
+
+    def test_instrument_parser(self):
+        """ test that instrumenting a parser wraps its class patterns and cleanup lists, without changing the results """
+        # a throwaway hierarchy, instrumenting a real parser would wrap the patterns of its base classes for the later tests
+        class ProfiledBaseToREFs(object):
+            re_base = regex.compile(r'w')
+            __module__ = 'adsrefpipe.refparsers.test_instrument'
+
+        class ProfiledTXTtoREFs(ProfiledBaseToREFs):
+            re_test = regex.compile(r'x')
+            test_cleanup = [(regex.compile(r'y'), 'z')]
+            __module__ = 'adsrefpipe.refparsers.test_instrument'
+
+        with patch.dict(os.environ, {'PERF_REGEX_PROFILE': 'true'}), patch.object(patterns, 'instrumented', set()):
+            patterns.instrument_class(ProfiledTXTtoREFs)
+            self.assertIsInstance(ProfiledTXTtoREFs.__dict__['re_test'], patterns.ProfiledPattern)
+            self.assertIsInstance(ProfiledTXTtoREFs.test_cleanup[0][0], patterns.ProfiledPattern)
+            self.assertIsInstance(ProfiledBaseToREFs.__dict__['re_base'], patterns.ProfiledPattern)
+            self.assertEqual(patterns.instrumented, {ProfiledTXTtoREFs, ProfiledBaseToREFs})
+            self.assertIsInstance(patterns.compile_cached(r'x'), patterns.ProfiledPattern)
+            # instrumenting twice does not double wrap
+            patterns.instrument_class(ProfiledTXTtoREFs)
+            self.assertIsInstance(ProfiledTXTtoREFs.__dict__['re_test'].compiled, regex.Pattern)
+
+        with patch.object(patterns.perf_metrics, 'emit_event') as mock_emit:
+            patterns.regex_profile.snapshot()
+            patterns.emit_profile({'source_filename': 'a.raw'})
+            mock_emit.assert_not_called()
+            ProfiledTXTtoREFs.re_test.search('x')
+            patterns.emit_profile({'source_filename': 'a.raw'})
+            mock_emit.assert_called_once()
+            self.assertEqual(mock_emit.call_args[1]['stage'], 'regex_profile')
+            self.assertEqual(mock_emit.call_args[1]['extra']['regex'][0]['owner'], 'ProfiledTXTtoREFs.re_test')
+        # the set of instrumented classes is restored, and the real parsers are left as they are
+        self.assertNotIn(ProfiledTXTtoREFs, patterns.instrumented)
+        for klass in ARXIVtoREFs.__mro__:
+            self.assertFalse([name for name, value in vars(klass).items() if isinstance(value, patterns.ProfiledPattern)])
+
+    def test_guarded_call(self):
+        """ test that a pattern backtracking past its budget returns the default and emits a regex_timeout event """
+        compiled = regex.compile(r'(\w+\s?)+\d')
+        with patch.object(patterns.perf_metrics, 'emit_event') as mock_emit:
+            self.assertEqual(patterns.guarded_call(compiled, 'search', 'a 1', budget=patterns.RegexBudget(1.0)).group(), 'a 1')
+            self.assertEqual(patterns.guarded_call(compiled, 'search', 'a 1', budget=patterns.RegexBudget(0)).group(), 'a 1')
+            mock_emit.assert_not_called()
+            result = patterns.guarded_call(compiled, 'search', 'word ' * 5000, budget=patterns.RegexBudget(0.05),
+                                           owner='Test.re_slow', source_filename='a.raw', default=False)
+            self.assertIs(result, False)
+            mock_emit.assert_called_once()
+            self.assertEqual(mock_emit.call_args[1]['stage'], 'regex_timeout')
+            self.assertEqual(mock_emit.call_args[1]['status'], 'timeout')
+            self.assertEqual(mock_emit.call_args[1]['extra']['owner'], 'Test.re_slow')
+            self.assertEqual(mock_emit.call_args[1]['extra']['source_filename'], 'a.raw')
+            self.assertEqual(mock_emit.call_args[1]['extra']['input_chars'], 25000)
+
+    def test_fix_inheritance_budget_is_per_reference(self):
+        """ test that fix_inheritance has a full regex budget, however long after the parser was built it is called """
+        filename = os.path.abspath(os.path.dirname(__file__) + '/stubdata/html/ARA+A/0/annurev.astro.00.html')
+        parser = verify('ARAnAhtml')(filename=filename, buffer=None)
+        perf_counter = patterns.time.perf_counter
+        # the clock moves past the budget set when the parser was built, annual reviews do not go through is_reference
+        with patch.object(patterns.time, 'perf_counter', side_effect=lambda: perf_counter() + 2 * patterns.REGEX_TIME_BUDGET + 1), \
+             patch.object(patterns.perf_metrics, 'emit_event') as mock_emit:
+            self.assertEqual(parser.fix_inheritance('---, 2001, ApJ, 500, 1', 'Smith, J. 1999, ApJ, 400, 2'), 'Smith, J. , 2001, ApJ, 500, 1')
+            mock_emit.assert_not_called()
+        self.assertEqual(parser.regex_owners, {'re_prior_year': 'HTMLtoREFs.re_prior_year'})
+
+
+class TestCleanupEngine(unittest.TestCase):
+    """
+    Testing the compiled cleanup chains
+    """
+    def test_required_literals(self):
+        """ test finding the literals every match has to contain """
+        self.assertEqual(cleanup.required_literals(r'&amp;'), ([('&amp;',)], True))
+        self.assertEqual(cleanup.required_literals(r'\s*<BR>\s*'), ([('<BR>',)], False))
+        self.assertEqual(cleanup.required_literals(r'</?(?:i|em)>'), ([('<',), ('i', 'em'), ('>',)], False))
+        self.assertEqual(cleanup.required_literals(r'(<sup>|<sub>)x'), ([('<sup>', '<sub>'), ('x',)], False))
+        self.assertEqual(cleanup.required_literals(r'ab?c{2}d*'), ([('a',), ('c',)], False))
+        self.assertEqual(cleanup.required_literals(r'\{\\it'), ([('{\\it',)], True))
+        self.assertEqual(cleanup.required_literals(r'(?!foo)bar'), ([('bar',)], False))
+        self.assertEqual(cleanup.required_literals(r'a|'), ([], False))
+        self.assertIsNone(cleanup.required_literals(r'(?i)abc'))
+        self.assertIsNone(cleanup.required_literals(r'\pL+'))
+
+    def test_compile_cleanup(self):
+        """ test that independent literal rules are fused, and the others anchored or left as they are """
+        rules = [
+            (regex.compile(r'<I>'), ' '),
+            (regex.compile(r'</I>'), ' '),
+            (regex.compile(r'<B>'), ' '),
+            (regex.compile(r'</B>'), ' '),
+            (regex.compile(r'\s*<BR>\s*', regex.I), ' '),
+            (regex.compile(r'\s+'), ' '),
+            (regex.compile(r'&amp;'), '&'),
+        ]
+        chain = cleanup.compile_cleanup(rules)
+        self.assertIs(cleanup.compile_cleanup(rules), chain)
+        self.assertEqual(chain.describe(), {'rules': 7, 'steps': 4, 'literal': 1, 'anchored': 2, 'pattern': 1})
+        self.assertEqual([step[0] for step in chain.steps],
+                         [cleanup.ANCHORED_ANY, cleanup.ANCHORED_NOCASE, cleanup.PATTERN, cleanup.LITERAL])
+        for text in ['a &amp;amp; b', '<<I>B>x</I>y', 'one<br>  two', '<B>&amp;</B>  <Br>', '']:
+            self.assertEqual(chain.apply(text), cleanup.apply_sequential(rules, text))
+        # the engine can be turned off
+        with patch.object(cleanup, 'CLEANUP_ENGINE_ENABLED', False):
+            with patch.object(cleanup.CleanupChain, 'apply') as mock_apply:
+                self.assertEqual(cleanup.apply_cleanup(rules, 'a &amp; b'), 'a & b')
+                mock_apply.assert_not_called()
+
+    def test_case_insensitive_anchor_on_non_ascii_letters(self):
+        """ test that the letters matching a non ascii character when ignoring case are not used as anchors """
+        self.assertEqual(cleanup.case_safe_fragment('</IT>'), '</')
+        self.assertEqual(cleanup.case_safe_fragment('<BR>'), '<br>')
+        rules = [(re.compile(r'</?IT>', re.I), '')]
+        self.assertEqual(cleanup.compile_cleanup(rules).apply('A <\u0130T>B</\u0130T> 2001'), 'A B 2001')
+        for text in ['A <\u0130T>B</\u0130T> 2001', 'A <\u0131T>B</\u0131T> 2001', 'A <\u212a>B 2001', 'A <\u017f>B 2001']:
+            for (cls, name), rules in cleanup.find_cleanup_lists().items():
+                self.assertEqual(cleanup.compile_cleanup(rules).apply(text), cleanup.apply_sequential(rules, text),
+                                 '%s.%s' % (cls.__name__, name))
+
+    def test_independent(self):
+        """ test that literal rules that can affect each other are not fused """
+        self.assertTrue(cleanup.independent(('<I>', ' '), ('</I>', ' ')))
+        self.assertFalse(cleanup.independent(('&amp;', '&'), ('&lt;', '<')))
+        self.assertFalse(cleanup.independent(('&amp;', '&'), ('&amp;lt;', '<')))
+        self.assertFalse(cleanup.independent(('ab', 'x'), ('bc', 'y')))
+        self.assertFalse(cleanup.independent(('--', '-'), ('-x', 'y')))
+        self.assertFalse(cleanup.independent(('<I>', ''), ('ab', 'c')))
+        self.assertTrue(cleanup.independent(('<I>', ''), ('a', 'c')))
+
+    def test_cleanup_lists_on_stubdata(self):
+        """ test that every cleanup list of the parsers gives the same result as applying its rules in order """
+        stubdata = os.path.join(os.path.dirname(__file__), 'stubdata')
+        texts = []
+        for root, _, names in os.walk(stubdata):
+            for name in sorted(names):
+                if not name.endswith(('.raw', '.tex', '.html', '.xml', '.txt', '.ocr', '.ref')):
+                    continue
+                with open(os.path.join(root, name), 'r', encoding='latin-1') as f:
+                    content = f.read()
+                texts.append(content[:4000])
+                texts.extend(line for line in content.splitlines()[:20] if line.strip())
+        cleanup_lists = cleanup.find_cleanup_lists()
+        self.assertGreater(len(cleanup_lists), 40)
+        for (cls, name), rules in cleanup_lists.items():
+            chain = cleanup.compile_cleanup(rules)
+            for text in texts:
+                self.assertEqual(chain.apply(text), cleanup.apply_sequential(rules, text), '%s.%s' % (cls.__name__, name))
+
+
 class TestUnicodeHandler(unittest.TestCase):
     """
     Testing Unicode Handler Class
@@ -440,6 +650,59 @@ class TestUnicodeHandler(unittest.TestCase):
         with self.assertRaises(KeyError):
             handler._UnicodeHandler__sub_morenum(match_invalid)
 
+    def test_compiled_cache(self):
+        """ test that the unicode tables are read back from the compiled cache, and rebuilt when the source changes """
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            data_filename = os.path.join(tmpdir, 'unicode.dat')
+            with open(data_filename, 'w') as f:
+                f.write('163 pound "#" "\\pounds" S\n')
+
+            with patch.dict(os.environ, {'REFERENCE_PIPELINE_DATA_CACHE_DIR': os.path.join(tmpdir, 'cache'),
+                                         'REFERENCE_PIPELINE_DATA_CACHE_ENABLED': 'true'}):
+                handler = UnicodeHandler(data_filename)
+                self.assertEqual(handler.unicode[163].ascii, '#')
+                self.assertTrue(os.path.exists(datacache.cache_filename('unicode')))
+
+                # second load comes from the cache, without parsing the data file
+                with patch.object(UnicodeHandler, 'parse_data_file') as mock_parse:
+                    handler = UnicodeHandler(data_filename)
+                    mock_parse.assert_not_called()
+                self.assertEqual(handler['pound'].ascii, '#')
+                self.assertIs(handler['pound'], handler.unicode[163])
+
+                # changing the data file makes the cache stale
+                with open(data_filename, 'w') as f:
+                    f.write('163 pound "GBP" "\\pounds" S\n')
+                os.utime(data_filename, (0, 0))
+                handler = UnicodeHandler(data_filename)
+                self.assertEqual(handler.unicode[163].ascii, 'GBP')
+
+    def test_compile_all(self):
+        """ test compiling the caches of all the data file tables """
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with patch.dict(os.environ, {'REFERENCE_PIPELINE_DATA_CACHE_DIR': tmpdir,
+                                         'REFERENCE_PIPELINE_DATA_CACHE_ENABLED': 'true'}):
+                compiled = datacache.compile_all()
+                self.assertEqual(sorted(compiled.keys()), ['LR2bibcode', 'aas_latex', 'unicode'])
+                for cache_file in compiled.values():
+                    self.assertTrue(os.path.exists(cache_file))
+
+                # a cache that cannot be written falls back on parsing, and a stale version is ignored
+                with patch('pickle.dump', side_effect=OSError('read-only')):
+                    self.assertFalse(datacache.write_cache(os.path.join(tmpdir, 'x.pickle'), [], {}))
+                with patch.object(datacache, 'CACHE_VERSION', 0):
+                    self.assertIsNone(datacache.read_cache(compiled['unicode'], datacache.source_signature([UnicodeHandler().data_filename])))
+
+    def test_lazy_unicode_handler(self):
+        """ test that the lazy handler loads the tables on first use only """
+        lazy_handler = LazyUnicodeHandler()
+        self.assertFalse(lazy_handler.is_materialized())
+        self.assertEqual(lazy_handler.u2asc('caf\u00e9'), 'cafe')
+        self.assertTrue(lazy_handler.is_materialized())
+        self.assertIn('pound', lazy_handler)
+        self.assertEqual(lazy_handler['pound'].entity, 'pound')
+
 
 if __name__ == '__main__':
     unittest.main()
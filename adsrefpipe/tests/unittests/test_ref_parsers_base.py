@@ -11,6 +11,7 @@ from unittest.mock import patch, mock_open, MagicMock
 from adsrefpipe.refparsers.toREFs import toREFs, TXTtoREFs, XMLtoREFs, OCRtoREFs, TEXtoREFs, HTMLtoREFs
 from adsrefpipe.refparsers.arXivTXT import ARXIVtoREFs
 from adsrefpipe.refparsers.reference import Reference, ReferenceError, XMLreference, LatexReference
+from adsrefpipe.refparsers.patterns import RegexBudget
 
 
 class TestToREFs(unittest.TestCase):
@@ -330,6 +331,25 @@ class TestTXTtoREFs(unittest.TestCase):
         valid_reference_with_author_and_volume = "Smith, J., and Johnson, A., A previous study on astrophysics, Astrophys. J., 99, 100-105."
         self.assertTrue(torefs.is_reference(valid_reference_with_author_and_volume))
 
+    @patch('adsrefpipe.refparsers.patterns.perf_metrics.emit_event')
+    def test_regex_timeout_fallback(self, mock_emit):
+        """ test the fallbacks when the regex time budget of the reference is spent """
+        torefs = TXTtoREFs(filename='', buffer={}, parsername='arXiv')
+        torefs.regex_budget = RegexBudget(1e-9)
+
+        # is_reference falls back to the simple check, a name and two numbers
+        self.assertTrue(torefs.is_reference("Smith, J., and Johnson, A., A previous study on astrophysics, Astrophys. J., 99, 100-105."))
+        self.assertFalse(torefs.is_reference("Miller, L. et al. The role of black holes in galaxy formation"))
+
+        # authors cannot be inherited, the placeholder is kept and the reference is flagged
+        result = torefs.fix_inheritance(cur_refstr="--- (2020), A study on astrophysics, Astrophys. J., 100, 123-126.",
+                                        prev_refstr="Smith, J., and Johnson, A. (2019), A previous study on astrophysics, Astrophys. J., 99, 100-105.")
+        self.assertEqual(result, "--- (2020), A study on astrophysics, Astrophys. J., 100, 123-126. --- Incomplete")
+
+        self.assertEqual(mock_emit.call_count, 3)
+        self.assertEqual(mock_emit.call_args[1]['stage'], 'regex_timeout')
+        self.assertEqual(mock_emit.call_args[1]['extra']['owner'], 'TXTtoREFs.re_prior_year')
+
 
 class TestXMLtoREFs(unittest.TestCase):
 
@@ -783,6 +803,19 @@ class TestTEXtoREFs(unittest.TestCase):
             'Returned 000123456789012345678 for bibcode. Skipping!')
 
 
+    @patch('adsrefpipe.refparsers.patterns.perf_metrics.emit_event')
+    def test_regex_timeout_fallback(self, mock_emit):
+        """ test that the anchored RE is used when the reference block REs run out of time """
+        filename = os.path.abspath(os.path.dirname(__file__) + '/stubdata/tex/ADS/0/iss0.tex')
+        with patch('adsrefpipe.refparsers.toREFs.RegexBudget', return_value=RegexBudget(1e-9)):
+            torefs = TEXtoREFs(filename=filename, buffer={}, parsername="ADStex")
+        # with every guarded RE timing out most of the references are still recovered
+        self.assertEqual(len(torefs.raw_references), 42)
+        self.assertEqual(sum(len(raw['block_references']) for raw in torefs.raw_references), 591)
+        self.assertTrue(mock_emit.called)
+        self.assertEqual(mock_emit.call_args[1]['extra']['owner'], 'TEXtoREFs.re_reference_block_all_bracketed')
+
+
 class TestHTMLtoREFs(unittest.TestCase):
 
     @patch('adsrefpipe.refparsers.toREFs.logger')
@@ -1,8 +1,15 @@
+import argparse
+import csv
 import io
+import json
 import os
+import shutil
 import sys
+import tempfile
+import threading
+import time
 import unittest
-from contextlib import redirect_stderr
+from contextlib import redirect_stderr, redirect_stdout
 from datetime import datetime
 from unittest.mock import patch
 
@@ -69,5 +76,308 @@ class TestRunResolveTimeDelay(unittest.TestCase):
         self.assertIn('time_delay must be greater than 0.', stderr.getvalue())
 
 
+
+class TestRunResolveDryRun(unittest.TestCase):
+
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.output_dir, True)
+        self.stubdata_dir = os.path.join(project_home, 'adsrefpipe/tests/unittests/stubdata/txt/arXiv/0')
+        self.filenames = [os.path.join(self.stubdata_dir, '0000%d.raw' % index) for index in range(4)]
+
+    def get_parser(self, filename):
+        return {'name': 'arXiv'} if filename.endswith('.raw') else {}
+
+    def dry_run(self, argv):
+        stdout = io.StringIO()
+        with patch.object(run.app, 'get_parser', side_effect=self.get_parser), \
+             patch.object(run.app, 'populate_tables_pre_resolved_initial_status') as mock_populate, \
+             patch.object(run, 'queue_references') as mock_queue, \
+             redirect_stdout(stdout):
+            result = run.main(['RESOLVE', '--dry-run'] + argv)
+        mock_populate.assert_not_called()
+        mock_queue.assert_not_called()
+        return result, stdout.getvalue()
+
+    def test_dry_run_streams_jsonl_and_reports_per_parser(self):
+        output = os.path.join(self.output_dir, 'references.jsonl')
+        result, stdout = self.dry_run(['-s'] + self.filenames + ['-o', output, '--top', '2'])
+
+        self.assertEqual(result, 0)
+        with open(output) as handle:
+            rows = [json.loads(line) for line in handle]
+        self.assertTrue(rows)
+        self.assertEqual({row['parser_name'] for row in rows}, {'arXiv'})
+        self.assertEqual({row['source_filename'] for row in rows}, set(self.filenames))
+        self.assertTrue(all(row['refstr'] and row['item_num'] >= 1 for row in rows))
+        self.assertIn('Parsed %d references from 4 files' % len(rows), stdout)
+        self.assertIn('Slowest files:', stdout)
+        self.assertEqual(len(stdout.split('Slowest files:')[1].strip().splitlines()), 2)
+
+    def test_dry_run_in_parallel_matches_single_process(self):
+        with patch.object(run.app, 'get_parser', side_effect=self.get_parser):
+            one = run.dry_run_files(self.filenames, output_filename=os.path.join(self.output_dir, 'one.csv'))
+            two = run.dry_run_files(self.filenames, output_filename=os.path.join(self.output_dir, 'two.csv'), workers=2)
+
+        self.assertEqual(one['parsers']['arXiv']['references'], two['parsers']['arXiv']['references'])
+        self.assertIsNotNone(two['parsers']['arXiv']['references_per_s'])
+        with open(os.path.join(self.output_dir, 'one.csv')) as first, open(os.path.join(self.output_dir, 'two.csv')) as second:
+            rows = list(csv.DictReader(first))
+            self.assertEqual(rows, list(csv.DictReader(second)))
+        self.assertEqual(list(rows[0].keys()), run.DryRunWriter.CSV_COLUMNS)
+        self.assertEqual(len(rows), one['references'])
+
+    def test_dry_run_counts_errors_per_parser(self):
+        missing = os.path.join(self.stubdata_dir, 'missing.raw')
+        unknown = os.path.join(self.stubdata_dir, 'unknown.xyz')
+        result, stdout = self.dry_run(['-s', self.filenames[0], missing, unknown])
+
+        self.assertEqual(result, 1)
+        self.assertIn('Failed files:', stdout)
+        self.assertIn('%s (arXiv): FileNotFoundError' % missing, stdout)
+        self.assertIn('%s (None): no parser for this file' % unknown, stdout)
+        self.assertRegex(stdout, r'arXiv\s+2\s+\d+\s+[\d.]+\s+1')
+
+    def test_dry_run_walks_the_path_without_delay(self):
+        with patch.object(run.time, 'sleep') as mock_sleep, \
+             patch.object(run.processed_log, 'info') as mock_processed:
+            result, stdout = self.dry_run(['-p', self.stubdata_dir, '-e', '*.raw', '-w', '2'])
+
+        self.assertEqual(result, 0)
+        self.assertIn('from 4 files', stdout)
+        self.assertIn('with 2 worker(s)', stdout)
+        mock_sleep.assert_not_called()
+        mock_processed.assert_not_called()
+
+    def test_dry_run_needs_source_files(self):
+        with patch.object(run.logger, 'error') as mock_error:
+            result, _ = self.dry_run(['-c', '0.5'])
+        self.assertEqual(result, 1)
+        mock_error.assert_called_once()
+
+
+class TestRunQuery(unittest.TestCase):
+
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.output_dir, True)
+        self.rows = [
+            {'source_bibcode': '2023A&A...657A...1X', 'date': '2025-01-01 00:00:00', 'id': 1, 'resolved_bibcode': '2020ApJ...900....1S',
+             'score': 1.0, 'parser_name': 'arXiv', 'parser_priority': 1},
+            {'source_bibcode': '2023A&A...657A...2X', 'date': '2025-01-02 00:00:00', 'id': 4, 'resolved_bibcode': '2021ApJ...901....2S',
+             'score': 0.9, 'parser_name': 'JATS', 'parser_priority': 2},
+        ]
+
+    def query(self, argv):
+        stdout, stderr = io.StringIO(), io.StringIO()
+        with patch.object(run.app, 'export_resolved_references', return_value=iter(self.rows)) as mock_export, \
+             redirect_stdout(stdout), redirect_stderr(stderr):
+            result = run.main(['QUERY'] + argv)
+        return result, mock_export, stdout.getvalue(), stderr.getvalue()
+
+    def test_query_bibcodes_from_file_to_stdout(self):
+        bibcodes = os.path.join(self.output_dir, 'bibcodes.txt')
+        with open(bibcodes, 'w') as handle:
+            handle.write('2023A&A...657A...1X\n\n# comment\n2023A&A...657A...2X\n2023A&A...657A...1X\n')
+        result, mock_export, stdout, stderr = self.query(['-b', '@' + bibcodes, '2023A&A...657A...3X'])
+
+        self.assertEqual(result, 0)
+        mock_export.assert_called_once_with(['2023A&A...657A...1X', '2023A&A...657A...2X', '2023A&A...657A...3X'],
+                                            since=None, all_parsers=False)
+        self.assertEqual([json.loads(line) for line in stdout.splitlines()], self.rows)
+        self.assertIn('Exported 2 resolved references of 2 source bibcodes', stderr)
+        self.assertIn('rows/sec', stderr)
+
+    def test_query_counts_source_bibcodes_as_they_change(self):
+        rows = [dict(self.rows[0]), dict(self.rows[0], id=2, resolved_bibcode='2020ApJ...900....2S'), self.rows[1]]
+        with patch.object(run.app, 'export_resolved_references', return_value=iter(rows)):
+            summary = run.export_resolved_references([], output_filename=os.path.join(self.output_dir, 'resolved.jsonl'))
+        self.assertEqual((summary['rows'], summary['source_bibcodes']), (3, 2))
+
+    def test_query_since_to_csv_file(self):
+        output = os.path.join(self.output_dir, 'resolved.csv')
+        result, mock_export, stdout, _ = self.query(['--since', '2025-01-01', '-a', '-o', output])
+
+        self.assertEqual(result, 0)
+        mock_export.assert_called_once_with([], since=datetime(2025, 1, 1), all_parsers=True)
+        self.assertEqual(stdout, '')
+        with open(output) as handle:
+            rows = list(csv.DictReader(handle))
+        self.assertEqual(list(rows[0].keys()), run.EXPORT_COLUMNS)
+        self.assertEqual([row['resolved_bibcode'] for row in rows], ['2020ApJ...900....1S', '2021ApJ...901....2S'])
+
+    def test_query_changes_since_pages_through_the_log(self):
+        # a later transaction can hold a lower id, the log is read in (txid, id) order
+        changes = [{'txid': txid, 'id': index, 'history_id': 1, 'item_num': index, 'old_bibcode': None,
+                    'new_bibcode': '2020ApJ...900....1S', 'score': 1.0, 'ts': '2025-01-01 00:00:00'}
+                   for txid, index in [(100, 11), (100, 14), (101, 12), (102, 15), (103, 13)]]
+        pages = lambda since_txid, since_id, limit: [change for change in changes if (change['txid'], change['id']) > (since_txid, since_id)][:limit]
+        stdout, stderr = io.StringIO(), io.StringIO()
+        with patch.object(run.app, 'get_resolution_changes', side_effect=pages) as mock_changes, \
+             redirect_stdout(stdout), redirect_stderr(stderr):
+            result = run.main(['QUERY', '--changes-since', '100:10', '--page_size', '2'])
+
+        self.assertEqual(result, 0)
+        self.assertEqual([(call.kwargs['since_txid'], call.kwargs['since_id']) for call in mock_changes.call_args_list],
+                         [(100, 10), (100, 14), (102, 15)])
+        self.assertEqual([json.loads(line)['id'] for line in stdout.getvalue().splitlines()], [11, 14, 12, 15, 13])
+        self.assertIn('Exported 5 resolution changes', stderr.getvalue())
+        self.assertIn('Next watermark: 103:13', stderr.getvalue())
+
+        # nothing new, the watermark stays
+        with patch.object(run.app, 'get_resolution_changes', return_value=[]):
+            summary = run.export_resolution_changes((103, 13), output_filename=os.path.join(self.output_dir, 'changes.csv'))
+        self.assertEqual((summary['rows'], summary['watermark']), (0, (103, 13)))
+        with open(os.path.join(self.output_dir, 'changes.csv')) as handle:
+            self.assertEqual(handle.read().strip(), ','.join(run.CHANGES_COLUMNS))
+
+    def test_watermark(self):
+        self.assertEqual(run.watermark('0'), (0, 0))
+        self.assertEqual(run.watermark('103:13'), (103, 13))
+        for value in ('13', '1:2:3', 'a:1', '-1:2'):
+            with self.assertRaises(argparse.ArgumentTypeError):
+                run.watermark(value)
+
+    def test_query_needs_bibcodes_or_since(self):
+        with patch.object(run.logger, 'error') as mock_error:
+            result, mock_export, _, _ = self.query([])
+        self.assertEqual(result, 1)
+        mock_error.assert_called_once()
+        mock_export.assert_not_called()
+
+        with self.assertRaises(SystemExit):
+            self.query(['--since', 'yesterday'])
+
+
+class TestRunCountRecords(unittest.TestCase):
+
+    def setUp(self):
+        self.results = [
+            {'name': 'ReferenceSource', 'description': 'source reference file information', 'count': 3, 'exact': True,
+             'updated': datetime(2025, 1, 1)},
+            {'name': 'ResolvedReference', 'description': 'resolved reference information for a processed run', 'count': 7000000,
+             'exact': False, 'updated': datetime(2025, 1, 2, 3, 4, 5)},
+        ]
+
+    def run_main(self, argv):
+        stdout = io.StringIO()
+        with patch.object(run.app, 'get_count_records', return_value=self.results) as mock_count, \
+             patch.object(run.app, 'iter_diagnostics') as mock_diagnostic, redirect_stdout(stdout):
+            result = run.main(argv)
+        return result, mock_count, mock_diagnostic, stdout.getvalue()
+
+    def test_stats_count_shows_exact_or_estimated(self):
+        result, mock_count, _, stdout = self.run_main(['STATS', '-c'])
+        self.assertEqual(result, 0)
+        mock_count.assert_called_once_with(exact=False)
+        self.assertIn('Currently there are 3 records in `ReferenceSource` table, which holds source reference file information '
+                      '(exact, as of 2025-01-01 00:00:00).', stdout)
+        self.assertIn('7000000 records in `ResolvedReference` table, which holds resolved reference information for a processed run '
+                      '(estimated, as of 2025-01-02 03:04:05).', stdout)
+
+        _, mock_count, _, _ = self.run_main(['STATS', '-c', '--exact'])
+        mock_count.assert_called_once_with(exact=True)
+
+    def test_diagnostics_without_arguments_shows_the_counts(self):
+        _, mock_count, mock_diagnostic, stdout = self.run_main(['DIAGNOSTICS'])
+        mock_count.assert_called_once_with()
+        mock_diagnostic.assert_not_called()
+        self.assertIn('(estimated, as of', stdout)
+
+
+class TestRunDiagnostics(unittest.TestCase):
+
+    def setUp(self):
+        self.scratch_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.scratch_dir, True)
+
+    def test_diagnostics_streams_the_rows_of_many_bibcodes(self):
+        bibcodes = ['%04dTEST..........Z' % index for index in range(2000)]
+        bibcodes_file = os.path.join(self.scratch_dir, 'bibcodes.txt')
+        with open(bibcodes_file, 'w') as handle:
+            handle.write('\n'.join(bibcodes[1:]) + '\n')
+        printed = []
+
+        def rows(bibcode_list, source_filename_list):
+            for bibcode in bibcode_list:
+                # each row is printed before the next one is read
+                self.assertEqual(len(printed), bibcode_list.index(bibcode))
+                yield {'bibcode': bibcode}
+
+        stdout = io.StringIO()
+        with patch.object(run.app, 'iter_diagnostics', side_effect=rows) as mock_diagnostic, \
+             patch('builtins.print', side_effect=lambda *args: printed.append(args)), redirect_stdout(stdout):
+            run.main(['DIAGNOSTICS', '-b', bibcodes[0], '@' + bibcodes_file])
+        mock_diagnostic.assert_called_once_with(bibcodes, [])
+        self.assertEqual(len(printed), 2000)
+
+    def test_diagnostics_queries_at_most_max_entries(self):
+        with patch.dict(run.config, {'MAX_ENTRIES_DIAGNOSTICS': 2}), \
+             patch.object(run.app, 'iter_diagnostics', return_value=iter([])) as mock_diagnostic, \
+             patch.object(run.logger, 'warning') as mock_warning:
+            run.main(['DIAGNOSTICS', '-s', 'a.raw', 'b.raw', 'c.raw'])
+        mock_diagnostic.assert_called_once_with([], ['a.raw', 'b.raw'])
+        mock_warning.assert_called_once_with('Only the first 2 of 3 source filenames are queried.')
+
+
+class TestRunQueueReferences(unittest.TestCase):
+
+    def queue(self, environment, side_effect):
+        references = [{'id': 'H1I%d' % index, 'refstr': 'reference %d' % index} for index in range(8)]
+        with patch.dict(os.environ, environment), \
+             patch.object(run.app, 'get_reference_service_endpoint', return_value='/text'), \
+             patch.object(run.tasks, 'task_process_reference', side_effect=side_effect) as mock_task, \
+             patch.object(run.logger, 'error'):
+            run.queue_references(references, '/tmp/input/A/file1.raw', '0000TEST..........Z', 'arXiv')
+        return mock_task
+
+    def test_queue_references_runs_tasks_from_threads_in_benchmark(self):
+        threads = set()
+
+        def task(reference_task):
+            threads.add(threading.get_ident())
+            time.sleep(0.01)
+            return True
+
+        with run.perf_metrics.trace_scope() as trace_id:
+            mock_task = self.queue({'PERF_BENCHMARK_TASK_CONCURRENCY': '4'}, task)
+        self.assertEqual(mock_task.call_count, 8)
+        self.assertGreater(len(threads), 1)
+        self.assertNotIn(threading.get_ident(), threads)
+        self.assertEqual({call.args[0]['trace']['trace_id'] for call in mock_task.call_args_list}, {trace_id})
+
+        threads.clear()
+        self.queue({'PERF_BENCHMARK_TASK_CONCURRENCY': 'x'}, task)
+        self.assertEqual(threads, {threading.get_ident()})
+
+    def test_queue_references_stamps_each_task_as_it_is_sent(self):
+        waits = []
+
+        def task(reference_task):
+            waits.append(time.time() - reference_task['trace']['enqueued_at'])
+            time.sleep(0.02)
+            return True
+
+        with run.perf_metrics.trace_scope():
+            self.queue({'PERF_BENCHMARK_TASK_CONCURRENCY': '1'}, task)
+        # the queue wait of a task does not include the run time of the tasks sent before it
+        self.assertEqual(len(waits), 8)
+        self.assertLess(max(waits), 0.015)
+
+    def test_queue_references_concurrent_failures(self):
+        def task(reference_task):
+            if reference_task['reference']['id'] == 'H1I3':
+                raise ValueError('resolver down')
+            return True
+
+        with self.assertRaises(ValueError):
+            self.queue({'PERF_BENCHMARK_TASK_CONCURRENCY': '4'}, task)
+        with patch.object(run.perf_metrics, 'emit_event') as mock_emit:
+            mock_task = self.queue({'PERF_BENCHMARK_TASK_CONCURRENCY': '4', 'PERF_BENCHMARK_CONTINUE_ON_ERROR': 'true'}, task)
+        self.assertEqual(mock_task.call_count, 8)
+        errors = [call.kwargs for call in mock_emit.call_args_list if call.kwargs.get('stage') == 'record_error']
+        self.assertEqual([error['record_id'] for error in errors], ['H1I3'])
+
+
 if __name__ == '__main__':
     unittest.main()
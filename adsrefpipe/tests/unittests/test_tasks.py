@@ -6,11 +6,10 @@ if project_home not in sys.path:
 import datetime
 import unittest
 from unittest.mock import Mock, patch
-import json
 from contextlib import contextmanager
 
 from adsrefpipe import app, tasks, utils
-from adsrefpipe.models import Base, Action, Parser, ReferenceSource, ProcessedHistory, ResolvedReference, CompareClassic
+from adsrefpipe.models import Action, Parser, ReferenceSource, ProcessedHistory, ResolvedReference, CompareClassic
 from adsrefpipe.refparsers.handler import verify
 from adsrefpipe.tests.unittests.stubdata.dbdata import actions_records, parsers_records
 
@@ -435,6 +434,53 @@ class TestTasks(unittest.TestCase):
              patch("adsrefpipe.tasks.app.populate_tables_post_resolved", return_value=True):
             self.assertTrue(tasks.task_process_reference.run(reference_task))
 
+    def test_task_process_reference_continues_trace(self):
+        """test that the task records its queue wait and stages in the trace of the source file"""
+        reference_task = {
+            'reference': [{'item_num': 2, 'refstr': 'Arcangeli, J., et al. 2019, A&A, 625, A136', 'id': '2'}],
+            'source_bibcode': '2023TEST..........S',
+            'source_filename': 'some_source.txt',
+            'resolver_service_url': 'text',
+            'trace': {'trace_id': 'trace-1', 'parent_span_id': 'span-1', 'enqueued_at': 1.0},
+        }
+        traces = []
+        with patch("adsrefpipe.tasks.utils.post_request_resolved_reference",
+                   side_effect=lambda *args: traces.append(tasks.perf_metrics.current_trace()) or ["resolved_ref"]), \
+             patch("adsrefpipe.tasks.app.populate_tables_post_resolved", return_value=True), \
+             patch("adsrefpipe.tasks.perf_metrics.emit_queue_wait") as mock_queue_wait:
+            self.assertTrue(tasks.task_process_reference.run(reference_task))
+        mock_queue_wait.assert_called_once()
+        self.assertEqual(mock_queue_wait.call_args[0][0], reference_task['trace'])
+        self.assertEqual(traces[0]['trace_id'], 'trace-1')
+        self.assertIsNone(tasks.perf_metrics.current_trace())
+
+    def test_flush_perf_events_at_task_end(self):
+        """test that the buffered perf events are written out when a task ends"""
+        with patch("adsrefpipe.tasks.perf_metrics.flush_events") as mock_flush:
+            tasks.signals.task_postrun.send(sender=tasks.task_process_reference, task_id='1', task=tasks.task_process_reference)
+            mock_flush.assert_called_once()
+
+    def test_start_live_metrics(self):
+        """test that the worker serves the live metrics only when they are configured"""
+        with patch("adsrefpipe.tasks.perf_prometheus.configure_live_metrics", return_value=False), \
+             patch("adsrefpipe.tasks.perf_prometheus.start_http_server") as mock_start:
+            self.assertIsNone(tasks.start_live_metrics())
+            mock_start.assert_not_called()
+
+        with patch("adsrefpipe.tasks.perf_prometheus.configure_live_metrics", return_value=True), \
+             patch.dict(os.environ, {"PERF_PROMETHEUS_PORT": "9108"}), \
+             patch("adsrefpipe.tasks.perf_prometheus.LIVE_METRICS.directory", "/metrics"), \
+             patch("adsrefpipe.tasks.perf_prometheus.start_http_server", return_value="server") as mock_start:
+            self.assertEqual(tasks.start_live_metrics(), "server")
+            mock_start.assert_called_once_with("/metrics", 9108)
+
+        with patch("adsrefpipe.tasks.perf_prometheus.configure_live_metrics", return_value=True), \
+             patch.dict(os.environ, {"PERF_PROMETHEUS_PORT": "9108"}), \
+             patch("adsrefpipe.tasks.perf_prometheus.start_http_server", side_effect=OSError("in use")), \
+             patch("adsrefpipe.tasks.logger.error") as mock_error:
+            self.assertIsNone(tasks.start_live_metrics())
+            mock_error.assert_called_once()
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,72 @@
+"""add best_resolved_reference
+
+Revision ID: 4c2f7a91d3b5
+Revises: 9a4b1e8b6c7d
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "4c2f7a91d3b5"
+down_revision = "9a4b1e8b6c7d"
+branch_labels = None
+depends_on = None
+
+
+# the highest score of each resolved bibcode per source bibcode and parser, the earliest run on a tie,
+# with the parser priority of ADSReferencePipelineCelery.PARSER_PRIORITY
+BACKFILL_SQL = """
+    INSERT INTO best_resolved_reference (source_bibcode, parser_name, resolved_bibcode, history_id, item_num, score, parser_priority, date)
+    SELECT DISTINCT ON (reference_source.bibcode, reference_source.parser_name, resolved_reference.bibcode)
+           reference_source.bibcode, reference_source.parser_name, resolved_reference.bibcode,
+           resolved_reference.history_id, resolved_reference.item_num, resolved_reference.score,
+           CASE WHEN reference_source.parser_name IN ('arXiv', 'CrossRef') THEN 1
+                WHEN reference_source.parser_name = 'Arthur' THEN 3
+                ELSE 2 END,
+           processed_history.date
+    FROM resolved_reference
+    JOIN processed_history ON processed_history.id = resolved_reference.history_id
+    JOIN reference_source ON reference_source.bibcode = processed_history.bibcode
+                         AND reference_source.source_filename = processed_history.source_filename
+    WHERE resolved_reference.score != 0 AND resolved_reference.bibcode != '0000'
+    ORDER BY reference_source.bibcode, reference_source.parser_name, resolved_reference.bibcode,
+             resolved_reference.score DESC, resolved_reference.history_id
+"""
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    tables = inspector.get_table_names()
+    if "resolved_reference" not in tables:
+        raise RuntimeError(
+            "Migration 4c2f7a91d3b5 requires table `resolved_reference`, "
+            "but it does not exist. Database schema and alembic_version are out of sync."
+        )
+    if "best_resolved_reference" in tables:
+        return
+
+    op.create_table('best_resolved_reference',
+                    sa.Column('source_bibcode', sa.String(), nullable=False),
+                    sa.Column('parser_name', sa.String(), nullable=False),
+                    sa.Column('resolved_bibcode', sa.String(), nullable=False),
+                    sa.Column('history_id', sa.Integer(), nullable=True),
+                    sa.Column('item_num', sa.Integer(), nullable=True),
+                    sa.Column('score', sa.Numeric(), nullable=True),
+                    sa.Column('parser_priority', sa.Integer(), nullable=True),
+                    sa.Column('date', sa.DateTime(), nullable=True),
+                    sa.ForeignKeyConstraint(['history_id'], ['processed_history.id'], ),
+                    sa.PrimaryKeyConstraint('source_bibcode', 'parser_name', 'resolved_bibcode'))
+    op.execute(BACKFILL_SQL)
+    # after the backfill, building the index once is quicker than keeping it up to date row by row
+    op.create_index('ix_best_resolved_reference_date', 'best_resolved_reference', ['date'])
+
+
+def downgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if "best_resolved_reference" in inspector.get_table_names():
+        op.drop_table('best_resolved_reference')
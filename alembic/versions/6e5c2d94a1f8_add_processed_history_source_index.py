@@ -0,0 +1,42 @@
+"""add processed_history source index
+
+Revision ID: 6e5c2d94a1f8
+Revises: d0a83f6b21c9
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "6e5c2d94a1f8"
+down_revision = "d0a83f6b21c9"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if "processed_history" not in inspector.get_table_names():
+        raise RuntimeError(
+            "Migration 6e5c2d94a1f8 requires table `processed_history`, "
+            "but it does not exist. Database schema and alembic_version are out of sync."
+        )
+    indexes = [index['name'] for index in inspector.get_indexes('processed_history')]
+    if "ix_processed_history_bibcode_source_filename" in indexes:
+        return
+
+    # the resolution change log compares every resolved reference with the previous runs of the same source file
+    op.create_index('ix_processed_history_bibcode_source_filename', 'processed_history', ['bibcode', 'source_filename'])
+
+
+def downgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if "processed_history" not in inspector.get_table_names():
+        return
+    indexes = [index['name'] for index in inspector.get_indexes('processed_history')]
+    if "ix_processed_history_bibcode_source_filename" in indexes:
+        op.drop_index('ix_processed_history_bibcode_source_filename', table_name='processed_history')
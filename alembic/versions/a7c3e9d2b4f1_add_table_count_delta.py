@@ -0,0 +1,38 @@
+"""add table_count_delta
+
+Revision ID: a7c3e9d2b4f1
+Revises: f3a9b5e07c16
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "a7c3e9d2b4f1"
+down_revision = "f3a9b5e07c16"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if "table_count_delta" in inspector.get_table_names():
+        return
+
+    # starts empty, the exact counts taken so far include all the writes before it
+    op.create_table('table_count_delta',
+                    sa.Column('id', sa.BigInteger(), nullable=False),
+                    sa.Column('table_name', sa.String(), nullable=True),
+                    sa.Column('delta', sa.BigInteger(), nullable=True),
+                    sa.PrimaryKeyConstraint('id'))
+    op.create_index('ix_table_count_delta_table_name', 'table_count_delta', ['table_name'])
+
+
+def downgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if "table_count_delta" in inspector.get_table_names():
+        op.drop_table('table_count_delta')
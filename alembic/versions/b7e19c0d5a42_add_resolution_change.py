@@ -0,0 +1,48 @@
+"""add resolution_change
+
+Revision ID: b7e19c0d5a42
+Revises: 4c2f7a91d3b5
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "b7e19c0d5a42"
+down_revision = "4c2f7a91d3b5"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    tables = inspector.get_table_names()
+    if "processed_history" not in tables:
+        raise RuntimeError(
+            "Migration b7e19c0d5a42 requires table `processed_history`, "
+            "but it does not exist. Database schema and alembic_version are out of sync."
+        )
+    if "resolution_change" in tables:
+        return
+
+    # starts empty, the changes are logged from now on
+    op.create_table('resolution_change',
+                    sa.Column('id', sa.Integer(), nullable=False),
+                    sa.Column('history_id', sa.Integer(), nullable=True),
+                    sa.Column('item_num', sa.Integer(), nullable=True),
+                    sa.Column('old_bibcode', sa.String(), nullable=True),
+                    sa.Column('new_bibcode', sa.String(), nullable=True),
+                    sa.Column('score', sa.Numeric(), nullable=True),
+                    sa.Column('ts', sa.DateTime(), nullable=True),
+                    sa.ForeignKeyConstraint(['history_id'], ['processed_history.id'], ),
+                    sa.PrimaryKeyConstraint('id'))
+
+
+def downgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if "resolution_change" in inspector.get_table_names():
+        op.drop_table('resolution_change')
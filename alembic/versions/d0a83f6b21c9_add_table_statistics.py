@@ -0,0 +1,38 @@
+"""add table_statistics
+
+Revision ID: d0a83f6b21c9
+Revises: b7e19c0d5a42
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "d0a83f6b21c9"
+down_revision = "b7e19c0d5a42"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if "table_statistics" in inspector.get_table_names():
+        return
+
+    # starts empty, the counts are estimated on the first request, or counted by STATS -c --exact
+    op.create_table('table_statistics',
+                    sa.Column('table_name', sa.String(), nullable=False),
+                    sa.Column('count', sa.BigInteger(), nullable=True),
+                    sa.Column('exact', sa.Boolean(), nullable=True),
+                    sa.Column('updated', sa.DateTime(), nullable=True),
+                    sa.PrimaryKeyConstraint('table_name'))
+
+
+def downgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if "table_statistics" in inspector.get_table_names():
+        op.drop_table('table_statistics')
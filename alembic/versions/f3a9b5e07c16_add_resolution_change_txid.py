@@ -0,0 +1,48 @@
+"""add resolution_change txid
+
+Revision ID: f3a9b5e07c16
+Revises: 6e5c2d94a1f8
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "f3a9b5e07c16"
+down_revision = "6e5c2d94a1f8"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if "resolution_change" not in inspector.get_table_names():
+        raise RuntimeError(
+            "Migration f3a9b5e07c16 requires table `resolution_change`, "
+            "but it does not exist. Database schema and alembic_version are out of sync."
+        )
+    columns = [column['name'] for column in inspector.get_columns('resolution_change')]
+    if "txid" not in columns:
+        op.add_column('resolution_change', sa.Column('txid', sa.BigInteger(), nullable=True))
+        # the changes logged so far are all committed, they are read first, in id order
+        op.execute("UPDATE resolution_change SET txid = 0 WHERE txid IS NULL")
+        op.alter_column('resolution_change', 'txid', server_default=sa.text('txid_current()'))
+    indexes = [index['name'] for index in inspector.get_indexes('resolution_change')]
+    if "ix_resolution_change_txid_id" not in indexes:
+        op.create_index('ix_resolution_change_txid_id', 'resolution_change', ['txid', 'id'])
+
+
+def downgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if "resolution_change" not in inspector.get_table_names():
+        return
+    indexes = [index['name'] for index in inspector.get_indexes('resolution_change')]
+    if "ix_resolution_change_txid_id" in indexes:
+        op.drop_index('ix_resolution_change_txid_id', table_name='resolution_change')
+    columns = [column['name'] for column in inspector.get_columns('resolution_change')]
+    if "txid" in columns:
+        op.drop_column('resolution_change', 'txid')
@@ -26,6 +26,10 @@ CELERY_BROKER = 'pyamqp://'
 
 # if task did not finish in this many seconds, abort
 TASK_PROCESS_TIME = 30
+# seconds of regex time the reference splitting patterns can spend on one reference before giving up, 0 to turn off
+REFERENCE_PIPELINE_REGEX_TIME_BUDGET = 1.0
+# apply the parsers' cleanup lists as compiled single pass chains, False to apply them rule by rule
+REFERENCE_PIPELINE_CLEANUP_ENGINE = True
 # checking queues every this many seconds
 QUEUE_AUDIT_INTERVAL = 10
 
@@ -36,7 +40,12 @@ REFERENCE_PIPELINE_DEFAULT_TIME_DELAY = 1000.0
 COMPARE_CLASSIC = True
 
 # number of bibcodes/sourcefiles that can be submitted for diagnostics
-MAX_ENTRIES_DIAGNOSTICS = 5
+MAX_ENTRIES_DIAGNOSTICS = 10000
+
+# STATS -c and DIAGNOSTICS without arguments show the row counts estimated by postgres, reused for this many seconds
+REFERENCE_PIPELINE_STATS_CACHE_TTL = 300
+# keep the exact counts taken by STATS -c --exact up to date, one delta row per write, added to the counts when they are read
+REFERENCE_PIPELINE_MAINTAIN_EXACT_COUNTS = False
 
 # number of times each items is requeued if not processed unsuccessfully before quiting
 MAX_QUEUE_RETRIES = 3
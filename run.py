@@ -1,16 +1,21 @@
 import sys
 import os, fnmatch
+import csv
+import json
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 from adsputils import setup_logging, load_config, get_date
-from datetime import timedelta
+from datetime import datetime, timedelta
 import time
 
 import argparse
 
 from adsrefpipe import tasks
 from adsrefpipe import perf_metrics
+from adsrefpipe import perf_profile
 from adsrefpipe.refparsers.handler import verify
+from adsrefpipe.refparsers.patterns import regex_profile, emit_profile
 from adsrefpipe.utils import get_date_modified_struct_time, ReprocessQueryType
 
 proj_home = os.path.realpath(os.path.dirname(__file__))
@@ -25,6 +30,14 @@ def _benchmark_continue_on_error() -> bool:
     return os.getenv("PERF_BENCHMARK_CONTINUE_ON_ERROR", "").strip().lower() in {"1", "true", "yes", "on"}
 
 
+def _benchmark_task_concurrency() -> int:
+    # the benchmark sweep runs the tasks of a block from this many threads, as that many workers would
+    try:
+        return max(1, int(os.getenv("PERF_BENCHMARK_TASK_CONCURRENCY", "1")))
+    except ValueError:
+        return 1
+
+
 def positive_float(value: str) -> float:
     """
     argparse type for positive floating point values.
@@ -38,6 +51,48 @@ def positive_float(value: str) -> float:
     return parsed_value
 
 
+def positive_int(value: str) -> int:
+    """
+    argparse type for positive integer values.
+
+    :param value: CLI argument value to validate
+    :return: validated int value
+    """
+    parsed_value = int(value)
+    if parsed_value <= 0:
+        raise argparse.ArgumentTypeError('%s must be greater than 0.' % value)
+    return parsed_value
+
+
+def watermark(value: str) -> tuple:
+    """
+    argparse type for the watermark of the resolution change log, TXID:ID as printed at the end of the previous call, or 0.
+
+    :param value: CLI argument value to validate
+    :return: validated (txid, id) tuple
+    """
+    try:
+        parsed_value = tuple(int(part) for part in value.split(':')) if value != '0' else (0, 0)
+    except ValueError:
+        parsed_value = ()
+    if len(parsed_value) != 2 or min(parsed_value) < 0:
+        raise argparse.ArgumentTypeError('%s is not a watermark, use TXID:ID as printed by the previous call, or 0.' % value)
+    return parsed_value
+
+
+def iso_date(value: str) -> datetime:
+    """
+    argparse type for dates, YYYY-MM-DD with an optional time.
+
+    :param value: CLI argument value to validate
+    :return: validated datetime value
+    """
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError('%s is not a date, use YYYY-MM-DD or YYYY-MM-DDTHH:MM:SS.' % value)
+
+
 def run_diagnostics(bibcodes: list, source_filenames: list) -> None:
     """
     show diagnostic information based on the provided bibcodes and source filenames
@@ -49,15 +104,41 @@ def run_diagnostics(bibcodes: list, source_filenames: list) -> None:
     max_entries_diagnostics = config['MAX_ENTRIES_DIAGNOSTICS']
     # make sure we only send max number of entires per bibcode/source_file to be queried
     if bibcodes:
+        bibcodes = read_bibcodes(bibcodes)
+        if len(bibcodes) > max_entries_diagnostics:
+            logger.warning('Only the first %d of %d bibcodes are queried.' % (max_entries_diagnostics, len(bibcodes)))
         bibcodes = bibcodes[:max_entries_diagnostics]
     if source_filenames:
+        source_filenames = read_bibcodes(source_filenames)
+        if len(source_filenames) > max_entries_diagnostics:
+            logger.warning('Only the first %d of %d source filenames are queried.' % (max_entries_diagnostics, len(source_filenames)))
         source_filenames = source_filenames[:max_entries_diagnostics]
-    results = app.diagnostic_query(bibcodes, source_filenames)
-    for result in results:
+    # without bibcodes or source filenames, show the number of records in the tables, as estimated by the database
+    if not bibcodes and not source_filenames:
+        print_count_records(app.get_count_records())
+        return
+    # printed as they are read from the database
+    for result in app.iter_diagnostics(bibcodes, source_filenames):
         print(result)
     return
 
 
+def print_count_records(results: list) -> None:
+    """
+    prints the number of records in the main tables, and if each number is exact or estimated
+
+    :param results: as returned by app.get_count_records
+    :return: None
+    """
+    print('\n')
+    for result in results:
+        kind = 'exact' if result['exact'] else 'estimated'
+        if result.get('updated'):
+            kind += ', as of %s' % result['updated'].strftime("%Y-%m-%d %H:%M:%S")
+        print('Currently there are %d records in `%s` table, which holds %s (%s).' % (result['count'], result['name'], result['description'], kind))
+    print('\n')
+
+
 def get_source_filenames(source_file_path: str, file_extension: str, date_cutoff: time.struct_time) -> list:
     """
     Return a list of lists of matching files, grouped by the first-level
@@ -115,38 +196,53 @@ def queue_references(references: list, source_filename: str, source_bibcode: str
         stage='ingest_enqueue',
         extra=event_extra,
     )
+    def send_task(reference_task: dict) -> None:
+        if reference_task['trace'] is not None:
+            # stamped as the task is sent, not when the block is built, so the wait excludes the tasks sent before it
+            reference_task['trace'] = dict(reference_task['trace'], enqueued_at=time.time())
+        try:
+            tasks.task_process_reference(reference_task)
+        except Exception as exc:
+            if not _benchmark_continue_on_error():
+                raise
+            perf_metrics.emit_event(
+                stage='record_error',
+                record_id=reference_task['reference'].get('id'),
+                status='error',
+                extra=perf_metrics.build_event_extra(
+                    source_filename=source_filename,
+                    parser_name=parsername,
+                    source_bibcode=source_bibcode,
+                    input_extension=event_extra.get('input_extension'),
+                    source_type=event_extra.get('source_type'),
+                    record_count=1,
+                    extra={'error': str(exc), 'error_type': exc.__class__.__name__},
+                ),
+            )
+            logger.error("Benchmark continuing after record failure for %s: %s" % (source_filename, str(exc)))
+
     with perf_metrics.timed_stage(
         stage='queue_references',
         extra=event_extra,
     ):
-        for reference in references:
-            reference_task = {'reference': reference,
-                              'source_bibcode': source_bibcode,
-                              'source_filename': source_filename,
-                              'resolver_service_url': resolver_service_url,
-                              'parser_name': parsername,
-                              'input_extension': event_extra.get('input_extension'),
-                              'source_type': event_extra.get('source_type')}
-            try:
-                tasks.task_process_reference(reference_task)
-            except Exception as exc:
-                if not _benchmark_continue_on_error():
-                    raise
-                perf_metrics.emit_event(
-                    stage='record_error',
-                    record_id=reference.get('id'),
-                    status='error',
-                    extra=perf_metrics.build_event_extra(
-                        source_filename=source_filename,
-                        parser_name=parsername,
-                        source_bibcode=source_bibcode,
-                        input_extension=event_extra.get('input_extension'),
-                        source_type=event_extra.get('source_type'),
-                        record_count=1,
-                        extra={'error': str(exc), 'error_type': exc.__class__.__name__},
-                    ),
-                )
-                logger.error("Benchmark continuing after record failure for %s: %s" % (source_filename, str(exc)))
+        # the trace carrier is taken here, the context of the file trace is not seen by the pool threads
+        carrier = perf_metrics.trace_carrier()
+        reference_tasks = [{'reference': reference,
+                            'source_bibcode': source_bibcode,
+                            'source_filename': source_filename,
+                            'resolver_service_url': resolver_service_url,
+                            'parser_name': parsername,
+                            'input_extension': event_extra.get('input_extension'),
+                            'source_type': event_extra.get('source_type'),
+                            'trace': carrier} for reference in references]
+        concurrency = _benchmark_task_concurrency()
+        if concurrency > 1 and len(reference_tasks) > 1:
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                # list to raise the first failure, as the loop does
+                list(executor.map(send_task, reference_tasks))
+        else:
+            for reference_task in reference_tasks:
+                send_task(reference_task)
 
 
 def process_files(filenames: list) -> None:
@@ -162,7 +258,10 @@ def process_files(filenames: list) -> None:
     for filename in filenames:
         current_filename = filename
         file_event_extra = perf_metrics.build_event_extra(source_filename=filename)
-        with perf_metrics.timed_stage(stage='file_wall', extra=file_event_extra):
+        # one trace per file, the tasks queued for its references carry it to the workers
+        # the stacks sampled while PERF_PROFILE is on are counted for the parser and source type of the file
+        with perf_metrics.trace_scope(), perf_profile.profile_scope(source_type=file_event_extra.get('source_type')) as profile, \
+                perf_metrics.timed_stage(stage='file_wall', extra=file_event_extra):
             # from filename get the parser info
             # file extension, and bibstem and volume directories are used to query database and return the parser info
             # ie for filename `adsrefpipe/tests/unittests/stubdata/txt/ARA+A/0/0000ADSTEST.0.....Z.ref.raw`
@@ -175,6 +274,7 @@ def process_files(filenames: list) -> None:
             #                              {'journal': 'ARNPS', 'volume_end': 56, 'volume_begin': 52}]]}
             with perf_metrics.timed_stage(stage='parser_lookup', extra=file_event_extra):
                 parser_dict = app.get_parser(filename)
+            profile.parser_name = parser_dict.get('name')
             file_event_extra = perf_metrics.build_event_extra(
                 source_filename=filename,
                 parser_name=parser_dict.get('name'),
@@ -186,12 +286,14 @@ def process_files(filenames: list) -> None:
                 logger.error("Unable to detect which parser to use for the file %s." % filename)
                 continue
 
-            with perf_metrics.timed_stage(stage='parser_init', extra=file_event_extra):
+            with perf_metrics.timed_stage(stage='parser_init', extra=file_event_extra), regex_profile.parser_scope(parser_dict.get('name')):
                 toREFs = parser(filename=filename, buffer=None)
             current_filename = getattr(toREFs, 'filename', None) or filename
             if toREFs:
-                with perf_metrics.timed_stage(stage='parse_dispatch', extra=file_event_extra):
+                with perf_metrics.timed_stage(stage='parse_dispatch', extra=file_event_extra), regex_profile.parser_scope(parser_dict.get('name')):
                     parsed_references = toREFs.process_and_dispatch()
+                # regex counters are only collected when PERF_REGEX_PROFILE is set
+                emit_profile(file_event_extra)
                 if not parsed_references:
                     logger.error("Unable to parse %s." % current_filename)
                     continue
@@ -225,6 +327,287 @@ def process_files(filenames: list) -> None:
                 logger.error("Unable to process %s. Skipped!" % current_filename)
 
 
+def _dry_run_parse(task: tuple) -> dict:
+    """
+    parses one source file for a dry run, in this process or in a worker process
+
+    :param task: the source filename and the name of its parser
+    :return: the parsed blocks of the file, with the time it took and the error if it failed
+    """
+    filename, parser_name = task
+    result = {'filename': filename, 'parser': parser_name, 'bytes': 0, 'seconds': 0.0, 'blocks': [], 'error': None}
+    started = time.perf_counter()
+    try:
+        result['bytes'] = os.path.getsize(filename)
+        parser = verify(parser_name)
+        if not parser:
+            result['error'] = 'no parser class for %s' % parser_name
+        else:
+            result['blocks'] = parser(filename=filename, buffer=None).process_and_dispatch() or []
+            if not result['blocks']:
+                result['error'] = 'no references parsed'
+    except Exception as exc:
+        result['error'] = '%s: %s' % (exc.__class__.__name__, str(exc))
+    result['seconds'] = time.perf_counter() - started
+    return result
+
+
+class DryRunWriter(object):
+    """
+    streams the references parsed in a dry run to a file, csv when the name ends with .csv, jsonl otherwise
+    """
+
+    CSV_COLUMNS = ['source_filename', 'source_bibcode', 'parser_name', 'item_num', 'refstr', 'refraw', 'fields']
+
+    def __init__(self, output_filename: str):
+        """
+        :param output_filename: the file to write to, or None to only count
+        """
+        self.handle = open(output_filename, 'w', newline='') if output_filename else None
+        self.csv = None
+        if self.handle and output_filename.lower().endswith('.csv'):
+            self.csv = csv.DictWriter(self.handle, fieldnames=self.CSV_COLUMNS)
+            self.csv.writeheader()
+
+    def write(self, result: dict) -> None:
+        """
+        :param result: the parsed file, as returned by _dry_run_parse
+        :return: None
+        """
+        if not self.handle:
+            return
+        for block in result['blocks']:
+            for item_num, reference in enumerate(block.get('references') or [], start=1):
+                row = {'source_filename': result['filename'], 'source_bibcode': block.get('bibcode'),
+                       'parser_name': result['parser'], 'item_num': item_num}
+                if self.csv:
+                    fields = {key: value for key, value in reference.items() if key not in ('refstr', 'refraw')}
+                    row.update(refstr=reference.get('refstr'), refraw=reference.get('refraw'),
+                               fields=json.dumps(fields, sort_keys=True) if fields else '')
+                    self.csv.writerow(row)
+                else:
+                    row.update(reference)
+                    self.handle.write(json.dumps(row) + '\n')
+
+    def close(self) -> None:
+        """
+        :return: None
+        """
+        if self.handle:
+            self.handle.close()
+
+
+def _dry_run_account(result: dict, stats: dict, errors: list) -> dict:
+    """
+    adds a parsed file to the stats of its parser
+
+    :param result: the parsed file, as returned by _dry_run_parse
+    :param stats: the running stats of the parser
+    :param errors: the list of failed files to add to
+    :return: the timing of the file
+    """
+    references = sum(len(block.get('references') or []) for block in result['blocks'])
+    stats['files'] += 1
+    stats['blocks'] += len(result['blocks'])
+    stats['references'] += references
+    stats['bytes'] += result['bytes']
+    stats['seconds'] += result['seconds']
+    if result['error']:
+        stats['errors'] += 1
+        errors.append({'filename': result['filename'], 'parser': result['parser'], 'error': result['error']})
+    return {'filename': result['filename'], 'parser': result['parser'], 'seconds': result['seconds'], 'references': references}
+
+
+def dry_run_files(filenames: list, output_filename: str = None, workers: int = 1, top: int = 10) -> dict:
+    """
+    parses the given source files without writing to the database or queueing anything for the resolver,
+    to validate and time a delivery before it is processed
+
+    the parser of a file is still looked up with app.get_parser, which reads the parser table,
+    the parsing itself runs in this process or in a pool of worker processes
+
+    :param filenames: list of filenames to be parsed
+    :param output_filename: file to stream the parsed references to, csv or jsonl (optional)
+    :param workers: number of processes to parse with
+    :param top: number of slowest files to report
+    :return: summary with per parser files, references, references per second and errors, and the slowest files
+    """
+    started = time.perf_counter()
+    parsers = defaultdict(lambda: {'files': 0, 'blocks': 0, 'references': 0, 'bytes': 0, 'seconds': 0.0, 'errors': 0})
+    errors, timings = [], []
+    tasks_to_parse = []
+    for filename in filenames:
+        parser_name = app.get_parser(filename).get('name')
+        if parser_name:
+            tasks_to_parse.append((filename, parser_name))
+        else:
+            errors.append({'filename': filename, 'parser': None, 'error': 'no parser for this file'})
+
+    writer = DryRunWriter(output_filename)
+    try:
+        if workers > 1 and len(tasks_to_parse) > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                # in order, so that the output is the same as with a single process
+                results = executor.map(_dry_run_parse, tasks_to_parse, chunksize=max(1, len(tasks_to_parse) // (workers * 4)))
+                for result in results:
+                    writer.write(result)
+                    timings.append(_dry_run_account(result, parsers[result['parser']], errors))
+        else:
+            for task in tasks_to_parse:
+                result = _dry_run_parse(task)
+                writer.write(result)
+                timings.append(_dry_run_account(result, parsers[result['parser']], errors))
+    finally:
+        writer.close()
+
+    for stats in parsers.values():
+        stats['references_per_s'] = stats['references'] / stats['seconds'] if stats['seconds'] > 0 else None
+    return {
+        'files': len(filenames),
+        'references': sum(stats['references'] for stats in parsers.values()),
+        'wall_seconds': time.perf_counter() - started,
+        'workers': workers,
+        'output': output_filename,
+        'parsers': dict(parsers),
+        'errors': errors,
+        'slowest': sorted(timings, key=lambda timing: timing['seconds'], reverse=True)[:top],
+    }
+
+
+def print_dry_run_summary(summary: dict) -> None:
+    """
+    prints the per parser throughput, the failed files and the slowest files of a dry run
+
+    :param summary: as returned by dry_run_files
+    :return: None
+    """
+    print('\nParsed %d references from %d files in %.2f seconds with %d worker(s).' % (
+        summary['references'], summary['files'], summary['wall_seconds'], summary['workers']))
+    if summary['output']:
+        print('References written to %s.' % summary['output'])
+    print('\n%-24s %8s %10s %12s %8s' % ('parser', 'files', 'references', 'refs/sec', 'errors'))
+    for name, stats in sorted(summary['parsers'].items()):
+        rate = '%.1f' % stats['references_per_s'] if stats['references_per_s'] is not None else '-'
+        print('%-24s %8d %10d %12s %8d' % (name, stats['files'], stats['references'], rate, stats['errors']))
+    if summary['errors']:
+        print('\nFailed files:')
+        for error in summary['errors']:
+            print('  %s (%s): %s' % (error['filename'], error['parser'], error['error']))
+    if summary['slowest']:
+        print('\nSlowest files:')
+        for timing in summary['slowest']:
+            print('  %8.3f s %6d references  %s (%s)' % (timing['seconds'], timing['references'], timing['filename'], timing['parser']))
+    print('\n')
+
+
+def read_bibcodes(values: list) -> list:
+    """
+    expands the bibcodes, or source filenames, given on the command line, an entry @filename is replaced by the entries in that file, one per line
+
+    :param values: bibcodes and @filenames
+    :return: list of bibcodes, in the order given, without duplicates
+    """
+    bibcodes = []
+    for value in values:
+        if value.startswith('@'):
+            with open(value[1:]) as handle:
+                bibcodes.extend(line.strip() for line in handle if line.strip() and not line.startswith('#'))
+        else:
+            bibcodes.append(value)
+    return list(dict.fromkeys(bibcodes))
+
+
+EXPORT_COLUMNS = ['source_bibcode', 'resolved_bibcode', 'score', 'parser_name', 'parser_priority', 'id', 'date']
+CHANGES_COLUMNS = ['txid', 'id', 'history_id', 'item_num', 'old_bibcode', 'new_bibcode', 'score', 'ts']
+
+
+def write_rows(rows, columns: list, output_filename: str = None, output_format: str = None) -> dict:
+    """
+    streams rows to a file or stdout, one row at a time
+
+    :param rows: iterable of dictionaries
+    :param columns: the keys of the rows, the header of csv
+    :param output_filename: file to write to, stdout if not given or -
+    :param output_format: jsonl or csv, by default csv when the filename ends with .csv, jsonl otherwise
+    :return: number of rows written, the time it took and the rows per second, and the last row written
+    """
+    to_stdout = not output_filename or output_filename == '-'
+    if not output_format:
+        output_format = 'csv' if not to_stdout and output_filename.lower().endswith('.csv') else 'jsonl'
+    handle = sys.stdout if to_stdout else open(output_filename, 'w', newline='')
+    started = time.perf_counter()
+    count, last = 0, None
+    try:
+        writer = None
+        if output_format == 'csv':
+            writer = csv.DictWriter(handle, fieldnames=columns)
+            writer.writeheader()
+        for row in rows:
+            if writer:
+                writer.writerow(row)
+            else:
+                handle.write(json.dumps(row) + '\n')
+            count += 1
+            last = row
+    finally:
+        if not to_stdout:
+            handle.close()
+    seconds = time.perf_counter() - started
+    return {'rows': count, 'seconds': seconds, 'rows_per_s': count / seconds if seconds > 0 else None, 'last': last}
+
+
+def export_resolved_references(source_bibcodes: list, since: datetime = None, all_parsers: bool = False,
+                               output_filename: str = None, output_format: str = None) -> dict:
+    """
+    streams the resolved references of the given source bibcodes to a file or stdout, one row at a time
+
+    :param source_bibcodes: source bibcodes to export, all of them if empty
+    :param since: only export the source bibcodes with a resolved reference updated at or after this date (optional)
+    :param all_parsers: export the highest score of every parser instead of the highest parser priority only
+    :param output_filename: file to write to, stdout if not given or -
+    :param output_format: jsonl or csv, by default csv when the filename ends with .csv, jsonl otherwise
+    :return: number of rows and source bibcodes written, the time it took and the rows per second
+    """
+    # the rows come ordered by source bibcode, a source bibcode is counted when it first shows up
+    counter = {'source_bibcodes': 0, 'previous': None}
+
+    def rows():
+        for row in app.export_resolved_references(source_bibcodes, since=since, all_parsers=all_parsers):
+            if row['source_bibcode'] != counter['previous']:
+                counter['source_bibcodes'] += 1
+                counter['previous'] = row['source_bibcode']
+            yield row
+
+    summary = write_rows(rows(), EXPORT_COLUMNS, output_filename, output_format)
+    summary['source_bibcodes'] = counter['source_bibcodes']
+    return summary
+
+
+def export_resolution_changes(since: tuple, page_size: int = 1000, output_filename: str = None, output_format: str = None) -> dict:
+    """
+    streams the resolution changes after the watermark to a file or stdout, reading them a page at a time
+
+    :param since: watermark (txid, id) of the last change already read, (0, 0) to read them all
+    :param page_size: number of changes read from the database at a time
+    :param output_filename: file to write to, stdout if not given or -
+    :param output_format: jsonl or csv, by default csv when the filename ends with .csv, jsonl otherwise
+    :return: number of changes written, the time it took and the rows per second, and the watermark to pass next time
+    """
+    def rows():
+        since_txid, since_id = since
+        while True:
+            page = app.get_resolution_changes(since_txid=since_txid, since_id=since_id, limit=page_size)
+            for row in page:
+                yield row
+            if len(page) < page_size:
+                return
+            since_txid, since_id = page[-1]['txid'], page[-1]['id']
+
+    summary = write_rows(rows(), CHANGES_COLUMNS, output_filename, output_format)
+    summary['watermark'] = (summary['last']['txid'], summary['last']['id']) if summary['last'] else tuple(since)
+    return summary
+
+
 def reprocess_references(reprocess_type: str, score_cutoff: float = 0, match_bibcode: str = '', date_cutoff: time.struct_time = None) -> None:
     """
     reprocesses references by querying the database and sending each reference for processing
@@ -299,14 +682,14 @@ def main(argv=None) -> int:
                         action='store',
                         nargs='+',
                         default=[],
-                        help='List of bibcodes separated by spaces')
+                        help='List of bibcodes separated by spaces, or @file with one bibcode per line')
     diagnostics.add_argument('-s',
                         '--source_filenames',
                         dest='source_filenames',
                         action='store',
                         nargs='+',
                         default=[],
-                        help='List of source_filenames separated by spaces')
+                        help='List of source_filenames separated by spaces, or @file with one source filename per line')
     diagnostics.add_argument('-p',
                         '--parse_filename',
                         dest='parse_filename',
@@ -376,6 +759,31 @@ def main(argv=None) -> int:
                         action='store',
                         default=None,
                         help='Skip directories that have been previously processed')
+    resolve.add_argument('-n',
+                        '--dry_run',
+                        '--dry-run',
+                        dest='dry_run',
+                        action='store_true',
+                        help='Only parse the source files given by -s, or by -p and -e, nothing is written to the database or sent to the resolver. Prints references per second and errors per parser, and the slowest files.')
+    resolve.add_argument('-o',
+                        '--output',
+                        dest='dry_run_output',
+                        action='store',
+                        default=None,
+                        help='With --dry_run, write the parsed references to this file, csv when it ends with .csv, jsonl otherwise')
+    resolve.add_argument('-w',
+                        '--workers',
+                        dest='workers',
+                        action='store',
+                        type=positive_int,
+                        default=1,
+                        help='With --dry_run, parse with this many processes. Defaults to 1.')
+    resolve.add_argument('--top',
+                        dest='top',
+                        action='store',
+                        type=positive_int,
+                        default=10,
+                        help='With --dry_run, number of slowest files to list. Defaults to 10.')
 
 
     stats = subparsers.add_parser('STATS', help='Print out statistics of the reference source file')
@@ -401,20 +809,58 @@ def main(argv=None) -> int:
                        '--count',
                        dest='count',
                        action='store_true',
-                       help='Print out the count of records in the four main tables')
+                       help='Print out the count of records in the four main tables, estimated by the database unless --exact')
+    stats.add_argument('-e',
+                       '--exact',
+                       dest='exact',
+                       action='store_true',
+                       help='With -c, count the records of every table, which reads them all, and store the counts')
 
-    query = subparsers.add_parser('QUERY', help='Print out statistics of the reference source file')
+    query = subparsers.add_parser('QUERY', help='Export the resolved references of source bibcodes')
     query.add_argument('-b',
                         '--bibcode',
-                        dest='bibcode',
+                        dest='bibcodes',
                         action='store',
-                        default=None,
-                        help='Query database by source bibcode, return resolved bibcodes')
+                        nargs='+',
+                        default=[],
+                        help='Query database by source bibcodes, return resolved bibcodes. List of bibcodes separated by spaces, @filename reads them from a file, one per line')
     query.add_argument('-a',
                        '--all',
                        dest='all',
                        action='store_true',
-                       help='Return all resolved bibcode')
+                       help='Return the highest scored resolved bibcode of every parser, instead of the one of the highest priority parser only')
+    query.add_argument('--since',
+                       dest='since',
+                       action='store',
+                       type=iso_date,
+                       default=None,
+                       help='Only source bibcodes with resolved references updated at or after this date, YYYY-MM-DD')
+    query.add_argument('--changes-since',
+                       '--changes_since',
+                       dest='changes_since',
+                       action='store',
+                       type=watermark,
+                       default=None,
+                       help='Return the resolution changes after this watermark, TXID:ID of the last change already read, 0 for all. The watermark to pass next time is printed at the end')
+    query.add_argument('--page_size',
+                       dest='page_size',
+                       action='store',
+                       type=positive_int,
+                       default=1000,
+                       help='With --changes-since, number of changes read from the database at a time. Defaults to 1000.')
+    query.add_argument('-o',
+                       '--output',
+                       dest='output',
+                       action='store',
+                       default=None,
+                       help='Write to this file instead of stdout')
+    query.add_argument('-f',
+                       '--format',
+                       dest='format',
+                       action='store',
+                       choices=['jsonl', 'csv'],
+                       default=None,
+                       help='Output format, by default csv when the output file ends with .csv, jsonl otherwise')
 
     args = parser.parse_args(argv)
     #import pdb;pdb.set_trace()
@@ -431,6 +877,20 @@ def main(argv=None) -> int:
         else:
             run_diagnostics(args.bibcodes, args.source_filenames)
 
+    elif args.action == 'RESOLVE' and args.dry_run:
+        # parse only, there is no database write and nothing is queued for the resolver
+        if args.source_filenames:
+            source_filenames = args.source_filenames
+        elif args.path and args.extension:
+            date_cutoff = get_date() - timedelta(days=int(args.days)) if args.days else get_date('1972')
+            source_filenames = [filename for subdir in get_source_filenames(args.path, args.extension, date_cutoff.timetuple()) for filename in subdir]
+        else:
+            logger.error('Dry run parses source files only. Provide them by -s <list of source filenames>, or by -p <path of source files> and -e <extension of files>.')
+            return 1
+        summary = dry_run_files(source_filenames, output_filename=args.dry_run_output, workers=args.workers, top=args.top)
+        print_dry_run_summary(summary)
+        return 1 if summary['errors'] else 0
+
     elif args.action == 'RESOLVE':
         if args.source_filenames:
             process_files(args.source_filenames)
@@ -504,18 +964,24 @@ def main(argv=None) -> int:
                 for record in records:
                     print(record['source_filename'])
         elif args.count:
-            results = app.get_count_records()
-            print('\n')
-            for result in results:
-                print('Currently there are %d records in `%s` table, which holds %s.'%(result['count'], result['name'], result['description']))
-            print('\n')
+            print_count_records(app.get_count_records(exact=args.exact))
+
+    elif args.action == 'QUERY' and args.changes_since is not None:
+        summary = export_resolution_changes(args.changes_since, page_size=args.page_size,
+                                            output_filename=args.output, output_format=args.format)
+        # the rows may be going to stdout
+        print('Exported %d resolution changes in %.2f seconds (%.1f rows/sec). Next watermark: %d:%d' % (
+            (summary['rows'], summary['seconds'], summary['rows_per_s'] or 0) + summary['watermark']), file=sys.stderr)
 
     elif args.action == 'QUERY':
-        results = app.get_resolved_references('0000PThPS...0.....U')
-        for r in results:
-            print(r)
-        # if args.all:
-        # else:
+        if not args.bibcodes and not args.since:
+            logger.error('Provide source bibcodes by -b <bibcodes or @file of bibcodes>, or a date by --since <YYYY-MM-DD>, or both.')
+            return 1
+        summary = export_resolved_references(read_bibcodes(args.bibcodes), since=args.since, all_parsers=args.all,
+                                             output_filename=args.output, output_format=args.format)
+        # the rows may be going to stdout
+        print('Exported %d resolved references of %d source bibcodes in %.2f seconds (%.1f rows/sec).' % (
+            summary['rows'], summary['source_bibcodes'], summary['seconds'], summary['rows_per_s'] or 0), file=sys.stderr)
 
     return 0
 